@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+"""
+ベンチマーク用の合成データ (no Discord / Twitch required)
+
+本番の linked_users と同じ形の JSON（連携・サブスク・リマインド・DM 失敗・プロフィール・Cheer の項目）を
+乱数の種を固定して作り、EventSub の受信履歴（webhook_events）と Cheer 履歴（cheer_events）と一緒に
+SQLite へ一括で書き込む。スキーマは save_and_load._db_init をそのまま使う。
+
+Usage:
+  python benchmarks/datagen.py --users 10000 --db /tmp/neibot-bench.sqlite3
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import datetime as dt
+import io
+import json
+import os
+import random
+import sqlite3
+import sys
+import uuid
+from dataclasses import dataclass, field
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+JST = dt.timezone(dt.timedelta(hours=9))
+DISCORD_ID_BASE = 300_000_000_000_000_000
+TWITCH_ID_BASE = 50_000_000
+TIERS = (("1000", 0.80), ("2000", 0.12), ("3000", 0.08))
+EVENT_TYPES = (
+    ("channel.subscription.message", 0.45),
+    ("channel.subscribe", 0.25),
+    ("channel.cheer", 0.20),
+    ("channel.subscription.end", 0.10),
+)
+CHEER_MESSAGES = ("Cheer100 いつも楽しい配信ありがとう！", "Cheer500", "cheer1000 おめでとう！", "")
+# 管理パネルの CSV 取り込みの上限（5MB）に収まる行数
+CSV_MAX_ROWS = 50_000
+
+
+@dataclass
+class Dataset:
+    """書き込んだデータのうち、ベンチマークが対象を選ぶのに使う ID。"""
+
+    users: int
+    discord_ids: list[str] = field(default_factory=list)
+    linked: list[tuple[str, str]] = field(default_factory=list)  # (discord_id, twitch_user_id)
+    subscribers: list[tuple[str, str]] = field(default_factory=list)  # (discord_id, twitch_username)
+    inbox_rows: int = 0
+    cheer_rows: int = 0
+
+
+def _pick(rng: random.Random, weighted) -> str:
+    value = rng.random()
+    for item, weight in weighted:
+        value -= weight
+        if value <= 0:
+            return item
+    return weighted[-1][0]
+
+
+def _iso(value: dt.datetime) -> str:
+    return value.astimezone(JST).isoformat()
+
+
+def _profile(i: int, rng: random.Random) -> dict:
+    username = f"member{i}"
+    global_name = f"Member {i}" if rng.random() < 0.7 else None
+    nickname = f"nick{i}" if rng.random() < 0.2 else None
+    display = nickname or global_name or username
+    return {
+        "discord_display_name": display,
+        "discord_username": username,
+        "discord_global_name": global_name,
+        "discord_discriminator": "0",
+        "discord_nickname": nickname,
+        "discord_profile": {
+            "id": str(DISCORD_ID_BASE + i),
+            "username": username,
+            "display_name": display,
+            "global_name": global_name,
+            "discriminator": "0",
+            "nickname": nickname,
+            "avatar_url": f"https://cdn.discordapp.com/avatars/{DISCORD_ID_BASE + i}/{uuid.UUID(int=rng.getrandbits(128)).hex}.png",
+            "mention": f"<@{DISCORD_ID_BASE + i}>",
+        },
+    }
+
+
+def user_blob(i: int, rng: random.Random, today: dt.date, linked_ratio: float) -> dict:
+    """linked_users.data 1 件分。"""
+    now = dt.datetime.combine(today, dt.time(12), JST)
+    data = _profile(i, rng)
+    if rng.random() >= linked_ratio:
+        # /link を始めたが Twitch 連携まで進んでいない人
+        data["resolved"] = False
+        return data
+
+    first_of_month = today.replace(day=1)
+    is_sub = rng.random() < 0.65
+    streak = rng.randint(1, 36) if is_sub else 0
+    cumulative = streak + (rng.randint(0, 24) if is_sub else rng.randint(0, 12))
+    verified = first_of_month if rng.random() < 0.8 else first_of_month - dt.timedelta(days=rng.randint(1, 90))
+    data.update(
+        twitch_username=f"viewer{i}",
+        twitch_user_id=str(TWITCH_ID_BASE + i),
+        tier=_pick(rng, TIERS) if is_sub else None,
+        is_subscriber=is_sub,
+        streak_months=streak,
+        cumulative_months=cumulative,
+        bits_score=rng.choice((0, 0, 0, 100, 500, 1500, 10000)),
+        bits_rank=None,
+        linked_date=(verified - dt.timedelta(days=30 * cumulative)).isoformat(),
+        last_verified_at=verified.isoformat(),
+        next_reverify_due_at=(first_of_month + dt.timedelta(days=32)).replace(day=1).isoformat(),
+        resolved=True,
+        roles_revoked=not is_sub,
+        roles_revoked_at=None if is_sub else _iso(now - dt.timedelta(days=rng.randint(1, 60))),
+        last_eventsub_type=_pick(rng, EVENT_TYPES),
+        last_eventsub_at=_iso(now - dt.timedelta(hours=rng.randint(1, 24 * 60))),
+    )
+    if is_sub:
+        data["subscribed_since"] = (today - dt.timedelta(days=30 * cumulative)).isoformat()
+    if rng.random() < 0.06:
+        # 月次の再リンク待ち（リマインド送信済み）
+        notice = now - dt.timedelta(days=rng.randint(0, 20))
+        data.update(
+            resolved=False,
+            first_notice_at=_iso(notice - dt.timedelta(days=rng.randint(0, 7))),
+            last_notice_at=_iso(notice),
+        )
+    if rng.random() < 0.02:
+        data.update(dm_failed=True, dm_failed_reason="dm_closed")
+    if rng.random() < 0.25:
+        bits = rng.choice((100, 300, 500, 1000, 5000))
+        data.update(
+            total_cheer_bits=bits * rng.randint(1, 20),
+            last_cheer_bits=bits,
+            last_cheer_at=_iso(now - dt.timedelta(days=rng.randint(0, 90))),
+            last_cheer_message=rng.choice(CHEER_MESSAGES) or None,
+        )
+    return data
+
+
+def notification(
+    sub_type: str,
+    twitch_user_id: str,
+    username: str,
+    when: dt.datetime,
+    rng: random.Random,
+    *,
+    msg_id: str | None = None,
+) -> tuple[dict, dict]:
+    """EventSub の通知本文と、署名に使うヘッダ相当の値。"""
+    event: dict = {
+        "user_id": twitch_user_id,
+        "user_login": username,
+        "user_name": username,
+        "broadcaster_user_id": "12345678",
+        "broadcaster_user_login": "neibot_test",
+        "broadcaster_user_name": "neibot_test",
+    }
+    if sub_type == "channel.subscribe":
+        event.update(tier=_pick(rng, TIERS), is_gift=rng.random() < 0.15)
+    elif sub_type == "channel.subscription.message":
+        months = rng.randint(1, 48)
+        event.update(
+            tier=_pick(rng, TIERS),
+            cumulative_months=months,
+            streak_months=rng.randint(1, months),
+            duration_months=1,
+            message={"text": "いつもありがとう", "emotes": []},
+        )
+    elif sub_type == "channel.subscription.end":
+        event.update(tier=_pick(rng, TIERS), is_gift=False)
+    elif sub_type == "channel.cheer":
+        event.update(
+            is_anonymous=rng.random() < 0.05,
+            bits=rng.choice((100, 300, 500, 1000, 5000)),
+            message=rng.choice(CHEER_MESSAGES),
+        )
+    timestamp = when.astimezone(dt.timezone.utc).isoformat().replace("+00:00", "Z")
+    msg_id = msg_id or str(uuid.UUID(int=rng.getrandbits(128)))
+    body = {
+        "subscription": {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "status": "enabled",
+            "type": sub_type,
+            "version": "1",
+            "condition": {"broadcaster_user_id": "12345678"},
+            "transport": {"method": "webhook", "callback": "https://example.invalid/twitch_eventsub"},
+            "created_at": timestamp,
+        },
+        "event": event,
+    }
+    headers = {
+        "Twitch-Eventsub-Message-Id": msg_id,
+        "Twitch-Eventsub-Message-Timestamp": timestamp,
+        "Twitch-Eventsub-Message-Type": "notification",
+        "Twitch-Eventsub-Subscription-Type": sub_type,
+    }
+    return body, headers
+
+
+def generate(
+    db_path: str,
+    users: int,
+    *,
+    seed: int = 42,
+    linked_ratio: float = 0.9,
+    inbox_per_user: float = 2.0,
+    cheers_per_user: float = 0.3,
+    today: dt.date | None = None,
+) -> Dataset:
+    """db_path に書き込む（既存の行は消さない。新しいファイルを渡すこと）。"""
+    from bot.utils.save_and_load import CHEER_TABLE, INBOX_TABLE, LINKED_USERS_TABLE, _db_init
+
+    rng = random.Random(seed)
+    today = today or dt.datetime.now(JST).date()
+    now = dt.datetime.combine(today, dt.time(12), JST)
+    dataset = Dataset(users=users)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL;")
+        _db_init(conn)
+        user_rows = []
+        inbox_rows = []
+        cheer_rows = []
+        for i in range(users):
+            did = str(DISCORD_ID_BASE + i)
+            blob = user_blob(i, rng, today, linked_ratio)
+            created = _iso(now - dt.timedelta(days=rng.randint(0, 720)))
+            user_rows.append((did, json.dumps(blob, ensure_ascii=False), created, _iso(now)))
+            dataset.discord_ids.append(did)
+            twitch_id = blob.get("twitch_user_id")
+            if not twitch_id:
+                continue
+            dataset.linked.append((did, twitch_id))
+            if blob.get("is_subscriber"):
+                dataset.subscribers.append((did, blob["twitch_username"]))
+            for _ in range(int(inbox_per_user) + (rng.random() < inbox_per_user % 1)):
+                sub_type = _pick(rng, EVENT_TYPES)
+                when = now - dt.timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+                body, headers = notification(sub_type, twitch_id, blob["twitch_username"], when, rng)
+                inbox_rows.append(
+                    (
+                        "twitch",
+                        headers["Twitch-Eventsub-Message-Id"],
+                        sub_type,
+                        twitch_id,
+                        json.dumps(body, ensure_ascii=False),
+                        json.dumps(headers),
+                        "done" if rng.random() < 0.995 else "failed",
+                        _iso(when),
+                        _iso(when + dt.timedelta(milliseconds=rng.randint(5, 500))),
+                    )
+                )
+            for _ in range(int(cheers_per_user) + (rng.random() < cheers_per_user % 1)):
+                when = now - dt.timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+                body, _headers = notification("channel.cheer", twitch_id, blob["twitch_username"], when, rng)
+                event = body["event"]
+                cheer_rows.append(
+                    (
+                        None if event["is_anonymous"] else twitch_id,
+                        event["bits"],
+                        1 if event["is_anonymous"] else 0,
+                        event["message"],
+                        json.dumps(event, ensure_ascii=False),
+                        _iso(when),
+                    )
+                )
+        with conn:
+            conn.executemany(
+                f"INSERT INTO {LINKED_USERS_TABLE} (discord_id, data, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                user_rows,
+            )
+            conn.executemany(
+                f"""
+                INSERT OR IGNORE INTO {INBOX_TABLE}
+                (source, delivery_id, event_type, twitch_user_id, payload, headers, status, received_at, processed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                inbox_rows,
+            )
+            conn.executemany(
+                f"""
+                INSERT INTO {CHEER_TABLE} (twitch_user_id, bits, is_anonymous, message, payload, cheer_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                cheer_rows,
+            )
+        conn.execute("ANALYZE;")
+        dataset.inbox_rows = len(inbox_rows)
+        dataset.cheer_rows = len(cheer_rows)
+    finally:
+        conn.close()
+    return dataset
+
+
+def subscriber_csv(dataset: Dataset, *, rows: int, seed: int = 7, missing_ratio: float = 0.02) -> bytes:
+    """Twitch のダッシュボードから落とす subscriber-list.csv と同じ列。一部は未連携の名前にする。"""
+    rng = random.Random(seed)
+    rows = min(rows, CSV_MAX_ROWS, len(dataset.subscribers))
+    picked = rng.sample(dataset.subscribers, rows) if rows else []
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["Username", "Subscribe Date", "Current Tier", "Tenure", "Streak", "Sub Type", "Founder"])
+    for n, (_did, username) in enumerate(picked):
+        if rng.random() < missing_ratio:
+            username = f"unknown_viewer{n}"
+        tenure = rng.randint(1, 48)
+        started = dt.date.today() - dt.timedelta(days=30 * tenure)
+        writer.writerow(
+            [
+                username,
+                started.strftime("%Y-%m-%d"),
+                rng.choice(("Tier 1", "Tier 1", "Tier 1", "Tier 2", "Tier 3", "Prime")),
+                tenure,
+                rng.randint(1, tenure),
+                rng.choice(("paid", "gift", "prime")),
+                "true" if rng.random() < 0.03 else "false",
+            ]
+        )
+    return out.getvalue().encode("utf-8")
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="synthetic linked_users / inbox / cheer data")
+    p.add_argument("--users", type=int, default=10_000)
+    p.add_argument("--db", required=True, help="書き込む SQLite ファイル（新規）")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--linked-ratio", type=float, default=0.9)
+    p.add_argument("--inbox-per-user", type=float, default=2.0)
+    p.add_argument("--cheers-per-user", type=float, default=0.3)
+    p.add_argument("--csv", help="subscriber-list.csv 形式のファイルも書き出す")
+    args = p.parse_args()
+
+    if os.path.exists(args.db):
+        p.error(f"{args.db} already exists")
+    dataset = generate(
+        args.db,
+        args.users,
+        seed=args.seed,
+        linked_ratio=args.linked_ratio,
+        inbox_per_user=args.inbox_per_user,
+        cheers_per_user=args.cheers_per_user,
+    )
+    if args.csv:
+        with open(args.csv, "wb") as f:
+            f.write(subscriber_csv(dataset, rows=len(dataset.subscribers)))
+    print(
+        json.dumps(
+            {
+                "users": dataset.users,
+                "linked": len(dataset.linked),
+                "subscribers": len(dataset.subscribers),
+                "inbox_rows": dataset.inbox_rows,
+                "cheer_rows": dataset.cheer_rows,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
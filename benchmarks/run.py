@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+"""
+保存処理と EventSub 反映のベンチマーク (no Discord / Twitch required)
+
+ユーザー数ごとに一時ディレクトリへ合成データ（datagen.py）を作り、別プロセスで次を測る。
+  storage : load_users / get_linked_user / patch_linked_user
+  eventsub: apply_event_to_linked_users（イベント種別ごと。連携していない相手も）
+  link    : reconcile_and_save_link / _build_allowed_member_ids
+  django  : _build_dashboard_context / _collect_unresolved_users / import_subscribers（CSV の POST）
+結果は JSON に書き、保存済みの基準（benchmarks/baseline.json）と中央値を比べて、
+許容幅（--tolerance）を超えて遅くなったものを表示する。基準は同じマシンで取り直すこと。
+
+Usage:
+  python benchmarks/run.py --sizes 1k,10k,100k
+  python benchmarks/run.py --sizes 1k,10k --only storage,eventsub --fail-on-regression
+  python benchmarks/run.py --sizes 1k,10k,100k --save-baseline
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_OUT = os.path.join(HERE, "results", "latest.json")
+GROUPS = ("storage", "eventsub", "link", "django")
+APPLY_TYPES = (
+    "channel.subscribe",
+    "channel.subscription.message",
+    "channel.subscription.end",
+    "channel.cheer",
+)
+# 中央値の差がこれ未満なら遅くなったとみなさない（タイマーと OS の揺れ）
+NOISE_FLOOR_MS = 0.05
+
+
+def _parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = 1
+    if text.endswith("k"):
+        text, scale = text[:-1], 1000
+    elif text.endswith("m"):
+        text, scale = text[:-1], 1_000_000
+    return int(float(text) * scale)
+
+
+def _size_label(n: int) -> str:
+    return f"{n // 1000}k" if n >= 1000 and n % 1000 == 0 else str(n)
+
+
+# ---- 計測 ----
+def _measure(
+    fn: Callable[[int], Any],
+    *,
+    min_time: float,
+    max_reps: int,
+    min_reps: int = 3,
+) -> dict:
+    """fn(回数) を min_time 秒経つか max_reps 回まで繰り返す（1 回目の前に 1 回捨てる）。"""
+    fn(-1)
+    times: list[float] = []
+    started = time.perf_counter()
+    while len(times) < max_reps and (
+        len(times) < min_reps or time.perf_counter() - started < min_time
+    ):
+        t0 = time.perf_counter()
+        fn(len(times))
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return {
+        "reps": len(times),
+        "median_ms": round(statistics.median(times) * 1000, 4),
+        "mean_ms": round(statistics.fmean(times) * 1000, 4),
+        "min_ms": round(times[0] * 1000, 4),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 4),
+    }
+
+
+def _setup_django(db_path: str):
+    sys.path.insert(0, os.path.join(ROOT, "webadmin"))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "webadmin.settings")
+    import django
+    from django.conf import settings
+
+    django.setup()
+    # Bot と同じファイルを使う設定を、合成データのファイルに向け直す（接続前なので効く）
+    settings.DATABASES["default"]["NAME"] = db_path
+    settings.ALLOWED_HOSTS = ["*"]
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0, interactive=False)
+
+
+def _worker(args) -> dict:
+    """1 つのデータ量を測る（NEIBOT_DB_PATH は親が設定済み）。"""
+    from benchmarks import datagen
+
+    db_path = os.environ["NEIBOT_DB_PATH"]
+    gen_started = time.perf_counter()
+    dataset = datagen.generate(db_path, args.size, seed=args.seed)
+    result: dict = {
+        "dataset": {
+            "users": dataset.users,
+            "linked": len(dataset.linked),
+            "subscribers": len(dataset.subscribers),
+            "inbox_rows": dataset.inbox_rows,
+            "cheer_rows": dataset.cheer_rows,
+            "db_mb": round(os.path.getsize(db_path) / 1024 / 1024, 1),
+            "generate_sec": round(time.perf_counter() - gen_started, 2),
+        },
+        "cases": {},
+    }
+    cases = result["cases"]
+    rng = random.Random(args.seed)
+    only = set(args.only.split(",")) if args.only else set(GROUPS)
+    heavy = {"min_time": args.min_time, "max_reps": args.max_reps}
+    light = {"min_time": args.min_time, "max_reps": args.max_reps * 20}
+
+    def _log(name: str) -> None:
+        print(f"[{_size_label(args.size)}] {name}: {cases[name]['median_ms']}ms", file=sys.stderr)
+
+    if "storage" in only:
+        from bot.utils.save_and_load import get_linked_user, load_users, patch_linked_user
+
+        cases["load_users"] = _measure(lambda _i: load_users(), **heavy)
+        _log("load_users")
+        ids = dataset.discord_ids
+        cases["get_linked_user"] = _measure(lambda _i: get_linked_user(rng.choice(ids)), **light)
+        _log("get_linked_user")
+        cases["patch_linked_user"] = _measure(
+            lambda i: patch_linked_user(rng.choice(ids), {"bench_counter": i, "dm_failed": False}),
+            **light,
+        )
+        _log("patch_linked_user")
+
+    if "eventsub" in only:
+        from benchmarks.datagen import notification
+        from bot.utils.eventsub_apply import apply_event_to_linked_users
+
+        now = dt.datetime.now(dt.timezone.utc)
+
+        def _apply(sub_type: str, linked: bool) -> Callable[[int], Any]:
+            def _run(_i: int) -> None:
+                if linked:
+                    _did, twitch_id = rng.choice(dataset.linked)
+                else:
+                    twitch_id = str(datagen.TWITCH_ID_BASE - 1 - rng.randrange(1_000_000))
+                body, headers = notification(sub_type, twitch_id, f"viewer_{twitch_id}", now, rng)
+                apply_event_to_linked_users(
+                    sub_type, body["event"], headers["Twitch-Eventsub-Message-Timestamp"]
+                )
+
+            return _run
+
+        for sub_type in APPLY_TYPES:
+            name = f"apply_event[{sub_type}]"
+            cases[name] = _measure(_apply(sub_type, True), **heavy)
+            _log(name)
+        cases["apply_event[unlinked]"] = _measure(_apply("channel.subscribe", False), **heavy)
+        _log("apply_event[unlinked]")
+
+    if "link" in only:
+        from bot.utils.streak import reconcile_and_save_link
+
+        def _reconcile(_i: int) -> None:
+            did, twitch_id = rng.choice(dataset.linked)
+            reconcile_and_save_link(
+                did,
+                {
+                    "twitch_username": f"viewer_{twitch_id}",
+                    "twitch_user_id": twitch_id,
+                    "tier": rng.choice(("1000", "2000", "3000", None)),
+                    "streak_months": 0,
+                    "cumulative_months": 0,
+                    "bits_rank": None,
+                    "bits_score": 0,
+                    "is_subscriber": True,
+                },
+            )
+
+        cases["reconcile_and_save_link"] = _measure(_reconcile, **light)
+        _log("reconcile_and_save_link")
+
+        from bot.bot_client import _build_allowed_member_ids
+
+        cases["_build_allowed_member_ids"] = _measure(
+            lambda _i: _build_allowed_member_ids([1, 3, 6, 12, 24]), **heavy
+        )
+        _log("_build_allowed_member_ids")
+
+    if "django" in only:
+        _setup_django(db_path)
+        from django.contrib.auth import get_user_model
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.test import Client
+        from panel import views
+
+        cases["_build_dashboard_context"] = _measure(lambda _i: views._build_dashboard_context(), **heavy)
+        _log("_build_dashboard_context")
+        cases["_collect_unresolved_users"] = _measure(lambda _i: views._collect_unresolved_users(), **heavy)
+        _log("_collect_unresolved_users")
+
+        staff = get_user_model().objects.create_user("bench", password="bench", is_staff=True)
+        client = Client()
+        client.force_login(staff)
+        csv_bytes = datagen.subscriber_csv(dataset, rows=max(1, args.size // 10))
+
+        def _import(_i: int) -> None:
+            upload = SimpleUploadedFile("subscriber-list.csv", csv_bytes, content_type="text/csv")
+            response = client.post("/import-subscribers/", {"file": upload})
+            if response.status_code != 200:
+                raise RuntimeError(f"import_subscribers returned {response.status_code}")
+
+        cases["import_subscribers"] = _measure(_import, **heavy)
+        cases["import_subscribers"]["csv_rows"] = csv_bytes.count(b"\n") - 1
+        _log("import_subscribers")
+
+    return result
+
+
+def _run_size(size: int, args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="neibot-bench-") as tmp:
+        env = dict(os.environ)
+        env.update(
+            NEIBOT_DB_PATH=os.path.join(tmp, "db.sqlite3"),
+            NEIBOT_DATA_DIR=tmp,
+            # 遅い SQL の EXPLAIN は測る対象に入れない
+            SQL_SLOW_MS="0",
+            LOG_FILE="off",
+            PYTHONPATH=ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        )
+        with open(os.path.join(tmp, "token.json"), "w", encoding="utf-8") as f:
+            json.dump({"discord_token": "", "admin_api_token": "bench"}, f)
+        cmd = [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--worker",
+            "--size",
+            str(size),
+            "--seed",
+            str(args.seed),
+            "--min-time",
+            str(args.min_time),
+            "--max-reps",
+            str(args.max_reps),
+        ]
+        if args.only:
+            cmd += ["--only", args.only]
+        out = subprocess.run(cmd, env=env, check=True, stdout=subprocess.PIPE, text=True)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[dict]:
+    """サイズ・ケースごとの中央値の比。基準に無いものは飛ばす。"""
+    rows = []
+    for size, entry in current.get("results", {}).items():
+        base_cases = baseline.get("results", {}).get(size, {}).get("cases", {})
+        for name, stats in entry["cases"].items():
+            base = base_cases.get(name)
+            if not base:
+                continue
+            now_ms, base_ms = stats["median_ms"], base["median_ms"]
+            ratio = now_ms / base_ms if base_ms else float("inf")
+            rows.append(
+                {
+                    "size": size,
+                    "case": name,
+                    "baseline_ms": base_ms,
+                    "median_ms": now_ms,
+                    "ratio": round(ratio, 3),
+                    "regression": ratio > 1 + tolerance and now_ms - base_ms > NOISE_FLOOR_MS,
+                    "improvement": ratio < 1 - tolerance and base_ms - now_ms > NOISE_FLOOR_MS,
+                }
+            )
+    return rows
+
+
+def _print_table(report: dict, comparison: list[dict]) -> None:
+    by_key = {(row["size"], row["case"]): row for row in comparison}
+    for size, entry in report["results"].items():
+        ds = entry["dataset"]
+        print(
+            f"\n== {size} users (linked {ds['linked']}, inbox {ds['inbox_rows']}, "
+            f"cheers {ds['cheer_rows']}, {ds['db_mb']} MB) =="
+        )
+        print(f"{'case':<45} {'median ms':>12} {'p95 ms':>10} {'reps':>6} {'vs base':>9}")
+        for name, stats in entry["cases"].items():
+            row = by_key.get((size, name))
+            mark = ""
+            if row:
+                mark = f"x{row['ratio']:.2f}"
+                if row["regression"]:
+                    mark += " !"
+            print(
+                f"{name:<45} {stats['median_ms']:>12.3f} {stats['p95_ms']:>10.3f} "
+                f"{stats['reps']:>6} {mark:>9}"
+            )
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="storage / event-apply benchmarks")
+    p.add_argument("--sizes", default="1k,10k,100k", help="ユーザー数（カンマ区切り、1k / 100k 表記可）")
+    p.add_argument("--only", default="", help=f"測るグループ（{','.join(GROUPS)} のカンマ区切り）")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--min-time", type=float, default=0.5, help="ケースごとに繰り返す最短の秒数")
+    p.add_argument("--max-reps", type=int, default=50, help="重いケースの最大回数（1 件ずつの操作はこの 20 倍）")
+    p.add_argument("--out", default=DEFAULT_OUT)
+    p.add_argument("--baseline", default=DEFAULT_BASELINE)
+    p.add_argument("--tolerance", type=float, default=0.25, help="中央値がこの割合を超えて遅くなったら回帰")
+    p.add_argument("--save-baseline", action="store_true", help="今回の結果を基準として保存する")
+    p.add_argument("--fail-on-regression", action="store_true")
+    p.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    p.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.worker:
+        print(json.dumps(_worker(args)))
+        return
+    unknown = set(filter(None, args.only.split(","))) - set(GROUPS)
+    if unknown:
+        p.error(f"unknown group(s): {', '.join(sorted(unknown))}")
+
+    report: dict = {
+        "meta": {
+            "created_at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+            "min_time": args.min_time,
+            "max_reps": args.max_reps,
+        },
+        "results": {},
+    }
+    for size in [_parse_size(s) for s in args.sizes.split(",") if s.strip()]:
+        report["results"][_size_label(size)] = _run_size(size, args)
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    comparison = compare(report, baseline, args.tolerance) if baseline else []
+    if baseline:
+        report["comparison"] = {
+            "baseline": os.path.relpath(args.baseline, ROOT),
+            "baseline_created_at": baseline.get("meta", {}).get("created_at"),
+            "tolerance": args.tolerance,
+            "rows": comparison,
+        }
+    _print_table(report, comparison)
+
+    targets = [args.out] + ([args.baseline] if args.save_baseline else [])
+    for path in targets:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report if path == args.out else {k: report[k] for k in ("meta", "results")}, f, indent=2)
+            f.write("\n")
+        print(f"\nwrote {os.path.relpath(path, ROOT)}")
+
+    regressions = [row for row in comparison if row["regression"]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}:")
+        for row in regressions:
+            print(f"  {row['size']} {row['case']}: {row['baseline_ms']}ms -> {row['median_ms']}ms (x{row['ratio']})")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,33 @@
 import asyncio
+import contextlib
 import json
+import signal
 import threading
 from typing import Coroutine, Any
 import zoneinfo
 import datetime as dt
-import copy
 import discord
-from discord.ext import commands
 from fastapi import FastAPI, Request, Header
-from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 import uvicorn
-import httpx
 import os
 import re
 import sys
 import subprocess
+import time
 import atexit
-from bot.common import debug_print
-from bot.utils.streak import reconcile_and_save_link
 from bot.utils.save_and_load import (
-    get_broadcast_id,
-    get_twitch_keys,
     get_guild_id,
-    get_admin_api_token,
-    save_all_guild_members,
-    load_role_ids,
-    save_role_ids,
-    save_channel_ids,
-    load_channel_ids,
-    load_subscription_categories,
-    save_subscription_categories,
+    linked_users_role_state,
+    scheduler_runs_recent,
     load_subscription_config,
     save_subscription_config,
 )
 from bot.utils.twitch import (
-    get_user_info_and_subscription,
     register_eventsub_subscriptions,
     list_eventsub_subscriptions,
     delete_eventsub_subscription,
@@ -43,239 +36,161 @@ from bot.utils.twitch import (
 from bot.utils.save_and_load import (
     load_users,
     get_eventsub_config,
-    inbox_enqueue_event,
-    inbox_mark_processed,
 )
-from bot.utils.eventsub_apply import apply_event_to_linked_users
-import hmac
-import hashlib
-import io
+from bot.utils.admin_auth import require_admin_token
+from bot.utils.bot_ipc import BOT_IPC_ADDRESS, WAKE_PATH, parse_ipc_address
+from bot.utils.ingress_routes import build_ingress_router
+from bot.utils.dm_broadcast import (
+    DM_CLOSED,
+    DM_FAILED,
+    DM_SENT,
+    DMOutcome,
+    classify_dm_error,
+)
+from bot.utils.dm_attachments import (
+    MAX_FILES_PER_MESSAGE,
+    AttachmentSet,
+    normalize_attachment_specs,
+)
+from bot.utils.broadcast_jobs import BroadcastJobRunner, create_job
+from bot.utils.scheduling import SCHEDULER
+from bot.utils.guild_provision import provision_guilds
+from bot.utils.role_plan import ROLE_PLANS
+from bot.utils.member_cache import MEMBER_CACHE, create_bot
+from bot.utils.dm_suppression import record_dm_outcome, suppressed_ids
+from bot.utils.outbox import (
+    KIND_MILESTONE_DM,
+    KIND_ROLES,
+    KIND_STREAM_ONLINE,
+    OutboxConsumer,
+    build_milestone_message,
+    unique_discord_ids,
+)
+from bot.utils.link_jobs import LinkJobRunner
+from bot.utils.logs import configure_logging, get_logger
+from bot.utils.loop_monitor import loop_monitor_snapshot, start_loop_monitor
+from bot.utils.metrics import CONTENT_TYPE, render_metrics
+from bot.utils.profiling import DEFAULT_HZ, MEMORY, ProfilerBusy, dump_tasks, sample_stacks
+from bot.utils.request_timing import TimingMiddleware, timing_snapshot
+from bot.utils.broadcast_progress import (
+    PROGRESS_HUB,
+    TERMINAL_STATUSES as BROADCAST_TERMINAL_STATUSES,
+    progress_from_job,
+)
+from bot.utils.save_and_load import broadcast_job_get
 
 # ==================== パス設定（絶対パス） ====================
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "./"))
 TOKEN_PATH = os.path.join(PROJECT_ROOT, "venv", "token.json")
 
-DEFAULT_SUBSCRIPTION_CONFIG: dict[str, Any] = {
-    "tiers": [
-        {
-            "key": "tier1",
-            "role_name": "Subscription Tier1",
-            "category_name": "サブスクTier 1",
-            "channel_name": "tier-1",
-            "view_roles": ["tier1"],
-        },
-        {
-            "key": "tier2",
-            "role_name": "Subscription Tier2",
-            "category_name": "サブスクTier 2",
-            "channel_name": "tier-2",
-            "view_roles": ["tier1", "tier2"],
-        },
-        {
-            "key": "tier3",
-            "role_name": "Subscription Tier3",
-            "category_name": "サブスクTier 3",
-            "channel_name": "tier-3",
-            "view_roles": ["tier1", "tier2", "tier3"],
-        },
-    ],
-    "linked_role_name": "Twitch-linked",
-    "notify_role_name": "Subscription Tier1",
-    "notify_channel_id": None,
-}
-
-
-def _load_subscription_definition() -> dict[str, Any]:
-    user_config = load_subscription_config()
-    if not user_config:
-        save_subscription_config(DEFAULT_SUBSCRIPTION_CONFIG)
-        user_config = {}
-
-    merged = copy.deepcopy(DEFAULT_SUBSCRIPTION_CONFIG)
-    if isinstance(user_config, dict):
-        for key, value in user_config.items():
-            if key == "tiers" or value is None:
-                continue
-            merged[key] = value
-
-    tiers: list[dict[str, Any]] = []
-    user_tiers = user_config.get("tiers") if isinstance(user_config, dict) else None
-    if isinstance(user_tiers, list) and user_tiers:
-        for idx, entry in enumerate(user_tiers):
-            if not isinstance(entry, dict):
-                continue
-            if idx < len(DEFAULT_SUBSCRIPTION_CONFIG["tiers"]):
-                base = copy.deepcopy(DEFAULT_SUBSCRIPTION_CONFIG["tiers"][idx])
-            else:
-                base = {
-                    "key": entry.get("key") or f"tier{idx + 1}",
-                    "role_name": entry.get("role_name")
-                    or entry.get("key")
-                    or f"Tier{idx + 1}",
-                    "category_name": entry.get("category_name")
-                    or entry.get("role_name")
-                    or f"Category{idx + 1}",
-                    "channel_name": entry.get("channel_name") or f"channel-{idx + 1}",
-                    "view_roles": entry.get("view_roles")
-                    or [entry.get("key") or f"tier{idx + 1}"],
-                }
-            for key, value in entry.items():
-                if value is not None:
-                    base[key] = value
-            if "key" not in base or not base["key"]:
-                base["key"] = f"tier{idx + 1}"
-            tiers.append(base)
-    if not tiers:
-        tiers = copy.deepcopy(DEFAULT_SUBSCRIPTION_CONFIG["tiers"])
-    merged["tiers"] = tiers
-    return merged
-
-
-SUBSCRIPTION_CONFIG = _load_subscription_definition()
-TIER_CONFIG = SUBSCRIPTION_CONFIG.get("tiers", [])
-
-ROLE_BY_KEY: dict[str, str] = {}
-TIER_ENTRIES: list[dict[str, Any]] = []
-ROLE_NAMES_LIST: list[str] = []
-CHANNEL_NAMES_LIST: list[str] = []
-CATEGORY_NAMES: list[str] = []
-CATEGORY_ROLE_MAP: dict[str, str] = {}
-CHANNEL_ROLE_MAP: dict[str, str] = {}
-CATEGORY_CHANNEL_MAP: dict[str, str] = {}
-CATEGORY_ALLOWED_ROLE_NAMES: dict[str, list[str]] = {}
-
-for entry in TIER_CONFIG:
-    key = str(entry.get("key") or f"tier{len(TIER_ENTRIES) + 1}")
-    role_name = str(entry.get("role_name") or key)
-    category_name = str(
-        entry.get("category_name") or entry.get("channel_name") or role_name
-    )
-    channel_name = str(entry.get("channel_name") or role_name)
-    allowed = entry.get("view_roles") or [key]
-
-    ROLE_BY_KEY[key] = role_name
-    if role_name not in ROLE_NAMES_LIST:
-        ROLE_NAMES_LIST.append(role_name)
-    if channel_name not in CHANNEL_NAMES_LIST:
-        CHANNEL_NAMES_LIST.append(channel_name)
-    if category_name not in CATEGORY_NAMES:
-        CATEGORY_NAMES.append(category_name)
-
-    CATEGORY_ROLE_MAP[category_name] = role_name
-    CHANNEL_ROLE_MAP[channel_name] = role_name
-    CATEGORY_CHANNEL_MAP[category_name] = channel_name
-
-    allowed_role_names: list[str] = []
-    for item in allowed:
-        resolved = ROLE_BY_KEY.get(str(item))
-        if not resolved and isinstance(item, str) and item in ROLE_BY_KEY.values():
-            resolved = item
-        if not resolved and item == key:
-            resolved = role_name
-        resolved = resolved or str(item)
-        if resolved not in allowed_role_names:
-            allowed_role_names.append(resolved)
-    if role_name not in allowed_role_names:
-        allowed_role_names.append(role_name)
-
-    CATEGORY_ALLOWED_ROLE_NAMES[category_name] = allowed_role_names
-    TIER_ENTRIES.append(
-        {
-            "key": key,
-            "role_name": role_name,
-            "category_name": category_name,
-            "channel_name": channel_name,
-            "view_role_names": allowed_role_names,
-        }
-    )
-
-LINKED_ROLE_NAME = SUBSCRIPTION_CONFIG.get("linked_role_name") or "Twitch-linked"
-if LINKED_ROLE_NAME and LINKED_ROLE_NAME not in ROLE_NAMES_LIST:
-    ROLE_NAMES_LIST.append(LINKED_ROLE_NAME)
 # ===== Discord Bot の準備 =====
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Intents・シャーディング・メンバーキャッシュは環境変数で切り替える（bot/utils/member_cache.py）
+bot = create_bot(command_prefix="!")
 JST = zoneinfo.ZoneInfo("Asia/Tokyo")
 BOT_LOOP = None  # will be captured in on_ready()
+STARTUP_DONE = False
+# サブシステムごとのロガー（LOG_LEVELS で指定する名前）
+log = get_logger("api")
+loop_log = get_logger("loop")
+dm_log = get_logger("dm")
+stream_log = get_logger("stream")
+eventsub_log = get_logger("eventsub")
+link_log = get_logger("linkjob")
+startup_log = get_logger("startup")
+shutdown_log = get_logger("shutdown")
+django_log = get_logger("django")
 
 # ===== FastAPI アプリ =====
 IS_PROD = (os.getenv("APP_ENV") or os.getenv("ENV") or "").lower() in (
     "prod",
     "production",
 )
+
+
+@contextlib.asynccontextmanager
+async def _api_lifespan(_app: FastAPI):
+    # thread モードでは uvicorn 専用のループ、single モードでは Bot と共有のループを監視する
+    start_loop_monitor("api")
+    yield
+
+
 app = FastAPI(
     docs_url=None if IS_PROD else "/docs",
     redoc_url=None if IS_PROD else "/redoc",
     openapi_url=None if IS_PROD else "/openapi.json",
+    lifespan=_api_lifespan,
 )
+app.add_middleware(TimingMiddleware, app_name="api")
 
 
-STREAM_NOTIFY_ROLE_NAME = SUBSCRIPTION_CONFIG.get("notify_role_name")
-if not STREAM_NOTIFY_ROLE_NAME:
-    notify_entry = next((e for e in TIER_ENTRIES if e.get("key") == "notify"), None)
-    if notify_entry:
-        STREAM_NOTIFY_ROLE_NAME = notify_entry.get("role_name")
-    elif TIER_ENTRIES:
-        STREAM_NOTIFY_ROLE_NAME = TIER_ENTRIES[0].get("role_name")
-    elif ROLE_NAMES_LIST:
-        STREAM_NOTIFY_ROLE_NAME = ROLE_NAMES_LIST[0]
-
-cfg_channel_id = SUBSCRIPTION_CONFIG.get("notify_channel_id")
-if not cfg_channel_id:
-    notify_entry = next((e for e in TIER_ENTRIES if e.get("key") == "notify"), None)
-    if notify_entry:
-        cfg_channel_id = notify_entry.get("channel_id")
-    else:
-        tier1_entry = next((e for e in TIER_ENTRIES if e.get("key") == "tier1"), None)
-        if tier1_entry:
-            cfg_channel_id = tier1_entry.get("channel_id")
+# ---- Bot ループにコルーチンを投げる小ヘルパ ----
+# 単一ループモード（API_SERVER_MODE=single）では API も Bot と同じループで動くので、
+# スレッド間の受け渡しをせずにそのまま await / create_task する
+_BACKGROUND_TASKS: set[asyncio.Task] = set()
 
-try:
-    STREAM_NOTIFY_CHANNEL_ID = int(cfg_channel_id) if cfg_channel_id else None
-except (TypeError, ValueError):
-    STREAM_NOTIFY_CHANNEL_ID = None
 
-if STREAM_NOTIFY_ROLE_NAME and STREAM_NOTIFY_ROLE_NAME not in ROLE_NAMES_LIST:
-    ROLE_NAMES_LIST.append(STREAM_NOTIFY_ROLE_NAME)
+def _bot_loop() -> asyncio.AbstractEventLoop | None:
+    return BOT_LOOP or getattr(bot, "loop", None)
+
+
+def _on_bot_loop() -> bool:
+    try:
+        return asyncio.get_running_loop() is _bot_loop()
+    except RuntimeError:
+        return False
 
 
-# ---- Bot ループにコルーチンを投げる小ヘルパ ----
 def run_in_bot_loop(coro: Coroutine[Any, Any, Any]):
     """Discord Bot のイベントループで coro を実行して、例外をログに出す"""
-    fut = asyncio.run_coroutine_threadsafe(coro, bot.loop)
+    fut = asyncio.run_coroutine_threadsafe(coro, _bot_loop())
 
     def _done(f):
         try:
             f.result()
         except Exception as e:
-            debug_print("❌ notify error:", repr(e))
+            loop_log.warning("bot loop call failed: %r", e)
 
     fut.add_done_callback(_done)
     return fut
 
 
+async def call_in_bot_loop(coro: Coroutine[Any, Any, Any]) -> Any:
+    """Bot ループで coro を実行して結果を返す（同じループならそのまま await）。"""
+    if _on_bot_loop():
+        return await coro
+    return await asyncio.wrap_future(run_in_bot_loop(coro))
+
+
 def schedule_in_bot_loop(coro: Coroutine[Any, Any, Any]):
     """Safely schedule a coroutine onto the Discord bot loop with logs."""
     try:
         name = getattr(coro, "__name__", None) or str(coro)
     except Exception:
         name = str(coro)
-    loop = BOT_LOOP or getattr(bot, "loop", None)
-    if loop is None:
-        debug_print(f"[loop] no bot loop available; cannot schedule {name}")
-        return None
-    debug_print(f"[loop] scheduling on {loop}: {name}")
-    fut = asyncio.run_coroutine_threadsafe(coro, loop)
 
-    def _done(f):
+    def _log_result(f):
         try:
             f.result()
-            debug_print("[loop] task completed successfully")
+            loop_log.debug("task completed: %s", name)
+        except asyncio.CancelledError:
+            loop_log.debug("task cancelled: %s", name)
         except Exception as e:
-            debug_print("[loop] task error:", repr(e))
-
-    fut.add_done_callback(_done)
+            loop_log.warning("task %s failed: %r", name, e, exc_info=e)
+
+    if _on_bot_loop():
+        task = asyncio.get_running_loop().create_task(coro)
+        _BACKGROUND_TASKS.add(task)
+        task.add_done_callback(_BACKGROUND_TASKS.discard)
+        task.add_done_callback(_log_result)
+        return task
+    loop = _bot_loop()
+    if loop is None:
+        loop_log.warning("no bot loop available; cannot schedule %s", name)
+        return None
+    loop_log.debug("scheduling on %s: %s", loop, name)
+    fut = asyncio.run_coroutine_threadsafe(coro, loop)
+    fut.add_done_callback(_log_result)
     return fut
 
 
@@ -288,154 +203,154 @@ async def notify_discord_user(
     await bot.wait_until_ready()
     user = await bot.fetch_user(discord_id)
     if not user:
-        debug_print(f"⚠ fetch_user({discord_id}) が None")
+        dm_log.warning("fetch_user(%s) returned None", discord_id)
         return
     msg = f"✅ Twitch `{twitch_name}` とリンクしました！Tier: {tier}"
     if streak is not None:
         msg += f", Streak: {streak}"
-    await user.send(msg)
+    # リンク完了の通知は停止中でも送る（届けば抑止リストから外れる）
+    try:
+        await user.send(msg)
+    except Exception as exc:
+        await asyncio.to_thread(
+            record_dm_outcome, discord_id, classify_dm_error(exc), source="link"
+        )
+        raise
+    await asyncio.to_thread(record_dm_outcome, discord_id, (DM_SENT, None), source="link")
 
 
 async def _send_dm(
     user: discord.User | discord.Member,
     message: str,
-    attachments: list[dict[str, Any]] | None = None,
-    file_url: str | None = None,
-    file_path: str | None = None,
-):
-    MAX_FILES_PER_MESSAGE = 10
-
-    async def _load_bytes(spec: dict[str, Any]) -> tuple[bytes, str] | None:
-        path = spec.get("path")
-        url = spec.get("url")
-        display_name = spec.get("name")
-        if path:
-            try:
-                if os.path.isfile(path):
-                    debug_print(f"[DM] reading local attachment: {path}")
-                    with open(path, "rb") as fp:
-                        data = fp.read()
-                    filename_local = (
-                        display_name or os.path.basename(path) or "attachment"
-                    )
-                    return data, filename_local
-                debug_print(f"[DM] local attachment not found: {path}")
-            except Exception as exc:
-                debug_print(f"[DM] failed reading local file: {exc!r}")
-        if url:
-            try:
-                async with httpx.AsyncClient(timeout=20) as client:
-                    debug_print(f"[DM] downloading attachment: {url}")
-                    response = await client.get(url)
-                    response.raise_for_status()
-                    filename_remote = (
-                        display_name or url.rsplit("/", 1)[-1] or "attachment"
-                    )
-                    debug_print(
-                        f"[DM] downloaded: status={response.status_code} bytes={len(response.content)}"
-                    )
-                    return response.content, filename_remote
-            except Exception as exc:
-                debug_print(f"[DM] failed downloading file: {exc!r}")
-        return None
-
-    def _make_file_objects(items: list[tuple[bytes, str]]) -> list[discord.File]:
-        files: list[discord.File] = []
-        for data, filename in items:
-            files.append(discord.File(io.BytesIO(data), filename))
-        return files
+    attachment_set: AttachmentSet | None = None,
+) -> DMOutcome:
+    """1 人分の DM を送る。添付はジョブ単位で読み込み済みの AttachmentSet を使う。"""
 
     async def _send_sequential(
         target: discord.User | discord.Member,
         text: str,
-        items: list[tuple[bytes, str]],
-    ) -> None:
+        prepared: AttachmentSet,
+    ) -> DMOutcome:
+        # 1通でも届けば sent。全滅なら最後のエラーで分類する
+        delivered = False
+        last_error: DMOutcome | None = None
         if text:
             try:
                 await target.send(content=text)
-                debug_print(
-                    f"[DM] sent text fallback -> user={getattr(target, 'id', '?')}"
-                )
+                delivered = True
             except Exception as exc:
-                debug_print(
-                    f"[DM] fallback text failed user={getattr(target, 'id', '?')}: {exc!r}"
+                last_error = classify_dm_error(exc)
+                dm_log.warning(
+                    "fallback text failed user=%s: %r", getattr(target, "id", "?"), exc
                 )
-        for data, filename in items:
+                if last_error[0] == DM_CLOSED:
+                    return last_error
+        for item in prepared.items:
             try:
-                await target.send(file=discord.File(io.BytesIO(data), filename))
-                debug_print(
-                    f"[DM] sent attachment fallback -> user={getattr(target, 'id', '?')} {filename}"
-                )
+                await target.send(file=item.to_file())
+                delivered = True
             except Exception as exc:
-                debug_print(
-                    f"[DM] fallback attachment failed user={getattr(target, 'id', '?')} file={filename}: {exc!r}"
+                last_error = classify_dm_error(exc)
+                dm_log.warning(
+                    "fallback attachment failed user=%s file=%s: %r",
+                    getattr(target, "id", "?"),
+                    item.filename,
+                    exc,
                 )
+                if last_error[0] == DM_CLOSED:
+                    return last_error
+        if delivered or last_error is None:
+            return DM_SENT, None
+        return last_error
 
+    # 成功は broadcast_dm の受信者ごとのログ（サンプリング対象）に任せ、ここでは失敗だけ出す
     try:
-        attachment_specs: list[dict[str, Any]] = []
-        if attachments:
-            for item in attachments:
-                if isinstance(item, dict):
-                    attachment_specs.append(
-                        {
-                            "url": item.get("url") or item.get("file_url"),
-                            "path": item.get("path") or item.get("file_path"),
-                            "name": item.get("name"),
-                        }
-                    )
-        if (file_url or file_path) and not attachment_specs:
-            attachment_specs.append(
-                {
-                    "url": file_url,
-                    "path": file_path,
-                    "name": None,
-                }
-            )
-
-        debug_print(
-            f"[DM] start -> user={getattr(user, 'id', '?')} attachments={len(attachment_specs)} msg_len={(len(message or ''))}"
-        )
-
-        prepared: list[tuple[bytes, str]] = []
-        for spec in attachment_specs:
-            loaded = await _load_bytes(spec)
-            if loaded is None:
-                continue
-            prepared.append(loaded)
-
-        if not prepared:
+        if not attachment_set:
             await user.send(content=message or None)
-            debug_print(f"[DM] sent text -> user={getattr(user, 'id', '?')}")
-            return
-
-        if len(prepared) > MAX_FILES_PER_MESSAGE:
-            debug_print(
-                f"[DM] too many attachments ({len(prepared)}) -> sending sequentially"
-            )
-            await _send_sequential(user, message, prepared)
-            return
+            return DM_SENT, None
 
         try:
-            files = _make_file_objects(prepared)
+            files = attachment_set.to_files()
             if len(files) == 1:
                 await user.send(content=(message or None), file=files[0])
             else:
                 await user.send(content=(message or None), files=files)
-            debug_print(
-                f"[DM] sent with {len(files)} attachment(s) -> user={getattr(user, 'id', '?')}"
-            )
+            return DM_SENT, None
+        except discord.Forbidden as exc:
+            # DM 拒否はフォールバックしても届かない
+            return classify_dm_error(exc)
         except discord.HTTPException as exc:
-            debug_print(
-                f"[DM] send with attachments failed user={getattr(user, 'id', '?')}: {exc!r}; falling back"
+            dm_log.warning(
+                "send with attachments failed user=%s: %r; falling back",
+                getattr(user, "id", "?"),
+                exc,
             )
-            await _send_sequential(user, message, prepared)
+            return await _send_sequential(user, message, attachment_set)
         except Exception as exc:
-            debug_print(
-                f"[DM] unexpected send error user={getattr(user, 'id', '?')}: {exc!r}; falling back"
+            dm_log.warning(
+                "unexpected send error user=%s: %r; falling back",
+                getattr(user, "id", "?"),
+                exc,
             )
-            await _send_sequential(user, message, prepared)
+            return await _send_sequential(user, message, attachment_set)
     except Exception as e:
-        debug_print(f"[DM] failed to {getattr(user, 'id', '?')}: {e!r}")
+        outcome = classify_dm_error(e)
+        # DM 拒否は想定内（broadcast_dm の受信者ログに残る）
+        if outcome[0] != DM_CLOSED:
+            dm_log.warning("failed to %s: %r", getattr(user, "id", "?"), e)
+        return outcome
+
+
+BROADCAST_JOBS = BroadcastJobRunner(bot, _send_dm)
+
+
+# ---- アウトボックス（EventSub → Discord の副作用） ----
+async def _outbox_roles(rows: list[dict]) -> dict[int, str]:
+    role_sync = bot.get_cog("RoleSyncCog")
+    if role_sync is None:
+        return {row["id"]: "RoleSyncCog is not loaded" for row in rows}
+    summary = await role_sync.reconciler.reconcile_members(unique_discord_ids(rows))
+    return {
+        row["id"]: "role edit failed"
+        for row in rows
+        if int(row["discord_id"]) in summary.failed_ids
+    }
+
+
+async def _outbox_milestone_dm(rows: list[dict]) -> dict[int, str]:
+    failures: dict[int, str] = {}
+    suppressed = await asyncio.to_thread(suppressed_ids, unique_discord_ids(rows))
+    for row in rows:
+        did = str(row["discord_id"])
+        if did in suppressed:
+            continue
+        try:
+            user = bot.get_user(int(did)) or await bot.fetch_user(int(did))
+        except discord.HTTPException as e:
+            failures[row["id"]] = repr(e)
+            continue
+        months = int((row.get("payload") or {}).get("months") or 0)
+        outcome = await _send_dm(user, build_milestone_message(months))
+        await asyncio.to_thread(record_dm_outcome, did, outcome, source="milestone")
+        # DM 拒否は再試行しても届かない
+        if outcome[0] == DM_FAILED:
+            failures[row["id"]] = outcome[1] or DM_FAILED
+    return failures
+
+
+async def _outbox_stream_online(rows: list[dict]) -> dict[int, str]:
+    for row in rows:
+        await notify_stream_online((row.get("payload") or {}).get("event") or {})
+    return {}
+
+
+OUTBOX = OutboxConsumer(
+    {
+        KIND_ROLES: _outbox_roles,
+        KIND_STREAM_ONLINE: _outbox_stream_online,
+        KIND_MILESTONE_DM: _outbox_milestone_dm,
+    }
+)
 
 
 def _coerce_int_list(value: Any) -> list[int]:
@@ -477,86 +392,6 @@ def _build_allowed_member_ids(streak_filters: list[int]) -> set[str]:
     return allowed
 
 
-async def notify_role_members(
-    role_id: int,
-    message: str,
-    attachments: list[dict[str, Any]] | None = None,
-    file_url: str | None = None,
-    file_path: str | None = None,
-    guild_id: int | None = None,
-    allowed_member_ids: set[str] | frozenset[str] | None = None,
-):
-    await bot.wait_until_ready()
-    attachments_count = len(attachments or [])
-    allowed_set: set[str] | None = None
-    if allowed_member_ids is not None:
-        allowed_set = {str(mid) for mid in allowed_member_ids}
-    debug_print(
-        f"[/send_role_dm] begin notify_role_members role_id={role_id} guild_id={guild_id} msg_len={(len(message or ''))} attachments={attachments_count} has_legacy_file={bool(file_url or file_path)} streak_filter={len(allowed_set) if allowed_set is not None else 'all'}"
-    )
-    guild: discord.Guild | None = None
-    if guild_id is not None:
-        guild = bot.get_guild(int(guild_id))
-    if guild is None:
-        # Try to find the guild that contains this role id
-        for g in bot.guilds:
-            if g.get_role(int(role_id)) is not None:
-                guild = g
-                break
-    if guild is None:
-        # Fallback to configured guild
-        try:
-            gid = get_guild_id()
-            guild = bot.get_guild(int(gid))
-        except Exception:
-            guild = None
-    if guild is None:
-        debug_print(f"[DM] guild not found for role {role_id}")
-        return
-    role = guild.get_role(int(role_id))
-    if role is None:
-        debug_print(f"[DM] role {role_id} not found in {guild.name}")
-        return
-    members = list(role.members)
-    targets: list[discord.Member] = []
-    for m in members:
-        if m.bot:
-            continue
-        if allowed_set is not None and str(m.id) not in allowed_set:
-            continue
-        targets.append(m)
-    debug_print(
-        f"[DM] target guild={guild.id}({guild.name}) role={role.id}({role.name}) members={len(members)} filtered={len(targets)}"
-    )
-    if not targets:
-        debug_print("[DM] no matching members for streak filter; abort send")
-        return
-    for m in targets:
-        # Per-user placeholder replacement (minimal): {user}
-        try:
-            dm_text = message
-            if dm_text and "{user}" in dm_text:
-                username = (
-                    getattr(m, "display_name", None)
-                    or getattr(m, "name", None)
-                    or str(m)
-                )
-                dm_text = dm_text.replace("{user}", str(username))
-        except Exception:
-            dm_text = message
-        await _send_dm(
-            m,
-            dm_text,
-            attachments=attachments,
-            file_url=file_url,
-            file_path=file_path,
-        )
-        await asyncio.sleep(0.3)
-    debug_print(
-        f"[/send_role_dm] done for role_id={role_id} guild_id={getattr(guild, 'id', None)}"
-    )
-
-
 async def notify_stream_online(event: dict[str, Any]) -> None:
     await bot.wait_until_ready()
     broadcaster_login = (
@@ -572,7 +407,7 @@ async def notify_stream_online(event: dict[str, Any]) -> None:
         or "配信者"
     )
     if not broadcaster_login:
-        debug_print("[stream.online] broadcaster login missing; skip notify")
+        stream_log.warning("stream.online without broadcaster login; no Twitch link")
     started_at_raw = event.get("started_at") or event.get("event_timestamp")
     started_display = None
     if started_at_raw:
@@ -586,19 +421,12 @@ async def notify_stream_online(event: dict[str, Any]) -> None:
     twitch_url = (
         f"https://www.twitch.tv/{broadcaster_login}" if broadcaster_login else None
     )
-    channel_map = load_channel_ids()
+    role_plan = await asyncio.to_thread(ROLE_PLANS.current)
 
     for guild in bot.guilds:
-        channel_id_value = STREAM_NOTIFY_CHANNEL_ID
-        if channel_id_value is None:
-            mapping = channel_map.get(str(guild.id)) or channel_map.get(guild.id)
-            if isinstance(mapping, dict):
-                channel_id_value = mapping.get(STREAM_NOTIFY_ROLE_NAME)
-        if not channel_id_value:
-            continue
-        try:
-            channel_id_int = int(channel_id_value)
-        except (TypeError, ValueError):
+        guild_plan = role_plan.guild(guild.id)
+        channel_id_int = guild_plan.notify_channel_id if guild_plan else None
+        if not channel_id_int:
             continue
 
         channel = guild.get_channel(channel_id_int)
@@ -606,12 +434,14 @@ async def notify_stream_online(event: dict[str, Any]) -> None:
             try:
                 channel = await guild.fetch_channel(channel_id_int)
             except Exception as exc:
-                debug_print(
-                    f"[stream.online] channel {channel_id_int} missing in guild {guild.id}: {exc!r}"
+                stream_log.warning(
+                    "channel %s missing in guild %s: %r", channel_id_int, guild.id, exc
                 )
                 continue
 
-        role = discord.utils.get(guild.roles, name=STREAM_NOTIFY_ROLE_NAME)
+        role = (
+            guild.get_role(guild_plan.notify_role_id) if guild_plan.notify_role_id else None
+        ) or discord.utils.get(guild.roles, name=role_plan.notify_role_name)
         mention = role.mention if role else ""
         lines = []
         if mention:
@@ -625,8 +455,8 @@ async def notify_stream_online(event: dict[str, Any]) -> None:
         try:
             await channel.send(message)
         except Exception as exc:
-            debug_print(
-                f"[stream.online] failed to send message to channel {channel_id_int}: {exc!r}"
+            stream_log.warning(
+                "failed to send message to channel %s: %r", channel_id_int, exc
             )
 
 
@@ -638,43 +468,23 @@ async def notify_link(
     tier: str,
     authorization: str | None = Header(None, alias="Authorization"),
 ):
-    if not _require_admin_token(authorization):
+    if not require_admin_token(authorization):
         return PlainTextResponse("forbidden", status_code=403)
     schedule_in_bot_loop(notify_discord_user(discord_id, twitch_name, tier))
     return {"status": "queued"}
 
 
 # ===== 管理API: ロール一覧とロールDMキュー =====
-ADMIN_API_TOKEN = get_admin_api_token()
-
-
-def _require_admin_token(auth_header: str | None) -> bool:
-    if not ADMIN_API_TOKEN:
-        debug_print("[ADMIN] token check: server-side token missing (reject)")
-        return False
-    if not auth_header:
-        debug_print("[ADMIN] token check: Authorization header missing (reject)")
-        return False
-    try:
-        scheme, token = auth_header.split(" ", 1)
-    except ValueError:
-        debug_print("[ADMIN] token check: malformed Authorization header (reject)")
-        return False
-    ok = scheme.lower() == "bearer" and token.strip() == ADMIN_API_TOKEN
-    debug_print(f"[ADMIN] token check: {'ok' if ok else 'reject'}")
-    return ok
-
-
 @app.get("/guilds")
 async def list_guilds(authorization: str | None = Header(None, alias="Authorization")):
-    if not _require_admin_token(authorization):
+    if not require_admin_token(authorization):
         return PlainTextResponse("forbidden", status_code=403)
     await bot.wait_until_ready()
     guilds = [
         {"id": g.id, "name": g.name}
         for g in sorted(bot.guilds, key=lambda x: x.name.lower())
     ]
-    debug_print(f"[/guilds] return {len(guilds)} guild(s)")
+    log.debug("/guilds return %d guild(s)", len(guilds))
     return {"guilds": guilds}
 
 
@@ -683,7 +493,7 @@ async def list_roles(
     authorization: str | None = Header(None, alias="Authorization"),
     guild_id: int | None = None,
 ):
-    if not _require_admin_token(authorization):
+    if not require_admin_token(authorization):
         return PlainTextResponse("forbidden", status_code=403)
     await bot.wait_until_ready()
     guild: discord.Guild | None = None
@@ -696,42 +506,160 @@ async def list_roles(
         except Exception:
             guild = None
     if guild is None:
-        debug_print(f"[/roles] guild not found (guild_id={guild_id}) -> []")
+        log.info("/roles guild not found (guild_id=%s) -> []", guild_id)
         return JSONResponse({"roles": []})
     roles = [
         {"id": r.id, "name": r.name}
         for r in sorted(guild.roles, key=lambda x: x.position, reverse=True)
         if r.name != "@everyone"
     ]
-    debug_print(f"[/roles] guild={guild.id}({guild.name}) roles={len(roles)}")
+    log.debug("/roles guild=%s(%s) roles=%d", guild.id, guild.name, len(roles))
     return {"roles": roles}
 
 
+ROLE_SET_MODES = ("union", "intersection")
+
+
+def _member_recipient_entry(member: discord.Member) -> dict[str, Any]:
+    display_name = (
+        getattr(member, "display_name", None)
+        or getattr(member, "nick", None)
+        or getattr(member, "name", None)
+        or str(member)
+    )
+    username = getattr(member, "name", None) or str(member)
+    return {
+        "id": int(member.id),
+        "display_name": str(display_name),
+        "username": str(username),
+        "discriminator": getattr(member, "discriminator", None),
+    }
+
+
+class UnknownRolesError(ValueError):
+    """指定されたロールがギルドに存在しない（削除済みなど）。"""
+
+    def __init__(self, role_ids: list[int]) -> None:
+        super().__init__(f"unknown role ids: {role_ids}")
+        self.role_ids = role_ids
+
+
+async def _resolve_role_recipients(
+    guild_id: int | None,
+    role_ids: list[int],
+    mode: str,
+    exclude_role_ids: list[int],
+    allowed_member_ids: set[str] | None,
+) -> tuple[
+    discord.Guild | None, list[discord.Role], list[discord.Role], list[dict[str, Any]]
+]:
+    """複数ロールの和集合／積集合から除外ロールを引き、重複なしの受信者を返す。"""
+    guild: discord.Guild | None = None
+    if guild_id is not None:
+        guild = bot.get_guild(int(guild_id))
+    if guild is None:
+        for candidate in bot.guilds:
+            if any(candidate.get_role(rid) is not None for rid in role_ids):
+                guild = candidate
+                break
+    if guild is None:
+        try:
+            guild = bot.get_guild(int(get_guild_id()))
+        except Exception:
+            guild = None
+    if guild is None:
+        return None, [], [], []
+
+    # 存在しないロールを黙って落とすと、積集合の条件が緩んで意図しない相手に届く
+    missing = [rid for rid in role_ids if guild.get_role(rid) is None]
+    if missing:
+        raise UnknownRolesError(missing)
+    roles = [r for r in (guild.get_role(rid) for rid in role_ids) if r is not None]
+    excluded = [
+        r for r in (guild.get_role(rid) for rid in exclude_role_ids) if r is not None
+    ]
+    if not roles:
+        return guild, [], excluded, []
+
+    # 保持者はロールごとに 1 回だけ集める（キャッシュを絞っているときはチャンクを取り寄せる）
+    holders = await MEMBER_CACHE.role_members(
+        guild, [r.id for r in roles] + [r.id for r in excluded]
+    )
+    members: dict[int, discord.Member] = {}
+    selected: set[int] | None = None
+    for role in roles:
+        ids: set[int] = set()
+        for member in holders.get(role.id, []):
+            members[member.id] = member
+            ids.add(member.id)
+        if selected is None:
+            selected = ids
+        elif mode == "intersection":
+            selected &= ids
+        else:
+            selected |= ids
+    excluded_ids: set[int] = set()
+    for role in excluded:
+        excluded_ids.update(m.id for m in holders.get(role.id, []))
+
+    recipients: list[dict[str, Any]] = []
+    for member_id in sorted((selected or set()) - excluded_ids):
+        member = members[member_id]
+        if getattr(member, "bot", False):
+            continue
+        if allowed_member_ids is not None and str(member_id) not in allowed_member_ids:
+            continue
+        recipients.append(_member_recipient_entry(member))
+    return guild, roles, excluded, recipients
+
+
 @app.post("/send_role_dm")
 async def send_role_dm(
     request: Request,
     authorization: str | None = Header(None, alias="Authorization"),
 ):
-    if not _require_admin_token(authorization):
+    """ロール指定の DM 一斉送信（プレビュー / ジョブ投入）。
+
+    role_ids（旧形式の role_id も可）を role_mode=union|intersection で合成し、
+    exclude_role_ids に含まれるメンバーを除いた上で 1 人 1 通に重複排除する。
+    """
+    if not require_admin_token(authorization):
         return PlainTextResponse("forbidden", status_code=403)
     payload = await request.json()
-    role_id = int(payload.get("role_id"))
+    role_ids = _coerce_int_list(payload.get("role_ids"))
+    if not role_ids:
+        role_ids = _coerce_int_list(payload.get("role_id"))
+    if not role_ids:
+        return JSONResponse({"error": "role_ids_required"}, status_code=400)
+    role_mode = str(payload.get("role_mode") or "union").lower()
+    if role_mode not in ROLE_SET_MODES:
+        return JSONResponse(
+            {"error": "invalid_role_mode", "allowed": list(ROLE_SET_MODES)},
+            status_code=400,
+        )
+    exclude_role_ids = [
+        rid
+        for rid in _coerce_int_list(payload.get("exclude_role_ids"))
+        if rid not in role_ids
+    ]
     message = str(payload.get("message") or "")
     file_url = payload.get("file_url")
     file_path = payload.get("file_path")
     attachments_payload = payload.get("attachments") or []
-    attachments: list[dict[str, Any]] = []
-    if isinstance(attachments_payload, list):
-        for item in attachments_payload:
-            if not isinstance(item, dict):
-                continue
-            attachments.append(
-                {
-                    "url": item.get("url") or item.get("file_url"),
-                    "path": item.get("path") or item.get("file_path"),
-                    "name": item.get("name"),
-                }
-            )
+    attachments = normalize_attachment_specs(
+        attachments_payload if isinstance(attachments_payload, list) else [],
+        file_url,
+        file_path,
+    )
+    if len(attachments) > MAX_FILES_PER_MESSAGE:
+        return JSONResponse(
+            {
+                "error": "too_many_attachments",
+                "count": len(attachments),
+                "max": MAX_FILES_PER_MESSAGE,
+            },
+            status_code=400,
+        )
     guild_id_value = payload.get("guild_id")
     # Validate placeholders and reject unknown ones
     unknown = _unknown_placeholders(message)
@@ -744,121 +672,243 @@ async def send_role_dm(
             },
             status_code=400,
         )
-    attachments_count = len(attachments)
-    if attachments_count == 0 and (file_url or file_path):
-        attachments.append({"url": file_url, "path": file_path, "name": None})
-        attachments_count = len(attachments)
 
     streak_filters = _coerce_int_list(payload.get("streak_filters"))
     allowed_member_ids: set[str] | None = None
     if streak_filters:
-        allowed_member_ids = _build_allowed_member_ids(streak_filters)
+        allowed_member_ids = await asyncio.to_thread(
+            _build_allowed_member_ids, streak_filters
+        )
     preview_only = bool(payload.get("preview_only"))
 
     guild_id: int | None = int(guild_id_value) if guild_id_value else None
 
-    debug_print(
-        f"[/send_role_dm] payload role_id={role_id} guild_id={guild_id} msg_len={(len(message or ''))} attachments={attachments_count} streak_filters={streak_filters or 'all'} preview_only={preview_only}"
+    log.debug(
+        "/send_role_dm payload role_ids=%s mode=%s exclude=%s guild_id=%s msg_len=%d "
+        "attachments=%d streak_filters=%s preview_only=%s",
+        role_ids,
+        role_mode,
+        exclude_role_ids,
+        guild_id,
+        len(message or ""),
+        len(attachments),
+        streak_filters or "all",
+        preview_only,
     )
 
     await bot.wait_until_ready()
     resolved_guild: discord.Guild | None = None
-    resolved_role: discord.Role | None = None
+    resolved_roles: list[discord.Role] = []
+    excluded_roles: list[discord.Role] = []
     recipients: list[dict[str, Any]] = []
     try:
-        if guild_id is not None:
-            resolved_guild = bot.get_guild(int(guild_id))
-        if resolved_guild is None:
-            for guild in bot.guilds:
-                role_candidate = guild.get_role(int(role_id))
-                if role_candidate is not None:
-                    resolved_guild = guild
-                    resolved_role = role_candidate
-                    break
-        if resolved_guild is None:
-            try:
-                fallback_gid = get_guild_id()
-                resolved_guild = bot.get_guild(int(fallback_gid))
-            except Exception:
-                resolved_guild = None
-        if resolved_guild and resolved_role is None:
-            resolved_role = resolved_guild.get_role(int(role_id))
-        if resolved_role:
-            for member in resolved_role.members:
-                if getattr(member, "bot", False):
-                    continue
-                if allowed_member_ids is not None and str(member.id) not in allowed_member_ids:
-                    continue
-                display_name = (
-                    getattr(member, "display_name", None)
-                    or getattr(member, "nick", None)
-                    or getattr(member, "name", None)
-                    or str(member)
-                )
-                username = getattr(member, "name", None) or str(member)
-                discriminator = getattr(member, "discriminator", None)
-                recipients.append(
-                    {
-                        "id": int(member.id),
-                        "display_name": str(display_name),
-                        "username": str(username),
-                        "discriminator": discriminator,
-                    }
+        # メンバーのチャンク取得は Bot ループの Future を待つので、API を別スレッドで
+        # 動かしているとき（API_SERVER_MODE=thread）も Bot ループ上で解決する
+        resolved_guild, resolved_roles, excluded_roles, recipients = (
+            await call_in_bot_loop(
+                _resolve_role_recipients(
+                    guild_id, role_ids, role_mode, exclude_role_ids, allowed_member_ids
                 )
-        debug_print(
-            f"[/send_role_dm] resolved recipients={len(recipients)} guild={getattr(resolved_guild, 'id', None)}"
+            )
+        )
+        log.debug(
+            "/send_role_dm resolved recipients=%d roles=%d excluded_roles=%d guild=%s",
+            len(recipients),
+            len(resolved_roles),
+            len(excluded_roles),
+            getattr(resolved_guild, "id", None),
+        )
+    except UnknownRolesError as exc:
+        return JSONResponse(
+            {"error": "unknown_roles", "role_ids": exc.role_ids}, status_code=400
         )
     except Exception as exc:
-        debug_print(f"[/send_role_dm] failed to resolve recipients: {exc!r}")
+        # 0 人として続けると、失敗が「該当者なし」に見えてしまう
+        log.exception("/send_role_dm failed to resolve recipients: %r", exc)
+        return JSONResponse(
+            {"error": "resolve_failed", "detail": repr(exc)}, status_code=500
+        )
 
-    allowed_member_ids_frozen = (
-        frozenset(allowed_member_ids) if allowed_member_ids is not None else None
+    role_names = [r.name for r in resolved_roles]
+    suppressed = await asyncio.to_thread(
+        suppressed_ids, [item["id"] for item in recipients]
     )
-
-    if not preview_only:
-        schedule_in_bot_loop(
-            notify_role_members(
-                role_id,
-                message,
-                attachments,
-                file_url,
-                file_path,
-                (
-                    int(guild_id)
-                    if guild_id is not None
-                    else getattr(resolved_guild, "id", None)
-                ),
-                allowed_member_ids=allowed_member_ids_frozen,
-            )
-        )
-        debug_print("[/send_role_dm] queued notify task")
+    for item in recipients:
+        item["suppressed"] = str(item["id"]) in suppressed
+    job_id: str | None = None
+    if preview_only:
+        log.debug("/send_role_dm preview only; job not created")
+    elif not recipients:
+        log.info("/send_role_dm no matching members; job not created")
     else:
-        debug_print("[/send_role_dm] preview_only=True -> skip notify task")
+        # 受信者をスナップショットして永続ジョブ化（再起動しても未送信分から再開できる）
+        spec = {
+            "message": message,
+            "attachments": attachments,
+            "guild_id": getattr(resolved_guild, "id", None),
+            "role_ids": role_ids,
+            "role_mode": role_mode,
+            "exclude_role_ids": exclude_role_ids,
+            "role_name": "、".join(role_names) or None,
+            "streak_filters": streak_filters,
+        }
+        job_id = await asyncio.to_thread(create_job, spec, recipients)
+        schedule_in_bot_loop(_start_broadcast_job(job_id))
+        log.info("/send_role_dm queued job=%s recipients=%d", job_id, len(recipients))
     return {
         "status": "preview" if preview_only else "queued",
+        "job_id": job_id,
         "recipients": recipients,
         "recipient_count": len(recipients),
+        "suppressed_count": len(suppressed),
         "guild_id": getattr(resolved_guild, "id", None),
         "guild_name": getattr(resolved_guild, "name", None),
-        "role_id": role_id,
-        "role_name": getattr(resolved_role, "name", None),
+        "role_ids": role_ids,
+        "role_mode": role_mode,
+        "roles": [{"id": r.id, "name": r.name} for r in resolved_roles],
+        "excluded_roles": [{"id": r.id, "name": r.name} for r in excluded_roles],
+        "role_name": "、".join(role_names) or None,
         "preview_only": preview_only,
     }
 
 
+async def _start_broadcast_job(job_id: str) -> None:
+    BROADCAST_JOBS.start(job_id)
+
+
+# SSE: 通知をまとめる間隔とキープアライブ間隔（秒）
+BROADCAST_EVENTS_MIN_INTERVAL = 0.5
+BROADCAST_EVENTS_KEEPALIVE = 15.0
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/broadcast/jobs/{job_id}/events")
+async def broadcast_jobs_events(
+    job_id: str,
+    request: Request,
+    authorization: str | None = Header(None, alias="Authorization"),
+):
+    """進捗を Server-Sent Events で配信する（ProgressHub を購読、SQLite は初回のみ）。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    initial = PROGRESS_HUB.snapshot(job_id)
+    if initial is None:
+        job = await asyncio.to_thread(broadcast_job_get, job_id)
+        if job is None:
+            return JSONResponse({"error": "not_found"}, status_code=404)
+        initial = progress_from_job(job)
+
+    async def _stream():
+        sub = PROGRESS_HUB.subscribe(job_id)
+        try:
+            yield "retry: 3000\n\n"
+            current, last_sent = initial, None
+            while True:
+                if current != last_sent:
+                    yield _sse("progress", current)
+                    last_sent = current
+                if current.get("status") in BROADCAST_TERMINAL_STATUSES:
+                    yield _sse("end", current)
+                    return
+                if await request.is_disconnected():
+                    return
+                if not await sub.wait(BROADCAST_EVENTS_KEEPALIVE):
+                    yield ": keep-alive\n\n"
+                    continue
+                # 連続した更新はまとめて 1 回だけ送る
+                await asyncio.sleep(BROADCAST_EVENTS_MIN_INTERVAL)
+                current = PROGRESS_HUB.snapshot(job_id) or current
+        finally:
+            sub.close()
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/broadcast/jobs/{job_id}/{action}")
+async def broadcast_jobs_action(
+    job_id: str,
+    action: str,
+    authorization: str | None = Header(None, alias="Authorization"),
+):
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    handler = {
+        "pause": BROADCAST_JOBS.pause,
+        "resume": BROADCAST_JOBS.resume,
+        "cancel": BROADCAST_JOBS.cancel,
+    }.get(action)
+    if handler is None:
+        return JSONResponse({"error": "unknown_action"}, status_code=400)
+    # ランナーの状態は Bot ループ側で持つので、そちらで実行して結果を待つ
+    ok = await call_in_bot_loop(handler(job_id))
+    job = await asyncio.to_thread(broadcast_job_get, job_id)
+    if job is None:
+        return JSONResponse({"error": "not_found"}, status_code=404)
+    log.info("/broadcast/jobs %s job=%s ok=%s", action, job_id, ok)
+    return JSONResponse({"ok": bool(ok), "job": job}, status_code=200 if ok else 409)
+
+
+@app.post("/roles/reconcile")
+async def roles_reconcile(
+    request: Request,
+    authorization: str | None = Header(None, alias="Authorization"),
+):
+    """連携ロールのリコンサイルを即時実行する（discord_ids 指定時はその人だけ）。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    try:
+        payload = await request.json()
+    except Exception:
+        payload = {}
+    role_sync = bot.get_cog("RoleSyncCog")
+    if role_sync is None:
+        return JSONResponse({"error": "role_sync_not_loaded"}, status_code=503)
+    ids = payload.get("discord_ids") if isinstance(payload, dict) else None
+    if ids:
+        coro = role_sync.reconciler.reconcile_members([str(i) for i in ids])
+    else:
+        coro = role_sync.reconciler.reconcile_all()
+    summary = await call_in_bot_loop(coro)
+    return JSONResponse(summary.as_dict())
+
+
+@app.get("/scheduler/runs")
+async def scheduler_runs(
+    authorization: str | None = Header(None, alias="Authorization"),
+    job_id: str | None = None,
+    limit: int = 50,
+):
+    """定期ジョブの実行履歴（新しい順）とこのプロセスがリーダーかどうか。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    runs = await asyncio.to_thread(
+        scheduler_runs_recent, max(1, min(limit, 500)), job_id
+    )
+    return JSONResponse(
+        {"owner": SCHEDULER.owner, "is_leader": SCHEDULER.is_leader, "runs": runs}
+    )
+
+
 @app.get("/eventsub/subscriptions")
 async def eventsub_list(
     authorization: str | None = Header(None, alias="Authorization"),
     status: str | None = None,
 ):
-    if not _require_admin_token(authorization):
+    if not require_admin_token(authorization):
         return PlainTextResponse("forbidden", status_code=403)
     try:
         subs = await list_eventsub_subscriptions(status=status)
         callback_url, _ = get_eventsub_config()
         return {"subscriptions": subs, "default_callback": callback_url}
     except Exception as exc:
-        debug_print(f"[EventSub][list] failed: {exc!r}")
+        eventsub_log.exception("list subscriptions failed: %r", exc)
         return JSONResponse({"error": str(exc)}, status_code=500)
 
 
@@ -867,7 +917,7 @@ async def eventsub_create(
     request: Request,
     authorization: str | None = Header(None, alias="Authorization"),
 ):
-    if not _require_admin_token(authorization):
+    if not require_admin_token(authorization):
         return PlainTextResponse("forbidden", status_code=403)
     payload = await request.json()
     sub_type = str(payload.get("type") or "").strip()
@@ -886,7 +936,7 @@ async def eventsub_create(
             secret=secret,
         )
     except Exception as exc:
-        debug_print(f"[EventSub][create] failed: {exc!r}")
+        eventsub_log.exception("create subscription failed: %r", exc)
         return JSONResponse({"error": str(exc)}, status_code=500)
 
     ok = 200 <= twitch_status < 300
@@ -903,12 +953,12 @@ async def eventsub_delete(
     subscription_id: str,
     authorization: str | None = Header(None, alias="Authorization"),
 ):
-    if not _require_admin_token(authorization):
+    if not require_admin_token(authorization):
         return PlainTextResponse("forbidden", status_code=403)
     try:
         twitch_status = await delete_eventsub_subscription(subscription_id)
     except Exception as exc:
-        debug_print(f"[EventSub][delete] failed: {exc!r}")
+        eventsub_log.exception("delete subscription failed: %r", exc)
         return JSONResponse({"error": str(exc)}, status_code=500)
 
     ok = 200 <= twitch_status < 300
@@ -921,231 +971,223 @@ async def eventsub_delete(
 
 
 # ---- API: Twitch OAuth コールバック ----
-@app.get("/twitch_callback")
-async def twitch_callback(request: Request):
-    debug_print("✅ [twitch_callback] にアクセスがありました")
-    code = request.query_params.get("code")
-    state = request.query_params.get("state")  # DiscordのユーザーID（str）
-
-    if not code or not state:
-        return PlainTextResponse("Missing code or state", status_code=400)
-
-    # 1) Twitch クレデンシャル
-    try:
-        client_id, client_secret, redirect_uri = get_twitch_keys()
-    except Exception as e:
-        return PlainTextResponse(f"Failed to read credentials: {e!r}", status_code=500)
-
-    # 2) アクセストークン取得（非同期 httpx）
-    token_url = "https://id.twitch.tv/oauth2/token"
-    payload = {
-        "client_id": client_id,
-        "client_secret": client_secret,
-        "code": code,
-        "grant_type": "authorization_code",
-        "redirect_uri": redirect_uri,
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-    try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.post(token_url, data=payload, headers=headers)
-    except httpx.HTTPError as e:
-        return PlainTextResponse(f"Token request failed: {e!r}", status_code=502)
+async def _finalize_link(discord_id: int, record: dict) -> None:
+    link_cog = bot.get_cog("LinkCog")
+    if link_cog is None:
+        link_log.warning("LinkCog is not loaded; skip roles/DM")
+        return
+    await link_cog.finalize_link(discord_id, record)
 
-    if resp.status_code != 200:
-        return PlainTextResponse(f"Failed to get token: {resp.text}", status_code=502)
 
-    data = resp.json()
-    access_token = data.get("access_token")
-    if not access_token:
-        return PlainTextResponse("Access token not found", status_code=502)
+LINK_JOBS = LinkJobRunner(bot, _finalize_link)
 
-    # 3) broadcaster_id を解決
-    try:
-        broadcaster_id_raw = get_broadcast_id()
-        BROADCASTER_ID = str(broadcaster_id_raw)
-        debug_print(f"[DEBUG] get_broadcast_id -> {BROADCASTER_ID!r}")
-    except Exception as e:
-        return PlainTextResponse(
-            f"Failed to resolve broadcaster_id: {e!r}", status_code=500
-        )
 
-    # 4) ユーザー情報 & サブスク情報（dict 返り値）
-    try:
-        info = await get_user_info_and_subscription(
-            viewer_access_token=access_token,
-            client_id=client_id,
-            broadcaster_id=BROADCASTER_ID,
-        )
-    except httpx.HTTPError as e:
-        return PlainTextResponse(f"Helix request failed: {e!r}", status_code=502)
-    except Exception as e:
-        return PlainTextResponse(
-            f"Failed to fetch user/sub info: {e!r}", status_code=500
-        )
+async def _start_link_job(job_id: str) -> None:
+    LINK_JOBS.start(job_id)
 
-    twitch_user_name = info.get("twitch_username")
-    if not twitch_user_name:
-        return PlainTextResponse("Failed to get Twitch user info", status_code=502)
 
-    # 5) リンク情報を保存（streak自前更新版）
-    try:
-        # debug_print("reconcile_and_save_link success")
-        rec = reconcile_and_save_link(str(state), info)
-    except Exception as e:
-        debug_print(f"❌ reconcile_and_save_link failed: {e!r}")
-        rec = info  # 万一失敗したら元のinfoを使う
+async def _on_link_job_queued(job_id: str) -> None:
+    schedule_in_bot_loop(_start_link_job(job_id))
 
-    # 6) Discord通知
-    try:
-        # Disabled to avoid duplicate DM; handled in LinkCog
-        if False:
-            schedule_in_bot_loop(
-                notify_discord_user(
-                    int(state),
-                    rec.get("twitch_username"),
-                    rec.get("tier"),
-                    rec.get("streak_months", 0),
-                )
-            )
-    except Exception as e:
-        debug_print("❌ failed to schedule notify:", repr(e))
 
-    return PlainTextResponse("連携完了", status_code=200)
+async def _on_outbox_queued() -> None:
+    OUTBOX.notify()
 
 
-# ---- EventSub Webhook ----
-def _hmac_sha256(secret: str, message: bytes) -> str:
-    mac = hmac.new(secret.encode("utf-8"), message, hashlib.sha256)
-    return "sha256=" + mac.hexdigest()
+# OAuth コールバック・EventSub・読み取り専用の管理 API（受付専用プロセスと共通）
+app.include_router(
+    build_ingress_router(on_link_job=_on_link_job_queued, on_queued=_on_outbox_queued)
+)
 
 
-def _verify_signature(
-    secret: str, msg_id: str, msg_ts: str, body: bytes, signature: str
-) -> bool:
-    message = (msg_id + msg_ts).encode("utf-8") + body
-    expected = _hmac_sha256(secret, message)
-    return hmac.compare_digest(expected, signature)
+@app.post(WAKE_PATH)
+async def internal_wake(
+    request: Request,
+    authorization: str | None = Header(None, alias="Authorization"),
+):
+    """受付専用プロセスがキューに積んだことを知らせる（ポーリングを待たずに処理する）。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    try:
+        payload = await request.json()
+    except Exception:
+        payload = {}
+    job_id = payload.get("link_job_id") if isinstance(payload, dict) else None
+    if job_id:
+        schedule_in_bot_loop(_start_link_job(str(job_id)))
+    OUTBOX.notify()
+    return {"status": "ok"}
+
+
+@app.get("/debug/loop")
+async def debug_loop(authorization: str | None = Header(None, alias="Authorization")):
+    """Bot ループ（thread モードでは uvicorn のループも）のラグとブロッキング箇所。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    return loop_monitor_snapshot()
 
 
-def _find_discord_ids_by_twitch_id(twitch_user_id: str) -> list[str]:
-    users = load_users()
-    res = []
-    for did, info in users.items():
-        if isinstance(info, dict) and str(info.get("twitch_user_id")) == str(
-            twitch_user_id
-        ):
-            res.append(str(did))
-    return res
+@app.get("/debug/profile/cpu")
+async def debug_profile_cpu(
+    seconds: float = 10.0,
+    hz: int = DEFAULT_HZ,
+    authorization: str | None = Header(None, alias="Authorization"),
+):
+    """全スレッドを seconds 秒サンプリングして collapsed 形式で返す（flamegraph.pl / speedscope 用）。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    try:
+        result = await asyncio.to_thread(sample_stacks, seconds, hz)
+    except ProfilerBusy:
+        return JSONResponse({"error": "profile_running"}, status_code=409)
+    stamp = dt.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return PlainTextResponse(
+        result["collapsed"],
+        headers={
+            "Content-Disposition": f'attachment; filename="neibot-cpu-{stamp}.collapsed"',
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Seconds": str(result["seconds"]),
+        },
+    )
 
 
-@app.get("/twitch_eventsub")
-async def twitch_eventsub_probe() -> PlainTextResponse:
-    """Health check endpoint for Twitch verification pings (GET)."""
-    return PlainTextResponse("ok", status_code=200)
+@app.post("/debug/profile/memory/start")
+async def debug_profile_memory_start(
+    frames: int = 1, authorization: str | None = Header(None, alias="Authorization")
+):
+    """tracemalloc を開始（済みなら基準のスナップショットだけ取り直す）。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    return await asyncio.to_thread(MEMORY.start, frames)
 
 
-@app.head("/twitch_eventsub")
-async def twitch_eventsub_head() -> PlainTextResponse:
-    """Respond to HEAD requests with empty 200 to satisfy preflight checks."""
-    return PlainTextResponse("", status_code=200)
+@app.get("/debug/profile/memory")
+async def debug_profile_memory(
+    top: int = 20,
+    key: str = "lineno",
+    authorization: str | None = Header(None, alias="Authorization"),
+):
+    """前回のスナップショットから増えた割り当ての上位 top 件。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    return await asyncio.to_thread(MEMORY.diff, top, key)
 
 
-@app.post("/twitch_eventsub")
-async def twitch_eventsub(
-    request: Request,
-    twitch_msg_id: str = Header(None, alias="Twitch-Eventsub-Message-Id"),
-    twitch_msg_type: str = Header(None, alias="Twitch-Eventsub-Message-Type"),
-    twitch_msg_ts: str = Header(None, alias="Twitch-Eventsub-Message-Timestamp"),
-    twitch_signature: str = Header(None, alias="Twitch-Eventsub-Message-Signature"),
+@app.post("/debug/profile/memory/stop")
+async def debug_profile_memory_stop(
+    authorization: str | None = Header(None, alias="Authorization"),
 ):
-    body_bytes = await request.body()
-    if body_bytes is None:
-        body_bytes = b""
-    try:
-        data = json.loads(body_bytes.decode("utf-8") or "{}")
-        if not isinstance(data, dict):
-            data = {}
-    except Exception:
-        data = {}
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    return await asyncio.to_thread(MEMORY.stop)
 
-    if twitch_msg_type == "webhook_callback_verification":
-        challenge = data.get("challenge")
-        debug_print("[EventSub] verification")
-        return PlainTextResponse(challenge or "", status_code=200)
 
-    try:
-        _, secret = get_eventsub_config()
-    except Exception as e:
-        return PlainTextResponse(f"EventSub secret missing: {e}", status_code=500)
+@app.get("/debug/profile/tasks")
+async def debug_profile_tasks(authorization: str | None = Header(None, alias="Authorization")):
+    """Bot ループ（thread モードでは API のループも）の asyncio タスクと await のスタック。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
 
-    if not (twitch_msg_id and twitch_msg_ts and twitch_signature):
-        return PlainTextResponse("missing headers", status_code=400)
+    async def _dump(name: str) -> dict:
+        return dump_tasks(name)
 
-    if not _verify_signature(
-        secret, twitch_msg_id, twitch_msg_ts, body_bytes, twitch_signature
-    ):
-        return PlainTextResponse("invalid signature", status_code=403)
+    loops = [await call_in_bot_loop(_dump("bot"))]
+    if not _on_bot_loop():
+        loops.append(dump_tasks("api"))
+    return {"loops": loops}
 
-    if twitch_msg_type == "notification":
-        sub_type = (data.get("subscription") or {}).get("type")
-        event = data.get("event") or {}
-        debug_print(f"[EventSub] notify: {sub_type}")
 
-        try:
-            inbox_enqueue_event(
-                source="twitch",
-                delivery_id=str(twitch_msg_id),
-                event_type=str(sub_type or ""),
-                twitch_user_id=str(
-                    event.get("user_id")
-                    or event.get("user")
-                    or event.get("user_login")
-                    or ""
-                )
-                or None,
-                payload=data,
-                headers={
-                    "Twitch-Eventsub-Message-Id": twitch_msg_id,
-                    "Twitch-Eventsub-Message-Type": twitch_msg_type,
-                    "Twitch-Eventsub-Message-Timestamp": twitch_msg_ts,
-                },
-                status="pending",
-            )
-        except Exception as e:
-            debug_print(f"[EventSub][inbox] enqueue failed: {e!r}")
+@app.get("/debug/requests")
+async def debug_requests(authorization: str | None = Header(None, alias="Authorization")):
+    """ルートごとの所要時間・DB 時間と、最近の遅い SQL（実行計画付き）。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    return timing_snapshot()
 
-        try:
-            matched = apply_event_to_linked_users(sub_type, event, twitch_msg_ts)
-            if sub_type == "stream.online":
-                schedule_in_bot_loop(notify_stream_online(event))
-            inbox_mark_processed("twitch", str(twitch_msg_id), ok=True)
-            return JSONResponse({"status": "ok", "matched": matched})
-        except Exception as e:
-            debug_print(f"[EventSub] apply failed: {e!r}")
-            inbox_mark_processed("twitch", str(twitch_msg_id), ok=False, error=str(e))
-            return JSONResponse({"status": "ok", "matched": 0})
 
-    if twitch_msg_type == "revocation":
-        debug_print("[EventSub] revoked:", data)
-        return JSONResponse({"status": "revoked"})
+@app.get("/metrics")
+async def metrics(authorization: str | None = Header(None, alias="Authorization")):
+    """Prometheus のテキスト形式（このプロセスの値。滞留数は DB から読む）。"""
+    if not require_admin_token(authorization):
+        return PlainTextResponse("forbidden", status_code=403)
+    body = await asyncio.to_thread(render_metrics)
+    return PlainTextResponse(body, media_type=CONTENT_TYPE)
 
-    return PlainTextResponse("ignored", status_code=200)
 
+# ===== FastAPI の起動 =====
+# single: Bot と同じイベントループで uvicorn を動かす（既定）
+# thread: 従来どおり別スレッド・別ループで動かす（問題があったときの退避用）
+API_SERVER_MODE = (os.getenv("API_SERVER_MODE") or "single").strip().lower()
+SHUTDOWN_TIMEOUT_SEC = 10.0
 
-# ===== FastAPI を別スレッドで起動 =====
-def start_api():
+
+def _api_config() -> uvicorn.Config:
+    # 受付を別プロセス（bot/ingress_app.py）に分けたときは IPC のアドレスだけで待ち受ける
+    ipc = parse_ipc_address(BOT_IPC_ADDRESS)
+    if ipc is not None:
+        return uvicorn.Config(app, log_level="info", **ipc.uvicorn_kwargs())
     host = os.getenv("FASTAPI_HOST", "127.0.0.1")
     try:
         port = int(os.getenv("FASTAPI_PORT", "8000"))
     except ValueError:
         port = 8000
-    uvicorn.run(app, host=host, port=port, log_level="info")
+    return uvicorn.Config(app, host=host, port=port, log_level="info")
+
+
+class _EmbeddedServer(uvicorn.Server):
+    """シグナルは run_single_loop 側で受ける（uvicorn だけが止まるのを防ぐ）。"""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+def start_api():
+    uvicorn.Server(_api_config()).run()
+
+
+async def run_single_loop() -> None:
+    """uvicorn と Discord Bot を 1 つのループで動かし、どちらかが止まったら両方止める。"""
+    global BOT_LOOP
+    loop = asyncio.get_running_loop()
+    BOT_LOOP = loop
+    server = _EmbeddedServer(_api_config())
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Windows 等: Ctrl+C は KeyboardInterrupt として __main__ で受ける
+            pass
+
+    api_task = asyncio.create_task(server.serve(), name="uvicorn")
+    bot_task = asyncio.create_task(run_discord_bot(), name="discord-bot")
+    stop_task = asyncio.create_task(stop.wait(), name="shutdown-signal")
+    done, _ = await asyncio.wait(
+        {api_task, bot_task, stop_task}, return_when=asyncio.FIRST_COMPLETED
+    )
+    for task in done:
+        if task is not stop_task and not task.cancelled() and task.exception():
+            shutdown_log.warning("%s stopped: %r", task.get_name(), task.exception())
+    shutdown_log.info("stopping API server and Discord client")
+
+    server.should_exit = True
+    try:
+        SCHEDULER.shutdown()
+    except Exception as e:
+        shutdown_log.warning("scheduler: %r", e)
+    if not bot.is_closed():
+        await bot.close()
+    stop_task.cancel()
+    _, pending = await asyncio.wait({api_task, bot_task}, timeout=SHUTDOWN_TIMEOUT_SEC)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(api_task, bot_task, stop_task, return_exceptions=True)
 
 
 # ===== Discord Bot を起動 =====
 async def run_discord_bot():
+    start_loop_monitor("bot")
     with open("./venv/token.json", "r", encoding="utf-8") as f:
         token = json.load(f)["discord_token"]
 
@@ -1153,166 +1195,74 @@ async def run_discord_bot():
     bot.load_extension("bot.cogs.unlink")
     bot.load_extension("bot.monthly_relink_bot")
     bot.load_extension("bot.cogs.auto_link_dm")
+    bot.load_extension("bot.cogs.role_sync")
+    bot.load_extension("bot.cogs.member_sync")
 
     await bot.start(token)
 
 
 @bot.event
 async def on_ready():
-    debug_print(f"login: {bot.user}")
+    startup_log.info("login: %s", bot.user)
     # Capture running loop for cross-thread scheduling
     try:
         global BOT_LOOP
         BOT_LOOP = asyncio.get_running_loop()
-        debug_print(f"[loop] captured: {BOT_LOOP}")
-    except Exception as e:
-        debug_print(f"[loop] capture failed: {e!r}")
-    save_all_guild_members(bot)
-    await make_subrole(bot)
-    await make_category_and_channel(bot)
-    # EventSub購読を（可能なら）登録
-    try:
-        await register_eventsub_subscriptions()
+        loop_log.debug("captured: %s", BOT_LOOP)
     except Exception as e:
-        debug_print(f"[EventSub] registration skipped or failed: {e!r}")
-
-
-async def ensure_role_exists(
-    guild: discord.Guild,
-    role_name: str,
-    color: discord.Colour = discord.Colour.default(),
-):
-    # 既に存在しているかチェック
-    role = discord.utils.get(guild.roles, name=role_name)
-    if role is None:
-        debug_print(f"ロール「{role_name}」が存在しないため作成します")
-        role = await guild.create_role(
-            name=role_name, colour=color, reason="Twitchサブスク用自動作成"
-        )
-    else:
-        debug_print(f"ロール「{role_name}」は既に存在します")
-    return role
-
-
-async def make_subrole(bot):
-    guilds = bot.guilds
-
-    role_data = load_role_ids()
-
-    for guild in guilds:
-        role_id_dic = role_data.get(str(guild.id), {})
-
-        for role_name in ROLE_NAMES_LIST:
-            role = await ensure_role_exists(guild, role_name)
-            role_id_dic[role.name] = role.id
-        role_data[str(guild.id)] = role_id_dic
-    save_role_ids(role_data)
-
-
-async def ensure_text_channel_exists(
-    guild: discord.Guild,
-    channel_name: str,
-    overwrites: dict[discord.Role, discord.PermissionOverwrite] | None = None,
-    category: discord.CategoryChannel | None = None,
-    reason: str = "Twitchサブスク用自動生成",
-) -> discord.TextChannel:
-    channel = discord.utils.get(guild.text_channels, name=channel_name)
-    if channel is None:
-        debug_print(
-            f"チャンネル「{channel_name}」が存在しないため作成します in {guild.name}"
-        )
-        channel = await guild.create_text_channel(
-            name=channel_name, category=category, reason=reason, overwrites=overwrites
-        )
-    else:
-        debug_print(f"チャンネル「{channel_name}」はすでに存在します in {guild.name}")
-
-    return channel
+        loop_log.warning("capture failed: %r", e)
+    # 再接続でも on_ready は再送されるので、起動処理はプロセスにつき 1 回だけ
+    global STARTUP_DONE
+    if STARTUP_DONE:
+        startup_log.info("reconnect; startup tasks already done")
+        return
+    STARTUP_DONE = True
+    timings: list[tuple[str, float]] = []
 
+    async def _step(name: str, coro: Coroutine[Any, Any, Any]) -> None:
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            startup_log.exception("%s failed: %r", name, e)
+        timings.append((name, time.perf_counter() - started))
+
+    await _step("provision", provision_guild_objects(bot))
+    # 前回プロセスで終わらなかった一斉送信ジョブを再開
+    await _step("broadcast_jobs", BROADCAST_JOBS.resume_unfinished())
+    await _step("link_jobs", LINK_JOBS.resume_unfinished())
+    await _step("outbox", OUTBOX.start())
+    await _step("member_cache", warm_member_cache(bot))
+    if BOT_IPC_ADDRESS:
+        # wake が届かなかった場合の保険として、受付プロセスが積んだリンクジョブを拾う
+        LINK_JOBS.watch()
+    # EventSub購読を（可能なら）登録
+    await _step("eventsub", register_eventsub_subscriptions())
+    startup_log.info(
+        "%s total=%.3fs",
+        " ".join(f"{name}={sec:.3f}s" for name, sec in timings),
+        sum(sec for _, sec in timings),
+        extra={"steps": {name: round(sec, 3) for name, sec in timings}},
+    )
 
-async def ensure_category_exists(
-    guild: discord.Guild,
-    category_name: str,
-    overwrites: dict[discord.Role, discord.PermissionOverwrite] | None = None,
-    reason: str = "Twitchサブスク用自動生成",
-) -> discord.CategoryChannel:
-    category = discord.utils.get(guild.categories, name=category_name)
-    if category is None:
-        debug_print(
-            f"カテゴリー「{category_name}」が存在しないため作成します in {guild.name}"
-        )
-        category = await guild.create_category(
-            name=category_name, reason=reason, overwrites=overwrites
-        )
-    else:
-        debug_print(f"カテゴリー「{category_name}」はすでに存在します in {guild.name}")
-
-    return category
-
-
-async def make_category_and_channel(bot):
-    guilds = bot.guilds
-    category_data = load_subscription_categories()
-    channel_data = load_channel_ids()
-    for guild in guilds:
-        everyone_role = guild.default_role
-        tier_role_dic: dict[str, discord.Role | None] = {}
-        for entry in TIER_ENTRIES:
-            role_obj = discord.utils.get(guild.roles, name=entry["role_name"])
-            tier_role_dic[entry["role_name"]] = role_obj
-        if LINKED_ROLE_NAME:
-            linked_role_obj = discord.utils.get(guild.roles, name=LINKED_ROLE_NAME)
-            tier_role_dic[LINKED_ROLE_NAME] = linked_role_obj
-
-        category_id_dic = category_data.get(str(guild.id), {})
-        channel_id_dic = channel_data.get(str(guild.id), {})
-
-        for entry in TIER_ENTRIES:
-            category_name = entry["category_name"]
-            channel_name = entry["channel_name"]
-            primary_role_name = entry["role_name"]
-            allowed_role_names = entry.get("view_role_names") or [primary_role_name]
-
-            overwrites: dict[Any, discord.PermissionOverwrite] = {}
-            overwrites[everyone_role] = discord.PermissionOverwrite(view_channel=False)
-
-            for role_name in allowed_role_names:
-                if role_name in {"@everyone", "everyone", "*"}:
-                    role_obj = everyone_role
-                else:
-                    role_obj = tier_role_dic.get(role_name)
-                if role_obj is None:
-                    role_obj = discord.utils.get(guild.roles, name=role_name)
-                    if role_obj:
-                        tier_role_dic[role_name] = role_obj
-                if role_obj is None:
-                    continue
-                overwrites[role_obj] = discord.PermissionOverwrite(view_channel=True)
-
-    category = None
-    if category_name and category_name.lower() not in {"none", "", "null"}:
-        category = await ensure_category_exists(
-            guild,
-            category_name,
-            overwrites,
-        )
-        category_id_dic[primary_role_name] = category.id
 
-    channel = await ensure_text_channel_exists(
-        guild=guild,
-        channel_name=channel_name,
-        overwrites=overwrites,
-        category=category,
-    )
-    channel_id_dic[primary_role_name] = channel.id
-    entry["channel_id"] = channel.id
+async def warm_member_cache(bot) -> None:
+    """DISCORD_MEMBER_CACHE=linked のとき、連携済みメンバーをバックグラウンドでキャッシュに入れる。"""
+    if MEMBER_CACHE.caches_all:
+        return
+    linked = await asyncio.to_thread(linked_users_role_state)
+    MEMBER_CACHE.start_warm(bot.guilds, linked.keys())
 
-    category_data[str(guild.id)] = category_id_dic
-    channel_data[str(guild.id)] = channel_id_dic
 
-    save_subscription_categories(category_data)
-    save_channel_ids(channel_data)
-    save_subscription_config(SUBSCRIPTION_CONFIG)
+async def provision_guild_objects(bot) -> None:
+    """サブスク用ロール・カテゴリー・チャンネルを全ギルドで用意する。"""
+    role_plan = await asyncio.to_thread(ROLE_PLANS.current)
+    await provision_guilds(bot.guilds, role_plan.role_names, role_plan.tier_entries)
+    # 既定値で補完した設定をファイルへ反映（内容が同じなら書かない）
+    if await asyncio.to_thread(load_subscription_config) != role_plan.subscription_config:
+        await asyncio.to_thread(save_subscription_config, role_plan.subscription_config)
+    # 作成したロール・チャンネルの ID を次の参照から使う
+    ROLE_PLANS.invalidate()
 
 
 def start_django_admin():
@@ -1328,7 +1278,7 @@ def start_django_admin():
         repo_root = os.path.abspath(os.path.join(PROJECT_ROOT, ".."))
         manage_py = os.path.join(repo_root, "webadmin", "manage.py")
         if not os.path.exists(manage_py):
-            debug_print(f"[Django] manage.py not found at {manage_py}; skip starting.")
+            django_log.warning("manage.py not found at %s; skip starting", manage_py)
             return
 
         env = os.environ.copy()
@@ -1337,7 +1287,7 @@ def start_django_admin():
 
         args = [sys.executable, manage_py, "runserver", "127.0.0.1:8001"]
         proc = subprocess.Popen(args, cwd=os.path.dirname(manage_py), env=env)
-        debug_print("[Django] runserver started on http://127.0.0.1:8001")
+        django_log.info("runserver started on http://127.0.0.1:8001")
 
         def _stop():
             try:
@@ -1352,7 +1302,7 @@ def start_django_admin():
 
         atexit.register(_stop)
     except Exception as e:
-        debug_print(f"[Django] failed to start: {e!r}")
+        django_log.exception("failed to start: %r", e)
 
 
 # ---- メッセージ中のプレースホルダ検証 ----
@@ -1382,13 +1332,16 @@ if os.getenv("RUN_DJANGO", "").strip() not in ("", "0", "false", "False"):
     start_django_admin()
 
 if __name__ == "__main__":
-    # FastAPI を別スレッドで開始（独自ループ）
-    threading.Thread(target=start_api, daemon=True).start()
-
-    # Discord Bot はメインスレッドで実行（bot.loop が基準になる）
+    configure_logging("bot")
     try:
-        asyncio.run(run_discord_bot())
+        if API_SERVER_MODE == "thread":
+            # FastAPI を別スレッドで開始（独自ループ）
+            threading.Thread(target=start_api, daemon=True).start()
+            # Discord Bot はメインスレッドで実行（bot.loop が基準になる）
+            asyncio.run(run_discord_bot())
+        else:
+            asyncio.run(run_single_loop())
     except KeyboardInterrupt:
-        debug_print("[shutdown] KeyboardInterrupt received")
+        shutdown_log.info("KeyboardInterrupt received")
     except asyncio.CancelledError:
-        debug_print("[shutdown] asyncio tasks cancelled")
+        shutdown_log.debug("asyncio tasks cancelled")
@@ -1,6 +1,10 @@
+import asyncio
+
 import discord
 from discord.ext import commands
-from bot.utils.save_and_load import load_users, save_all_guild_members
+from bot.utils.save_and_load import get_linked_user
+from bot.utils.dm_broadcast import DM_SENT, classify_dm_error
+from bot.utils.dm_suppression import is_suppressed, record_dm_outcome
 
 
 class AutoLinkDM(commands.Cog):
@@ -12,10 +16,12 @@ class AutoLinkDM(commands.Cog):
     async def on_member_join(self, member: discord.Member):
         discord_id = str(member.id)
 
-        # 既にリンク済みならDM不要
-        linked_users = load_users()
-        save_all_guild_members(self.bot)
-        if discord_id in linked_users:
+        # 既にリンク済みならDM不要（プロフィールの保存は MemberSyncCog が行う）
+        record = await asyncio.to_thread(get_linked_user, discord_id)
+        if record.get("twitch_user_id") or record.get("twitch_username"):
+            return
+        # 以前 DM を拒否されたユーザー（再参加など）には停止期間中は送らない
+        if await asyncio.to_thread(is_suppressed, discord_id):
             return
 
         try:
@@ -28,9 +34,16 @@ class AutoLinkDM(commands.Cog):
                 "・サブスク限定のチャンネルや特典にアクセスできます 🎁\n\n"
                 "ぜひお早めに連携をお願いします！"
             )
-        except discord.Forbidden:
-            # ユーザーがDM拒否設定にしている場合は無視
+        except discord.HTTPException as e:
+            # ユーザーがDM拒否設定にしている場合は抑止リストへ
             print(f"⚠ {member} にDMを送信できませんでした。")
+            await asyncio.to_thread(
+                record_dm_outcome, discord_id, classify_dm_error(e), source="welcome"
+            )
+        else:
+            await asyncio.to_thread(
+                record_dm_outcome, discord_id, (DM_SENT, None), source="welcome"
+            )
 
 
 def setup(bot):
@@ -2,103 +2,44 @@
 from __future__ import annotations
 
 import asyncio
+import os
 from typing import Optional, Dict, Any
 
 import discord
 from discord.ext import commands
+from bot.common import debug_print
 from bot.utils.twitch import get_auth_url
 from bot.monthly_relink_bot import mark_resolved
-
-from bot.utils.save_and_load import (
-    load_role_ids,
-    load_users,
-    patch_linked_user,
-    load_subscription_config,
+from bot.utils.dm_broadcast import (
+    DM_SENT,
+    DMOutcome,
+    classify_dm_error,
+    persist_linked_user_outcomes,
 )
+from bot.utils.dm_suppression import record_dm_outcome
+from bot.utils.link_registry import LINK_REGISTRY, LinkWaitSuperseded
+from bot.utils.member_cache import MEMBER_CACHE
+from bot.utils.metrics import DISCORD_ROLE_CHANGES
+from bot.utils.role_plan import ROLE_PLANS, GuildRolePlan
+
+# /link 実行後、OAuth 完了を待つ秒数
+LINK_WAIT_TIMEOUT = int(os.getenv("LINK_WAIT_TIMEOUT", "300"))
 
 
 class LinkCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-    @staticmethod
-    def _role_name_map(role_conf: Dict[str, int]) -> Dict[str, Optional[int]]:
-        return {
-            str(name): rid for name, rid in role_conf.items() if isinstance(rid, int)
-        }
-
-    @staticmethod
-    def _subscription_tier_map() -> Dict[str, str]:
-        config = load_subscription_config()
-        tiers = config.get("tiers") if isinstance(config, dict) else None
-        result: Dict[str, str] = {}
-        if isinstance(tiers, list):
-            for entry in tiers:
-                if not isinstance(entry, dict):
-                    continue
-                key = str(entry.get("key") or "").strip()
-                role_name = str(entry.get("role_name") or "").strip()
-                if key and role_name:
-                    result[key] = role_name
-        return result
-
-    @staticmethod
-    def _all_tier_role_ids(role_conf: Dict[str, int]) -> set[int]:
-        config_map = LinkCog._subscription_tier_map()
-        managed_names = {
-            role_name
-            for key, role_name in config_map.items()
-            if key.lower().startswith("tier")
-        }
-        fallback = {
-            "Subscription Tier1",
-            "Subscription Tier2",
-            "Subscription Tier3",
-        }
-        target_names = managed_names or fallback
-        return {
-            rid
-            for name, rid in role_conf.items()
-            if isinstance(rid, int) and name in target_names
-        }
-
     async def _ensure_roles_for_member(
         self,
         member: discord.Member,
         tier: Optional[str],
-        role_conf: Dict[str, int],
+        plan: GuildRolePlan,
     ) -> None:
         guild = member.guild
+        tier_role_id = plan.tier_role_ids.get(tier) if tier else None
 
-        role_name_map = self._role_name_map(role_conf)
-        subscription_map = self._subscription_tier_map()
-        linked_role_id = role_name_map.get("Twitch-linked") or role_name_map.get(
-            "twitch_linked"
-        )
-        tier_role_id = None
-        if tier:
-            tier_key_map = {
-                "1000": "Subscription Tier1",
-                "2000": "Subscription Tier2",
-                "3000": "Subscription Tier3",
-            }
-            tier_name = None
-            tier_key = None
-            tier_code_map = {
-                "1000": "tier1",
-                "2000": "tier2",
-                "3000": "tier3",
-            }
-            tier_key = tier_code_map.get(tier)
-            if tier_key:
-                tier_name = subscription_map.get(tier_key)
-            if not tier_name:
-                tier_name = tier_key_map.get(tier)
-            if tier_name:
-                tier_role_id = role_name_map.get(tier_name)
-        all_tier_ids = self._all_tier_role_ids(role_conf)
-
-        linked_role = guild.get_role(linked_role_id) if linked_role_id else None
+        linked_role = guild.get_role(plan.linked_role_id) if plan.linked_role_id else None
         tier_role_to_add = guild.get_role(tier_role_id) if tier_role_id else None
 
         roles_to_add = [
@@ -107,7 +48,7 @@ class LinkCog(commands.Cog):
 
         current_role_ids = {r.id for r in member.roles}
         tier_roles_to_remove = [
-            guild.get_role(rid) for rid in all_tier_ids if rid in current_role_ids
+            guild.get_role(rid) for rid in plan.all_tier_role_ids if rid in current_role_ids
         ]
         tier_roles_to_remove = [
             r
@@ -115,12 +56,97 @@ class LinkCog(commands.Cog):
             if r and (tier_role_to_add is None or r.id != tier_role_to_add.id)
         ]
 
-        if roles_to_add:
-            await member.add_roles(*roles_to_add, reason="Twitch link: add roles")
-        if tier_roles_to_remove:
-            await member.remove_roles(
-                *tier_roles_to_remove, reason="Twitch link: remove old tier"
-            )
+        if not roles_to_add and not tier_roles_to_remove:
+            return
+        try:
+            if roles_to_add:
+                await member.add_roles(*roles_to_add, reason="Twitch link: add roles")
+            if tier_roles_to_remove:
+                await member.remove_roles(
+                    *tier_roles_to_remove, reason="Twitch link: remove old tier"
+                )
+        except Exception:
+            DISCORD_ROLE_CHANGES.inc("link", "failed")
+            raise
+        DISCORD_ROLE_CHANGES.inc("link", "ok")
+
+    async def _resolve_member(
+        self, guild: discord.Guild, user_id: int
+    ) -> Optional[discord.Member]:
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+        try:
+            member = await guild.fetch_member(user_id)
+        except (discord.NotFound, discord.HTTPException):
+            return None
+        # 連携したメンバーはロール管理の対象なのでキャッシュに残す
+        MEMBER_CACHE.remember(member)
+        return member
+
+    async def finalize_link(
+        self,
+        user_id: int,
+        record: Dict[str, Any],
+        guild: Optional[discord.Guild] = None,
+    ) -> None:
+        """連携ジョブの最後に呼ばれる: ロール付与と完了 DM。record は保存済みの連携レコード。
+
+        guild を省略した場合はロール設定のある全ギルドを対象にする。
+        """
+        discord_id = str(user_id)
+        role_plan = await asyncio.to_thread(ROLE_PLANS.current)
+        if guild is not None:
+            guilds = [guild]
+        else:
+            guilds = [g for g in self.bot.guilds if role_plan.guild(g.id) is not None]
+
+        tier = record.get("tier")  # "1000"/"2000"/"3000" or None
+        notices: list[str] = []
+        for target_guild in guilds:
+            guild_plan = role_plan.guild(target_guild.id)
+            if guild_plan is None:
+                continue
+            member = await self._resolve_member(target_guild, user_id)
+            if member is None:
+                continue
+            try:
+                await self._ensure_roles_for_member(member, tier, guild_plan)
+            except discord.Forbidden:
+                notices.append(
+                    "⚠ Botにロール管理権限が不足しているため、ロール付与に失敗しました。管理者に連絡してください。"
+                )
+            except Exception as e:
+                notices.append(f"⚠ ロール付与中にエラーが発生しました: {e!r}")
+
+        # reconcile_and_save_link が保存できていれば resolved 済み
+        if not record.get("resolved"):
+            await asyncio.to_thread(mark_resolved, discord_id)
+
+        twitch_name = record.get("twitch_username")
+        is_sub = bool(record.get("is_subscriber", False))
+        tier_msg = {"1000": "1", "2000": "2", "3000": "3"}.get(tier, "0")
+        msg = (
+            "✅ Twitch連携が完了しました！\n"
+            f"・Twitch名: **{twitch_name}**\n"
+            f"・サブスク状態: {'✅ 登録中' if is_sub else '❌ 未登録'}\n"
+            f"・Tier: {tier_msg}\n"
+            "※ ロールが反映されていない場合は、数秒待ってから再度ご確認ください。"
+        )
+
+        user = self.bot.get_user(user_id)
+        try:
+            if user is None:
+                user = await self.bot.fetch_user(user_id)
+            for notice in notices:
+                await user.send(notice)
+            await user.send(msg)
+            outcome: DMOutcome = (DM_SENT, None)
+        except Exception as exc:
+            outcome = classify_dm_error(exc)
+            debug_print(f"[link] confirmation DM to {discord_id} failed: {outcome}")
+        await asyncio.to_thread(persist_linked_user_outcomes, {discord_id: outcome})
+        await asyncio.to_thread(record_dm_outcome, discord_id, outcome, source="link")
 
     @discord.slash_command(
         name="link",
@@ -141,91 +167,23 @@ class LinkCog(commands.Cog):
             finally:
                 return
 
-        role_conf = load_role_ids()[str(ctx.guild_id)]
-
-        for _ in range(6):  # 10s x 6 = 60s
-            await asyncio.sleep(10)
-            users = load_users()
-            if discord_id not in users:
-                continue
-
-            info: Dict[str, Any] = users[discord_id]
-            twitch_name = info.get("twitch_username")
-            is_sub = info.get("is_subscriber", False)
-            tier = info.get("tier")  # "1000"/"2000"/"3000" or None
-            streak = int(info.get("streak_months", 0) or 0)
-            cumulative = int(info.get("cumulative_months", 0) or 0)
-            since = info.get("subscribed_since")  # ISO文字列 or None
-
-            try:
-                member = ctx.guild.get_member(
-                    ctx.author.id
-                ) or await ctx.guild.fetch_member(ctx.author.id)
-            except discord.NotFound:
-                member = None
-
-            if member is not None:
-                try:
-                    await self._ensure_roles_for_member(member, tier, role_conf)
-                except discord.Forbidden:
-                    await ctx.author.send(
-                        "⚠ Botにロール管理権限が不足しているため、ロール付与に失敗しました。管理者に連絡してください。"
-                    )
-                except Exception as e:
-                    await ctx.author.send(
-                        f"⚠ ロール付与中にエラーが発生しました: {e!r}"
-                    )
-
-            mark_resolved(discord_id)
-
-            # 念のため、直近で保存された値を再読込（初回リンク直後のズレ対策）
-            users = load_users()
-            info = users.get(discord_id, info)
-            streak = int(info.get("streak_months", streak) or streak)
-            cumulative = int(info.get("cumulative_months", cumulative) or cumulative)
-            since = info.get("subscribed_since", since)
-
-            # フォールバック: サブであれば累計は最低1
-            if is_sub and cumulative <= 0:
-                cumulative = 1
-
-            tier_msg = {"1000": "1", "2000": "2", "3000": "3"}.get(tier, "0")
-            msg = (
-                "✅ Twitch連携が完了しました！\n"
-                f"・Twitch名: **{twitch_name}**\n"
-                f"・サブスク状態: {'✅ 登録中' if is_sub else '❌ 未登録'}\n"
-                f"・Tier: {tier_msg}\n"
-                # f"・連続月数(streak): {streak}ヶ月\n"
-                # f"・累計月数(cumulative): {cumulative}ヶ月\n"
-                # f"・サブスク開始日: {since if since else '不明'}\n"
-                "※ ロールが反映されていない場合は、数秒待ってから再度ご確認ください。"
-            )
-
-            try:
-                await ctx.author.send(msg)
-                patch_linked_user(
-                    discord_id,
-                    {"dm_failed": False, "dm_failed_reason": None},
-                    include_none=True,
-                )
-            except discord.Forbidden:
-                patch_linked_user(
-                    discord_id,
-                    {"dm_failed": True, "dm_failed_reason": "DM拒否 (Forbidden)"},
-                )
-            except discord.HTTPException as e:
-                patch_linked_user(
-                    discord_id,
-                    {"dm_failed": True, "dm_failed_reason": f"HTTPエラー: {e}"},
-                )
-            finally:
-                return
-
+        # ロール付与と完了 DM は連携ジョブ (bot.utils.link_jobs) が行う。
+        # ここでは完了／失敗の知らせを待ち、来なかった場合だけ案内する
+        try:
+            record = await LINK_REGISTRY.wait(discord_id, LINK_WAIT_TIMEOUT)
+        except LinkWaitSuperseded:
+            # 同じユーザーが /link をやり直した
+            return
+        if record is not None and not record.get("error"):
+            return
+
+        if record is None:
+            notice = f"⏳ {LINK_WAIT_TIMEOUT // 60}分経っても連携が完了しませんでした。もう一度 `/link` をお試しください。"
+        else:
+            notice = f"⚠ 連携に失敗しました（{record['error']}）。もう一度 `/link` をお試しください。"
         try:
-            await ctx.author.send(
-                "⏳ 60秒経っても連携が完了しませんでした。もう一度 `/link` をお試しください。"
-            )
-        except discord.Forbidden:
+            await ctx.author.send(notice)
+        except discord.HTTPException:
             pass
 
 
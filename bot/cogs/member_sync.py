@@ -0,0 +1,74 @@
+# bot/cogs/member_sync.py
+"""
+メンバー情報の差分同期
+- on_member_join / on_member_update / on_user_update / on_raw_member_remove で該当メンバーだけを更新
+  （DISCORD_MEMBER_CACHE=linked ではキャッシュ外のメンバーの更新イベントは届かず、起動時の全件同期で拾う）
+- 起動時（初回の on_ready）にギルド全員をバックグラウンドで同期
+"""
+
+from __future__ import annotations
+
+import discord
+from discord.ext import commands
+
+from bot.common import debug_print
+from bot.utils.member_profiles import MemberProfileSync, member_profile_fields
+from bot.utils.save_and_load import get_guild_id
+
+
+class MemberSyncCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.sync = MemberProfileSync()
+        self._startup_synced = False
+        try:
+            self.guild_id: int | None = int(get_guild_id())
+        except Exception:
+            self.guild_id = None
+
+    def _target_guild(self, guild: discord.Guild | None) -> bool:
+        return guild is not None and guild.id == self.guild_id
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if self._startup_synced:
+            return
+        guild = self.bot.get_guild(self.guild_id) if self.guild_id else None
+        if guild is None:
+            debug_print("[MemberSync] guild not found; startup sync skipped")
+            return
+        self._startup_synced = True
+        self.sync.start_full_sync(guild)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        if self._target_guild(member.guild):
+            self.sync.update(member)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        # ロール変更などでも届くので、保存項目が変わったときだけ書き込む
+        if not self._target_guild(after.guild):
+            return
+        if member_profile_fields(before) != member_profile_fields(after):
+            self.sync.update(after)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before: discord.User, after: discord.User):
+        if member_profile_fields(before) == member_profile_fields(after):
+            return
+        guild = self.bot.get_guild(self.guild_id) if self.guild_id else None
+        member = guild.get_member(after.id) if guild is not None else None
+        if member is not None:
+            self.sync.update(member)
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        # on_member_remove はキャッシュにいたメンバーにしか届かないので raw で受ける
+        if payload.guild_id != self.guild_id or getattr(payload.user, "bot", False):
+            return
+        await self.sync.member_left(payload.user)
+
+
+def setup(bot: commands.Bot):
+    bot.add_cog(MemberSyncCog(bot))
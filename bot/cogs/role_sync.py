@@ -0,0 +1,97 @@
+# bot/cogs/role_sync.py
+"""
+連携ロールの定期リコンサイル
+- 起動直後と一定間隔（既定 6 時間）で全員分
+- 短い間隔（既定 60 秒）で EventSub 等から mark_dirty されたユーザー分
+- /reconcile_roles（ロール管理権限）で即時実行
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import os
+
+import discord
+from discord.ext import commands
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+
+from bot.common import debug_print
+from bot.utils.logs import get_logger
+from bot.utils.role_reconciler import RoleReconciler
+
+FULL_INTERVAL_MIN = int(os.getenv("ROLE_SYNC_FULL_INTERVAL_MIN", "360"))
+INCREMENTAL_INTERVAL_SEC = int(os.getenv("ROLE_SYNC_INCREMENTAL_SEC", "60"))
+# 起動直後の全件実行までの待ち（キャッシュが温まるのを待つ）
+STARTUP_DELAY_SEC = 60
+
+log = get_logger("rolesync")
+
+
+class RoleSyncCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.reconciler = RoleReconciler(bot)
+        self.scheduler = AsyncIOScheduler(timezone="Asia/Tokyo")
+        self._scheduler_started = False
+
+    async def _run_full(self) -> None:
+        try:
+            await self.reconciler.reconcile_all()
+        except Exception as e:
+            log.exception("full reconcile failed: %r", e)
+
+    async def _run_incremental(self) -> None:
+        try:
+            await self.reconciler.reconcile_dirty()
+        except Exception as e:
+            log.exception("incremental reconcile failed: %r", e)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if self._scheduler_started:
+            return
+        self.scheduler.add_job(
+            self._run_full,
+            IntervalTrigger(minutes=FULL_INTERVAL_MIN),
+            next_run_time=dt.datetime.now(dt.timezone.utc)
+            + dt.timedelta(seconds=STARTUP_DELAY_SEC),
+            id="role_sync_full",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+        self.scheduler.add_job(
+            self._run_incremental,
+            IntervalTrigger(seconds=INCREMENTAL_INTERVAL_SEC),
+            id="role_sync_incremental",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+        self.scheduler.start()
+        self._scheduler_started = True
+        debug_print("[RoleSync] scheduler started")
+
+    def cog_unload(self):
+        if self._scheduler_started:
+            self.scheduler.shutdown(wait=False)
+
+    @discord.slash_command(
+        name="reconcile_roles",
+        description="連携ロールを全員分いますぐ再計算して付け直します",
+        default_member_permissions=discord.Permissions(manage_roles=True),
+    )
+    async def reconcile_roles(self, ctx: discord.ApplicationContext):
+        await ctx.respond("ロールのリコンサイルを開始します…", ephemeral=True)
+        summary = await self.reconciler.reconcile_all()
+        result = summary.as_dict()
+        await ctx.followup.send(
+            f"完了: 変更 {result['changed']}人（追加 {result['added']} / 削除 {result['removed']}）"
+            f"、失敗 {result['failed']}件、{result['elapsed_sec']}秒",
+            ephemeral=True,
+        )
+
+
+def setup(bot: commands.Bot):
+    bot.add_cog(RoleSyncCog(bot))
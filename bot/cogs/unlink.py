@@ -16,6 +16,10 @@ class Unlink(commands.Cog):
 
         if discord_id in linked_users:
             delete_linked_user(discord_id)
+            # 連携ロールは次回の差分リコンサイルで外れる
+            role_sync = self.bot.get_cog("RoleSyncCog")
+            if role_sync is not None:
+                role_sync.reconciler.mark_dirty([discord_id])
             await ctx.respond(
                 "Twitchアカウントとのリンクを解除しました ✅", ephemeral=True
             )
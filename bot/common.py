@@ -4,8 +4,19 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DATA_DIR = os.path.join(PROJECT_ROOT, "venv")
 DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
 
+_legacy_debug = None
+
 
 # ========= 共通ユーティリティ =========
 def debug_print(*args, **kwargs):
-    if DEBUG:
-        print(*args, **kwargs)
+    """
+    互換用。新しいコードは bot.utils.logs.get_logger を使う。
+    先頭の "[EventSub]" のようなタグのロガーへ DEBUG レベルで出す（LOG_LEVELS で個別に調整できる）
+    """
+    global _legacy_debug
+    if _legacy_debug is None:
+        # bot.utils.logs がこのモジュールを読むので、読み込みは初回呼び出し時に
+        from bot.utils.logs import legacy_debug
+
+        _legacy_debug = legacy_debug
+    _legacy_debug(*args, **kwargs)
@@ -0,0 +1,207 @@
+# bot/ingress_app.py
+"""
+Webhook 受付専用プロセス（Discord には接続しない）
+- OAuth コールバック・EventSub・読み取り専用の管理 API は bot/utils/ingress_routes.py を
+  そのまま使い、link_jobs / webhook_events / outbox に書いたら Bot プロセスへ wake を送る
+- Discord の状態が必要な管理 API（/guilds, /roles, 一斉送信のプレビュー・作成・操作・進捗,
+  リコンサイル, スケジューラ履歴, EventSub 購読管理）は BOT_IPC_ADDRESS の Bot プロセスへ中継する
+- プロセス内に状態を持たないので uvicorn の複数ワーカーで動かせる
+    python -m bot.ingress_app            （INGRESS_WORKERS / FASTAPI_HOST / FASTAPI_PORT）
+    uvicorn bot.ingress_app:app --workers 4 --host 127.0.0.1 --port 8000
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from bot.common import debug_print
+from bot.utils.admin_auth import ADMIN_API_TOKEN, require_admin_token
+from bot.utils.bot_ipc import BOT_IPC_ADDRESS, WAKE_PATH, ipc_client, parse_ipc_address
+from bot.utils.ingress_routes import build_ingress_router
+from bot.utils.logs import configure_logging
+from bot.utils.loop_monitor import loop_monitor_snapshot, start_loop_monitor
+from bot.utils.metrics import CONTENT_TYPE, render_metrics
+from bot.utils.request_timing import TimingMiddleware, timing_snapshot
+
+# Bot プロセスへ中継するパス（前方一致）。それ以外は 404
+BOT_ONLY_PREFIXES = (
+    "/guilds",
+    "/roles",
+    "/send_role_dm",
+    "/broadcast/jobs/",
+    "/scheduler/runs",
+    "/eventsub/subscriptions",
+    "/notify_link",
+    "/debug/loop",
+    "/debug/profile/",
+    "/debug/requests",
+    "/metrics",
+)
+# 中継しないヘッダ（hop-by-hop と、httpx が付け直すもの）
+_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "transfer-encoding",
+    "te",
+    "trailer",
+    "upgrade",
+    "host",
+    "content-length",
+}
+# SSE を中継するので読み取りは無制限
+IPC_TIMEOUT = httpx.Timeout(30.0, connect=5.0, read=None)
+
+IS_PROD = (os.getenv("APP_ENV") or os.getenv("ENV") or "").lower() in (
+    "prod",
+    "production",
+)
+
+_ipc_client: Optional[httpx.AsyncClient] = None
+_wake_tasks: set[asyncio.Task] = set()
+
+
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    global _ipc_client
+    # ワーカーは別プロセスなのでログファイルも分ける（RotatingFileHandler は共有できない）
+    configure_logging(f"ingress-{os.getpid()}")
+    start_loop_monitor(f"ingress-{os.getpid()}")
+    address = parse_ipc_address(BOT_IPC_ADDRESS)
+    if address is None:
+        debug_print("[ingress] BOT_IPC_ADDRESS not set; bot-only endpoints return 503")
+    else:
+        _ipc_client = ipc_client(address, IPC_TIMEOUT)
+        debug_print(f"[ingress] worker {os.getpid()} relays to {BOT_IPC_ADDRESS}")
+    try:
+        yield
+    finally:
+        if _ipc_client is not None:
+            await _ipc_client.aclose()
+            _ipc_client = None
+
+
+def _admin_headers() -> dict[str, str]:
+    return {"Authorization": f"Bearer {ADMIN_API_TOKEN}"} if ADMIN_API_TOKEN else {}
+
+
+async def _send_wake(payload: dict) -> None:
+    if _ipc_client is None:
+        return
+    try:
+        await _ipc_client.post(WAKE_PATH, json=payload, headers=_admin_headers(), timeout=5.0)
+    except httpx.HTTPError as e:
+        # Bot 側は定期的にキューを見ているので、届かなくても遅れるだけ
+        debug_print(f"[ingress] wake failed: {e!r}")
+
+
+def _wake_bot(payload: dict) -> None:
+    task = asyncio.create_task(_send_wake(payload))
+    _wake_tasks.add(task)
+    task.add_done_callback(_wake_tasks.discard)
+
+
+async def _on_link_job_queued(job_id: str) -> None:
+    _wake_bot({"link_job_id": job_id})
+
+
+async def _on_outbox_queued() -> None:
+    _wake_bot({})
+
+
+app = FastAPI(
+    docs_url=None if IS_PROD else "/docs",
+    redoc_url=None if IS_PROD else "/redoc",
+    openapi_url=None if IS_PROD else "/openapi.json",
+    lifespan=_lifespan,
+)
+app.add_middleware(TimingMiddleware, app_name="ingress")
+app.include_router(
+    build_ingress_router(on_link_job=_on_link_job_queued, on_queued=_on_outbox_queued)
+)
+
+
+@app.get("/debug/loop/ingress")
+async def debug_loop_ingress(request: Request):
+    """応答したワーカーのループのラグ（Bot プロセスのループは /debug/loop を中継）。"""
+    if not require_admin_token(request.headers.get("Authorization")):
+        return PlainTextResponse("forbidden", status_code=403)
+    return loop_monitor_snapshot()
+
+
+@app.get("/debug/requests/ingress")
+async def debug_requests_ingress(request: Request):
+    """応答したワーカーのルート別の所要時間（中継したリクエストは /{path:path} にまとまる）。"""
+    if not require_admin_token(request.headers.get("Authorization")):
+        return PlainTextResponse("forbidden", status_code=403)
+    return timing_snapshot()
+
+
+@app.get("/metrics/ingress")
+async def metrics_ingress(request: Request):
+    """応答したワーカーのメトリクス（EventSub の受信はここに出る）。"""
+    if not require_admin_token(request.headers.get("Authorization")):
+        return PlainTextResponse("forbidden", status_code=403)
+    body = await asyncio.to_thread(render_metrics)
+    return PlainTextResponse(body, media_type=CONTENT_TYPE)
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "DELETE"])
+async def relay_to_bot(path: str, request: Request):
+    url_path = "/" + path
+    if not url_path.startswith(BOT_ONLY_PREFIXES):
+        return JSONResponse({"detail": "Not Found"}, status_code=404)
+    # 認証されていないリクエストは Bot プロセスまで通さない
+    if not require_admin_token(request.headers.get("Authorization")):
+        return PlainTextResponse("forbidden", status_code=403)
+    if _ipc_client is None:
+        return JSONResponse({"error": "bot_ipc_not_configured"}, status_code=503)
+
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in _HOP_HEADERS}
+    upstream = _ipc_client.build_request(
+        request.method,
+        url_path,
+        params=request.query_params,
+        headers=headers,
+        content=await request.body(),
+    )
+    try:
+        response = await _ipc_client.send(upstream, stream=True)
+    except httpx.HTTPError as e:
+        debug_print(f"[ingress] relay {request.method} {url_path} failed: {e!r}")
+        return JSONResponse({"error": "bot_unavailable"}, status_code=503)
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers={
+            k: v for k, v in response.headers.items() if k.lower() not in _HOP_HEADERS
+        },
+        background=BackgroundTask(response.aclose),
+    )
+
+
+def main() -> None:
+    host = os.getenv("FASTAPI_HOST", "127.0.0.1")
+    try:
+        port = int(os.getenv("FASTAPI_PORT", "8000"))
+    except ValueError:
+        port = 8000
+    try:
+        workers = max(1, int(os.getenv("INGRESS_WORKERS", "2")))
+    except ValueError:
+        workers = 2
+    uvicorn.run(
+        "bot.ingress_app:app", host=host, port=port, workers=workers, log_level="info"
+    )
+
+
+if __name__ == "__main__":
+    main()
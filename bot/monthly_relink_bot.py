@@ -15,14 +15,27 @@ from __future__ import annotations
 import os
 import asyncio
 import datetime as dt
-from typing import Any, Optional, Dict
+from typing import Any, Callable, Dict, Iterable, Optional
 
 import discord
 from discord.ext import commands
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from bot.utils.save_and_load import load_users, patch_linked_user, load_role_ids
+from bot.utils.save_and_load import (
+    load_users,
+    patch_linked_user,
+    patch_linked_users,
+    unlinked_notice_targets,
+)
+from bot.utils.dm_broadcast import (
+    DM_SENT,
+    BroadcastSummary,
+    DMOutcome,
+    broadcast_dm,
+    outcome_updates,
+)
+from bot.utils.dm_suppression import record_dm_outcomes, suppressed_ids
+from bot.utils.scheduling import SCHEDULER
 from bot.common import debug_print
 
 # ========= 定数・パス =========
@@ -31,6 +44,18 @@ DATA_DIR = os.path.join(PROJECT_ROOT, "venv")
 JST = dt.timezone(dt.timedelta(hours=9))
 
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+# 再リンク DM の初期／最大並列数（429 を観測すると自動で絞る）
+RELINK_DM_CONCURRENCY = _env_int("RELINK_DM_CONCURRENCY", 2)
+RELINK_DM_MAX_CONCURRENCY = _env_int("RELINK_DM_MAX_CONCURRENCY", 5)
+
+
 def jst_now() -> dt.datetime:
     return dt.datetime.now(tz=JST)
 
@@ -71,14 +96,48 @@ def build_relink_message(discord_id: str) -> str:
     return "\n".join(lines)
 
 
-async def send_dm(bot: commands.Bot, discord_user_id: int, content: str) -> bool:
-    try:
-        user = await bot.fetch_user(discord_user_id)
-        await user.send(content)
-        return True
-    except Exception as e:
-        debug_print(f"[DM送信失敗] user={discord_user_id} err={e!r}")
-        return False
+async def send_relink_dm(bot: commands.Bot, discord_id: str) -> DMOutcome:
+    """キャッシュ済みのユーザーを優先し、無ければ REST で取得して送る。"""
+    user = bot.get_user(int(discord_id)) or await bot.fetch_user(int(discord_id))
+    await user.send(build_relink_message(discord_id))
+    return DM_SENT, None
+
+
+def _notice_persister(
+    now: dt.datetime, first_notice_missing: set[str]
+) -> Callable[[Dict[str, DMOutcome]], None]:
+    """送信結果のバッチを linked_users と抑止リストへまとめて書き込む関数を作る。"""
+    stamp = now.isoformat()
+
+    def _persist(outcomes: Dict[str, DMOutcome]) -> None:
+        updates: Dict[str, Dict[str, Any]] = {}
+        for did, outcome in outcomes.items():
+            row = outcome_updates(outcome)
+            if outcome[0] == DM_SENT:
+                row["last_notice_at"] = stamp
+                row["resolved"] = False
+                if did in first_notice_missing:
+                    row["first_notice_at"] = stamp
+            updates[did] = row
+        patch_linked_users(updates, include_none=True)
+        record_dm_outcomes(outcomes, source="relink")
+
+    return _persist
+
+
+async def _send_relink_batch(
+    bot: commands.Bot,
+    discord_ids: list[str],
+    now: dt.datetime,
+    first_notice_missing: Iterable[str] = (),
+) -> BroadcastSummary:
+    return await broadcast_dm(
+        discord_ids,
+        lambda did: send_relink_dm(bot, did),
+        concurrency=RELINK_DM_CONCURRENCY,
+        max_concurrency=RELINK_DM_MAX_CONCURRENCY,
+        persist=_notice_persister(now, set(first_notice_missing)),
+    )
 
 
 def mark_resolved(discord_id: str) -> None:
@@ -98,141 +157,87 @@ def mark_resolved(discord_id: str) -> None:
 class ReLinkCog(commands.Cog):
     """月初め再リンク＆7日後再送のスケジュール運用とテスト用コマンドを提供"""
 
+    JOB_MONTHLY = "monthly_relink_first_day"
+    JOB_RESEND = "monthly_relink_resend"
+
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.scheduler = AsyncIOScheduler(timezone="Asia/Tokyo")
+        # ジョブは db.sqlite3 に永続化され、リーダーのプロセスだけが実行する
+        SCHEDULER.register(self.JOB_MONTHLY, self.notify_monthly_relink)
+        SCHEDULER.register(self.JOB_RESEND, self.resend_after_7days_if_unlinked)
         self._scheduler_started = False
 
-    async def _revoke_link_roles(
-        self, discord_id: str, role_map: dict[str, dict[str, int]] | None = None
-    ) -> bool:
-        if role_map is None:
-            role_map = load_role_ids() or {}
-        removed_any = False
-        try:
-            discord_int = int(discord_id)
-        except (TypeError, ValueError):
-            return False
-
-        for guild in self.bot.guilds:
-            role_conf = (role_map or {}).get(str(guild.id))
-            if not role_conf:
-                continue
-            try:
-                member = guild.get_member(discord_int) or await guild.fetch_member(
-                    discord_int
-                )
-            except (discord.NotFound, discord.Forbidden):
-                continue
-            except discord.HTTPException:
-                continue
-
-            target_role_ids: set[int] = set()
-            for rid in role_conf.values():
-                if isinstance(rid, int):
-                    target_role_ids.add(rid)
-                else:
-                    try:
-                        target_role_ids.add(int(rid))
-                    except (TypeError, ValueError):
-                        continue
-            if not target_role_ids:
-                continue
-
-            roles_to_remove = [
-                role for role in member.roles if role.id in target_role_ids
-            ]
-            if not roles_to_remove:
-                continue
-
-            try:
-                await member.remove_roles(
-                    *roles_to_remove, reason="Twitch link: revoke roles (unresolved)"
-                )
-                removed_any = True
-            except discord.Forbidden:
-                continue
-            except discord.HTTPException:
-                continue
-
-            if removed_any:
-                break
-
-        return removed_any
+    async def _revoke_link_roles(self, discord_ids: list[str], now: dt.datetime) -> None:
+        """roles_revoked を立ててから、差分リコンサイルで連携ロールを外す。"""
+        if not discord_ids:
+            return
+        await asyncio.to_thread(
+            patch_linked_users,
+            {
+                did: {"roles_revoked": True, "roles_revoked_at": now.isoformat()}
+                for did in discord_ids
+            },
+        )
+        role_sync = self.bot.get_cog("RoleSyncCog")
+        if role_sync is None:
+            debug_print("[resend] RoleSyncCog が無いためロール剥奪をスキップ")
+            return
+        await role_sync.reconciler.reconcile_members(discord_ids)
 
     # ===== スケジュール本体 =====
-    async def notify_monthly_relink(self, *, force: bool = False) -> None:
+    async def notify_monthly_relink(self, *, force: bool = False) -> Dict[str, Any]:
+        # 実行日は CronTrigger が決める（停止明けの追いかけ実行は 1 日を過ぎることがある）
         now = jst_now()
-        if not force and now.day != 1:
-            debug_print("[monthly] 月初ではないためスキップ")
-            return
-
-        sent = 0
-        state = load_users()
-        for discord_id, user in list(state.items()):
-            if not isinstance(user, dict):
-                continue
 
-            if user.get("twitch_user_id"):
-                continue
-
-            if not force and user.get("resolved", False):
-                continue
+        targets = await asyncio.to_thread(
+            unlinked_notice_targets, include_resolved=force
+        )
+        ids = [t["discord_id"] for t in targets]
+        suppressed = await asyncio.to_thread(suppressed_ids, ids)
+        send_ids = [did for did in ids if did not in suppressed]
+        summary = await _send_relink_batch(
+            self.bot,
+            send_ids,
+            now,
+            {t["discord_id"] for t in targets if not t["first_notice_at"]},
+        )
+        debug_print(
+            f"[monthly] 送信完了: {summary.sent}件 (DM停止中スキップ: {len(ids) - len(send_ids)}件) {summary.as_dict()}"
+        )
+        return {
+            "targets": len(ids),
+            "suppressed": len(ids) - len(send_ids),
+            **summary.as_dict(),
+        }
 
-            ok = await send_dm(
-                self.bot, int(discord_id), build_relink_message(discord_id)
-            )
-            if ok:
-                sent += 1
-                updates: Dict[str, Any] = {
-                    "last_notice_at": now.isoformat(),
-                    "resolved": False,
-                }
-                if not user.get("first_notice_at"):
-                    updates["first_notice_at"] = now.isoformat()
-                patch_linked_user(str(discord_id), updates)
-            await asyncio.sleep(1)
-        debug_print(f"[monthly] 送信完了: {sent}件")
-
-    async def resend_after_7days_if_unlinked(self) -> None:
+    async def resend_after_7days_if_unlinked(self) -> Dict[str, Any]:
         now = jst_now()
-        users = load_users()
-        role_map = load_role_ids() or {}
-        resend_cnt = 0
-
-        for discord_id, lu in list(users.items()):
-            if not isinstance(lu, dict):
-                continue
-            if lu.get("resolved", False):
-                continue
-
-            if lu.get("twitch_user_id"):
-                continue
-
-            last_notice = _parse_iso_datetime(lu.get("last_notice_at"))
+        targets = await asyncio.to_thread(
+            unlinked_notice_targets, noticed_only=True
+        )
+        due: list[str] = []
+        for target in targets:
+            last_notice = _parse_iso_datetime(target["last_notice_at"])
             if last_notice is None:
                 continue
             if now - last_notice < dt.timedelta(days=7):
                 continue
+            due.append(target["discord_id"])
+
+        await self._revoke_link_roles(due, now)
 
-            revoked = await self._revoke_link_roles(discord_id, role_map=role_map)
-            if revoked:
-                patch_linked_user(
-                    str(discord_id),
-                    {"roles_revoked": True, "roles_revoked_at": now.isoformat()},
-                )
-
-            ok = await send_dm(
-                self.bot, int(discord_id), build_relink_message(discord_id)
-            )
-            if ok:
-                resend_cnt += 1
-                patch_linked_user(
-                    str(discord_id),
-                    {"last_notice_at": now.isoformat(), "resolved": False},
-                )
-            await asyncio.sleep(0.5)
-        debug_print(f"[resend] 再送完了: {resend_cnt}件")
+        # ロール剥奪は行うが、DM 拒否で停止中の相手には再送しない
+        suppressed = await asyncio.to_thread(suppressed_ids, due)
+        send_ids = [did for did in due if did not in suppressed]
+        summary = await _send_relink_batch(self.bot, send_ids, now)
+        debug_print(
+            f"[resend] 再送完了: {summary.sent}件 (DM停止中スキップ: {len(due) - len(send_ids)}件) {summary.as_dict()}"
+        )
+        return {
+            "targets": len(due),
+            "suppressed": len(due) - len(send_ids),
+            **summary.as_dict(),
+        }
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -240,25 +245,25 @@ class ReLinkCog(commands.Cog):
         # 複数回 on_ready が来ても二重起動しないように
         if self._scheduler_started:
             return
+        SCHEDULER.start()
         # 毎月1日 09:05 JST に初回通知
-        self.scheduler.add_job(
-            self.notify_monthly_relink,
+        SCHEDULER.ensure_job(
+            self.JOB_MONTHLY,
             CronTrigger(day="1", hour=9, minute=5, timezone="Asia/Tokyo"),
             kwargs={"force": False},
-            id="monthly_relink_first_day",
-            replace_existing=True,
         )
         # 毎日 09:10 JST に「7日経過未解決へ再送」
-        self.scheduler.add_job(
-            self.resend_after_7days_if_unlinked,
+        SCHEDULER.ensure_job(
+            self.JOB_RESEND,
             CronTrigger(hour=9, minute=10, timezone="Asia/Tokyo"),
-            id="monthly_relink_resend",
-            replace_existing=True,
         )
-        self.scheduler.start()
         self._scheduler_started = True
         debug_print("[scheduler] started")
 
+    def cog_unload(self):
+        if self._scheduler_started:
+            SCHEDULER.shutdown()
+
     # ===== テスト用スラッシュコマンド =====
     @discord.slash_command(
         name="force_relink", description="（テスト）今すぐ全員に再リンクDMを送ります"
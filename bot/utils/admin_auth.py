@@ -0,0 +1,28 @@
+# bot/utils/admin_auth.py
+"""管理 API の Bearer 認証（token.json の admin_api_token と照合）。"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from bot.common import debug_print
+from bot.utils.save_and_load import get_admin_api_token
+
+ADMIN_API_TOKEN = get_admin_api_token()
+
+
+def require_admin_token(auth_header: Optional[str]) -> bool:
+    if not ADMIN_API_TOKEN:
+        debug_print("[ADMIN] token check: server-side token missing (reject)")
+        return False
+    if not auth_header:
+        debug_print("[ADMIN] token check: Authorization header missing (reject)")
+        return False
+    try:
+        scheme, token = auth_header.split(" ", 1)
+    except ValueError:
+        debug_print("[ADMIN] token check: malformed Authorization header (reject)")
+        return False
+    ok = scheme.lower() == "bearer" and token.strip() == ADMIN_API_TOKEN
+    debug_print(f"[ADMIN] token check: {'ok' if ok else 'reject'}")
+    return ok
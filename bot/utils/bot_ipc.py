@@ -0,0 +1,60 @@
+# bot/utils/bot_ipc.py
+"""
+受付専用プロセス（bot/ingress_app.py）と Bot プロセスの間のローカル IPC
+- BOT_IPC_ADDRESS を設定すると、Bot プロセスは FastAPI を公開ポートではなくこのアドレスで
+  待ち受ける。"unix:/path/to/bot.sock"（Unix ソケット）か "http://127.0.0.1:8100"
+  （Unix ソケットの使えない Windows 向け、ループバック限定）
+- 受付プロセスは同じアドレスへ Bot 専用の管理 API を中継し、キューに積んだら wake を送る
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+BOT_IPC_ADDRESS = (os.getenv("BOT_IPC_ADDRESS") or "").strip()
+WAKE_PATH = "/internal/wake"
+DEFAULT_IPC_PORT = 8100
+
+
+@dataclass(frozen=True)
+class IPCAddress:
+    uds: Optional[str] = None
+    host: str = "127.0.0.1"
+    port: int = DEFAULT_IPC_PORT
+
+    @property
+    def base_url(self) -> str:
+        # Unix ソケットでもホスト名は必要（中身は使われない）
+        return "http://bot" if self.uds else f"http://{self.host}:{self.port}"
+
+    def uvicorn_kwargs(self) -> Dict[str, Any]:
+        if self.uds:
+            return {"uds": self.uds}
+        return {"host": self.host, "port": self.port}
+
+
+def parse_ipc_address(value: Optional[str]) -> Optional[IPCAddress]:
+    value = (value or "").strip()
+    if not value:
+        return None
+    if value.startswith("unix:"):
+        path = value[len("unix:") :]
+        if not path:
+            raise ValueError("BOT_IPC_ADDRESS: unix socket path is empty")
+        return IPCAddress(uds=path)
+    parsed = urlparse(value if "://" in value else f"http://{value}")
+    return IPCAddress(
+        host=parsed.hostname or "127.0.0.1", port=parsed.port or DEFAULT_IPC_PORT
+    )
+
+
+def ipc_client(address: IPCAddress, timeout: httpx.Timeout) -> httpx.AsyncClient:
+    transport = httpx.AsyncHTTPTransport(uds=address.uds) if address.uds else None
+    return httpx.AsyncClient(
+        base_url=address.base_url, transport=transport, timeout=timeout
+    )
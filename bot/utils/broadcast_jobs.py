@@ -0,0 +1,313 @@
+# bot/utils/broadcast_jobs.py
+"""
+永続化された DM 一斉送信ジョブ
+- ジョブ作成時に受信者をスナップショットして broadcast_recipients に保存する
+- 送信結果は受信者ごとにバッチで書き戻すので、再起動後は pending の人だけ再開できる
+- pause / resume / cancel は DB のステータスを正とし、実行中ワーカーには停止を通知する
+"""
+
+from __future__ import annotations
+
+import asyncio
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import discord
+
+from bot.utils.dm_attachments import AttachmentSet, load_attachment_set
+from bot.utils.broadcast_progress import PROGRESS_HUB, ProgressHub
+from bot.utils.dm_broadcast import (
+    DMOutcome,
+    broadcast_dm,
+    classify_dm_error,
+    persist_linked_user_outcomes,
+)
+from bot.utils.dm_suppression import (
+    DM_SUPPRESSED,
+    SUPPRESSED_REASON,
+    record_dm_outcomes,
+    suppressed_ids,
+)
+from bot.utils.logs import get_logger, set_correlation_id
+from bot.utils.metrics import BROADCAST_JOBS, BROADCAST_RECIPIENTS
+from bot.utils.save_and_load import (
+    broadcast_job_create,
+    broadcast_job_get,
+    broadcast_job_pending_recipients,
+    broadcast_job_set_status,
+    broadcast_jobs_unfinished,
+    broadcast_recipients_record,
+)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_CANCELLED = "cancelled"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+TERMINAL_STATUSES = frozenset({JOB_CANCELLED, JOB_DONE, JOB_FAILED})
+
+log = get_logger("dmjob")
+
+SendDM = Callable[
+    [discord.abc.Messageable, str, Optional[AttachmentSet]], Awaitable[DMOutcome]
+]
+
+
+@dataclass
+class _Recipient:
+    id: int
+    display_name: str | None
+
+
+def render_message(message: str, display_name: str | None) -> str:
+    """受信者ごとのプレースホルダ置換（現状 {user} のみ）。"""
+    if message and "{user}" in message:
+        return message.replace("{user}", str(display_name or ""))
+    return message
+
+
+def job_correlation_id(job_id: str) -> str:
+    return f"dmjob:{job_id}"
+
+
+def create_job(spec: Dict[str, Any], recipients: list[Dict[str, Any]]) -> str:
+    """ジョブを作成して ID を返す（同期。API スレッドからそのまま呼べる）。"""
+    job_id = uuid.uuid4().hex
+    broadcast_job_create(job_id, spec, recipients)
+    log.info(
+        "created job=%s recipients=%d",
+        job_id,
+        len(recipients),
+        extra={"correlation_id": job_correlation_id(job_id)},
+    )
+    return job_id
+
+
+class BroadcastJobRunner:
+    """Bot のイベントループ上でジョブを実行する。メソッドは必ずそのループから呼ぶ。"""
+
+    def __init__(
+        self,
+        bot: discord.Client,
+        send_dm: SendDM,
+        progress: ProgressHub = PROGRESS_HUB,
+    ) -> None:
+        self.bot = bot
+        self.send_dm = send_dm
+        self.progress = progress
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stop_requests: Dict[str, str] = {}
+
+    def is_running(self, job_id: str) -> bool:
+        task = self._tasks.get(job_id)
+        return task is not None and not task.done()
+
+    def start(self, job_id: str) -> bool:
+        if self.is_running(job_id):
+            return False
+        self._stop_requests.pop(job_id, None)
+        task = asyncio.create_task(self._run(job_id), name=f"dm-job-{job_id}")
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda t, jid=job_id: self._on_task_done(jid, t))
+        return True
+
+    def _on_task_done(self, job_id: str, task: asyncio.Task) -> None:
+        if self._tasks.get(job_id) is task:
+            del self._tasks[job_id]
+        if task.cancelled():
+            return
+        # 停止処理中に resume された場合、DB は pending / running のまま残るので拾い直す
+        asyncio.create_task(
+            self._restart_if_pending(job_id), name=f"dm-job-restart-{job_id}"
+        )
+
+    async def _restart_if_pending(self, job_id: str) -> None:
+        job = await asyncio.to_thread(broadcast_job_get, job_id)
+        if job and job["status"] in (JOB_PENDING, JOB_RUNNING) and self.start(job_id):
+            log.info("job=%s restarted after resume", job_id)
+
+    async def resume_unfinished(self) -> int:
+        """起動時: pending / running のまま残ったジョブを再開する。"""
+        job_ids = await asyncio.to_thread(broadcast_jobs_unfinished)
+        started = sum(1 for job_id in job_ids if self.start(job_id))
+        if started:
+            log.info("resumed %d unfinished job(s)", started)
+        return started
+
+    async def pause(self, job_id: str) -> bool:
+        ok = await asyncio.to_thread(
+            broadcast_job_set_status,
+            job_id,
+            JOB_PAUSED,
+            only_from=[JOB_PENDING, JOB_RUNNING],
+        )
+        if ok:
+            self.progress.set_status(job_id, JOB_PAUSED)
+            if self.is_running(job_id):
+                self._stop_requests[job_id] = JOB_PAUSED
+        return ok
+
+    async def resume(self, job_id: str) -> bool:
+        if not self.is_running(job_id):
+            ok = await asyncio.to_thread(
+                broadcast_job_set_status, job_id, JOB_PENDING, only_from=[JOB_PAUSED]
+            )
+            if ok:
+                self.progress.set_status(job_id, JOB_PENDING)
+                self.start(job_id)
+            return ok
+        # 停止待ちのタスクがまだ動いている: 停止要求を取り消してそのまま続けさせる
+        # （送信ループがすでに止まっていたら、_run が pending に戻して終了時に start し直す）
+        ok = await asyncio.to_thread(
+            broadcast_job_set_status, job_id, JOB_RUNNING, only_from=[JOB_PAUSED]
+        )
+        if ok:
+            self.progress.set_status(job_id, JOB_RUNNING)
+            self._stop_requests.pop(job_id, None)
+            # 更新を待つ間にタスクが終わっていたら start し直す
+            if not self.is_running(job_id):
+                self.start(job_id)
+        return ok
+
+    async def cancel(self, job_id: str) -> bool:
+        ok = await asyncio.to_thread(
+            broadcast_job_set_status,
+            job_id,
+            JOB_CANCELLED,
+            only_from=[JOB_PENDING, JOB_RUNNING, JOB_PAUSED],
+        )
+        if ok:
+            self.progress.set_status(job_id, JOB_CANCELLED)
+            if self.is_running(job_id):
+                self._stop_requests[job_id] = JOB_CANCELLED
+        return ok
+
+    def _resolve(self, guild: discord.Guild | None, recipient: _Recipient) -> Any:
+        if guild is not None:
+            member = guild.get_member(recipient.id)
+            if member is not None:
+                return member
+        return self.bot.get_user(recipient.id)
+
+    async def _run(self, job_id: str) -> None:
+        # このタスクと送信ワーカーのログ（受信者ごとの DM ログも）をジョブ単位でたどれるようにする
+        set_correlation_id(job_correlation_id(job_id))
+        await self.bot.wait_until_ready()
+        job = await asyncio.to_thread(broadcast_job_get, job_id)
+        if not job or job["status"] not in (JOB_PENDING, JOB_RUNNING):
+            return
+        spec = job["spec"]
+        # 取得後に pause / cancel された場合は上書きしない
+        claimed = await asyncio.to_thread(
+            broadcast_job_set_status,
+            job_id,
+            JOB_RUNNING,
+            only_from=[JOB_PENDING, JOB_RUNNING],
+        )
+        if not claimed:
+            return
+        counts = dict(job.get("counts") or {})
+        try:
+            pending = await asyncio.to_thread(broadcast_job_pending_recipients, job_id)
+            # DM 拒否で停止中の相手には送らず、スキップとして記録する
+            suppressed = await asyncio.to_thread(
+                suppressed_ids, [item["id"] for item in pending]
+            )
+            if suppressed:
+                await asyncio.to_thread(
+                    broadcast_recipients_record,
+                    job_id,
+                    {did: (DM_SUPPRESSED, SUPPRESSED_REASON) for did in suppressed},
+                )
+                counts[DM_SUPPRESSED] = counts.get(DM_SUPPRESSED, 0) + len(suppressed)
+            self.progress.begin(job_id, total=job["total"], counts=counts)
+            targets = [
+                _Recipient(int(item["id"]), item.get("display_name"))
+                for item in pending
+                if str(item["id"]) not in suppressed
+            ]
+            log.info(
+                "start job=%s pending=%d suppressed=%d total=%s",
+                job_id,
+                len(targets),
+                len(suppressed),
+                job["total"],
+            )
+            guild = None
+            if spec.get("guild_id"):
+                guild = self.bot.get_guild(int(spec["guild_id"]))
+            message = str(spec.get("message") or "")
+            attachment_set = await load_attachment_set(spec.get("attachments") or [])
+
+            async def _send_one(recipient: _Recipient) -> DMOutcome:
+                user = self._resolve(guild, recipient)
+                if user is None:
+                    try:
+                        user = await self.bot.fetch_user(recipient.id)
+                    except Exception as exc:
+                        return classify_dm_error(exc)
+                display_name = recipient.display_name or getattr(
+                    user, "display_name", None
+                )
+                return await self.send_dm(
+                    user, render_message(message, display_name), attachment_set
+                )
+
+            def _on_outcome(_rid: Any, outcome: DMOutcome) -> None:
+                BROADCAST_RECIPIENTS.inc(outcome[0])
+                self.progress.record(job_id, outcome[0])
+
+            def _persist(outcomes: Dict[str, DMOutcome]) -> None:
+                broadcast_recipients_record(job_id, outcomes)
+                persist_linked_user_outcomes(outcomes)
+                record_dm_outcomes(outcomes, source="broadcast")
+
+            halted = False
+
+            def _should_stop() -> bool:
+                nonlocal halted
+                if job_id in self._stop_requests:
+                    halted = True
+                return halted
+
+            summary = await broadcast_dm(
+                targets,
+                _send_one,
+                persist=_persist,
+                should_stop=_should_stop,
+                on_outcome=_on_outcome,
+            )
+        except Exception as exc:
+            log.exception("job=%s failed: %r", job_id, exc)
+            await asyncio.to_thread(
+                broadcast_job_set_status, job_id, JOB_FAILED, error=repr(exc)
+            )
+            self.progress.set_status(job_id, JOB_FAILED)
+            BROADCAST_JOBS.inc(JOB_FAILED)
+            return
+
+        stopped = self._stop_requests.pop(job_id, None)
+        if stopped is None and halted:
+            # 送信ループを止めた後に resume された。未送信分は _on_task_done で start し直す
+            requeued = await asyncio.to_thread(
+                broadcast_job_set_status, job_id, JOB_PENDING, only_from=[JOB_RUNNING]
+            )
+            if requeued:
+                self.progress.set_status(job_id, JOB_PENDING)
+            log.info("job=%s interrupted and resumed", job_id)
+            return
+        if stopped is None:
+            finished = await asyncio.to_thread(
+                broadcast_job_set_status, job_id, JOB_DONE, only_from=[JOB_RUNNING]
+            )
+            if finished:
+                self.progress.set_status(job_id, JOB_DONE)
+        BROADCAST_JOBS.inc(stopped or JOB_DONE)
+        log.info(
+            "job=%s %s",
+            job_id,
+            stopped or JOB_DONE,
+            extra={"result": summary.as_dict()},
+        )
@@ -0,0 +1,203 @@
+# bot/utils/broadcast_progress.py
+"""
+一斉送信ジョブの進捗 pub/sub（インメモリ）
+- 送信エンジンが結果ごとに record() し、最新スナップショットだけを保持する
+- 購読者（SSE 接続）は別スレッドのイベントループにいてもよい。通知は
+  call_soon_threadsafe で起こすだけで、未消化の通知は 1 つにまとめる
+- SQLite は読まないので、同時に何人が見ていても送信側の負荷は変わらない
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import datetime as dt
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+# 直近何秒の完了件数から送信レートを出すか
+RATE_WINDOW_SEC = 30.0
+# 保持する終了済みジョブの数
+MAX_RETAINED_JOBS = 50
+TERMINAL_STATUSES = frozenset({"done", "cancelled", "failed"})
+
+
+@dataclass
+class JobProgress:
+    job_id: str
+    status: str
+    total: int = 0
+    sent: int = 0
+    dm_closed: int = 0
+    failed: int = 0
+    suppressed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    updated_at: str = ""
+    completions: Deque[float] = field(default_factory=collections.deque)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.dm_closed + self.failed + self.suppressed
+
+    def rate(self, now: float) -> float:
+        while self.completions and now - self.completions[0] > RATE_WINDOW_SEC:
+            self.completions.popleft()
+        if not self.completions:
+            return 0.0
+        span = max(1.0, min(RATE_WINDOW_SEC, now - self.started_at))
+        return len(self.completions) / span
+
+    def as_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        remaining = max(0, self.total - self.done)
+        rate = self.rate(now)
+        eta = None
+        if self.status == "running" and rate > 0:
+            eta = round(remaining / rate, 1)
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "total": self.total,
+            "sent": self.sent,
+            "dm_closed": self.dm_closed,
+            "failed": self.failed,
+            "suppressed": self.suppressed,
+            "done": self.done,
+            "remaining": remaining,
+            "rate_per_sec": round(rate, 2),
+            "eta_sec": eta,
+            "updated_at": self.updated_at,
+        }
+
+
+def progress_from_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """DB のジョブ行（broadcast_job_get の戻り値）から同じ形のスナップショットを作る。"""
+    counts = job.get("counts") or {}
+    progress = JobProgress(
+        job_id=str(job.get("id")),
+        status=str(job.get("status") or ""),
+        total=int(job.get("total") or 0),
+        sent=int(counts.get("sent", 0)),
+        dm_closed=int(counts.get("dm_closed", 0)),
+        failed=int(counts.get("failed", 0)),
+        suppressed=int(counts.get("suppressed", 0)),
+        updated_at=str(job.get("updated_at") or ""),
+    )
+    return progress.as_dict()
+
+
+class Subscription:
+    """1 接続分の購読。wait() は購読を作ったループで呼ぶこと。"""
+
+    def __init__(self, hub: "ProgressHub", job_id: str) -> None:
+        self.hub = hub
+        self.job_id = job_id
+        self.loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._pending = False
+
+    def _wake(self) -> None:
+        # ProgressHub のロック内から呼ばれる
+        if self._pending:
+            return
+        self._pending = True
+        self.loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            woke = True
+        except asyncio.TimeoutError:
+            woke = False
+        with self.hub._lock:
+            self._event.clear()
+            self._pending = False
+        return woke
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class ProgressHub:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._jobs: "collections.OrderedDict[str, JobProgress]" = (
+            collections.OrderedDict()
+        )
+        self._subs: Dict[str, set[Subscription]] = {}
+
+    def _notify(self, job_id: str) -> None:
+        for sub in self._subs.get(job_id, ()):
+            try:
+                sub._wake()
+            except RuntimeError:
+                # 購読側のループが既に閉じている
+                pass
+
+    def _touch(self, progress: JobProgress) -> None:
+        progress.updated_at = dt.datetime.now(dt.timezone.utc).isoformat()
+        self._notify(progress.job_id)
+
+    def begin(self, job_id: str, *, total: int, counts: Dict[str, int]) -> None:
+        with self._lock:
+            progress = JobProgress(
+                job_id=job_id,
+                status="running",
+                total=int(total),
+                sent=int(counts.get("sent", 0)),
+                dm_closed=int(counts.get("dm_closed", 0)),
+                failed=int(counts.get("failed", 0)),
+                suppressed=int(counts.get("suppressed", 0)),
+            )
+            self._jobs[job_id] = progress
+            self._jobs.move_to_end(job_id)
+            while len(self._jobs) > MAX_RETAINED_JOBS:
+                self._jobs.popitem(last=False)
+            self._touch(progress)
+
+    def record(self, job_id: str, status: str) -> None:
+        with self._lock:
+            progress = self._jobs.get(job_id)
+            if progress is None:
+                return
+            if status == "sent":
+                progress.sent += 1
+            elif status == "dm_closed":
+                progress.dm_closed += 1
+            else:
+                progress.failed += 1
+            progress.completions.append(time.monotonic())
+            self._touch(progress)
+
+    def set_status(self, job_id: str, status: str) -> None:
+        with self._lock:
+            progress = self._jobs.get(job_id)
+            if progress is None:
+                return
+            progress.status = status
+            self._touch(progress)
+
+    def snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            progress = self._jobs.get(job_id)
+            return progress.as_dict() if progress is not None else None
+
+    def subscribe(self, job_id: str) -> Subscription:
+        sub = Subscription(self, job_id)
+        with self._lock:
+            self._subs.setdefault(job_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.job_id)
+            if subs is None:
+                return
+            subs.discard(sub)
+            if not subs:
+                self._subs.pop(sub.job_id, None)
+
+
+PROGRESS_HUB = ProgressHub()
@@ -0,0 +1,220 @@
+# bot/utils/dm_attachments.py
+"""
+一斉送信用の添付ファイル読み込み
+- ジョブ開始時に 1 回だけローカル読込／ダウンロードして不変バッファに保持する
+- 受信者ごとの discord.File はバッファのビュー（コピーしない）から作る
+- メモリ上限は Discord DM の制限と同じ 8MB × 10 ファイル
+"""
+
+from __future__ import annotations
+
+import io
+import os
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+
+import discord
+import httpx
+
+from bot.common import debug_print
+
+# Discord DM の添付上限（webadmin/panel/forms.py の MAX_ATTACHMENT_BYTES と揃える）
+MAX_ATTACHMENT_BYTES = 8 * 1024 * 1024
+MAX_FILES_PER_MESSAGE = 10
+DOWNLOAD_TIMEOUT = 20.0
+
+
+class _BufferReader(io.BufferedIOBase):
+    """memoryview を読むだけのファイルオブジェクト。
+
+    aiohttp は 64KB 単位で read() するため、全体のコピーは発生しない。
+    close() しても共有バッファには影響しない。
+    """
+
+    def __init__(self, view: memoryview) -> None:
+        super().__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        self._pos = max(0, min(pos, len(self._view)))
+        return self._pos
+
+    def read(self, size: int | None = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else self._pos + size
+        chunk = self._view[self._pos : end]
+        self._pos += len(chunk)
+        return chunk.tobytes()
+
+    def read1(self, size: int = -1) -> bytes:
+        return self.read(size)
+
+    def readinto(self, buffer: Any) -> int:
+        target = memoryview(buffer).cast("B")
+        chunk = self._view[self._pos : self._pos + len(target)]
+        n = len(chunk)
+        target[:n] = chunk
+        self._pos += n
+        return n
+
+
+@dataclass(frozen=True)
+class PreparedAttachment:
+    filename: str
+    data: bytes
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def to_file(self) -> discord.File:
+        return discord.File(_BufferReader(memoryview(self.data)), self.filename)
+
+
+@dataclass(frozen=True)
+class AttachmentSet:
+    """ジョブ単位で共有する添付バッファ（不変）。"""
+
+    items: tuple[PreparedAttachment, ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(item.size for item in self.items)
+
+    def to_files(self) -> list[discord.File]:
+        # discord.File は 1 回きりなので送信ごとに作り直す（バッファは共有）
+        return [item.to_file() for item in self.items]
+
+
+def normalize_attachment_specs(
+    attachments: Iterable[Any] | None,
+    file_url: str | None = None,
+    file_path: str | None = None,
+) -> list[dict[str, Any]]:
+    specs: list[dict[str, Any]] = []
+    for item in attachments or []:
+        if not isinstance(item, dict):
+            continue
+        specs.append(
+            {
+                "url": item.get("url") or item.get("file_url"),
+                "path": item.get("path") or item.get("file_path"),
+                "name": item.get("name"),
+            }
+        )
+    if (file_url or file_path) and not specs:
+        specs.append({"url": file_url, "path": file_path, "name": None})
+    return specs
+
+
+def _read_local(path: str, display_name: Optional[str]) -> PreparedAttachment | None:
+    try:
+        if not os.path.isfile(path):
+            debug_print(f"[DM] local attachment not found: {path}")
+            return None
+        size = os.path.getsize(path)
+        if size > MAX_ATTACHMENT_BYTES:
+            debug_print(f"[DM] local attachment too large ({size} bytes): {path}")
+            return None
+        debug_print(f"[DM] reading local attachment: {path}")
+        with open(path, "rb") as fp:
+            data = fp.read(MAX_ATTACHMENT_BYTES + 1)
+        if len(data) > MAX_ATTACHMENT_BYTES:
+            return None
+        return PreparedAttachment(
+            display_name or os.path.basename(path) or "attachment", data
+        )
+    except Exception as exc:
+        debug_print(f"[DM] failed reading local file: {exc!r}")
+        return None
+
+
+async def _download(
+    client: httpx.AsyncClient, url: str, display_name: Optional[str]
+) -> PreparedAttachment | None:
+    try:
+        debug_print(f"[DM] downloading attachment: {url}")
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            buf = bytearray()
+            async for chunk in response.aiter_bytes():
+                buf.extend(chunk)
+                if len(buf) > MAX_ATTACHMENT_BYTES:
+                    debug_print(f"[DM] remote attachment exceeds 8MB: {url}")
+                    return None
+        debug_print(
+            f"[DM] downloaded: status={response.status_code} bytes={len(buf)}"
+        )
+        return PreparedAttachment(
+            display_name or url.rsplit("/", 1)[-1] or "attachment", bytes(buf)
+        )
+    except Exception as exc:
+        debug_print(f"[DM] failed downloading file: {exc!r}")
+        return None
+
+
+async def load_attachment_set(
+    specs: Iterable[dict[str, Any]],
+    *,
+    client: httpx.AsyncClient | None = None,
+) -> AttachmentSet:
+    """添付指定をまとめて解決する（ジョブにつき 1 回だけ呼ぶ）。
+
+    上限を超える指定は受付時（フォームと /send_role_dm）で弾くので、ここに来たら黙って削らずに失敗させる。
+    """
+    spec_list = list(specs or [])
+    if len(spec_list) > MAX_FILES_PER_MESSAGE:
+        raise ValueError(
+            f"too many attachments: {len(spec_list)} > {MAX_FILES_PER_MESSAGE}"
+        )
+    if not spec_list:
+        return AttachmentSet()
+
+    close_client = False
+    if client is None and any(spec.get("url") for spec in spec_list):
+        client = httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT)
+        close_client = True
+
+    items: list[PreparedAttachment] = []
+    try:
+        for spec in spec_list:
+            display_name = spec.get("name")
+            loaded: PreparedAttachment | None = None
+            if spec.get("path"):
+                loaded = _read_local(str(spec["path"]), display_name)
+            if loaded is None and spec.get("url") and client is not None:
+                loaded = await _download(client, str(spec["url"]), display_name)
+            if loaded is not None:
+                items.append(loaded)
+    finally:
+        if close_client and client is not None:
+            await client.aclose()
+
+    attachment_set = AttachmentSet(tuple(items))
+    debug_print(
+        f"[DM] attachments prepared files={len(attachment_set)} bytes={attachment_set.total_bytes}"
+    )
+    return attachment_set
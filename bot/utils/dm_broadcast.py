@@ -0,0 +1,349 @@
+# bot/utils/dm_broadcast.py
+"""
+DM 一斉送信エンジン
+- 有界ワーカープールで並列送信（固定 sleep は使わない）
+- レート制限は py-cord の HTTPClient がレスポンスヘッダ (X-RateLimit-*) を元に
+  ルート単位・グローバルのバケットで待機する。ここではその 429 通知を拾って
+  並列数を AIMD で調整する（429 で半減、成功が続けば +1）。
+- 受信者ごとの結果 (sent / dm_closed / failed) を linked_users に書き戻す
+  （persist を渡せばジョブテーブル等へも同じバッチで書ける）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+import discord
+
+from bot.utils.logs import get_logger
+from bot.utils.save_and_load import patch_linked_users
+
+log = get_logger("dm")
+
+DM_SENT = "sent"
+DM_CLOSED = "dm_closed"
+DM_FAILED = "failed"
+
+# Discord: "Cannot send messages to this user"
+DISCORD_CANNOT_DM_CODE = 50007
+
+DMOutcome = Tuple[str, Optional[str]]
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+DEFAULT_CONCURRENCY = _env_int("DM_BROADCAST_CONCURRENCY", 4)
+MAX_CONCURRENCY = _env_int("DM_BROADCAST_MAX_CONCURRENCY", 10)
+# 何件連続で成功したら並列数を 1 増やすか
+INCREASE_AFTER = _env_int("DM_BROADCAST_INCREASE_AFTER", 25)
+# linked_users へ結果を書き戻す単位（件数 / 秒）
+OUTCOME_FLUSH_SIZE = _env_int("DM_BROADCAST_FLUSH_SIZE", 50)
+OUTCOME_FLUSH_INTERVAL = 2.0
+
+
+def classify_dm_error(exc: BaseException) -> DMOutcome:
+    """送信時の例外を (status, reason) に分類する。"""
+    if isinstance(exc, discord.Forbidden):
+        return DM_CLOSED, "DM拒否 (Forbidden)"
+    if isinstance(exc, discord.HTTPException):
+        if getattr(exc, "code", None) == DISCORD_CANNOT_DM_CODE:
+            return DM_CLOSED, "DM拒否 (Forbidden)"
+        return DM_FAILED, f"HTTPエラー: {exc}"
+    return DM_FAILED, f"送信エラー: {exc!r}"
+
+
+def outcome_updates(outcome: DMOutcome) -> Dict[str, Any]:
+    """結果を linked_users の dm_failed / dm_failed_reason に変換する。"""
+    status, reason = outcome
+    if status == DM_SENT:
+        return {"dm_failed": False, "dm_failed_reason": None}
+    return {"dm_failed": True, "dm_failed_reason": reason or status}
+
+
+def persist_linked_user_outcomes(outcomes: Dict[str, DMOutcome]) -> None:
+    """結果バッチを linked_users に反映する（スレッドから呼ぶ同期関数）。"""
+    patch_linked_users(
+        {did: outcome_updates(outcome) for did, outcome in outcomes.items()},
+        include_none=True,
+    )
+
+
+# ========= 429 監視 =========
+class _RateLimitLogHandler(logging.Handler):
+    """discord.http が出す 429 警告を拾ってリミッタに通知する。
+
+    py-cord は 429 を内部でリトライするため例外としては見えない。
+    警告ログの引数 (retry_after, bucket) が唯一の観測点になる。
+    グローバル制限では同じ 429 について「Global rate limit」の警告がもう 1 件続くので、
+    そちらは減速には数えず、全体の一時停止だけに使う。
+    """
+
+    def __init__(self) -> None:
+        super().__init__(level=logging.WARNING)
+        self.limiters: "weakref.WeakSet[AdaptiveLimiter]" = weakref.WeakSet()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            msg = str(record.msg)
+            if "rate limited" not in msg and "Global rate limit" not in msg:
+                return
+            retry_after = 1.0
+            if record.args:
+                try:
+                    retry_after = float(record.args[0])
+                except (TypeError, ValueError, IndexError):
+                    retry_after = 1.0
+            is_global = "Global rate limit" in msg
+            for limiter in list(self.limiters):
+                if is_global:
+                    limiter.pause_for(retry_after)
+                else:
+                    limiter.on_rate_limited(retry_after)
+        except Exception:
+            pass
+
+
+_RATE_LIMIT_HANDLER: _RateLimitLogHandler | None = None
+
+
+def _rate_limit_handler() -> _RateLimitLogHandler:
+    global _RATE_LIMIT_HANDLER
+    if _RATE_LIMIT_HANDLER is None:
+        _RATE_LIMIT_HANDLER = _RateLimitLogHandler()
+        logging.getLogger("discord.http").addHandler(_RATE_LIMIT_HANDLER)
+    return _RATE_LIMIT_HANDLER
+
+
+class AdaptiveLimiter:
+    """並列数を動的に変える非同期セマフォ（AIMD）。"""
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_CONCURRENCY,
+        *,
+        minimum: int = 1,
+        maximum: int = MAX_CONCURRENCY,
+        increase_after: int = INCREASE_AFTER,
+    ) -> None:
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.increase_after = max(1, increase_after)
+        self.rate_limited = 0
+        self._active = 0
+        self._streak = 0
+        self._paused_until = 0.0
+        self._cond = asyncio.Condition()
+
+    def attach(self) -> "AdaptiveLimiter":
+        _rate_limit_handler().limiters.add(self)
+        return self
+
+    def detach(self) -> None:
+        _rate_limit_handler().limiters.discard(self)
+
+    def on_rate_limited(self, retry_after: float) -> None:
+        """429 1 件につき 1 回だけ呼ぶ（並列数を半分にする）。"""
+        self.rate_limited += 1
+        self._streak = 0
+        new_limit = max(self.minimum, self.limit // 2)
+        if new_limit != self.limit:
+            log.warning(
+                "429 observed (retry_after=%.2fs) concurrency %d -> %d",
+                retry_after,
+                self.limit,
+                new_limit,
+            )
+        self.limit = new_limit
+
+    def pause_for(self, retry_after: float) -> None:
+        """グローバル制限: retry_after の間は新しい送信を始めない。"""
+        self._paused_until = max(
+            self._paused_until, time.monotonic() + max(0.0, retry_after)
+        )
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            while self._active >= self.limit:
+                await self._cond.wait()
+            self._active += 1
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, *, success: bool) -> None:
+        async with self._cond:
+            self._active -= 1
+            if success:
+                self._streak += 1
+                if self._streak >= self.increase_after and self.limit < self.maximum:
+                    self.limit += 1
+                    self._streak = 0
+            self._cond.notify_all()
+
+
+# ========= ブロードキャスト本体 =========
+@dataclass
+class BroadcastSummary:
+    total: int = 0
+    sent: int = 0
+    dm_closed: int = 0
+    failed: int = 0
+    rate_limited: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: float | None = None
+    outcomes: Dict[str, DMOutcome] = field(default_factory=dict)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.dm_closed + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return max(0.0, end - self.started_at)
+
+    def record(self, recipient_id: str, outcome: DMOutcome) -> None:
+        status = outcome[0]
+        if status == DM_SENT:
+            self.sent += 1
+        elif status == DM_CLOSED:
+            self.dm_closed += 1
+        else:
+            self.failed += 1
+        self.outcomes[recipient_id] = outcome
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "sent": self.sent,
+            "dm_closed": self.dm_closed,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "elapsed_sec": round(self.elapsed, 3),
+        }
+
+
+async def broadcast_dm(
+    recipients: Iterable[Any],
+    send_one: Callable[[Any], Awaitable[DMOutcome]],
+    *,
+    concurrency: int | None = None,
+    max_concurrency: int | None = None,
+    record_outcomes: bool = True,
+    on_outcome: Callable[[str, DMOutcome], Any] | None = None,
+    persist: Callable[[Dict[str, DMOutcome]], Any] | None = None,
+    should_stop: Callable[[], bool] | None = None,
+) -> BroadcastSummary:
+    """recipients へ send_one を並列適用し、結果を集計する。
+
+    recipients の各要素は ``id`` 属性を持つこと（discord.Member / User 等）。
+    persist は結果バッチを受け取る同期関数で、to_thread で実行される
+    （既定は linked_users への書き戻し）。should_stop が True を返すと
+    ワーカーは新しい受信者を取らずに終了する（送信中のものは完了させる）。
+    """
+    targets = list(recipients)
+    summary = BroadcastSummary(total=len(targets))
+    if not targets:
+        summary.finished_at = time.monotonic()
+        return summary
+
+    limiter = AdaptiveLimiter(
+        concurrency or DEFAULT_CONCURRENCY,
+        maximum=max_concurrency or MAX_CONCURRENCY,
+    ).attach()
+    queue: asyncio.Queue = asyncio.Queue()
+    for target in targets:
+        queue.put_nowait(target)
+
+    persist_fn = persist or persist_linked_user_outcomes
+    pending_outcomes: Dict[str, DMOutcome] = {}
+    last_flush = time.monotonic()
+
+    async def _flush() -> None:
+        nonlocal last_flush
+        last_flush = time.monotonic()
+        if not pending_outcomes:
+            return
+        batch = dict(pending_outcomes)
+        pending_outcomes.clear()
+        try:
+            await asyncio.to_thread(persist_fn, batch)
+        except Exception as exc:
+            log.exception("failed to persist outcomes: %r", exc)
+
+    async def _worker() -> None:
+        while True:
+            if should_stop is not None and should_stop():
+                return
+            try:
+                target = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            recipient_id = str(getattr(target, "id", target))
+            await limiter.acquire()
+            outcome: DMOutcome
+            try:
+                outcome = await send_one(target)
+            except Exception as exc:
+                outcome = classify_dm_error(exc)
+            await limiter.release(success=outcome[0] == DM_SENT)
+            summary.record(recipient_id, outcome)
+            # 受信者ごとのログは数が多いので、届いた分は LOG_SAMPLE_RATES の割合だけ残す
+            log.info(
+                "recipient=%s %s %s",
+                recipient_id,
+                outcome[0],
+                outcome[1] or "",
+                extra={"sample": "dm.recipient"} if outcome[0] == DM_SENT else None,
+            )
+            if on_outcome is not None:
+                try:
+                    on_outcome(recipient_id, outcome)
+                except Exception:
+                    pass
+            if record_outcomes:
+                pending_outcomes[recipient_id] = outcome
+                if (
+                    len(pending_outcomes) >= OUTCOME_FLUSH_SIZE
+                    or time.monotonic() - last_flush >= OUTCOME_FLUSH_INTERVAL
+                ):
+                    await _flush()
+
+    workers = [
+        asyncio.create_task(_worker())
+        for _ in range(min(limiter.maximum, len(targets)))
+    ]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            if not w.done():
+                w.cancel()
+        limiter.detach()
+        if record_outcomes:
+            await _flush()
+        summary.rate_limited = limiter.rate_limited
+        summary.finished_at = time.monotonic()
+
+    log.info(
+        "broadcast finished total=%d sent=%d closed=%d failed=%d rate_limited=%d elapsed=%.1fs",
+        summary.total,
+        summary.sent,
+        summary.dm_closed,
+        summary.failed,
+        summary.rate_limited,
+        summary.elapsed,
+    )
+    return summary
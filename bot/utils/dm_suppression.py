@@ -0,0 +1,80 @@
+# bot/utils/dm_suppression.py
+"""
+DM 抑止リスト
+- DM 拒否 (Forbidden / 50007) を返したユーザーを dm_suppressions に記録し、
+  停止期間中は一斉送信・月次再リンク・7日後再送・参加時 DM の対象から外す
+- 停止期間は拒否が続くたびに倍に伸びる（既定 7 日 → 14 日 → … 最大 90 日）
+- 期間が切れたら次の送信が再試行を兼ね、届けばリストから外れる
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Iterable, Mapping
+
+from bot.common import debug_print
+from bot.utils.dm_broadcast import DM_CLOSED, DM_SENT, DMOutcome
+from bot.utils.metrics import DISCORD_DMS
+from bot.utils.save_and_load import (
+    dm_suppressions_active,
+    dm_suppressions_clear,
+    dm_suppressions_record,
+)
+
+# broadcast_recipients 上で「抑止によりスキップ」を表すステータス
+DM_SUPPRESSED = "suppressed"
+SUPPRESSED_REASON = "DM停止中（DM拒否の履歴あり）"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+SUPPRESSION_BASE_DAYS = _env_float("DM_SUPPRESSION_BASE_DAYS", 7.0)
+SUPPRESSION_MAX_DAYS = _env_float("DM_SUPPRESSION_MAX_DAYS", 90.0)
+
+
+def suppressed_ids(discord_ids: Iterable[Any] | None = None) -> Dict[str, Dict[str, Any]]:
+    """停止期間中のユーザー（discord_id -> 詳細）。同期関数なので to_thread から呼ぶ。"""
+    ids = None if discord_ids is None else [str(did) for did in discord_ids]
+    try:
+        return dm_suppressions_active(ids)
+    except Exception as exc:
+        # 抑止リストが読めなくても送信自体は止めない
+        debug_print(f"[DM] suppression lookup failed: {exc!r}")
+        return {}
+
+
+def is_suppressed(discord_id: Any) -> bool:
+    return str(discord_id) in suppressed_ids([discord_id])
+
+
+def record_dm_outcomes(outcomes: Mapping[str, DMOutcome], *, source: str) -> None:
+    """送信結果を抑止リストへ反映する（拒否は追加／延長、到達は解除）。"""
+    for status, _ in outcomes.values():
+        DISCORD_DMS.inc(source, status)
+    closed = {
+        str(did): reason
+        for did, (status, reason) in outcomes.items()
+        if status == DM_CLOSED
+    }
+    delivered = [str(did) for did, (status, _) in outcomes.items() if status == DM_SENT]
+    try:
+        if closed:
+            dm_suppressions_record(
+                closed,
+                source=source,
+                base_days=SUPPRESSION_BASE_DAYS,
+                max_days=SUPPRESSION_MAX_DAYS,
+            )
+        if delivered:
+            dm_suppressions_clear(delivered)
+    except Exception as exc:
+        debug_print(f"[DM] failed to update suppression list: {exc!r}")
+
+
+def record_dm_outcome(discord_id: Any, outcome: DMOutcome, *, source: str) -> None:
+    record_dm_outcomes({str(discord_id): outcome}, source=source)
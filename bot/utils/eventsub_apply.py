@@ -1,10 +1,11 @@
 import datetime as dt
 from typing import Any, Dict, List, Optional
 
+from .outbox import actions_for_event
 from .save_and_load import (
     load_users,
     get_linked_user,
-    patch_linked_user,
+    patch_linked_user_with_outbox,
     record_cheer_event,
 )
 
@@ -90,6 +91,8 @@ def apply_event_to_linked_users(
 ) -> int:
     """Apply a Twitch EventSub notification to linked_users.
 
+    Discord-side follow-ups (role changes, milestone DMs) are written to the
+    outbox in the same transaction as each user patch.
     Returns the number of matched Discord IDs updated.
     """
     if not sub_type:
@@ -220,7 +223,9 @@ def apply_event_to_linked_users(
             updates.setdefault("next_reverify_due_at", due_next_month)
 
         if updates:
-            patch_linked_user(did, updates)
+            patch_linked_user_with_outbox(
+                did, updates, actions_for_event(sub_type, did, event)
+            )
             matched += 1
 
     return matched
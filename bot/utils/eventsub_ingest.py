@@ -0,0 +1,97 @@
+# bot/utils/eventsub_ingest.py
+"""
+EventSub 通知の受け付け（同期。Webhook ハンドラから to_thread で呼ぶ）
+- HMAC 署名の検証
+- webhook_events（inbox）への記録 → linked_users / outbox への反映
+  （処理済みの Message-Id の再送は記録だけ見て読み捨てる）
+- Discord には触れないので、Bot プロセスでも受付専用プロセスでも同じものを使う
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import time
+from typing import Any, Dict, Optional
+
+from bot.utils.eventsub_apply import apply_event_to_linked_users
+from bot.utils.logs import get_logger
+from bot.utils.metrics import EVENTSUB_APPLY_SECONDS, EVENTSUB_NOTIFICATIONS
+from bot.utils.outbox import stream_online_action
+from bot.utils.save_and_load import (
+    inbox_enqueue_event,
+    inbox_mark_processed,
+    outbox_enqueue,
+)
+
+log = get_logger("eventsub")
+
+
+def _hmac_sha256(secret: str, message: bytes) -> str:
+    mac = hmac.new(secret.encode("utf-8"), message, hashlib.sha256)
+    return "sha256=" + mac.hexdigest()
+
+
+def verify_signature(
+    secret: str, msg_id: str, msg_ts: str, body: bytes, signature: str
+) -> bool:
+    message = (msg_id + msg_ts).encode("utf-8") + body
+    expected = _hmac_sha256(secret, message)
+    return hmac.compare_digest(expected, signature)
+
+
+def ingest_eventsub_notification(
+    data: Dict[str, Any],
+    msg_id: str,
+    msg_type: str,
+    msg_ts: str,
+    *,
+    received_at: Optional[float] = None,
+) -> tuple[int, bool]:
+    """
+    inbox へ記録して linked_users / outbox に反映する。(matched, 成功したか) を返す。
+    received_at はリクエストを受けた時点の time.perf_counter()（スレッド待ちも含めて計測する）
+    """
+    started = received_at if received_at is not None else time.perf_counter()
+    sub_type = (data.get("subscription") or {}).get("type")
+    event = data.get("event") or {}
+    fresh = True
+    try:
+        fresh = inbox_enqueue_event(
+            source="twitch",
+            delivery_id=str(msg_id),
+            event_type=str(sub_type or ""),
+            twitch_user_id=str(
+                event.get("user_id") or event.get("user") or event.get("user_login") or ""
+            )
+            or None,
+            payload=data,
+            headers={
+                "Twitch-Eventsub-Message-Id": msg_id,
+                "Twitch-Eventsub-Message-Type": msg_type,
+                "Twitch-Eventsub-Message-Timestamp": msg_ts,
+            },
+            status="pending",
+        )
+    except Exception as e:
+        log.warning("inbox enqueue failed: %r", e)
+    if not fresh:
+        # 処理済みの Message-Id の再送。反映も outbox への追加もしない
+        log.info("duplicate %s delivery=%s skipped", sub_type, msg_id, extra={"event_type": sub_type})
+        EVENTSUB_NOTIFICATIONS.inc(str(sub_type), "duplicate")
+        return 0, True
+
+    try:
+        matched = apply_event_to_linked_users(sub_type, event, msg_ts)
+        log.info("applied %s matched=%d", sub_type, matched, extra={"event_type": sub_type})
+        if sub_type == "stream.online":
+            outbox_enqueue([stream_online_action(event)])
+        inbox_mark_processed("twitch", str(msg_id), ok=True)
+        EVENTSUB_APPLY_SECONDS.observe(time.perf_counter() - started, str(sub_type))
+        EVENTSUB_NOTIFICATIONS.inc(str(sub_type), "ok")
+        return matched, True
+    except Exception as e:
+        log.exception("apply failed: %r", e, extra={"event_type": sub_type})
+        inbox_mark_processed("twitch", str(msg_id), ok=False, error=str(e))
+        EVENTSUB_NOTIFICATIONS.inc(str(sub_type), "failed")
+        return 0, False
@@ -0,0 +1,188 @@
+# bot/utils/guild_provision.py
+"""
+サブスク用ロール・カテゴリー・チャンネルの自動作成（起動時に 1 回）
+- guild_state.json に保存済みの ID をゲートウェイのキャッシュで検証し、
+  見つからないものだけを名前で探し、それでも無ければ作成する
+- ギルドは並列に処理し、guild_state.json への書き込みは最後に 1 回だけ
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+import discord
+
+from bot.common import debug_print
+from bot.utils.logs import get_logger
+from bot.utils.role_plan import EVERYONE_ALIASES
+from bot.utils.save_and_load import (
+    load_channel_ids,
+    load_role_ids,
+    load_subscription_categories,
+    save_guild_state_sections,
+)
+
+PROVISION_REASON = "Twitchサブスク用自動生成"
+
+log = get_logger("provision")
+
+
+@dataclass
+class GuildProvisionResult:
+    guild_id: int
+    roles: Dict[str, int]
+    categories: Dict[str, int]
+    channels: Dict[str, int]
+    created: list[str] = field(default_factory=list)
+    elapsed_sec: float = 0.0
+
+
+def _cached(
+    guild: discord.Guild, obj_id: Any, kind: type
+) -> Optional[discord.abc.Snowflake]:
+    try:
+        obj_id = int(obj_id)
+    except (TypeError, ValueError):
+        return None
+    obj = guild.get_role(obj_id) if kind is discord.Role else guild.get_channel(obj_id)
+    return obj if isinstance(obj, kind) else None
+
+
+async def provision_guild(
+    guild: discord.Guild,
+    role_names: Sequence[str],
+    tier_entries: Sequence[Mapping[str, Any]],
+    *,
+    role_ids: Mapping[str, Any],
+    category_ids: Mapping[str, Any],
+    channel_ids: Mapping[str, Any],
+) -> GuildProvisionResult:
+    started = time.perf_counter()
+    result = GuildProvisionResult(
+        guild.id, dict(role_ids), dict(category_ids), dict(channel_ids)
+    )
+
+    roles_by_name = {r.name: r for r in guild.roles}
+    roles: Dict[str, discord.Role] = {}
+    for name in role_names:
+        role = _cached(guild, role_ids.get(name), discord.Role) or roles_by_name.get(name)
+        if role is None:
+            debug_print(f"ロール「{name}」が存在しないため作成します in {guild.name}")
+            role = await guild.create_role(name=name, reason="Twitchサブスク用自動作成")
+            roles_by_name[name] = role
+            result.created.append(f"role:{name}")
+        roles[name] = role
+        result.roles[name] = role.id
+
+    categories_by_name = {c.name: c for c in guild.categories}
+    channels_by_name = {c.name: c for c in guild.text_channels}
+    for entry in tier_entries:
+        category_name = entry["category_name"]
+        channel_name = entry["channel_name"]
+        primary_role_name = entry["role_name"]
+
+        overwrites: dict[Any, discord.PermissionOverwrite] = {
+            guild.default_role: discord.PermissionOverwrite(view_channel=False)
+        }
+        for role_name in entry.get("view_role_names") or [primary_role_name]:
+            if role_name in EVERYONE_ALIASES:
+                role_obj = guild.default_role
+            else:
+                role_obj = roles.get(role_name) or roles_by_name.get(role_name)
+            if role_obj is not None:
+                overwrites[role_obj] = discord.PermissionOverwrite(view_channel=True)
+
+        category = None
+        if category_name and category_name.lower() not in {"none", "", "null"}:
+            category = _cached(
+                guild, category_ids.get(primary_role_name), discord.CategoryChannel
+            ) or categories_by_name.get(category_name)
+            if category is None:
+                debug_print(
+                    f"カテゴリー「{category_name}」が存在しないため作成します in {guild.name}"
+                )
+                category = await guild.create_category(
+                    name=category_name, reason=PROVISION_REASON, overwrites=overwrites
+                )
+                categories_by_name[category_name] = category
+                result.created.append(f"category:{category_name}")
+            result.categories[primary_role_name] = category.id
+
+        channel = _cached(
+            guild, channel_ids.get(primary_role_name), discord.TextChannel
+        ) or channels_by_name.get(channel_name)
+        if channel is None:
+            debug_print(
+                f"チャンネル「{channel_name}」が存在しないため作成します in {guild.name}"
+            )
+            channel = await guild.create_text_channel(
+                name=channel_name,
+                category=category,
+                reason=PROVISION_REASON,
+                overwrites=overwrites,
+            )
+            channels_by_name[channel_name] = channel
+            result.created.append(f"channel:{channel_name}")
+        result.channels[primary_role_name] = channel.id
+
+    result.elapsed_sec = time.perf_counter() - started
+    return result
+
+
+async def provision_guilds(
+    guilds: Sequence[discord.Guild],
+    role_names: Sequence[str],
+    tier_entries: Sequence[Mapping[str, Any]],
+) -> list[GuildProvisionResult]:
+    """全ギルドを並列に処理し、変化があれば guild_state.json を 1 回だけ書く。"""
+    role_data, category_data, channel_data = await asyncio.to_thread(
+        lambda: (load_role_ids(), load_subscription_categories(), load_channel_ids())
+    )
+    outcomes = await asyncio.gather(
+        *(
+            provision_guild(
+                guild,
+                role_names,
+                tier_entries,
+                role_ids=role_data.get(str(guild.id)) or {},
+                category_ids=category_data.get(str(guild.id)) or {},
+                channel_ids=channel_data.get(str(guild.id)) or {},
+            )
+            for guild in guilds
+        ),
+        return_exceptions=True,
+    )
+
+    results: list[GuildProvisionResult] = []
+    new_roles, new_categories, new_channels = (
+        dict(role_data),
+        dict(category_data),
+        dict(channel_data),
+    )
+    for guild, outcome in zip(guilds, outcomes):
+        if isinstance(outcome, BaseException):
+            log.warning("guild=%s failed: %r", guild.id, outcome, exc_info=outcome)
+            continue
+        results.append(outcome)
+        new_roles[str(guild.id)] = outcome.roles
+        new_categories[str(guild.id)] = outcome.categories
+        new_channels[str(guild.id)] = outcome.channels
+        debug_print(
+            f"[provision] guild={guild.id} created={outcome.created or 'none'} {outcome.elapsed_sec:.3f}s"
+        )
+
+    if (new_roles, new_categories, new_channels) != (
+        role_data,
+        category_data,
+        channel_data,
+    ):
+        await asyncio.to_thread(
+            save_guild_state_sections,
+            roles=new_roles,
+            categories=new_categories,
+            channels=new_channels,
+        )
+    return results
@@ -0,0 +1,183 @@
+# bot/utils/ingress_routes.py
+"""
+Discord に触れない API（OAuth コールバック・EventSub・読み取り専用の管理 API）
+- 検証して db.sqlite3 に書くか、読むだけ。Bot プロセス（bot_client.app）と
+  受付専用プロセス（bot/ingress_app.py）の両方がこのルーターを組み込む
+- キューに積んだ後の処理はフックで呼び出し側に任せる
+    on_link_job(job_id): link_jobs に積んだ
+    on_queued(): outbox に積んだ可能性がある（EventSub の反映後）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable
+
+import httpx
+from fastapi import APIRouter, Header, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+
+from bot.common import debug_print
+from bot.utils.admin_auth import require_admin_token
+from bot.utils.eventsub_ingest import ingest_eventsub_notification, verify_signature
+from bot.utils.link_jobs import create_link_job, link_job_public_status, link_status_page
+from bot.utils.logs import correlation, get_logger
+from bot.utils.save_and_load import (
+    broadcast_job_get,
+    broadcast_job_list,
+    get_eventsub_config,
+    link_job_get,
+)
+from bot.utils.twitch import exchange_oauth_code, verify_link_state
+
+log = get_logger("eventsub")
+
+OnLinkJob = Callable[[str], Awaitable[None]]
+OnQueued = Callable[[], Awaitable[None]]
+
+
+def build_ingress_router(*, on_link_job: OnLinkJob, on_queued: OnQueued) -> APIRouter:
+    router = APIRouter()
+
+    # ---- Twitch OAuth コールバック ----
+    @router.get("/twitch_callback")
+    async def twitch_callback(request: Request):
+        """トークン交換までを行ってジョブを積み、状態ページを即返す。"""
+        debug_print("✅ [twitch_callback] にアクセスがありました")
+        code = request.query_params.get("code")
+        state = request.query_params.get("state")
+
+        if not code or not state:
+            return PlainTextResponse("Missing code or state", status_code=400)
+
+        # 1) state（署名付き Discord ID）の検証
+        try:
+            discord_id = await asyncio.to_thread(verify_link_state, state)
+        except Exception as e:
+            return PlainTextResponse(f"Failed to read credentials: {e!r}", status_code=500)
+        if discord_id is None:
+            return PlainTextResponse(
+                "リンクの有効期限が切れているか、不正なリクエストです。Discord でもう一度 /link を実行してください。",
+                status_code=400,
+            )
+
+        # 2) アクセストークン取得（認可コードは一度しか使えないのでここで済ませる）
+        try:
+            access_token = await exchange_oauth_code(code)
+        except httpx.HTTPError as e:
+            return PlainTextResponse(f"Token request failed: {e!r}", status_code=502)
+        except Exception as e:
+            return PlainTextResponse(str(e), status_code=502)
+
+        # 3) 残りはバックグラウンドで
+        job_id = await asyncio.to_thread(create_link_job, discord_id, access_token)
+        await on_link_job(job_id)
+        return HTMLResponse(link_status_page(job_id), status_code=202)
+
+    @router.get("/link_status/{job_id}")
+    async def link_status(job_id: str):
+        job = await asyncio.to_thread(link_job_get, job_id)
+        if job is None:
+            return JSONResponse({"error": "not_found"}, status_code=404)
+        return JSONResponse(
+            link_job_public_status(job), headers={"Cache-Control": "no-store"}
+        )
+
+    # ---- EventSub Webhook ----
+    @router.get("/twitch_eventsub")
+    async def twitch_eventsub_probe() -> PlainTextResponse:
+        """Health check endpoint for Twitch verification pings (GET)."""
+        return PlainTextResponse("ok", status_code=200)
+
+    @router.head("/twitch_eventsub")
+    async def twitch_eventsub_head() -> PlainTextResponse:
+        """Respond to HEAD requests with empty 200 to satisfy preflight checks."""
+        return PlainTextResponse("", status_code=200)
+
+    @router.post("/twitch_eventsub")
+    async def twitch_eventsub(
+        request: Request,
+        twitch_msg_id: str = Header(None, alias="Twitch-Eventsub-Message-Id"),
+        twitch_msg_type: str = Header(None, alias="Twitch-Eventsub-Message-Type"),
+        twitch_msg_ts: str = Header(None, alias="Twitch-Eventsub-Message-Timestamp"),
+        twitch_signature: str = Header(None, alias="Twitch-Eventsub-Message-Signature"),
+    ):
+        received_at = time.perf_counter()
+        body_bytes = await request.body()
+        if body_bytes is None:
+            body_bytes = b""
+        try:
+            data = json.loads(body_bytes.decode("utf-8") or "{}")
+            if not isinstance(data, dict):
+                data = {}
+        except Exception:
+            data = {}
+
+        if twitch_msg_type == "webhook_callback_verification":
+            challenge = data.get("challenge")
+            log.info("verification")
+            return PlainTextResponse(challenge or "", status_code=200)
+
+        try:
+            _, secret = get_eventsub_config()
+        except Exception as e:
+            return PlainTextResponse(f"EventSub secret missing: {e}", status_code=500)
+
+        if not (twitch_msg_id and twitch_msg_ts and twitch_signature):
+            return PlainTextResponse("missing headers", status_code=400)
+
+        if not verify_signature(
+            secret, twitch_msg_id, twitch_msg_ts, body_bytes, twitch_signature
+        ):
+            return PlainTextResponse("invalid signature", status_code=403)
+
+        if twitch_msg_type == "notification":
+            sub_type = (data.get("subscription") or {}).get("type")
+            # inbox → linked_users → outbox → Discord まで同じ ID でたどれるようにする
+            with correlation(f"eventsub:{twitch_msg_id}"):
+                log.debug("notify: %s", sub_type)
+                # SQLite への書き込みはスレッドで（イベントループを止めないため）
+                matched, ok = await asyncio.to_thread(
+                    ingest_eventsub_notification,
+                    data,
+                    twitch_msg_id,
+                    twitch_msg_type,
+                    twitch_msg_ts,
+                    received_at=received_at,
+                )
+            if ok:
+                await on_queued()
+            return JSONResponse({"status": "ok", "matched": matched})
+
+        if twitch_msg_type == "revocation":
+            log.warning("revoked: %s", data.get("subscription"))
+            return JSONResponse({"status": "revoked"})
+
+        return PlainTextResponse("ignored", status_code=200)
+
+    # ---- 管理 API（読み取りのみ） ----
+    @router.get("/broadcast/jobs")
+    async def broadcast_jobs_list(
+        authorization: str | None = Header(None, alias="Authorization"),
+        limit: int = 20,
+    ):
+        if not require_admin_token(authorization):
+            return PlainTextResponse("forbidden", status_code=403)
+        jobs = await asyncio.to_thread(broadcast_job_list, max(1, min(int(limit), 200)))
+        return {"jobs": jobs}
+
+    @router.get("/broadcast/jobs/{job_id}")
+    async def broadcast_jobs_detail(
+        job_id: str,
+        authorization: str | None = Header(None, alias="Authorization"),
+    ):
+        if not require_admin_token(authorization):
+            return PlainTextResponse("forbidden", status_code=403)
+        job = await asyncio.to_thread(broadcast_job_get, job_id)
+        if job is None:
+            return JSONResponse({"error": "not_found"}, status_code=404)
+        return job
+
+    return router
@@ -0,0 +1,307 @@
+# bot/utils/link_jobs.py
+"""
+Twitch 連携のバックグラウンド処理
+- OAuth コールバックはトークン交換までを済ませて link_jobs に積み、すぐ応答する
+- 残り（Helix でのサブスク取得 → streak 反映 → ロール付与と完了 DM）は
+  Bot ループ上のワーカーが実行し、段階 (stage) を link_jobs に書く
+- 状態ページは /link_status/{job_id} をポーリングして結果を表示する
+"""
+
+from __future__ import annotations
+
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import discord
+import httpx
+
+from bot.common import debug_print
+from bot.utils.link_registry import LINK_REGISTRY
+from bot.utils.logs import get_logger
+from bot.utils.save_and_load import (
+    get_broadcast_id,
+    get_twitch_keys,
+    link_job_create,
+    link_job_get,
+    link_job_update,
+    link_jobs_unfinished,
+)
+from bot.utils.streak import reconcile_and_save_link
+from bot.utils.twitch import get_user_info_and_subscription
+
+LINK_PENDING = "pending"
+LINK_RUNNING = "running"
+LINK_DONE = "done"
+LINK_FAILED = "failed"
+
+STAGE_QUEUED = "queued"
+STAGE_FETCHING = "fetching"
+STAGE_SAVING = "saving"
+STAGE_ROLES = "roles"
+STAGE_DONE = "done"
+
+# Helix 呼び出しの再試行（_request_json の 429/5xx 再試行とは別に、ジョブ単位で）
+MAX_ATTEMPTS = 3
+RETRY_BASE_SEC = 2.0
+
+# 受付を別プロセスに分けたとき、wake を取りこぼしても拾う間隔
+WATCH_INTERVAL_SEC = 5.0
+
+FinalizeLink = Callable[[int, Dict[str, Any]], Awaitable[Any]]
+
+log = get_logger("linkjob")
+
+
+def create_link_job(discord_id: str, access_token: str) -> str:
+    """リンクジョブを作成して ID を返す（同期。コールバックから to_thread で呼ぶ）。"""
+    job_id = uuid.uuid4().hex
+    link_job_create(job_id, discord_id, access_token)
+    return job_id
+
+
+def link_job_public_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """状態ページ向けの最小限の情報（Discord ID やトークンは出さない）。"""
+    result = job.get("result") or {}
+    return {
+        "status": job.get("status"),
+        "stage": job.get("stage"),
+        "twitch_username": result.get("twitch_username"),
+        "is_subscriber": result.get("is_subscriber"),
+        "tier": result.get("tier"),
+        "error": job.get("error"),
+    }
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        # 401/403 はトークンやスコープの問題なので繰り返しても直らない
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return isinstance(exc, httpx.HTTPError)
+
+
+class LinkJobRunner:
+    """Bot のイベントループ上でリンクジョブを実行する。"""
+
+    def __init__(self, bot: discord.Client, finalize: FinalizeLink) -> None:
+        self.bot = bot
+        self.finalize = finalize
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+
+    def start(self, job_id: str) -> bool:
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            return False
+        task = asyncio.create_task(self._run(job_id), name=f"link-job-{job_id}")
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _t, jid=job_id: self._tasks.pop(jid, None))
+        return True
+
+    async def resume_unfinished(self) -> int:
+        job_ids = await asyncio.to_thread(link_jobs_unfinished)
+        started = sum(1 for job_id in job_ids if self.start(job_id))
+        if started:
+            debug_print(f"[LinkJob] resumed {started} unfinished job(s)")
+        return started
+
+    def watch(self, interval: float = WATCH_INTERVAL_SEC) -> None:
+        """他のプロセスが積んだジョブを定期的に拾う。"""
+        if self._watch_task is not None and not self._watch_task.done():
+            return
+        self._watch_task = asyncio.create_task(
+            self._watch(interval), name="link-job-watch"
+        )
+
+    async def _watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.resume_unfinished()
+            except Exception as e:
+                log.warning("watch failed: %r", e)
+
+    async def _fetch_info(self, job_id: str, access_token: str) -> Dict[str, Any]:
+        client_id, _, _ = await asyncio.to_thread(get_twitch_keys)
+        broadcaster_id = str(await asyncio.to_thread(get_broadcast_id))
+        delay = RETRY_BASE_SEC
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await asyncio.to_thread(link_job_update, job_id, attempt=True)
+            try:
+                return await get_user_info_and_subscription(
+                    viewer_access_token=access_token,
+                    client_id=client_id,
+                    broadcaster_id=broadcaster_id,
+                )
+            except Exception as exc:
+                if attempt >= MAX_ATTEMPTS or not _is_retryable(exc):
+                    raise
+                debug_print(
+                    f"[LinkJob] job={job_id} Helix attempt {attempt} failed: {exc!r}; retry in {delay}s"
+                )
+                await asyncio.sleep(delay)
+                delay *= 2
+        raise RuntimeError("unreachable")
+
+    async def _fail(self, job_id: str, discord_id: str, message: str) -> None:
+        await asyncio.to_thread(
+            link_job_update, job_id, status=LINK_FAILED, error=message
+        )
+        LINK_REGISTRY.resolve(discord_id, {"error": message})
+
+    async def _run(self, job_id: str) -> None:
+        discord_id: Optional[str] = None
+        # finalize まで済んだら連携結果が入る
+        finalized: Dict[str, Any] = {}
+        try:
+            job = await asyncio.to_thread(link_job_get, job_id)
+            if not job or job["status"] not in (LINK_PENDING, LINK_RUNNING):
+                return
+            discord_id = str(job["discord_id"])
+            await self._process(job_id, job, discord_id, finalized)
+        except Exception as exc:
+            # DB の busy / IO エラー等。running のまま残すと状態ページは待ち続け、
+            # 分割構成では watch が 5 秒ごとに再実行してしまうので、できる範囲で終わらせる
+            log.exception("job=%s failed: %r", job_id, exc)
+            message = "連携処理中にエラーが発生しました"
+            outcome = finalized or {"error": message}
+            try:
+                if finalized:
+                    await asyncio.to_thread(link_job_update, job_id, status=LINK_DONE)
+                else:
+                    await asyncio.to_thread(
+                        link_job_update, job_id, status=LINK_FAILED, error=message
+                    )
+            except Exception as e:
+                log.warning("job=%s could not be closed: %r", job_id, e)
+            if discord_id is not None:
+                LINK_REGISTRY.resolve(discord_id, outcome)
+
+    async def _process(
+        self,
+        job_id: str,
+        job: Dict[str, Any],
+        discord_id: str,
+        finalized: Dict[str, Any],
+    ) -> None:
+        if job.get("stage") == STAGE_DONE:
+            # 前回は finalize（ロール付与・完了 DM）まで済んで、最後の更新だけ失敗した。
+            # もう一度 finalize すると DM が二重に届くので、完了の記録だけやり直す
+            result = job.get("result") or {}
+            await asyncio.to_thread(link_job_update, job_id, status=LINK_DONE)
+            LINK_REGISTRY.resolve(discord_id, result)
+            debug_print(f"[LinkJob] job={job_id} done for {discord_id} (already finalized)")
+            return
+        access_token = job.get("access_token")
+        if not access_token:
+            await self._fail(job_id, discord_id, "アクセストークンがありません")
+            return
+        await asyncio.to_thread(
+            link_job_update, job_id, status=LINK_RUNNING, stage=STAGE_FETCHING
+        )
+
+        try:
+            info = await self._fetch_info(job_id, access_token)
+        except Exception as exc:
+            log.warning("job=%s Helix failed: %r", job_id, exc)
+            await self._fail(job_id, discord_id, "Twitch からの情報取得に失敗しました")
+            return
+        if not info.get("twitch_username"):
+            await self._fail(job_id, discord_id, "Twitch のユーザー情報を取得できませんでした")
+            return
+
+        await asyncio.to_thread(link_job_update, job_id, stage=STAGE_SAVING)
+        try:
+            record = await asyncio.to_thread(reconcile_and_save_link, discord_id, info)
+        except Exception as exc:
+            log.warning("job=%s reconcile_and_save_link failed: %r", job_id, exc)
+            record = info  # 万一失敗したら元のinfoを使う
+
+        await asyncio.to_thread(link_job_update, job_id, stage=STAGE_ROLES)
+        await self.bot.wait_until_ready()
+        try:
+            await self.finalize(int(discord_id), record)
+        except Exception as exc:
+            # ロール・DM の失敗は連携自体の失敗ではない
+            log.warning("job=%s finalize failed: %r", job_id, exc)
+        finalized.update(record)
+
+        # finalize 済みを先に記録する（status の更新が失敗して再実行されても finalize は繰り返さない）
+        await asyncio.to_thread(
+            link_job_update,
+            job_id,
+            stage=STAGE_DONE,
+            result={
+                "twitch_username": record.get("twitch_username"),
+                "is_subscriber": bool(record.get("is_subscriber", False)),
+                "tier": record.get("tier"),
+            },
+        )
+        await asyncio.to_thread(link_job_update, job_id, status=LINK_DONE)
+        # /link で待っている LinkCog に完了を知らせる（タイムアウト通知を止める）
+        LINK_REGISTRY.resolve(discord_id, record)
+        debug_print(f"[LinkJob] job={job_id} done for {discord_id}")
+
+
+def link_status_page(job_id: str) -> str:
+    """コールバック直後に返す状態ページ。/link_status/{job_id} をポーリングする。"""
+    return LINK_STATUS_PAGE.replace("__JOB_ID__", job_id)
+
+
+LINK_STATUS_PAGE = """<!doctype html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Twitch 連携</title>
+<style>
+body { font-family: sans-serif; max-width: 32rem; margin: 4rem auto; padding: 0 1rem; color: #222; }
+#status { font-size: 1.2rem; }
+.muted { color: #777; font-size: .9rem; }
+</style>
+</head>
+<body>
+<h1>Twitch 連携</h1>
+<p id="status">連携処理を受け付けました…</p>
+<p id="detail" class="muted"></p>
+<script>
+(function () {
+  var STAGES = {
+    queued: "処理を待っています…",
+    fetching: "Twitch からサブスク情報を取得しています…",
+    saving: "連携情報を保存しています…",
+    roles: "Discord のロールを付与しています…"
+  };
+  var statusEl = document.getElementById("status");
+  var detailEl = document.getElementById("detail");
+  var delay = 1000;
+  function poll() {
+    fetch("/link_status/__JOB_ID__", { cache: "no-store" })
+      .then(function (r) { return r.ok ? r.json() : Promise.reject(r.status); })
+      .then(function (job) {
+        if (job.status === "done") {
+          statusEl.textContent = "✅ 連携が完了しました！このページは閉じて大丈夫です。";
+          var tier = { "1000": "1", "2000": "2", "3000": "3" }[job.tier] || "0";
+          detailEl.textContent = "Twitch名: " + job.twitch_username +
+            " / サブスク: " + (job.is_subscriber ? "登録中" : "未登録") + " / Tier: " + tier;
+          return;
+        }
+        if (job.status === "failed") {
+          statusEl.textContent = "⚠ 連携に失敗しました。Discord でもう一度 /link をお試しください。";
+          detailEl.textContent = job.error || "";
+          return;
+        }
+        statusEl.textContent = STAGES[job.stage] || "処理中です…";
+        setTimeout(poll, delay);
+        delay = Math.min(delay * 1.5, 5000);
+      })
+      .catch(function () {
+        setTimeout(poll, 5000);
+      });
+  }
+  poll();
+})();
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,92 @@
+# bot/utils/link_registry.py
+"""
+/link の完了通知（プロセス内レジストリ）
+- /link を実行したユーザーごとに Future を 1 つ登録し、OAuth コールバックが
+  保存直後のレコードでそれを解決する。DB のポーリングは行わない
+- 登録は Bot のイベントループ、解決は API スレッドから行われる想定なので、
+  辞書はロックで守り、Future への結果設定は call_soon_threadsafe で渡す
+- 同じユーザーが /link を再実行した場合は古い待機をキャンセルして置き換える
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+LinkRecord = Dict[str, Any]
+
+
+class LinkWaitSuperseded(Exception):
+    """同じユーザーの新しい /link に待機が置き換えられた。"""
+
+
+def _set_result(fut: "asyncio.Future[LinkRecord]", record: LinkRecord) -> None:
+    if not fut.done():
+        fut.set_result(record)
+
+
+class LinkCompletionRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._waiters: Dict[
+            str, Tuple[asyncio.AbstractEventLoop, "asyncio.Future[LinkRecord]"]
+        ] = {}
+
+    def register(self, discord_id: Any) -> "asyncio.Future[LinkRecord]":
+        """待機用の Future を登録する。イベントループ上から呼ぶこと。"""
+        loop = asyncio.get_running_loop()
+        fut: "asyncio.Future[LinkRecord]" = loop.create_future()
+        with self._lock:
+            previous = self._waiters.get(str(discord_id))
+            self._waiters[str(discord_id)] = (loop, fut)
+        if previous is not None:
+            prev_loop, prev_fut = previous
+            prev_loop.call_soon_threadsafe(prev_fut.cancel)
+        return fut
+
+    def unregister(self, discord_id: Any, fut: "asyncio.Future[LinkRecord]") -> bool:
+        """自分の登録が残っていれば外す。既に resolve 側が取り出していれば False。"""
+        with self._lock:
+            entry = self._waiters.get(str(discord_id))
+            if entry is None or entry[1] is not fut:
+                return False
+            del self._waiters[str(discord_id)]
+            return True
+
+    def resolve(self, discord_id: Any, record: LinkRecord) -> bool:
+        """連携完了を通知する（どのスレッドからでも可）。待機者がいなければ False。"""
+        with self._lock:
+            entry = self._waiters.pop(str(discord_id), None)
+        if entry is None:
+            return False
+        loop, fut = entry
+        try:
+            loop.call_soon_threadsafe(_set_result, fut, record)
+        except RuntimeError:
+            # 待機側のループが既に閉じている
+            return False
+        return True
+
+    async def wait(self, discord_id: Any, timeout: float) -> Optional[LinkRecord]:
+        """連携完了まで待つ。タイムアウト時は None。"""
+        fut = self.register(discord_id)
+        try:
+            done, _ = await asyncio.wait({fut}, timeout=timeout)
+            if not done and not self.unregister(discord_id, fut):
+                # タイムアウトと同時に resolve された: 結果はすぐに届く
+                await asyncio.wait({fut})
+        finally:
+            self.unregister(discord_id, fut)
+        if not fut.done():
+            return None
+        if fut.cancelled():
+            raise LinkWaitSuperseded(str(discord_id))
+        return fut.result()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+
+LINK_REGISTRY = LinkCompletionRegistry()
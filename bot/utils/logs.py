@@ -0,0 +1,322 @@
+# bot/utils/logs.py
+"""
+構造化ログ（標準の logging をそのまま使う）
+- get_logger("eventsub") は "neibot.eventsub" のロガー。本文は %s で引数を渡し、
+  出力が決まったものだけをリスナースレッドで組み立てる（重い値は lazy() で包む）
+- LOG_LEVEL（既定 INFO、DEBUG=1 なら DEBUG）と LOG_LEVELS="eventsub=DEBUG,dm=WARNING" で
+  サブシステムごとのレベルを決める
+- 呼び出し側は QueueHandler でキューに積むだけ。ファイル書き込みは QueueListener のスレッドが行う
+  - LOG_FILE（既定 logs/<プロセス名>.jsonl）に JSON Lines。LOG_FILE_MAX_MB / LOG_FILE_BACKUPS でローテート
+  - DEBUG=1 のときは従来どおり標準出力にも本文を出す
+  - キューがあふれたら捨てて数える（呼び出し側は待たない）
+- extra={"sample": "dm.recipient"} を付けたログは LOG_SAMPLE_RATES の割合だけ残す（WARNING 以上は全部）
+- correlation(...) の中で出したログには correlation_id が付く。contextvars なので
+  asyncio.to_thread や子タスクにも引き継がれる
+- debug_print（legacy_debug）は常に DEBUG なので細かい経過の出力専用。
+  本番でも残すべき失敗・警告は get_logger(...).warning / exception で出す
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import datetime as dt
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from bot.common import DEBUG, PROJECT_ROOT
+
+ROOT_NAME = "neibot"
+LEGACY_NAME = "legacy"
+DEFAULT_SAMPLE_RATES = {"dm.recipient": 0.01}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def _parse_levels(raw: str) -> Dict[str, int]:
+    """"eventsub=DEBUG,dm=WARNING" → {"neibot.eventsub": 10, "neibot.dm": 30}"""
+    result: Dict[str, int] = {}
+    for part in raw.split(","):
+        name, _, level = part.partition("=")
+        name, level = name.strip().lower(), level.strip().upper()
+        if not name or not isinstance(logging.getLevelName(level), int):
+            continue
+        result[f"{ROOT_NAME}.{name}"] = logging.getLevelName(level)
+    return result
+
+
+def _parse_rates(raw: str) -> Dict[str, float]:
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for part in raw.split(","):
+        key, _, value = part.partition("=")
+        try:
+            rates[key.strip()] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+# ---- 相関 ID ----
+_correlation_id: ContextVar[Optional[str]] = ContextVar("neibot_correlation_id", default=None)
+
+
+def current_correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+
+@contextlib.contextmanager
+def correlation(correlation_id: Optional[str]) -> Iterator[Optional[str]]:
+    """この中（と、ここから作ったタスク・to_thread）で出したログに correlation_id を付ける。"""
+    token = _correlation_id.set(correlation_id or None)
+    try:
+        yield correlation_id
+    finally:
+        _correlation_id.reset(token)
+
+
+def set_correlation_id(correlation_id: Optional[str]) -> None:
+    """タスクの先頭で使う（タスクごとにコンテキストが別なので戻さなくてよい）。"""
+    _correlation_id.set(correlation_id or None)
+
+
+class lazy:
+    """出力されるときだけ評価する値。log.debug("%s", lazy(json.dumps, data, indent=4))"""
+
+    __slots__ = ("_fn", "_args", "_kwargs")
+
+    def __init__(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+
+    def __str__(self) -> str:
+        return str(self._fn(*self._args, **self._kwargs))
+
+    __repr__ = __str__
+
+
+# ---- フィルタ・ハンドラ ----
+class _SamplingFilter(logging.Filter):
+    """sample キーごとに 1/N 件だけ通す（乱数ではなく件数で間引く）。"""
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(key, 1.0)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        every = max(1, round(1 / rate))
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+        if seen % every:
+            return False
+        record.sampled_1_in = every
+        return True
+
+
+class _ContextFilter(logging.Filter):
+    """呼び出し元のスレッド・タスクで相関 ID を読み取る（リスナー側では読めない）。"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "correlation_id", None) is None:
+            record.correlation_id = _correlation_id.get()
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同じプロセス内のキューなので pickle 用の整形はしない（本文はリスナーで組み立てる）
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            from bot.utils.metrics import LOG_RECORDS_DROPPED
+
+            LOG_RECORDS_DROPPED.inc()
+
+
+class _Listener(logging.handlers.QueueListener):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 本文はここで 1 回だけ組み立てる（ハンドラが複数でも lazy を二度評価しない）
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+        except Exception as e:
+            record.msg = f"<log format error {e!r}> {record.msg!r} {record.args!r}"
+            record.args = None
+        return record
+
+
+_STANDARD_ATTRS = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None)).keys()
+) | {"message", "asctime", "sample", "taskName", "correlation_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """1 行 1 レコードの JSON。extra で渡した値もそのまま入れる。"""
+
+    def __init__(self, process_name: str) -> None:
+        super().__init__()
+        self.process_name = process_name
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": dt.datetime.fromtimestamp(record.created, dt.timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "process": self.process_name,
+            "thread": record.threadName,
+            "where": f"{record.module}:{record.funcName}:{record.lineno}",
+        }
+        if getattr(record, "correlation_id", None):
+            entry["correlation_id"] = record.correlation_id
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _ConsoleFormatter(logging.Formatter):
+    """DEBUG=1 の標準出力。従来の print と同じく本文だけ（相関 ID があれば後ろに付ける）。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = record.getMessage()
+        if getattr(record, "correlation_id", None):
+            text = f"{text} ({record.correlation_id})"
+        if record.exc_info:
+            text = f"{text}\n{self.formatException(record.exc_info)}"
+        return text
+
+
+# ---- 設定 ----
+_config_lock = threading.Lock()
+_listener: Optional[_Listener] = None
+_handler: Optional[_NonBlockingQueueHandler] = None
+_configured_name: Optional[str] = None
+
+
+def _log_path(process_name: str) -> Optional[str]:
+    raw = (os.getenv("LOG_FILE") or "").strip()
+    if raw.lower() in ("0", "off", "none", "false"):
+        return None
+    if not raw:
+        return os.path.join(PROJECT_ROOT, "logs", f"{process_name}.jsonl")
+    return raw.replace("{name}", process_name)
+
+
+def configure_logging(process_name: str = "neibot", *, to_file: bool = True) -> None:
+    """プロセスの入口で 1 回呼ぶ。呼び直すと出力先を作り直す。"""
+    global _listener, _handler, _configured_name
+    with _config_lock:
+        root = logging.getLogger(ROOT_NAME)
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _handler is not None:
+            root.removeHandler(_handler)
+
+        default_level = "DEBUG" if DEBUG else "INFO"
+        level = logging.getLevelName((os.getenv("LOG_LEVEL") or default_level).strip().upper())
+        root.setLevel(level if isinstance(level, int) else logging.INFO)
+        for name, sub_level in _parse_levels(os.getenv("LOG_LEVELS", "")).items():
+            logging.getLogger(name).setLevel(sub_level)
+        # uvicorn や Django がルートに付けたハンドラへ重ねて出さない
+        root.propagate = False
+
+        outputs: list[logging.Handler] = []
+        path = _log_path(process_name) if to_file else None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                path,
+                maxBytes=_env_int("LOG_FILE_MAX_MB", 20) * 1024 * 1024,
+                backupCount=_env_int("LOG_FILE_BACKUPS", 5),
+                encoding="utf-8",
+            )
+            file_handler.setFormatter(JsonFormatter(process_name))
+            outputs.append(file_handler)
+        if DEBUG:
+            console = logging.StreamHandler(sys.stdout)
+            console.setFormatter(_ConsoleFormatter())
+            outputs.append(console)
+
+        records: queue.Queue = queue.Queue(maxsize=_env_int("LOG_QUEUE_SIZE", 10000))
+        _handler = _NonBlockingQueueHandler(records)
+        _handler.addFilter(_SamplingFilter(_parse_rates(os.getenv("LOG_SAMPLE_RATES", ""))))
+        _handler.addFilter(_ContextFilter())
+        root.addHandler(_handler)
+        _listener = _Listener(records, *outputs, respect_handler_level=True)
+        _listener.start()
+        _configured_name = process_name
+
+
+def _shutdown() -> None:
+    # 終了時にキューに残った分を書き出す
+    global _listener
+    with _config_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(_shutdown)
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_NAME}.{subsystem}")
+
+
+# ---- debug_print 互換 ----
+_legacy_loggers: Dict[str, logging.Logger] = {}
+
+
+def _legacy_logger(first: Any) -> logging.Logger:
+    # "[EventSub][inbox] ..." → neibot.eventsub（サブシステムごとのレベルがそのまま効く）
+    tag = LEGACY_NAME
+    if isinstance(first, str) and first.startswith("["):
+        inner = first[1 : first.find("]")] if "]" in first else ""
+        if inner and inner.upper() not in ("DEBUG", "INFO", "WARN", "ERROR"):
+            tag = inner.split(" ")[0].lower()
+    logger = _legacy_loggers.get(tag)
+    if logger is None:
+        logger = _legacy_loggers[tag] = get_logger(tag)
+    return logger
+
+
+def legacy_debug(*args: Any, sep: str = " ", **_print_kwargs: Any) -> None:
+    """debug_print の中身。print と同じ引数を DEBUG レベルのログにする。"""
+    if _configured_name is None:
+        # 入口で設定していないスクリプト等: 従来どおり DEBUG=1 のときだけ標準出力へ
+        configure_logging(to_file=False)
+    logger = _legacy_logger(args[0] if args else "")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s", sep.join(str(a) for a in args), stacklevel=3)
@@ -0,0 +1,328 @@
+# bot/utils/loop_monitor.py
+"""
+イベントループの遅延（ラグ）監視とブロッキング呼び出しの検出
+- ラグ: ループごとの監視タスクが LOOP_MONITOR_INTERVAL_MS ごとに起き、予定より遅れた分を
+  記録する（直近 LOOP_MONITOR_WINDOW 回分から p50 / p95 / p99 / max を出す）
+- ブロック: ループのコールバック（asyncio.Handle._run）の実行時間を測り、
+  LOOP_BLOCK_THRESHOLD_MS 以上かかったものを記録する。実行中は別スレッドのウォッチドッグが
+  ループスレッドのスタックを採取し、最も多く写った bot/ 配下のフレーム（呼び出し元）と
+  それを含むコルーチンに帰属させる
+- LOOP_ASYNCIO_DEBUG=1 で asyncio のデバッグモード（slow_callback_duration = しきい値）も
+  有効にする。デバッグモード自体が重いので既定は off
+- 常時動かす前提: コールバックごとの追加処理は時刻 2 回と dict 参照 1 回、
+  スタック採取はしきい値を超えて実行中のときだけ
+- uvloop のループではコールバックの計測ができないので、ラグがしきい値を超えた回をブロックとして数える
+"""
+
+from __future__ import annotations
+
+import asyncio
+import asyncio.events
+import collections
+import inspect
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Deque, Dict, Optional
+
+from bot.common import PROJECT_ROOT, debug_print
+from bot.utils.logs import get_logger
+
+
+def _env_ms(name: str, default: float) -> float:
+    try:
+        return max(1.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+LOOP_MONITOR_ENABLED = (os.getenv("LOOP_MONITOR") or "1").strip().lower() not in (
+    "0",
+    "false",
+    "off",
+)
+LOOP_MONITOR_INTERVAL_MS = _env_ms("LOOP_MONITOR_INTERVAL_MS", 250)
+LOOP_BLOCK_THRESHOLD_MS = _env_ms("LOOP_BLOCK_THRESHOLD_MS", 100)
+LOOP_MONITOR_WINDOW = int(_env_ms("LOOP_MONITOR_WINDOW", 2400))  # 250ms × 2400 = 10 分
+LOOP_ASYNCIO_DEBUG = (os.getenv("LOOP_ASYNCIO_DEBUG") or "").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# ブロック中のスタック採取間隔
+SAMPLE_INTERVAL_SEC = 0.02
+STACK_DEPTH = 12
+RECENT_BLOCKS = 20
+TOP_SITES = 10
+
+log = get_logger("loopmonitor")
+
+_THIS_FILE = os.path.abspath(__file__)
+# 呼び出し元として扱うのはリポジトリのコードだけ（venv/ に置いた仮想環境は除く）
+_PROJECT_DIRS = tuple(
+    os.path.join(PROJECT_ROOT, d) + os.sep for d in ("bot", "webadmin", "scripts")
+)
+_ASYNC_FLAGS = inspect.CO_COROUTINE | inspect.CO_ASYNC_GENERATOR
+
+
+def _relpath(filename: str) -> str:
+    path = os.path.abspath(filename)
+    if path.startswith(PROJECT_ROOT + os.sep):
+        return os.path.relpath(path, PROJECT_ROOT).replace(os.sep, "/")
+    return filename
+
+
+def _is_project(filename: str) -> bool:
+    path = os.path.abspath(filename)
+    return path.startswith(_PROJECT_DIRS) and path != _THIS_FILE
+
+
+def _sample(frame) -> tuple[str, str, tuple[str, ...]]:
+    """(呼び出し元, コルーチン, スタック) を返す。スタックは外側から内側の順。"""
+    site = coroutine = ""
+    f = frame
+    while f is not None:
+        code = f.f_code
+        if _is_project(code.co_filename):
+            where = f"{_relpath(code.co_filename)}:{f.f_lineno} {code.co_name}"
+            if not site:
+                site = where
+            if code.co_flags & _ASYNC_FLAGS:
+                coroutine = where
+                break
+        f = f.f_back
+    stack = tuple(
+        f"{_relpath(fs.filename)}:{fs.lineno} {fs.name}"
+        for fs in traceback.extract_stack(frame, limit=STACK_DEPTH)
+    )
+    if not site:
+        site = stack[-1] if stack else "unknown"
+    return site, coroutine, stack
+
+
+def _describe_handle(handle: Any) -> str:
+    """スタックが採れなかったときの帰属先: タスクならコルーチン名、それ以外はコールバック名。"""
+    callback = getattr(handle, "_callback", None)
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        code = getattr(coro, "cr_code", None)
+        if code is not None:
+            return f"{_relpath(code.co_filename)}:{code.co_firstlineno} {code.co_name}"
+        return repr(coro)
+    return getattr(callback, "__qualname__", None) or repr(callback)
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LoopLagMonitor:
+    """1 つのイベントループを監視する。記録はループのスレッドだけが書く。"""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        interval_ms: float = LOOP_MONITOR_INTERVAL_MS,
+        threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS,
+        window: int = LOOP_MONITOR_WINDOW,
+    ) -> None:
+        self.names = [name]
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.lags_ms: Deque[float] = collections.deque(maxlen=max(10, window))
+        self.callbacks_timed = 0
+        self.blocks_total = 0
+        self.blocked_ms_total = 0.0
+        self.recent_blocks: Deque[Dict[str, Any]] = collections.deque(maxlen=RECENT_BLOCKS)
+        # 呼び出し元 → [回数, 合計 ms, 最大 ms, コルーチン]
+        self.sites: Dict[str, list] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._thread_id: Optional[int] = None
+        # 実行中のコールバックの開始時刻（0 = 実行していない）
+        self._busy_since = 0.0
+        # ウォッチドッグが追記し、ループ側が入れ替えて読む
+        self._samples: list[tuple[str, str, tuple[str, ...]]] = []
+
+    @property
+    def name(self) -> str:
+        return "+".join(self.names)
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        if LOOP_ASYNCIO_DEBUG:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._thread_id = threading.get_ident()
+        self._task = loop.create_task(self._run(), name=f"loop-monitor-{self.names[0]}")
+
+    async def _run(self) -> None:
+        interval = self.interval
+        while True:
+            due = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.perf_counter() - due)
+            self.lags_ms.append(lag * 1000)
+            if lag >= self.threshold and not self.callbacks_timed:
+                # コールバックを計測できないループ（uvloop 等）はラグで代用する
+                self._record_block(lag, None)
+
+    def check(self, now: float) -> None:
+        """ウォッチドッグスレッドから呼ぶ。しきい値を超えて実行中ならスタックを採る。"""
+        since = self._busy_since
+        if not since or now - since < self.threshold:
+            return
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is not None:
+            self._samples.append(_sample(frame))
+
+    def _record_block(self, elapsed: float, handle: Any) -> None:
+        elapsed_ms = elapsed * 1000
+        samples, self._samples = self._samples, []
+        self.blocks_total += 1
+        self.blocked_ms_total += elapsed_ms
+        if samples:
+            counts = collections.Counter(s[0] for s in samples)
+            site = counts.most_common(1)[0][0]
+            site_sample = next(s for s in reversed(samples) if s[0] == site)
+            coroutine, stack = site_sample[1], list(site_sample[2])
+        else:
+            # ウォッチドッグが採取する前に終わった（しきい値付近の短いブロック）
+            site = _describe_handle(handle) if handle is not None else "unsampled"
+            coroutine, stack = "", []
+        entry = self.sites.setdefault(site, [0, 0.0, 0.0, coroutine])
+        entry[0] += 1
+        entry[1] += elapsed_ms
+        entry[2] = max(entry[2], elapsed_ms)
+        entry[3] = coroutine or entry[3]
+        self.recent_blocks.append(
+            {
+                "at": time.time(),
+                "blocked_ms": round(elapsed_ms, 1),
+                "site": site,
+                "coroutine": coroutine,
+                "samples": len(samples),
+                "stack": stack,
+            }
+        )
+        log.warning(
+            "%s blocked %.0fms at %s%s",
+            self.name,
+            elapsed_ms,
+            site,
+            f" (in {coroutine})" if coroutine and coroutine != site else "",
+            extra={"blocked_ms": round(elapsed_ms, 1), "site": site},
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        lags = sorted(self.lags_ms)
+        top = sorted(
+            list(self.sites.items()), key=lambda kv: kv[1][1], reverse=True
+        )[:TOP_SITES]
+        return {
+            "loop": self.name,
+            "running": self._task is not None and not self._task.done(),
+            "interval_ms": round(self.interval * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "asyncio_debug": LOOP_ASYNCIO_DEBUG,
+            "callback_timing": bool(self.callbacks_timed),
+            "lag_ms": {
+                "samples": len(lags),
+                "p50": round(_percentile(lags, 0.50), 2),
+                "p95": round(_percentile(lags, 0.95), 2),
+                "p99": round(_percentile(lags, 0.99), 2),
+                "max": round(lags[-1], 2) if lags else 0.0,
+            },
+            "blocks_total": self.blocks_total,
+            "blocked_ms_total": round(self.blocked_ms_total, 1),
+            "top_sites": [
+                {
+                    "site": site,
+                    "coroutine": coroutine,
+                    "count": count,
+                    "total_ms": round(total, 1),
+                    "max_ms": round(worst, 1),
+                }
+                for site, (count, total, worst, coroutine) in top
+            ],
+            "recent_blocks": list(self.recent_blocks)[::-1],
+        }
+
+
+# ループ（id）→ 監視。Bot と uvicorn が同じループなら 1 つを共有する
+LOOP_MONITORS: Dict[int, LoopLagMonitor] = {}
+# ループのスレッド → 監視（コールバックの計測から引く）
+_BY_THREAD: Dict[int, LoopLagMonitor] = {}
+_registry_lock = threading.Lock()
+_watchdog: Optional[threading.Thread] = None
+_original_handle_run = asyncio.events.Handle._run
+
+
+def _timed_handle_run(self) -> None:
+    monitor = _BY_THREAD.get(threading.get_ident())
+    if monitor is None:
+        return _original_handle_run(self)
+    started = time.perf_counter()
+    monitor._busy_since = started
+    try:
+        return _original_handle_run(self)
+    finally:
+        monitor._busy_since = 0.0
+        monitor.callbacks_timed += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= monitor.threshold:
+            monitor._record_block(elapsed, self)
+
+
+def _watchdog_main() -> None:
+    while True:
+        time.sleep(SAMPLE_INTERVAL_SEC)
+        now = time.perf_counter()
+        for monitor in list(LOOP_MONITORS.values()):
+            try:
+                monitor.check(now)
+            except Exception as e:  # 監視で本体を巻き込まない
+                log.warning("watchdog: %r", e)
+
+
+def start_loop_monitor(name: str) -> Optional[LoopLagMonitor]:
+    """実行中のループに監視を付ける（同じループに 2 回目以降は名前だけ足す）。"""
+    global _watchdog
+    if not LOOP_MONITOR_ENABLED:
+        return None
+    loop = asyncio.get_running_loop()
+    with _registry_lock:
+        monitor = LOOP_MONITORS.get(id(loop))
+        if monitor is not None and monitor._task is not None and not monitor._task.done():
+            if name not in monitor.names:
+                monitor.names.append(name)
+            return monitor
+        monitor = LoopLagMonitor(name)
+        LOOP_MONITORS[id(loop)] = monitor
+        monitor.start(loop)
+        _BY_THREAD[monitor._thread_id] = monitor
+        asyncio.events.Handle._run = _timed_handle_run
+        if _watchdog is None or not _watchdog.is_alive():
+            _watchdog = threading.Thread(
+                target=_watchdog_main, name="loop-monitor-watchdog", daemon=True
+            )
+            _watchdog.start()
+    debug_print(
+        f"[LoopMonitor] watching {name}: lag every {monitor.interval * 1000:.0f}ms, "
+        f"block >= {monitor.threshold * 1000:.0f}ms"
+        + (" (asyncio debug)" if LOOP_ASYNCIO_DEBUG else "")
+    )
+    return monitor
+
+
+def loop_monitor_snapshot() -> Dict[str, Any]:
+    return {
+        "pid": os.getpid(),
+        "enabled": LOOP_MONITOR_ENABLED,
+        "loops": [m.snapshot() for m in list(LOOP_MONITORS.values())],
+    }
@@ -0,0 +1,234 @@
+# bot/utils/member_cache.py
+"""
+Gateway 接続とメンバーキャッシュの方針
+- DISCORD_INTENTS: minimal（既定: guilds / members / DM のみ）| all
+- DISCORD_SHARD_COUNT: 未設定なら 1 接続の commands.Bot、"auto"（Discord の推奨数）か
+  数値なら AutoShardedBot
+- DISCORD_MEMBER_CACHE: all（既定: 起動時に全員をチャンクしてキャッシュ）| linked
+  linked は起動時にチャンクせず、連携済みメンバーと管理ロールの保持者だけをキャッシュする。
+  全員が必要な処理（全件のロール照合・プロフィール同期・ロール指定 DM）は、その都度
+  キャッシュせずにチャンクを取り寄せる（直後の別処理には結果を使い回す）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Collection, Dict, Iterable, Optional
+
+import discord
+from discord.ext import commands
+
+from bot.common import debug_print
+
+INTENTS_MODE = (os.getenv("DISCORD_INTENTS") or "minimal").strip().lower()
+SHARD_COUNT = (os.getenv("DISCORD_SHARD_COUNT") or "").strip().lower()
+MEMBER_CACHE_POLICY = (os.getenv("DISCORD_MEMBER_CACHE") or "all").strip().lower()
+
+# query_members(user_ids=...) の 1 リクエストあたりの上限
+QUERY_BATCH = 100
+QUERY_TIMEOUT_SEC = 30.0
+CHUNK_TIMEOUT_SEC = 300.0
+# all_members の結果を使い回す時間（起動直後のプロフィール同期とロール照合など）
+MEMBER_LIST_TTL_SEC = 60.0
+
+
+def build_intents(mode: str = INTENTS_MODE) -> discord.Intents:
+    if mode == "all":
+        return discord.Intents.all()
+    # スラッシュコマンドと DM 送信だけなので、プレゼンスやメッセージ本文は受け取らない
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.members = True
+    intents.dm_messages = True
+    return intents
+
+
+def _shard_count(raw: str = SHARD_COUNT) -> tuple[bool, Optional[int]]:
+    """(シャーディングするか, シャード数) を返す。数が None なら Discord の推奨数。"""
+    if not raw or raw in ("0", "1", "off", "none"):
+        return False, None
+    if raw == "auto":
+        return True, None
+    try:
+        return True, max(1, int(raw))
+    except ValueError:
+        debug_print(f"[gateway] invalid DISCORD_SHARD_COUNT={raw!r}; sharding disabled")
+        return False, None
+
+
+def create_bot(
+    command_prefix: str,
+    *,
+    intents_mode: str = INTENTS_MODE,
+    member_cache: str = MEMBER_CACHE_POLICY,
+    shard_count: str = SHARD_COUNT,
+) -> commands.Bot:
+    options: Dict[str, Any] = {
+        "command_prefix": command_prefix,
+        "intents": build_intents(intents_mode),
+    }
+    if member_cache == "linked":
+        options["chunk_guilds_at_startup"] = False
+        # 参加・更新イベントのたびに全員を溜めない。スラッシュコマンドを使った人は残す
+        options["member_cache_flags"] = discord.MemberCacheFlags(
+            voice=False, joined=False, interaction=True
+        )
+    sharded, count = _shard_count(shard_count)
+    debug_print(
+        f"[gateway] intents={intents_mode} member_cache={member_cache} "
+        f"shards={'off' if not sharded else (count or 'auto')}"
+    )
+    if sharded:
+        return commands.AutoShardedBot(shard_count=count, **options)
+    return commands.Bot(**options)
+
+
+class MemberCache:
+    """Bot のイベントループ上で使う。policy が all のときは何もしない。"""
+
+    def __init__(self, policy: str = MEMBER_CACHE_POLICY) -> None:
+        self.policy = policy
+        self._lists: Dict[int, tuple[float, list[discord.Member]]] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._guilds: Dict[int, discord.Guild] = {}
+        self._warm_task: Optional[asyncio.Task] = None
+
+    @property
+    def caches_all(self) -> bool:
+        return self.policy != "linked"
+
+    def remember(self, member: Any) -> None:
+        """取得したメンバーをキャッシュに残す（連携した人・管理ロールを付けた人）。"""
+        if self.caches_all or not isinstance(member, discord.Member):
+            return
+        guild = member.guild
+        if guild.get_member(member.id) is None:
+            # py-cord にはキャッシュへ入れる公開 API が無い（チャンク処理と同じ経路）
+            guild._add_member(member)
+
+    async def all_members(self, guild: discord.Guild) -> list[discord.Member]:
+        """ギルド全員。linked ではキャッシュせずにチャンクを取り寄せる。"""
+        if self.caches_all or guild.chunked:
+            return list(guild.members)
+        lock = self._locks.setdefault(guild.id, asyncio.Lock())
+        async with lock:
+            cached = self._lists.get(guild.id)
+            if cached is not None and time.monotonic() - cached[0] < MEMBER_LIST_TTL_SEC:
+                return cached[1]
+            started = time.perf_counter()
+            members = await asyncio.wait_for(guild.chunk(cache=False), CHUNK_TIMEOUT_SEC)
+            members = list(members or [])
+            stamp = time.monotonic()
+            self._lists[guild.id] = (stamp, members)
+            self._guilds[guild.id] = guild
+            debug_print(
+                f"[MemberCache] chunked guild={guild.id} members={len(members)} "
+                f"{time.perf_counter() - started:.2f}s (not cached)"
+            )
+            # 使い回し期間が過ぎたら手放す（全員分を持ち続けない）
+            asyncio.get_running_loop().call_later(
+                MEMBER_LIST_TTL_SEC, self._expire, guild.id, stamp
+            )
+            return members
+
+    def _expire(self, guild_id: int, stamp: float) -> None:
+        cached = self._lists.get(guild_id)
+        if cached is not None and cached[0] == stamp:
+            del self._lists[guild_id]
+            self._release_users(self._guilds.pop(guild_id), cached[1])
+
+    def _release_users(self, guild: discord.Guild, members: list[discord.Member]) -> None:
+        """
+        チャンクで作られた User を手放す。cache=False でも User は ConnectionState の
+        ユーザーキャッシュに強参照で残るため、キャッシュしていないメンバーの分は自分で外す。
+        """
+        state = guild._state
+        client = state.user
+        keep = {client.id} if client is not None else set()
+        released = 0
+        for member in members:
+            uid = member.id
+            if uid in keep or any(g.get_member(uid) is not None for g in state.guilds):
+                continue
+            state.deref_user(uid)
+            released += 1
+        if released:
+            debug_print(f"[MemberCache] released users={released} guild={guild.id}")
+
+    async def role_members(
+        self, guild: discord.Guild, role_ids: Iterable[int]
+    ) -> Dict[int, list[discord.Member]]:
+        """ロールごとの保持者。linked では全員を 1 回だけ走査する。"""
+        wanted = set(role_ids)
+        if self.caches_all:
+            return {
+                rid: list(role.members)
+                for rid in wanted
+                if (role := guild.get_role(rid)) is not None
+            }
+        result: Dict[int, list[discord.Member]] = {rid: [] for rid in wanted}
+        for member in await self.all_members(guild):
+            for role in member.roles:
+                if role.id in wanted:
+                    result[role.id].append(member)
+        return result
+
+    async def ensure_cached(self, guild: discord.Guild, member_ids: Iterable[int]) -> int:
+        """キャッシュに無いメンバーを user_ids 指定のチャンク要求で取り寄せる。"""
+        if self.caches_all:
+            return 0
+        missing = sorted({int(mid) for mid in member_ids if guild.get_member(int(mid)) is None})
+        fetched = 0
+        for start in range(0, len(missing), QUERY_BATCH):
+            batch = missing[start : start + QUERY_BATCH]
+            try:
+                members = await asyncio.wait_for(
+                    guild.query_members(user_ids=batch, limit=len(batch), cache=True),
+                    QUERY_TIMEOUT_SEC,
+                )
+                fetched += len(members)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                debug_print(f"[MemberCache] query_members failed: {e!r}")
+        return fetched
+
+    async def cache_matching(
+        self,
+        guild: discord.Guild,
+        keep_ids: Collection[int],
+        role_ids: Collection[int],
+    ) -> int:
+        """全員を走査して、keep_ids に含まれる人と role_ids の保持者をキャッシュに残す。"""
+        if self.caches_all:
+            return 0
+        kept = 0
+        for member in await self.all_members(guild):
+            if member.id in keep_ids or any(r.id in role_ids for r in member.roles):
+                if guild.get_member(member.id) is None:
+                    self.remember(member)
+                    kept += 1
+        return kept
+
+    def start_warm(self, guilds: Iterable[discord.Guild], member_ids: Iterable[Any]) -> bool:
+        """起動時: 連携済みメンバーをバックグラウンドでキャッシュに入れる。"""
+        if self.caches_all or (self._warm_task is not None and not self._warm_task.done()):
+            return False
+        ids = [int(mid) for mid in member_ids if str(mid).isdigit()]
+        self._warm_task = asyncio.create_task(
+            self._warm(list(guilds), ids), name="member-cache-warm"
+        )
+        return True
+
+    async def _warm(self, guilds: list[discord.Guild], ids: list[int]) -> None:
+        started = time.perf_counter()
+        fetched = 0
+        for guild in guilds:
+            fetched += await self.ensure_cached(guild, ids)
+        debug_print(
+            f"[MemberCache] warmed linked members={fetched}/{len(ids)} "
+            f"{time.perf_counter() - started:.2f}s"
+        )
+
+
+MEMBER_CACHE = MemberCache()
@@ -0,0 +1,130 @@
+# bot/utils/member_profiles.py
+"""
+Discord メンバー情報（表示名・アバター等）の linked_users への反映
+- ゲートウェイのイベント（参加・更新・退出）で該当メンバーだけを書き込む
+- 参加ラッシュ等で続けて届いた更新は短時間まとめて 1 トランザクションで反映する
+- 起動時の全件同期はバックグラウンドでチャンクごとに行い、on_ready を止めない
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, Iterable, Optional
+
+import discord
+
+from bot.common import debug_print
+from bot.utils.member_cache import MEMBER_CACHE
+from bot.utils.save_and_load import apply_member_profiles, mark_members_left
+
+FULL_SYNC_CHUNK = 500
+FLUSH_DELAY_SEC = 1.0
+
+
+def _clean(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def member_profile_fields(member: discord.abc.User) -> Dict[str, Any]:
+    """メンバー（またはユーザー）から linked_users に保存する項目を取り出す。"""
+    username = _clean(getattr(member, "name", None))
+    global_name = _clean(getattr(member, "global_name", None))
+    nickname = _clean(getattr(member, "nick", None))
+    display_name = _clean(getattr(member, "display_name", None))
+    if not display_name:
+        display_name = nickname or global_name or username
+    discriminator = _clean(getattr(member, "discriminator", None))
+    try:
+        avatar_url = getattr(getattr(member, "display_avatar", None), "url", None)
+    except Exception:
+        avatar_url = None
+    return {
+        "discord_display_name": display_name,
+        "discord_username": username,
+        "discord_global_name": global_name,
+        "discord_discriminator": discriminator,
+        "discord_nickname": nickname,
+        "discord_profile": {
+            "id": str(member.id),
+            "username": username,
+            "display_name": display_name,
+            "global_name": global_name,
+            "discriminator": discriminator,
+            "nickname": nickname,
+            "avatar_url": _clean(avatar_url),
+            "mention": _clean(getattr(member, "mention", None)),
+        },
+    }
+
+
+class MemberProfileSync:
+    """Bot のイベントループ上で使う。"""
+
+    def __init__(self) -> None:
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._full_task: Optional[asyncio.Task] = None
+
+    def update(self, member: discord.abc.User) -> None:
+        """1 人分の更新を積む（少し待ってからまとめて書き込む）。"""
+        if getattr(member, "bot", False):
+            return
+        self._pending[str(member.id)] = member_profile_fields(member)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(
+                self._flush_later(), name="member-profile-flush"
+            )
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(FLUSH_DELAY_SEC)
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(apply_member_profiles, batch)
+            except Exception as e:
+                debug_print(f"[MemberSync] flush of {len(batch)} profile(s) failed: {e!r}")
+
+    async def member_left(self, member: discord.abc.Snowflake) -> None:
+        did = str(member.id)
+        self._pending.pop(did, None)
+        try:
+            await asyncio.to_thread(mark_members_left, [did])
+        except Exception as e:
+            debug_print(f"[MemberSync] mark left {did} failed: {e!r}")
+
+    def start_full_sync(self, guild: discord.Guild) -> bool:
+        """ギルド全員の同期をバックグラウンドで開始する。実行中なら False。"""
+        if self._full_task is not None and not self._full_task.done():
+            return False
+        self._full_task = asyncio.create_task(
+            self._full_sync_guild(guild), name=f"member-full-sync-{guild.id}"
+        )
+        return True
+
+    async def _full_sync_guild(self, guild: discord.Guild) -> int:
+        try:
+            members = await MEMBER_CACHE.all_members(guild)
+        except Exception as e:
+            debug_print(f"[MemberSync] member list for {guild.id} failed: {e!r}")
+            return 0
+        return await self.full_sync(members)
+
+    async def full_sync(self, members: Iterable[discord.Member]) -> int:
+        snapshot = [m for m in members if not getattr(m, "bot", False)]
+        changed = 0
+        for start in range(0, len(snapshot), FULL_SYNC_CHUNK):
+            chunk = {
+                str(m.id): member_profile_fields(m)
+                for m in snapshot[start : start + FULL_SYNC_CHUNK]
+            }
+            try:
+                changed += await asyncio.to_thread(apply_member_profiles, chunk)
+            except Exception as e:
+                debug_print(f"[MemberSync] chunk at {start} failed: {e!r}")
+            # チャンクの合間にイベントループへ制御を返す
+            await asyncio.sleep(0)
+        debug_print(f"[MemberSync] full sync: members={len(snapshot)} changed={changed}")
+        return changed
@@ -0,0 +1,350 @@
+# bot/utils/metrics.py
+"""
+Prometheus 形式のメトリクス（GET /metrics、管理トークン必須）
+- カウンタ・ヒストグラムはスレッドごとの集計表に書き、出力時に合算する
+  （Bot ループ・to_thread のワーカー・uvicorn のスレッドから同時に書いてもロック不要）
+- ゲージ（inbox / outbox の滞留数）は出力時に DB から読む
+- プロセスごとの値。受付プロセスを分けた場合は各ワーカーが自分の分を持つ
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+import httpx
+
+from bot.common import debug_print
+
+# 秒。SQLite・Helix のような短い処理向け
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 秒。キュー経由の反映やジョブのような長い処理向け
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard: dict = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def _snapshots(self) -> list[dict]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        # dict のコピーは GIL の下で一度に行われる
+        return [dict(shard) for shard in shards]
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self) -> Dict[tuple, float]:
+        total: Dict[tuple, float] = {}
+        for shard in self._snapshots():
+            for labels, value in shard.items():
+                total[labels] = total.get(labels, 0) + value
+        return total
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = FAST_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            # [バケットごとの件数..., +Inf の件数, 合計]
+            cell = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def render(self) -> list[str]:
+        merged: Dict[tuple, list] = {}
+        for shard in self._snapshots():
+            for labels, cell in shard.items():
+                acc = merged.setdefault(labels, [0] * len(cell))
+                for i, v in enumerate(list(cell)):
+                    acc[i] += v
+        lines = self.header()
+        for labels, cell in sorted(merged.items()):
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), cell[:-1]):
+                running += count
+                le = f'le="{_number(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_label_text(self.labelnames, labels, le)} {running}"
+                )
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_number(cell[-1])}")
+            lines.append(f"{self.name}_count{label_text} {running}")
+        return lines
+
+    def time(self, *labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+
+class _Timer:
+    __slots__ = ("_hist", "_labels", "_started")
+
+    def __init__(self, hist: Histogram, labels: tuple) -> None:
+        self._hist = hist
+        self._labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._hist.observe(time.perf_counter() - self._started, *self._labels)
+
+
+class Gauge(_Metric):
+    """出力時にコレクタが値を入れ直す（書き込みは 1 スレッドだけ）。"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def replace(self, values: Dict[tuple, float]) -> None:
+        self._values = dict(values)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for labels, value in sorted(dict(self._values).items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """テキスト形式で出力する。コレクタが DB を読むので to_thread から呼ぶ。"""
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                COLLECTOR_ERRORS.inc(getattr(collector, "__name__", "collector"))
+                debug_print(f"[metrics] collector failed: {e!r}")
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, tuple(labelnames)))  # type: ignore[return-value]
+
+
+def histogram(
+    name: str,
+    help_text: str,
+    labelnames: Iterable[str] = (),
+    buckets: Sequence[float] = FAST_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, tuple(labelnames), buckets))  # type: ignore[return-value]
+
+
+def gauge(name: str, help_text: str, labelnames: Iterable[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help_text, tuple(labelnames)))  # type: ignore[return-value]
+
+
+# ---- EventSub / inbox / outbox ----
+EVENTSUB_NOTIFICATIONS = counter(
+    "neibot_eventsub_notifications_total",
+    "EventSub notifications received, by subscription type and apply result.",
+    ("type", "result"),
+)
+EVENTSUB_APPLY_SECONDS = histogram(
+    "neibot_eventsub_apply_seconds",
+    "Time from receiving an EventSub notification to applying it to linked_users/outbox.",
+    ("type",),
+)
+OUTBOX_ACTION_SECONDS = histogram(
+    "neibot_outbox_action_seconds",
+    "Time from queueing an outbox action to applying it on Discord.",
+    ("kind",),
+    SLOW_BUCKETS,
+)
+OUTBOX_ACTIONS = counter(
+    "neibot_outbox_actions_total", "Outbox actions handled, by kind and result.", ("kind", "result")
+)
+QUEUE_ROWS = gauge(
+    "neibot_queue_rows",
+    "Rows in the webhook inbox and the outbox by status (read at scrape time).",
+    ("queue", "status"),
+)
+
+# ---- SQLite / Helix ----
+SQLITE_OP_SECONDS = histogram(
+    "neibot_sqlite_op_seconds",
+    "SQLite helper latency from connect to close, by save_and_load function.",
+    ("function",),
+)
+HELIX_REQUEST_SECONDS = histogram(
+    "neibot_helix_request_seconds", "Twitch API latency by endpoint.", ("endpoint",)
+)
+HELIX_REQUESTS = counter(
+    "neibot_helix_requests_total", "Twitch API requests by endpoint and status.", ("endpoint", "status")
+)
+
+# ---- Discord ----
+DISCORD_DMS = counter(
+    "neibot_discord_dm_total", "DM outcomes by feature and outcome.", ("source", "outcome")
+)
+DISCORD_ROLE_CHANGES = counter(
+    "neibot_discord_role_changes_total",
+    "Member role edits by feature and result.",
+    ("source", "result"),
+)
+BROADCAST_RECIPIENTS = counter(
+    "neibot_broadcast_recipients_total",
+    "Broadcast DM recipients processed (rate = throughput), by outcome.",
+    ("outcome",),
+)
+BROADCAST_JOBS = counter(
+    "neibot_broadcast_jobs_total", "Broadcast jobs finished, by final status.", ("status",)
+)
+
+# ---- Scheduler ----
+SCHEDULER_JOB_SECONDS = histogram(
+    "neibot_scheduler_job_seconds",
+    "Scheduled job run time by job id and status.",
+    ("job", "status"),
+    SLOW_BUCKETS,
+)
+
+# ---- HTTP ----
+HTTP_REQUEST_SECONDS = histogram(
+    "neibot_http_request_seconds",
+    "HTTP request latency by app, method and route template.",
+    ("app", "method", "route"),
+)
+
+LOG_RECORDS_DROPPED = counter(
+    "neibot_log_records_dropped_total", "Log records dropped because the log queue was full."
+)
+COLLECTOR_ERRORS = counter(
+    "neibot_metrics_collector_errors_total", "Failures while collecting gauges.", ("collector",)
+)
+
+
+def _collect_queue_rows() -> None:
+    # save_and_load がこのモジュールを使うので、読み込みは実行時に
+    from bot.utils.save_and_load import queue_status_counts
+
+    QUEUE_ROWS.replace(
+        {(queue, status): count for (queue, status), count in queue_status_counts().items()}
+    )
+
+
+REGISTRY.add_collector(_collect_queue_rows)
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """応答ヘッダが届くまでの時間とステータスをエンドポイント（URL のパス）ごとに記録する。"""
+
+    def __init__(
+        self,
+        latency: Histogram,
+        requests: Counter,
+        inner: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self._inner = inner or httpx.AsyncHTTPTransport()
+        self._latency = latency
+        self._requests = requests
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path
+        started = time.perf_counter()
+        try:
+            response = await self._inner.handle_async_request(request)
+        except Exception as e:
+            self._requests.inc(endpoint, type(e).__name__)
+            raise
+        self._latency.observe(time.perf_counter() - started, endpoint)
+        self._requests.inc(endpoint, str(response.status_code))
+        return response
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
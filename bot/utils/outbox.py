@@ -0,0 +1,238 @@
+# bot/utils/outbox.py
+"""
+EventSub → Discord 副作用のアウトボックス
+- Webhook スレッドは linked_users の更新と同じトランザクションで outbox に積むだけで、
+  Discord には触れない
+- Bot ループ上のコンシューマが優先度順（ロール変更 → 配信開始通知 → DM）に取り出して実行する
+- 未処理の同一アクション（dedupe_key）は DB 側で 1 件に合流し、同じバッチ内の
+  ロール変更は 1 回のリコンサイルにまとめる
+- once を付けたアクション（節目 DM・配信開始通知）は、実行済みの行が残っている間は積み直さない
+- 失敗は指数バックオフで再試行し、上限を超えたら failed として残す
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from bot.utils.logs import correlation, get_logger
+from bot.utils.metrics import OUTBOX_ACTION_SECONDS, OUTBOX_ACTIONS
+from bot.utils.save_and_load import (
+    outbox_claim,
+    outbox_complete,
+    outbox_prune,
+    outbox_requeue_running,
+    outbox_retry,
+)
+
+KIND_ROLES = "roles"
+KIND_MILESTONE_DM = "milestone_dm"
+KIND_STREAM_ONLINE = "stream_online"
+
+PRIORITY_ROLES = 10
+PRIORITY_STREAM_ONLINE = 20
+PRIORITY_DM = 50
+
+BATCH_SIZE = 50
+POLL_INTERVAL_SEC = 5.0
+RETRY_BASE_SEC = 10.0
+MAX_ATTEMPTS = 6
+
+log = get_logger("outbox")
+
+
+def _parse_milestones(raw: str) -> frozenset[int]:
+    result = set()
+    for part in raw.split(","):
+        part = part.strip()
+        if part.isdigit() and int(part) > 0:
+            result.add(int(part))
+    return frozenset(result)
+
+
+# 累計月数がこの値になったらお祝い DM を送る
+SUB_MILESTONES = _parse_milestones(os.getenv("SUB_MILESTONES", "3,6,12,24,36,48,60"))
+
+# 取り出した行のうち失敗したもの: 行 ID → エラー内容
+OutboxHandler = Callable[[list[Dict[str, Any]]], Awaitable[Dict[int, str]]]
+
+
+def roles_action(discord_id: str) -> Dict[str, Any]:
+    return {
+        "kind": KIND_ROLES,
+        "discord_id": str(discord_id),
+        "priority": PRIORITY_ROLES,
+        "dedupe_key": f"{KIND_ROLES}:{discord_id}",
+    }
+
+
+def milestone_dm_action(discord_id: str, months: int) -> Dict[str, Any]:
+    return {
+        "kind": KIND_MILESTONE_DM,
+        "discord_id": str(discord_id),
+        "payload": {"months": int(months)},
+        "priority": PRIORITY_DM,
+        "dedupe_key": f"{KIND_MILESTONE_DM}:{discord_id}:{int(months)}",
+        # 実行済みの行があれば積み直さない（EventSub の再送で二重に送らない）
+        "once": True,
+    }
+
+
+def stream_online_action(event: Dict[str, Any]) -> Dict[str, Any]:
+    """配信開始の通知。Twitch の再送で同じ配信が二重に通知されないよう配信 ID で合流する（通知済みでも）。"""
+    stream_id = event.get("id") or event.get("started_at") or ""
+    return {
+        "kind": KIND_STREAM_ONLINE,
+        "payload": {"event": event},
+        "priority": PRIORITY_STREAM_ONLINE,
+        "dedupe_key": f"{KIND_STREAM_ONLINE}:{event.get('broadcaster_user_id')}:{stream_id}",
+        "once": True,
+    }
+
+
+def build_milestone_message(months: int) -> str:
+    return (
+        f"🎉 サブスク累計 {months} ヶ月、ありがとうございます！\n"
+        "いつも応援してくれて本当にうれしいです。これからもよろしくお願いします！"
+    )
+
+
+def actions_for_event(
+    sub_type: str, discord_id: str, event: Dict[str, Any]
+) -> list[Dict[str, Any]]:
+    """EventSub 1 件から Discord 側で必要なアクションを決める。"""
+    actions: list[Dict[str, Any]] = []
+    if sub_type in (
+        "channel.subscribe",
+        "channel.subscription.message",
+        "channel.subscription.end",
+    ):
+        actions.append(roles_action(discord_id))
+    if sub_type == "channel.subscription.message":
+        months = event.get("cumulative_months")
+        if isinstance(months, int) and months in SUB_MILESTONES:
+            actions.append(milestone_dm_action(discord_id, months))
+    return actions
+
+
+class OutboxConsumer:
+    """Bot のイベントループ上でアウトボックスを処理する。notify はどのスレッドからでも可。"""
+
+    def __init__(self, handlers: Dict[str, OutboxHandler]) -> None:
+        self.handlers = handlers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass
+
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        requeued = await asyncio.to_thread(outbox_requeue_running)
+        await asyncio.to_thread(outbox_prune)
+        if requeued:
+            log.info("requeued %d interrupted action(s)", requeued)
+        self._task = asyncio.create_task(self._run(), name="outbox-consumer")
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while True:
+            try:
+                processed = await self.drain_once()
+            except Exception as e:
+                log.exception("consumer error: %r", e)
+                processed = 0
+            if processed:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), POLL_INTERVAL_SEC)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def drain_once(self) -> int:
+        rows = await asyncio.to_thread(outbox_claim, BATCH_SIZE)
+        if not rows:
+            return 0
+        groups: Dict[str, list[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(row["kind"], []).append(row)
+        done: list[int] = []
+        failures: Dict[int, str] = {}
+        # 行は priority 順に取り出しているので、グループも最初の行の順に処理する
+        for kind, items in sorted(groups.items(), key=lambda kv: kv[1][0]["priority"]):
+            handler = self.handlers.get(kind)
+            if handler is None:
+                failures.update({item["id"]: f"no handler for {kind}" for item in items})
+                continue
+            try:
+                # ハンドラ内のログにも元の EventSub の相関 ID を付ける（まとめた分は列挙）
+                with correlation(_batch_correlation_id(items)):
+                    failed = await handler(items)
+            except Exception as e:
+                failed = {item["id"]: repr(e) for item in items}
+            failures.update(failed)
+            done.extend(item["id"] for item in items if item["id"] not in failed)
+        await asyncio.to_thread(outbox_complete, done)
+        await asyncio.to_thread(
+            outbox_retry,
+            failures,
+            base_delay_sec=RETRY_BASE_SEC,
+            max_attempts=MAX_ATTEMPTS,
+        )
+        if failures:
+            log.warning("done=%d retry=%d", len(done), len(failures))
+        _record_metrics(rows, failures)
+        for row in rows:
+            log.debug(
+                "%s id=%s discord_id=%s %s",
+                row["kind"],
+                row["id"],
+                row.get("discord_id"),
+                failures.get(row["id"], "done"),
+                extra={"correlation_id": _batch_correlation_id([row])},
+            )
+        return len(rows)
+
+
+def _batch_correlation_id(items: list[Dict[str, Any]]) -> Optional[str]:
+    ids = dict.fromkeys(
+        cid for item in items if (cid := (item.get("payload") or {}).get("correlation_id"))
+    )
+    return ",".join(ids) if ids else None
+
+
+def _record_metrics(rows: list[Dict[str, Any]], failures: Dict[int, str]) -> None:
+    """積まれてから反映されるまでの時間（再試行の待ちも含む）と件数を記録する。"""
+    now = dt.datetime.now(dt.timezone.utc)
+    for row in rows:
+        kind = str(row["kind"])
+        if row["id"] in failures:
+            OUTBOX_ACTIONS.inc(kind, "retry")
+            continue
+        OUTBOX_ACTIONS.inc(kind, "ok")
+        try:
+            queued = dt.datetime.fromisoformat(row.get("created_at") or "")
+        except ValueError:
+            continue
+        OUTBOX_ACTION_SECONDS.observe((now - queued).total_seconds(), kind)
+
+
+def unique_discord_ids(rows: Iterable[Dict[str, Any]]) -> list[str]:
+    seen: Dict[str, None] = {}
+    for row in rows:
+        if row.get("discord_id"):
+            seen.setdefault(str(row["discord_id"]), None)
+    return list(seen)
@@ -0,0 +1,236 @@
+# bot/utils/profiling.py
+"""
+本番プロセスをそのまま調べるためのプロファイラ（管理トークン必須の /debug/* から使う）
+- CPU: 指定秒数だけ別スレッドで全スレッドのスタックを一定間隔で採り、
+  flamegraph.pl / speedscope が読める collapsed 形式（"スレッド;外側;…;内側 件数"）で返す
+- メモリ: tracemalloc を開始し、前回のスナップショットとの差分（増えた行の上位 N 件）を返す
+- タスク: ループ上の asyncio タスクと、await でつながったコルーチンのスタック
+いずれも呼ばれるまでは何もしない（スレッドもフックも無い）。tracemalloc だけは
+開始から停止まで割り当てごとのコストがかかるので、調べ終わったら止める
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from bot.common import PROJECT_ROOT
+from bot.utils.logs import get_logger
+
+log = get_logger("profiling")
+
+MAX_PROFILE_SEC = 300.0
+DEFAULT_HZ = 100
+MAX_HZ = 1000
+TASK_STACK_DEPTH = 20
+
+
+class ProfilerBusy(RuntimeError):
+    """別のプロファイルが実行中。"""
+
+
+def _short_path(filename: str) -> str:
+    path = os.path.abspath(filename)
+    if path.startswith(PROJECT_ROOT + os.sep):
+        return os.path.relpath(path, PROJECT_ROOT).replace(os.sep, "/")
+    # site-packages 等は末尾だけ（スタックを短くする）
+    return "/".join(path.replace(os.sep, "/").split("/")[-2:])
+
+
+def _label(code, lineno: Optional[int] = None) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    where = f"{_short_path(code.co_filename)}:{lineno or code.co_firstlineno}"
+    # collapsed 形式の区切り文字（;）を含めない
+    return f"{name} ({where})".replace(";", ":")
+
+
+# ---- CPU: サンプリング ----
+_profile_lock = threading.Lock()
+
+
+def _collapse(frame, thread_name: str, cache: Dict[Any, str]) -> str:
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        label = cache.get(code)
+        if label is None:
+            label = cache[code] = _label(code)
+        labels.append(label)
+        frame = frame.f_back
+    labels.append(thread_name)
+    labels.reverse()
+    return ";".join(labels)
+
+
+def sample_stacks(seconds: float, hz: int = DEFAULT_HZ) -> Dict[str, Any]:
+    """
+    呼んだスレッドで seconds 秒サンプリングする（to_thread から呼ぶ）。
+    GIL を持っている間しかサンプルできないので、C 拡張や I/O 待ちの中は待ち始めた行に出る
+    """
+    seconds = min(max(0.1, float(seconds)), MAX_PROFILE_SEC)
+    hz = min(max(1, int(hz)), MAX_HZ)
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("another profile is running")
+    try:
+        me = threading.get_ident()
+        interval = 1.0 / hz
+        stacks: Counter[str] = Counter()
+        labels: Dict[Any, str] = {}
+        names: Dict[int, str] = {}
+        samples = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_at = started
+        log.info("cpu profile started seconds=%.1f hz=%d", seconds, hz)
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {t.ident: t.name for t in threading.enumerate() if t.ident}
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stacks[_collapse(frame, names.get(ident, f"thread-{ident}"), labels)] += 1
+            samples += 1
+            del frames
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+        elapsed = time.perf_counter() - started
+        log.info("cpu profile finished samples=%d stacks=%d", samples, len(stacks))
+        return {
+            "collapsed": "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+            "samples": samples,
+            "seconds": round(elapsed, 3),
+            "hz": hz,
+        }
+    finally:
+        _profile_lock.release()
+
+
+# ---- メモリ: tracemalloc ----
+class MemoryTracker:
+    """tracemalloc の開始・差分・停止。スナップショットの取得は重いので to_thread から呼ぶ。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._started_at: Optional[float] = None
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+
+    def start(self, frames: int = 1) -> Dict[str, Any]:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, min(int(frames), 50)))
+                self._started_at = time.time()
+                log.info("tracemalloc started frames=%d", tracemalloc.get_traceback_limit())
+            self._baseline = self._snapshot()
+            return self.status()
+
+    def diff(self, top: int = 20, key_type: str = "lineno") -> Dict[str, Any]:
+        """前回（start か前回の diff）からの増減の上位 top 件。今回のスナップショットが次の基準になる。"""
+        if key_type not in ("lineno", "filename", "traceback"):
+            key_type = "lineno"
+        with self._lock:
+            if not tracemalloc.is_tracing() or self._baseline is None:
+                return {"tracing": False, "error": "tracemalloc is not running"}
+            current = self._snapshot()
+            stats = current.compare_to(self._baseline, key_type)
+            self._baseline = current
+        top = max(1, min(int(top), 200))
+        rows = []
+        for stat in stats[:top]:
+            frames = stat.traceback.format() if key_type == "traceback" else []
+            frame = stat.traceback[0]
+            rows.append(
+                {
+                    "where": f"{frame.filename}:{frame.lineno}",
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "size_kb": round(stat.size / 1024, 1),
+                    "count_diff": stat.count_diff,
+                    "count": stat.count,
+                    **({"traceback": frames} if frames else {}),
+                }
+            )
+        return {**self.status(), "key_type": key_type, "top": rows}
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                log.info("tracemalloc stopped")
+            self._baseline = None
+            self._started_at = None
+            return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        result: Dict[str, Any] = {"tracing": tracing}
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            result.update(
+                traced_mb=round(current / 1024 / 1024, 2),
+                peak_mb=round(peak / 1024 / 1024, 2),
+                overhead_mb=round(tracemalloc.get_tracemalloc_memory() / 1024 / 1024, 2),
+                started_at=self._started_at,
+            )
+        return result
+
+
+MEMORY = MemoryTracker()
+
+
+# ---- asyncio タスク ----
+def _await_chain(coro: Any) -> list[str]:
+    """コルーチンが await している先をたどる（Task.get_stack は一番外側しか返さない）。"""
+    lines: list[str] = []
+    while coro is not None and len(lines) < TASK_STACK_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        code = getattr(coro, "cr_code", None) or getattr(coro, "gi_code", None)
+        if code is None:
+            # Future 等（コルーチン以外）を待っている
+            lines.append(f"<{type(coro).__name__}>")
+            break
+        lines.append(_label(code, frame.f_lineno if frame is not None else None))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return lines
+
+
+def dump_tasks(loop_name: str = "") -> Dict[str, Any]:
+    """実行中のループ上で呼ぶ（all_tasks はスレッドセーフではない）。"""
+    current = asyncio.current_task()
+    tasks = []
+    for task in asyncio.all_tasks():
+        if task is current:
+            continue
+        tasks.append(
+            {
+                "name": task.get_name(),
+                "state": "cancelling" if task.cancelling() else "pending",
+                "coro": getattr(task.get_coro(), "__qualname__", repr(task.get_coro())),
+                "stack": _await_chain(task.get_coro()),
+            }
+        )
+    tasks.sort(key=lambda t: t["name"])
+    return {
+        "loop": loop_name,
+        "thread": threading.current_thread().name,
+        "count": len(tasks),
+        "tasks": tasks,
+    }
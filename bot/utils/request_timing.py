@@ -0,0 +1,261 @@
+# bot/utils/request_timing.py
+"""
+リクエストごとの所要時間と DB 時間（FastAPI と Django の webadmin で共通）
+- begin_request() で DB 時間の集計先をコンテキストに置き、end_request() でルートごとに集計する
+  （contextvars なので asyncio.to_thread で呼んだ save_and_load の時間も同じリクエストに入る）
+- SQL 文の時間は save_and_load の接続と Django の connection.execute_wrapper から record_statement に渡す。
+  SQL_SLOW_MS を超えた文は EXPLAIN QUERY PLAN と一緒に残し、警告ログにも出す
+- SQL_TRACE=1 で save_and_load の全文（引数を埋めた形）を neibot.sql の DEBUG ログに出す
+- 集計はプロセスごと。Bot は GET /debug/requests、パネルは「性能」ページで見る
+"""
+
+from __future__ import annotations
+
+import collections
+import os
+import threading
+import time
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional, Sequence
+
+from bot.utils.logs import get_logger
+from bot.utils.metrics import HTTP_REQUEST_SECONDS
+
+log = get_logger("timing")
+sql_log = get_logger("sql")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+# 0 で遅い文の記録（と EXPLAIN）をしない
+SLOW_SQL_SEC = _env_float("SQL_SLOW_MS", 200.0) / 1000.0
+SQL_TRACE = os.getenv("SQL_TRACE", "0") == "1"
+# ルートごとにパーセンタイル計算用に残す件数
+ROUTE_WINDOW = 500
+RECENT_SLOW_QUERIES = 50
+SQL_TEXT_LIMIT = 2000
+UNMATCHED_ROUTE = "<unmatched>"
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete", "replace")
+
+
+@dataclass
+class RequestDB:
+    """1 リクエスト分の DB 時間。to_thread のワーカーからも足される。"""
+
+    label: str = ""
+    seconds: float = 0.0
+    statements: int = 0
+
+
+_current: ContextVar[Optional[RequestDB]] = ContextVar("neibot_request_db", default=None)
+
+
+def begin_request(label: str) -> tuple[RequestDB, Token]:
+    acc = RequestDB(label=label)
+    return acc, _current.set(acc)
+
+
+def end_request(token: Token) -> None:
+    _current.reset(token)
+
+
+# ---- ルートごとの集計 ----
+class _Route:
+    __slots__ = ("count", "errors", "total", "db_total", "statements", "max", "durations", "last_status")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.db_total = 0.0
+        self.statements = 0
+        self.max = 0.0
+        self.durations: Deque[float] = collections.deque(maxlen=ROUTE_WINDOW)
+        self.last_status = 0
+
+
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RouteStats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._routes: Dict[tuple[str, str, str], _Route] = {}
+        self.started_at = time.time()
+
+    def record(
+        self,
+        app: str,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        db: Optional[RequestDB],
+    ) -> None:
+        HTTP_REQUEST_SECONDS.observe(seconds, app, method, route)
+        with self._lock:
+            entry = self._routes.get((app, method, route))
+            if entry is None:
+                entry = self._routes[(app, method, route)] = _Route()
+            entry.count += 1
+            entry.errors += status >= 500
+            entry.total += seconds
+            entry.max = max(entry.max, seconds)
+            entry.durations.append(seconds)
+            entry.last_status = status
+            if db is not None:
+                entry.db_total += db.seconds
+                entry.statements += db.statements
+
+    def snapshot(self) -> list[Dict[str, Any]]:
+        with self._lock:
+            items = [
+                (key, entry.count, entry.errors, entry.total, entry.db_total, entry.statements,
+                 entry.max, sorted(entry.durations), entry.last_status)
+                for key, entry in self._routes.items()
+            ]
+        rows = []
+        for (app, method, route), count, errors, total, db_total, statements, max_sec, durations, last in items:
+            rows.append(
+                {
+                    "app": app,
+                    "method": method,
+                    "route": route,
+                    "count": count,
+                    "errors": errors,
+                    "last_status": last,
+                    "total_ms": round(total * 1000, 1),
+                    "avg_ms": round(total / count * 1000, 1),
+                    "p50_ms": round(_percentile(durations, 0.50) * 1000, 1),
+                    "p95_ms": round(_percentile(durations, 0.95) * 1000, 1),
+                    "max_ms": round(max_sec * 1000, 1),
+                    "avg_db_ms": round(db_total / count * 1000, 1),
+                    "db_share": round(db_total / total, 3) if total else 0.0,
+                    "avg_statements": round(statements / count, 1),
+                }
+            )
+        # 合計時間の大きい順（まず見るべきルートが上に来る）
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return rows
+
+
+REQUEST_STATS = RouteStats()
+
+# ---- SQL 文 ----
+_slow_lock = threading.Lock()
+_slow_queries: Deque[Dict[str, Any]] = collections.deque(maxlen=RECENT_SLOW_QUERIES)
+
+
+def is_explainable(sql: str) -> bool:
+    return sql.lstrip().lower().startswith(_EXPLAINABLE)
+
+
+def format_plan(rows: Sequence[Sequence[Any]]) -> list[str]:
+    """EXPLAIN QUERY PLAN の行 (id, parent, notused, detail) を親子の字下げで並べる。"""
+    depth: Dict[Any, int] = {0: -1}
+    lines = []
+    for row in rows:
+        node, parent, detail = row[0], row[1], row[-1]
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + str(detail))
+    return lines
+
+
+def trace_sql(statement: str) -> None:
+    """sqlite3 の set_trace_callback 用。"""
+    sql_log.debug("%s", statement)
+
+
+def record_statement(
+    seconds: float,
+    sql: str,
+    source: str,
+    explain: Optional[Callable[[], list[str]]] = None,
+) -> None:
+    """文 1 件分。現在のリクエストの DB 時間に足し、遅ければ実行計画と一緒に残す。"""
+    acc = _current.get()
+    if acc is not None:
+        acc.seconds += seconds
+        acc.statements += 1
+    if not SLOW_SQL_SEC or seconds < SLOW_SQL_SEC:
+        return
+    plan: list[str] = []
+    if explain is not None:
+        try:
+            plan = explain()
+        except Exception as e:
+            plan = [f"<explain failed: {e!r}>"]
+    entry = {
+        "ts": time.time(),
+        "ms": round(seconds * 1000, 1),
+        "source": source,
+        "route": acc.label if acc is not None else "",
+        "sql": " ".join(sql.split())[:SQL_TEXT_LIMIT],
+        "plan": plan,
+    }
+    with _slow_lock:
+        _slow_queries.append(entry)
+    log.warning(
+        "slow sql %.1fms (%s) %s",
+        entry["ms"],
+        source,
+        entry["sql"][:200],
+        extra={"sql": entry["sql"], "plan": plan, "route": entry["route"]},
+    )
+
+
+def timing_snapshot() -> Dict[str, Any]:
+    with _slow_lock:
+        slow = list(_slow_queries)
+    slow.reverse()
+    return {
+        "pid": os.getpid(),
+        "since": REQUEST_STATS.started_at,
+        "slow_sql_ms": round(SLOW_SQL_SEC * 1000, 1),
+        "routes": REQUEST_STATS.snapshot(),
+        "slow_queries": slow,
+    }
+
+
+# ---- FastAPI / Starlette ----
+class TimingMiddleware:
+    """ASGI ミドルウェア（BaseHTTPMiddleware と違いストリーミング応答やコンテキストを崩さない）。"""
+
+    def __init__(self, app: Any, app_name: str = "api") -> None:
+        self.app = app
+        self.app_name = app_name
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def _send(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        acc, token = begin_request(scope.get("path", ""))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            elapsed = time.perf_counter() - started
+            end_request(token)
+            # ルーティング後は scope にルートが入る（パスそのものは使わず、件数が増えないようにする）
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+            REQUEST_STATS.record(
+                self.app_name, scope.get("method", ""), route, status, elapsed, acc
+            )
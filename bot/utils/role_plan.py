@@ -0,0 +1,358 @@
+# bot/utils/role_plan.py
+"""
+サブスク Tier とロールの対応表（ロールプラン）
+- subscription_config.json（Tier 定義）と guild_state.json（ギルドごとのロール・チャンネル ID）から、
+  ギルドごとに「Tier コード → ロール ID」「管理ロール」「Tier チャンネルの閲覧ロール」を組み立てておく
+- どちらかのファイルが変わったら次に参照したときに組み立て直す（Bot の再起動は不要）。
+  ただし新しいロール名・チャンネル名の作成は起動時のプロビジョニングだけ
+- 連携 Cog・ロールのリコンサイル（月次再リンクもここを経由）・配信開始通知・起動時の作成で共有する
+"""
+
+from __future__ import annotations
+
+import copy
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional
+
+from bot.common import debug_print
+from bot.utils.save_and_load import (
+    GUILD_STATE_FILE,
+    ROLE_CONFIG_FILE,
+    load_channel_ids,
+    load_role_ids,
+    load_subscription_config,
+)
+
+DEFAULT_SUBSCRIPTION_CONFIG: dict[str, Any] = {
+    "tiers": [
+        {
+            "key": "tier1",
+            "role_name": "Subscription Tier1",
+            "category_name": "サブスクTier 1",
+            "channel_name": "tier-1",
+            "view_roles": ["tier1"],
+        },
+        {
+            "key": "tier2",
+            "role_name": "Subscription Tier2",
+            "category_name": "サブスクTier 2",
+            "channel_name": "tier-2",
+            "view_roles": ["tier1", "tier2"],
+        },
+        {
+            "key": "tier3",
+            "role_name": "Subscription Tier3",
+            "category_name": "サブスクTier 3",
+            "channel_name": "tier-3",
+            "view_roles": ["tier1", "tier2", "tier3"],
+        },
+    ],
+    "linked_role_name": "Twitch-linked",
+    "notify_role_name": "Subscription Tier1",
+    "notify_channel_id": None,
+}
+
+# Helix の tier 値 → subscription_config の key
+TIER_CODE_KEYS = {"1000": "tier1", "2000": "tier2", "3000": "tier3"}
+FALLBACK_TIER_ROLE_NAMES = {
+    "tier1": "Subscription Tier1",
+    "tier2": "Subscription Tier2",
+    "tier3": "Subscription Tier3",
+}
+FALLBACK_LINKED_ROLE_NAMES = ("Twitch-linked", "twitch_linked")
+EVERYONE_ALIASES = {"@everyone", "everyone", "*"}
+
+# ファイルの更新確認（stat）をこれより頻繁には行わない
+RELOAD_CHECK_INTERVAL_SEC = 1.0
+
+
+def _int_or_none(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_subscription_config(user_config: Mapping[str, Any]) -> dict[str, Any]:
+    """ユーザー設定を既定値で補完する（Tier は位置ごとに既定の項目を引き継ぐ）。"""
+    merged = copy.deepcopy(DEFAULT_SUBSCRIPTION_CONFIG)
+    if isinstance(user_config, Mapping):
+        for key, value in user_config.items():
+            if key == "tiers" or value is None:
+                continue
+            merged[key] = value
+
+    tiers: list[dict[str, Any]] = []
+    user_tiers = user_config.get("tiers") if isinstance(user_config, Mapping) else None
+    if isinstance(user_tiers, list) and user_tiers:
+        for idx, entry in enumerate(user_tiers):
+            if not isinstance(entry, dict):
+                continue
+            if idx < len(DEFAULT_SUBSCRIPTION_CONFIG["tiers"]):
+                base = copy.deepcopy(DEFAULT_SUBSCRIPTION_CONFIG["tiers"][idx])
+            else:
+                base = {
+                    "key": entry.get("key") or f"tier{idx + 1}",
+                    "role_name": entry.get("role_name")
+                    or entry.get("key")
+                    or f"Tier{idx + 1}",
+                    "category_name": entry.get("category_name")
+                    or entry.get("role_name")
+                    or f"Category{idx + 1}",
+                    "channel_name": entry.get("channel_name") or f"channel-{idx + 1}",
+                    "view_roles": entry.get("view_roles")
+                    or [entry.get("key") or f"tier{idx + 1}"],
+                }
+            for key, value in entry.items():
+                if value is not None:
+                    base[key] = value
+            if "key" not in base or not base["key"]:
+                base["key"] = f"tier{idx + 1}"
+            tiers.append(base)
+    if not tiers:
+        tiers = copy.deepcopy(DEFAULT_SUBSCRIPTION_CONFIG["tiers"])
+    merged["tiers"] = tiers
+    return merged
+
+
+def compile_tier_entries(tiers: list[Mapping[str, Any]]) -> list[dict[str, Any]]:
+    """Tier 定義をプロビジョニング用のエントリ（閲覧ロールは名前に解決済み）にする。"""
+    role_by_key: dict[str, str] = {}
+    entries: list[dict[str, Any]] = []
+    for entry in tiers:
+        key = str(entry.get("key") or f"tier{len(entries) + 1}")
+        role_name = str(entry.get("role_name") or key)
+        category_name = str(
+            entry.get("category_name") or entry.get("channel_name") or role_name
+        )
+        channel_name = str(entry.get("channel_name") or role_name)
+        allowed = entry.get("view_roles") or [key]
+
+        role_by_key[key] = role_name
+        allowed_role_names: list[str] = []
+        for item in allowed:
+            resolved = role_by_key.get(str(item))
+            if not resolved and isinstance(item, str) and item in role_by_key.values():
+                resolved = item
+            if not resolved and item == key:
+                resolved = role_name
+            resolved = resolved or str(item)
+            if resolved not in allowed_role_names:
+                allowed_role_names.append(resolved)
+        if role_name not in allowed_role_names:
+            allowed_role_names.append(role_name)
+
+        entries.append(
+            {
+                "key": key,
+                "role_name": role_name,
+                "category_name": category_name,
+                "channel_name": channel_name,
+                "view_role_names": allowed_role_names,
+            }
+        )
+    return entries
+
+
+@dataclass(frozen=True)
+class GuildRolePlan:
+    """1 ギルド分の管理対象ロール。"""
+
+    guild_id: int
+    linked_role_id: Optional[int]
+    tier_role_ids: Dict[str, int]  # "1000" → role id
+    all_tier_role_ids: frozenset[int]
+    managed_role_ids: frozenset[int]
+    # Tier の key → その Tier チャンネルを閲覧できるロール（@everyone はギルド ID）
+    view_role_ids: Dict[str, frozenset[int]] = field(default_factory=dict)
+    notify_role_id: Optional[int] = None
+    notify_channel_id: Optional[int] = None
+
+    def desired(self, state: Optional[Mapping[str, Any]]) -> frozenset[int]:
+        """連携状態からあるべき管理ロールを返す（未連携・剥奪済みは空）。"""
+        if not state or state.get("roles_revoked"):
+            return frozenset()
+        if not (state.get("twitch_user_id") or state.get("twitch_username")):
+            return frozenset()
+        roles: set[int] = set()
+        if self.linked_role_id is not None:
+            roles.add(self.linked_role_id)
+        if state.get("is_subscriber"):
+            tier_role = self.tier_role_ids.get(str(state.get("tier") or ""))
+            if tier_role is not None:
+                roles.add(tier_role)
+        return frozenset(roles)
+
+
+@dataclass(frozen=True)
+class RolePlan:
+    subscription_config: dict[str, Any]
+    tier_entries: list[dict[str, Any]]
+    # プロビジョニングで用意するロール名（Tier・連携・通知）
+    role_names: list[str]
+    notify_role_name: Optional[str]
+    guilds: Dict[int, GuildRolePlan]
+
+    def guild(self, guild_id: int) -> Optional[GuildRolePlan]:
+        return self.guilds.get(int(guild_id))
+
+
+def _notify_settings(
+    config: Mapping[str, Any], entries: list[dict[str, Any]]
+) -> tuple[Optional[str], Optional[int]]:
+    role_name = config.get("notify_role_name")
+    if not role_name:
+        notify_entry = next((e for e in entries if e.get("key") == "notify"), None)
+        if notify_entry:
+            role_name = notify_entry.get("role_name")
+        elif entries:
+            role_name = entries[0].get("role_name")
+
+    # 明示指定が無ければギルドごとの channel_id.json（プロビジョニング結果）から引く。
+    # tiers[*].channel_id はギルド共通の値で更新もされないので見ない
+    channel_id = config.get("notify_channel_id")
+    return (str(role_name) if role_name else None), _int_or_none(channel_id)
+
+
+def _compile_guild(
+    guild_id: int,
+    role_conf: Mapping[str, Any],
+    channel_conf: Mapping[str, Any],
+    config: Mapping[str, Any],
+    entries: list[dict[str, Any]],
+    notify_role_name: Optional[str],
+    notify_channel_id: Optional[int],
+) -> GuildRolePlan:
+    def rid(name: Optional[str]) -> Optional[int]:
+        return _int_or_none(role_conf.get(name)) if name else None
+
+    tier_role_names = {
+        e["key"]: e["role_name"] for e in entries if e["key"].lower().startswith("tier")
+    } or dict(FALLBACK_TIER_ROLE_NAMES)
+
+    tier_role_ids: Dict[str, int] = {}
+    for code, key in TIER_CODE_KEYS.items():
+        role_id = rid(tier_role_names.get(key) or FALLBACK_TIER_ROLE_NAMES[key])
+        if role_id is not None:
+            tier_role_ids[code] = role_id
+    all_tier = {r for name in tier_role_names.values() if (r := rid(name)) is not None}
+    all_tier.update(tier_role_ids.values())
+
+    linked_names = [str(config.get("linked_role_name") or ""), *FALLBACK_LINKED_ROLE_NAMES]
+    linked_role_id = next((r for name in linked_names if (r := rid(name)) is not None), None)
+    managed = set(all_tier)
+    if linked_role_id is not None:
+        managed.add(linked_role_id)
+
+    view_role_ids: Dict[str, frozenset[int]] = {}
+    for entry in entries:
+        allowed = {
+            guild_id if name in EVERYONE_ALIASES else rid(name)
+            for name in entry["view_role_names"]
+        }
+        allowed.discard(None)
+        view_role_ids[entry["key"]] = frozenset(allowed)
+
+    return GuildRolePlan(
+        guild_id=guild_id,
+        linked_role_id=linked_role_id,
+        tier_role_ids=tier_role_ids,
+        all_tier_role_ids=frozenset(all_tier),
+        managed_role_ids=frozenset(managed),
+        view_role_ids=view_role_ids,
+        notify_role_id=rid(notify_role_name),
+        notify_channel_id=notify_channel_id
+        or (_int_or_none(channel_conf.get(notify_role_name)) if notify_role_name else None),
+    )
+
+
+def compile_role_plan(
+    user_config: Mapping[str, Any],
+    role_ids: Mapping[str, Any],
+    channel_ids: Mapping[str, Any],
+) -> RolePlan:
+    config = normalize_subscription_config(user_config)
+    entries = compile_tier_entries(config["tiers"])
+    role_names: list[str] = []
+    for entry in entries:
+        if entry["role_name"] not in role_names:
+            role_names.append(entry["role_name"])
+    linked_role_name = config.get("linked_role_name") or "Twitch-linked"
+    notify_role_name, notify_channel_id = _notify_settings(config, entries)
+    for name in (linked_role_name, notify_role_name):
+        if name and name not in role_names:
+            role_names.append(name)
+
+    guilds: Dict[int, GuildRolePlan] = {}
+    for gid, role_conf in role_ids.items():
+        guild_id = _int_or_none(gid)
+        if guild_id is None or not isinstance(role_conf, Mapping):
+            continue
+        channel_conf = channel_ids.get(str(gid))
+        guilds[guild_id] = _compile_guild(
+            guild_id,
+            role_conf,
+            channel_conf if isinstance(channel_conf, Mapping) else {},
+            config,
+            entries,
+            notify_role_name,
+            notify_channel_id,
+        )
+    return RolePlan(config, entries, role_names, notify_role_name, guilds)
+
+
+def _file_signature(path: str) -> Optional[tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class RolePlanStore:
+    """組み立て済みのロールプランを持ち、元ファイルが変わったら作り直す。どのスレッドからでも可。"""
+
+    def __init__(self, check_interval: float = RELOAD_CHECK_INTERVAL_SEC) -> None:
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._plan: Optional[RolePlan] = None
+        self._signature: Optional[tuple] = None
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _signature_now() -> tuple:
+        return (_file_signature(ROLE_CONFIG_FILE), _file_signature(GUILD_STATE_FILE))
+
+    def current(self) -> RolePlan:
+        now = time.monotonic()
+        plan = self._plan
+        if plan is not None and now - self._checked_at < self.check_interval:
+            return plan
+        with self._lock:
+            signature = self._signature_now()
+            self._checked_at = time.monotonic()
+            if self._plan is not None and signature == self._signature:
+                return self._plan
+            started = time.perf_counter()
+            plan = compile_role_plan(
+                load_subscription_config(), load_role_ids(), load_channel_ids()
+            )
+            if self._plan is not None:
+                debug_print(
+                    f"[RolePlan] reloaded guilds={len(plan.guilds)} "
+                    f"{time.perf_counter() - started:.3f}s"
+                )
+            self._plan, self._signature = plan, signature
+            return plan
+
+    def invalidate(self) -> None:
+        """自分でファイルを書いた直後など、次の参照で必ず作り直させる。"""
+        with self._lock:
+            self._signature = None
+            self._checked_at = 0.0
+
+
+ROLE_PLANS = RolePlanStore()
@@ -0,0 +1,307 @@
+# bot/utils/role_reconciler.py
+"""
+連携ロールの一括リコンサイル
+- linked_users（連携状態・Tier・roles_revoked）とロールプラン（bot/utils/role_plan.py）から
+  「あるべきロール」を計算し、role.members から見た現状との差分だけを適用する
+- 付け外しは管理ロールだけを add_roles / remove_roles で行い、他のロールには触れない
+- 適用は AdaptiveLimiter で並列数を絞り、429 を観測したら自動で減速する
+- 全員・指定ユーザー（アウトボックス等）・mark_dirty されたユーザーの 3 通りで実行できる
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+import discord
+
+from bot.common import debug_print
+from bot.utils.dm_broadcast import AdaptiveLimiter
+from bot.utils.logs import get_logger
+from bot.utils.member_cache import MEMBER_CACHE
+from bot.utils.metrics import DISCORD_ROLE_CHANGES
+from bot.utils.role_plan import ROLE_PLANS, GuildRolePlan
+from bot.utils.save_and_load import linked_users_role_state
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+ROLE_SYNC_CONCURRENCY = _env_int("ROLE_SYNC_CONCURRENCY", 2)
+ROLE_SYNC_MAX_CONCURRENCY = _env_int("ROLE_SYNC_MAX_CONCURRENCY", 4)
+
+log = get_logger("rolesync")
+
+
+def _int_or_none(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RoleChange:
+    member_id: int
+    add: frozenset[int]
+    remove: frozenset[int]
+
+
+@dataclass
+class ReconcileSummary:
+    mode: str
+    members: int = 0
+    changed: int = 0
+    added: int = 0
+    removed: int = 0
+    failed: int = 0
+    skipped_removals: bool = False
+    failed_ids: set[int] = field(default_factory=set)
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: float | None = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return {
+            "mode": self.mode,
+            "members": self.members,
+            "changed": self.changed,
+            "added": self.added,
+            "removed": self.removed,
+            "failed": self.failed,
+            "skipped_removals": self.skipped_removals,
+            "elapsed_sec": round(end - self.started_at, 3),
+        }
+
+
+def plan_guild_changes(
+    guild: discord.Guild,
+    targets: GuildRolePlan,
+    states: Mapping[str, Mapping[str, Any]],
+    only_ids: Optional[set[int]] = None,
+    *,
+    allow_removals: bool = True,
+) -> list[RoleChange]:
+    """role.members と linked_users の差分を計算する（API は呼ばない）。"""
+    current: Dict[int, set[int]] = {}
+    for rid in targets.managed_role_ids:
+        role = guild.get_role(rid)
+        if role is None:
+            continue
+        for member in role.members:
+            if only_ids is None or member.id in only_ids:
+                current.setdefault(member.id, set()).add(rid)
+
+    candidates: set[int] = set(current)
+    for did in states:
+        mid = _int_or_none(did)
+        if mid is not None and (only_ids is None or mid in only_ids):
+            candidates.add(mid)
+    if only_ids is not None:
+        candidates.update(only_ids)
+
+    changes: list[RoleChange] = []
+    for mid in candidates:
+        have = current.get(mid, set())
+        want = targets.desired(states.get(str(mid)))
+        # ギルドに実在するロールだけを付与対象にする
+        add = frozenset(rid for rid in want - have if guild.get_role(rid) is not None)
+        remove = frozenset(have - want) if allow_removals else frozenset()
+        if not add and not remove:
+            continue
+        if add and guild.get_member(mid) is None:
+            # 未参加（またはキャッシュ外）のユーザーには付けられない
+            if not remove:
+                continue
+            add = frozenset()
+        changes.append(RoleChange(mid, add, remove))
+    return changes
+
+
+class RoleReconciler:
+    """Bot のイベントループ上で動かす。mark_dirty だけはどのスレッドからでも可。"""
+
+    def __init__(self, bot: discord.Client) -> None:
+        self.bot = bot
+        self._dirty: set[str] = set()
+        self._dirty_lock = threading.Lock()
+        self._run_lock = asyncio.Lock()
+        self.last_summary: Optional[ReconcileSummary] = None
+
+    def mark_dirty(self, discord_ids: Iterable[Any]) -> None:
+        with self._dirty_lock:
+            self._dirty.update(str(did) for did in discord_ids)
+
+    def _drain_dirty(self) -> set[str]:
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    async def reconcile_all(self) -> ReconcileSummary:
+        return await self._reconcile("full", None)
+
+    async def reconcile_members(self, discord_ids: Iterable[Any]) -> ReconcileSummary:
+        ids = {str(did) for did in discord_ids}
+        return await self._reconcile("members", ids)
+
+    async def reconcile_dirty(self) -> Optional[ReconcileSummary]:
+        """前回以降に mark_dirty されたユーザーだけを処理する。"""
+        dirty = self._drain_dirty()
+        if not dirty:
+            return None
+        try:
+            return await self._reconcile("incremental", dirty)
+        except Exception:
+            # 次回に持ち越す
+            self.mark_dirty(dirty)
+            raise
+
+    async def _reconcile(self, mode: str, ids: Optional[set[str]]) -> ReconcileSummary:
+        # 全件・差分の実行は直列に。指定ユーザー分（アウトボックス等）は待たせない
+        if mode == "members":
+            summary = await self._reconcile_unlocked(mode, ids)
+        else:
+            async with self._run_lock:
+                summary = await self._reconcile_unlocked(mode, ids)
+        self.last_summary = summary
+        debug_print(f"[RoleSync] {summary.as_dict()}")
+        return summary
+
+    async def _reconcile_unlocked(
+        self, mode: str, ids: Optional[set[str]]
+    ) -> ReconcileSummary:
+        summary = ReconcileSummary(mode=mode)
+        await self.bot.wait_until_ready()
+        role_plan, states = await asyncio.to_thread(self._load_inputs, ids)
+        only_ids = (
+            {mid for did in ids if (mid := _int_or_none(did)) is not None}
+            if ids is not None
+            else None
+        )
+        # 全件実行で連携レコードが 1 件も読めない場合は DB 障害を疑い、剥奪はしない
+        allow_removals = ids is not None or bool(states)
+        summary.skipped_removals = not allow_removals
+
+        plans: list[tuple[discord.Guild, RoleChange]] = []
+        for guild in self.bot.guilds:
+            targets = role_plan.guild(guild.id)
+            if targets is None or not targets.managed_role_ids:
+                continue
+            # キャッシュを絞っている場合、対象者と管理ロールの保持者を先にキャッシュへ入れる
+            if only_ids is not None:
+                await MEMBER_CACHE.ensure_cached(guild, only_ids)
+            else:
+                await MEMBER_CACHE.cache_matching(
+                    guild,
+                    {mid for did in states if (mid := _int_or_none(did)) is not None},
+                    targets.managed_role_ids,
+                )
+            for change in plan_guild_changes(
+                guild, targets, states, only_ids, allow_removals=allow_removals
+            ):
+                plans.append((guild, change))
+        summary.members = len(only_ids) if only_ids is not None else len(states)
+        await self._apply(plans, summary)
+        summary.finished_at = time.monotonic()
+        return summary
+
+    @staticmethod
+    def _load_inputs(ids: Optional[set[str]]):
+        return (
+            ROLE_PLANS.current(),
+            linked_users_role_state(sorted(ids) if ids is not None else None),
+        )
+
+    async def _apply(
+        self, plans: list[tuple[discord.Guild, RoleChange]], summary: ReconcileSummary
+    ) -> None:
+        if not plans:
+            return
+        limiter = AdaptiveLimiter(
+            ROLE_SYNC_CONCURRENCY, maximum=ROLE_SYNC_MAX_CONCURRENCY
+        ).attach()
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in plans:
+            queue.put_nowait(item)
+
+        async def _worker() -> None:
+            while True:
+                try:
+                    guild, change = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await limiter.acquire()
+                ok = False
+                try:
+                    ok = await self._apply_one(guild, change)
+                finally:
+                    await limiter.release(success=ok)
+                DISCORD_ROLE_CHANGES.inc("reconcile", "ok" if ok else "failed")
+                if ok:
+                    summary.changed += 1
+                    summary.added += len(change.add)
+                    summary.removed += len(change.remove)
+                else:
+                    summary.failed += 1
+                    summary.failed_ids.add(change.member_id)
+
+        workers = [
+            asyncio.create_task(_worker())
+            for _ in range(min(limiter.maximum, len(plans)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                if not w.done():
+                    w.cancel()
+            limiter.detach()
+
+    async def _apply_one(self, guild: discord.Guild, change: RoleChange) -> bool:
+        member = guild.get_member(change.member_id)
+        if member is None:
+            if change.add:
+                return False
+            try:
+                member = await guild.fetch_member(change.member_id)
+            except discord.NotFound:
+                # 退出済み: 外すべきロールも無い
+                return True
+            except discord.HTTPException as exc:
+                log.warning("fetch_member %s failed: %r", change.member_id, exc)
+                return False
+        # 計画後に変わっている可能性があるので、最新のロール一覧と突き合わせて
+        # 管理ロールだけを付け外しする（roles= で丸ごと上書きすると、古いキャッシュで他のロールを消しかねない）
+        current = {r.id for r in member.roles}
+        add = [
+            guild.get_role(rid) or discord.Object(id=rid)
+            for rid in change.add
+            if rid not in current
+        ]
+        remove = [
+            guild.get_role(rid) or discord.Object(id=rid)
+            for rid in change.remove
+            if rid in current
+        ]
+        if not add and not remove:
+            return True
+        reason = "Twitch link: role reconcile"
+        try:
+            if add:
+                await member.add_roles(*add, reason=reason)
+            if remove:
+                await member.remove_roles(*remove, reason=reason)
+            return True
+        except discord.HTTPException as exc:
+            log.warning(
+                "edit roles for %s in %s failed: %r", change.member_id, guild.id, exc
+            )
+            return False
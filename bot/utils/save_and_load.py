@@ -5,9 +5,22 @@ import json
 import datetime as dt
 import inspect as _inspect
 import sqlite3
+import sys
+import time
+
+from bot.utils.logs import current_correlation_id
+from bot.utils.metrics import SQLITE_OP_SECONDS
+from bot.utils.request_timing import (
+    SQL_TRACE,
+    format_plan,
+    is_explainable,
+    record_statement,
+    trace_sql,
+)
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
-DATA_DIR = os.path.join(PROJECT_ROOT, "venv")
+# 複数プロセス構成のローカル検証などで、設定と DB の場所を環境変数で差し替えられる
+DATA_DIR = os.getenv("NEIBOT_DATA_DIR") or os.path.join(PROJECT_ROOT, "venv")
 TOKEN_FILE = os.path.join(DATA_DIR, "token.json")
 ROLE_FILE = os.path.join(DATA_DIR, "role_id.json")
 CHANNEL_FILE = os.path.join(DATA_DIR, "channel_id.json")
@@ -19,17 +32,83 @@ LEGACY_GUILD_STATE_FILES = {
     "channels": CHANNEL_FILE,
     "categories": CATEGORY_FILE,
 }
-DB_PATH = os.path.join(PROJECT_ROOT, "db.sqlite3")
+DB_PATH = os.getenv("NEIBOT_DB_PATH") or os.path.join(PROJECT_ROOT, "db.sqlite3")
 JST = dt.timezone(dt.timedelta(hours=9))
 
 # ---- SQLite tables ----
 LINKED_USERS_TABLE = "linked_users"
 INBOX_TABLE = "webhook_events"
 CHEER_TABLE = "cheer_events"
+BROADCAST_JOBS_TABLE = "broadcast_jobs"
+BROADCAST_RECIPIENTS_TABLE = "broadcast_recipients"
+DM_SUPPRESSIONS_TABLE = "dm_suppressions"
+LINK_JOBS_TABLE = "link_jobs"
+OUTBOX_TABLE = "outbox"
+SCHEDULER_JOBS_TABLE = "scheduler_jobs"
+SCHEDULER_LEASES_TABLE = "scheduler_leases"
+SCHEDULER_RUNS_TABLE = "scheduler_runs"
+
+# 未連携ユーザーの判定式（インデックスと検索で同じ式を使うこと）
+_UNLINKED_WHERE = "json_extract(data, '$.twitch_user_id') IS NULL"
+_UNLINKED_RESOLVED_EXPR = "coalesce(json_extract(data, '$.resolved'), 0)"
+
+
+class _TimedConnection(sqlite3.Connection):
+    """
+    接続から close までの時間を、接続を開いた関数の名前で記録する。
+    文ごとの時間（最初の行が返るまで）はリクエストの DB 時間に足し、遅い文は実行計画を残す
+    """
+
+    op = "unknown"
+    started = 0.0
+
+    def _explain(self, sql: str, params: Any) -> list[str]:
+        if not is_explainable(sql):
+            return []
+        rows = super().execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        return format_plan(rows)
+
+    def execute(self, sql: str, params: Any = ()) -> sqlite3.Cursor:  # type: ignore[override]
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            record_statement(
+                time.perf_counter() - started,
+                sql,
+                f"sqlite:{self.op}",
+                lambda: self._explain(sql, params),
+            )
+
+    def executemany(self, sql: str, seq_of_params: Any) -> sqlite3.Cursor:  # type: ignore[override]
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            # ジェネレータは使い切っているので、計画は先頭の引数が残っているときだけ
+            first = seq_of_params[0] if isinstance(seq_of_params, (list, tuple)) and seq_of_params else None
+            record_statement(
+                time.perf_counter() - started,
+                sql,
+                f"sqlite:{self.op}",
+                (lambda: self._explain(sql, first)) if first is not None else None,
+            )
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            SQLITE_OP_SECONDS.observe(time.perf_counter() - self.started, self.op)
 
 
 def _db_connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    conn = sqlite3.connect(
+        DB_PATH, timeout=30, check_same_thread=False, factory=_TimedConnection
+    )
+    conn.started = time.perf_counter()
+    conn.op = sys._getframe(1).f_code.co_name
+    if SQL_TRACE:
+        conn.set_trace_callback(trace_sql)
     try:
         conn.execute("PRAGMA journal_mode=WAL;")
         conn.execute("PRAGMA foreign_keys=ON;")
@@ -49,6 +128,17 @@ def _db_init(conn: sqlite3.Connection) -> None:
         );
         """
     )
+    # 再リンク DM の対象選定用（未連携ユーザーだけの部分インデックス）
+    conn.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS idx_{LINKED_USERS_TABLE}_unlinked_notice
+        ON {LINKED_USERS_TABLE}(
+            {_UNLINKED_RESOLVED_EXPR},
+            json_extract(data, '$.last_notice_at')
+        )
+        WHERE {_UNLINKED_WHERE}
+        """
+    )
     conn.execute(
         f"""
         CREATE TABLE IF NOT EXISTS {INBOX_TABLE} (
@@ -67,6 +157,9 @@ def _db_init(conn: sqlite3.Connection) -> None:
         );
         """
     )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{INBOX_TABLE}_status ON {INBOX_TABLE}(status)"
+    )
     conn.execute(
         f"""
         CREATE TABLE IF NOT EXISTS {CHEER_TABLE} (
@@ -80,6 +173,141 @@ def _db_init(conn: sqlite3.Connection) -> None:
         );
         """
     )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {BROADCAST_JOBS_TABLE} (
+            id          TEXT PRIMARY KEY,
+            spec        TEXT NOT NULL,
+            status      TEXT NOT NULL DEFAULT 'pending',
+            total       INTEGER NOT NULL DEFAULT 0,
+            error       TEXT,
+            created_at  TEXT NOT NULL,
+            started_at  TEXT,
+            finished_at TEXT,
+            updated_at  TEXT NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {BROADCAST_RECIPIENTS_TABLE} (
+            job_id       TEXT NOT NULL,
+            discord_id   TEXT NOT NULL,
+            display_name TEXT,
+            status       TEXT NOT NULL DEFAULT 'pending',
+            reason       TEXT,
+            updated_at   TEXT,
+            PRIMARY KEY (job_id, discord_id),
+            FOREIGN KEY (job_id) REFERENCES {BROADCAST_JOBS_TABLE}(id) ON DELETE CASCADE
+        );
+        """
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{BROADCAST_RECIPIENTS_TABLE}_status ON {BROADCAST_RECIPIENTS_TABLE}(job_id, status)"
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {DM_SUPPRESSIONS_TABLE} (
+            discord_id       TEXT PRIMARY KEY,
+            reason           TEXT,
+            source           TEXT,
+            failure_count    INTEGER NOT NULL DEFAULT 1,
+            first_failed_at  TEXT NOT NULL,
+            last_failed_at   TEXT NOT NULL,
+            suppressed_until TEXT NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{DM_SUPPRESSIONS_TABLE}_until ON {DM_SUPPRESSIONS_TABLE}(suppressed_until)"
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {LINK_JOBS_TABLE} (
+            id           TEXT PRIMARY KEY,
+            discord_id   TEXT NOT NULL,
+            status       TEXT NOT NULL DEFAULT 'pending',
+            stage        TEXT,
+            access_token TEXT,
+            result       TEXT,
+            error        TEXT,
+            attempts     INTEGER NOT NULL DEFAULT 0,
+            created_at   TEXT NOT NULL,
+            updated_at   TEXT NOT NULL,
+            finished_at  TEXT
+        );
+        """
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{LINK_JOBS_TABLE}_status ON {LINK_JOBS_TABLE}(status)"
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {OUTBOX_TABLE} (
+            id              INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind            TEXT NOT NULL,
+            discord_id      TEXT,
+            payload         TEXT,
+            priority        INTEGER NOT NULL DEFAULT 100,
+            dedupe_key      TEXT,
+            status          TEXT NOT NULL DEFAULT 'pending',
+            attempts        INTEGER NOT NULL DEFAULT 0,
+            last_error      TEXT,
+            next_attempt_at TEXT NOT NULL,
+            created_at      TEXT NOT NULL,
+            updated_at      TEXT NOT NULL
+        );
+        """
+    )
+    # 未処理の同一アクションは 1 件にまとめる（再試行待ちなら前倒しして合流）
+    conn.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{OUTBOX_TABLE}_dedupe ON {OUTBOX_TABLE}(dedupe_key) WHERE status = 'pending'"
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{OUTBOX_TABLE}_due ON {OUTBOX_TABLE}(status, priority, next_attempt_at)"
+    )
+    # APScheduler のジョブ（next_run_time は UTC の UNIX 秒、job_state は pickle）
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEDULER_JOBS_TABLE} (
+            id            TEXT PRIMARY KEY,
+            next_run_time REAL,
+            job_state     BLOB NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{SCHEDULER_JOBS_TABLE}_next ON {SCHEDULER_JOBS_TABLE}(next_run_time)"
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEDULER_LEASES_TABLE} (
+            name        TEXT PRIMARY KEY,
+            owner       TEXT NOT NULL,
+            expires_at  REAL NOT NULL,
+            acquired_at TEXT NOT NULL,
+            renewed_at  TEXT NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {SCHEDULER_RUNS_TABLE} (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id       TEXT NOT NULL,
+            owner        TEXT,
+            status       TEXT NOT NULL DEFAULT 'running',
+            started_at   TEXT NOT NULL,
+            finished_at  TEXT,
+            duration_sec REAL,
+            metrics      TEXT,
+            error        TEXT
+        );
+        """
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{SCHEDULER_RUNS_TABLE}_job ON {SCHEDULER_RUNS_TABLE}(job_id, started_at)"
+    )
     conn.commit()
 
 
@@ -248,6 +476,14 @@ def _save_guild_state(guild_state: Dict[str, Any]) -> None:
     save_file(payload, GUILD_STATE_FILE)
 
 
+def save_guild_state_sections(**sections: Dict[str, Any]) -> None:
+    """複数セクション（roles / channels / categories）を 1 回の書き込みで保存する。"""
+    state = _load_guild_state()
+    for key, value in sections.items():
+        state[key] = _coerce_mapping(value)
+    _save_guild_state(state)
+
+
 def load_role_ids() -> Dict[str, Any]:
     state = _load_guild_state()
     roles = state.get("roles")
@@ -409,112 +645,128 @@ def save_linked_user(
     save_linked_users(data)
 
 
-def save_all_guild_members(bot):
-    data = load_users()
-    if not isinstance(data, dict):
-        data = {}
+def _merge_member_profile(existing: Dict[str, Any], profile: Mapping[str, Any]) -> bool:
+    """メンバー情報を既存レコードへ反映する。値が変わったときだけ True。"""
+    changed = False
+    for key, value in profile.items():
+        if key == "discord_profile" or value is None:
+            continue
+        if existing.get(key) != value:
+            existing[key] = value
+            changed = True
 
-    guild_id = get_guild_id()
+    profile_existing = existing.get("discord_profile")
+    if not isinstance(profile_existing, dict):
+        profile_existing = {}
+    profile_candidate = dict(profile_existing)
+    for key, value in (profile.get("discord_profile") or {}).items():
+        if value is not None:
+            profile_candidate[key] = value
+    if profile_candidate != profile_existing:
+        existing["discord_profile"] = profile_candidate
+        changed = True
+
+    # ギルドに居るので退出記録は消す
+    if existing.pop("discord_left_at", None) is not None:
+        changed = True
+
+    # 連携済みユーザーは resolved を自動的に維持
+    # （roles_revoked は購読イベントや再連携で解除する。ここで消すと次のリコンサイルでロールが戻ってしまう）
+    if existing.get("twitch_user_id") and not existing.get("resolved"):
+        existing["resolved"] = True
+        changed = True
+    return changed
+
+
+def apply_member_profiles(profiles_by_id: Mapping[str, Mapping[str, Any]]) -> int:
+    """メンバー情報をまとめて反映する（1 接続・1 トランザクション）。
+
+    profiles_by_id は discord_id → bot.utils.member_profiles.member_profile_fields の結果。
+    変更があった行だけを書き込み、その件数を返す。
+    """
+    items = [(str(did), profile) for did, profile in (profiles_by_id or {}).items()]
+    if not items:
+        return 0
+    conn = _db_connect()
     try:
-        guild_ref = int(guild_id)
-    except (TypeError, ValueError):
-        guild_ref = guild_id
-    guild = bot.get_guild(guild_ref)
-    if guild is None:
-        return
-
-    def _clean(value: Any) -> Optional[str]:
-        if value is None:
-            return None
-        text = str(value).strip()
-        return text or None
-
-    dirty = False
+        _db_init(conn)
+        now = _now_iso()
+        with conn:
+            current_by_id: Dict[str, Dict[str, Any]] = {}
+            ids = [did for did, _ in items]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start : start + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                cur = conn.execute(
+                    f"SELECT discord_id, data FROM {LINKED_USERS_TABLE} WHERE discord_id IN ({placeholders})",
+                    chunk,
+                )
+                for did, data_json in cur.fetchall():
+                    try:
+                        loaded = json.loads(data_json or "{}")
+                    except Exception:
+                        loaded = {}
+                    current_by_id[str(did)] = loaded if isinstance(loaded, dict) else {}
+            rows = []
+            for did, profile in items:
+                is_new_entry = did not in current_by_id
+                current = current_by_id.setdefault(did, {})
+                if not _merge_member_profile(current, profile) and not is_new_entry:
+                    continue
+                try:
+                    payload_json = json.dumps(current, ensure_ascii=False, default=str)
+                except Exception:
+                    payload_json = json.dumps(str(current), ensure_ascii=False)
+                rows.append((did, payload_json, now, now))
+            if rows:
+                conn.executemany(
+                    f"""
+                    INSERT INTO {LINKED_USERS_TABLE} (discord_id, data, created_at, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(discord_id) DO UPDATE SET
+                        data=excluded.data,
+                        updated_at=excluded.updated_at
+                    """,
+                    rows,
+                )
+        return len(rows)
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
 
-    for member in guild.members:
-        if getattr(member, "bot", False):
-            continue
 
-        discord_id = str(member.id)
-        existing = data.get(discord_id)
-        is_new_entry = not isinstance(existing, dict)
-        if is_new_entry:
-            existing = {}
-        data[discord_id] = existing
-
-        changed = is_new_entry
-
-        def _set_field(key: str, value: Optional[str]) -> None:
-            nonlocal changed
-            if value is None:
-                return
-            if existing.get(key) != value:
-                existing[key] = value
-                changed = True
-
-        username = _clean(getattr(member, "name", None))
-        global_name = _clean(getattr(member, "global_name", None))
-        nickname = _clean(getattr(member, "nick", None))
-        display_name = _clean(getattr(member, "display_name", None))
-        if not display_name:
-            display_name = nickname or global_name or username
-        discriminator = _clean(getattr(member, "discriminator", None))
-
-        _set_field("discord_display_name", display_name)
-        _set_field("discord_username", username)
-        _set_field("discord_global_name", global_name)
-        _set_field("discord_discriminator", discriminator)
-        _set_field("discord_nickname", nickname)
-
-        profile_existing = existing.get("discord_profile")
-        if not isinstance(profile_existing, dict):
-            profile_existing = {}
-        profile_candidate = dict(profile_existing)
-        profile_changed = False
-
-        def _set_profile(key: str, value: Optional[str]) -> None:
-            nonlocal profile_changed
-            if value is None:
-                return
-            if profile_candidate.get(key) != value:
-                profile_candidate[key] = value
-                profile_changed = True
-
-        _set_profile("id", discord_id)
-        _set_profile("username", username)
-        _set_profile("display_name", display_name)
-        _set_profile("global_name", global_name)
-        _set_profile("discriminator", discriminator)
-        _set_profile("nickname", nickname)
-
-        avatar_url = None
-        try:
-            avatar_url = getattr(getattr(member, "display_avatar", None), "url", None)
-        except Exception:
-            avatar_url = None
-        _set_profile("avatar_url", _clean(avatar_url))
-        _set_profile("mention", _clean(getattr(member, "mention", None)))
-
-        if profile_changed:
-            existing["discord_profile"] = profile_candidate
-            changed = True
+def mark_members_left(discord_ids: list[str]) -> int:
+    """ギルドから退出したメンバーに退出時刻を記録する（レコードは消さない）。"""
+    ids = [str(did) for did in discord_ids]
+    if not ids:
+        return 0
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        updated = 0
+        with conn:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start : start + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                cur = conn.execute(
+                    f"""
+                    UPDATE {LINKED_USERS_TABLE}
+                    SET data = json_set(data, '$.discord_left_at', ?), updated_at = ?
+                    WHERE discord_id IN ({placeholders})
+                    """,
+                    [now, now, *chunk],
+                )
+                updated += cur.rowcount or 0
+        return updated
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
 
-        # 連携済みユーザーは resolved を自動的に維持
-        if existing.get("twitch_user_id"):
-            if not existing.get("resolved"):
-                existing["resolved"] = True
-                changed = True
-            if existing.get("roles_revoked"):
-                existing["roles_revoked"] = False
-                existing["roles_revoked_at"] = None
-                changed = True
-
-        if changed:
-            dirty = True
-            try:
-                _db_upsert_user(discord_id, existing)
-            except Exception:
-                pass
 
 def get_taken_json():
     try:
@@ -567,47 +819,61 @@ def patch_linked_user(
     return current
 
 
-# ---- Inbox helpers ----
-def inbox_enqueue_event(
-    *,
-    source: str,
-    delivery_id: str,
-    event_type: str,
-    twitch_user_id: str | None,
-    payload: dict,
-    headers: dict | None,
-    status: str = "pending",
-) -> None:
+def patch_linked_users(
+    updates_by_id: Mapping[str, Dict[str, Any]], *, include_none: bool = False
+) -> int:
+    """patch_linked_user の一括版。1 接続・1 トランザクションでまとめて反映する。"""
+    items = [
+        (str(did), dict(updates or {}))
+        for did, updates in (updates_by_id or {}).items()
+    ]
+    if not items:
+        return 0
     conn = _db_connect()
     try:
         _db_init(conn)
         now = _now_iso()
-        p_json = json.dumps(payload, ensure_ascii=False, default=str)
-        h_json = json.dumps(headers or {}, ensure_ascii=False, default=str)
         with conn:
-            conn.execute(
+            current_by_id: Dict[str, Dict[str, Any]] = {}
+            ids = [did for did, _ in items]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start : start + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                cur = conn.execute(
+                    f"SELECT discord_id, data FROM {LINKED_USERS_TABLE} WHERE discord_id IN ({placeholders})",
+                    chunk,
+                )
+                for did, data_json in cur.fetchall():
+                    try:
+                        loaded = json.loads(data_json or "{}")
+                    except Exception:
+                        loaded = {}
+                    current_by_id[str(did)] = loaded if isinstance(loaded, dict) else {}
+            rows = []
+            for did, updates in items:
+                current = current_by_id.setdefault(did, {})
+                for k, v in updates.items():
+                    if v is None and not include_none:
+                        continue
+                    current[k] = v
+                try:
+                    payload_json = json.dumps(current, ensure_ascii=False, default=str)
+                except Exception:
+                    payload_json = json.dumps(str(current), ensure_ascii=False)
+                rows.append((did, payload_json, now, now))
+            conn.executemany(
                 f"""
-                INSERT INTO {INBOX_TABLE}
-                (source, delivery_id, event_type, twitch_user_id, payload, headers, status, received_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(source, delivery_id) DO UPDATE SET
-                    event_type=excluded.event_type,
-                    twitch_user_id=excluded.twitch_user_id,
-                    payload=excluded.payload,
-                    headers=excluded.headers,
-                    status=excluded.status
+                INSERT INTO {LINKED_USERS_TABLE} (discord_id, data, created_at, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(discord_id) DO UPDATE SET
+                    data=excluded.data,
+                    updated_at=excluded.updated_at
                 """,
-                (
-                    source,
-                    delivery_id,
-                    event_type,
-                    str(twitch_user_id) if twitch_user_id is not None else None,
-                    p_json,
-                    h_json,
-                    status,
-                    now,
-                ),
+                rows,
             )
+        return len(items)
+    except Exception:
+        return 0
     finally:
         try:
             conn.close()
@@ -615,25 +881,1195 @@ def inbox_enqueue_event(
             pass
 
 
-def inbox_mark_processed(
-    source: str, delivery_id: str, *, ok: bool, error: str | None = None
+def linked_users_role_state(
+    discord_ids: list[str] | None = None,
+) -> Dict[str, Dict[str, Any]]:
+    """ロール計算に必要な項目だけを返す（連携済みユーザーのみ、JSON 全体はデコードしない）。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        select = f"""
+            SELECT discord_id,
+                   json_extract(data, '$.twitch_user_id'),
+                   json_extract(data, '$.twitch_username'),
+                   json_extract(data, '$.is_subscriber'),
+                   json_extract(data, '$.tier'),
+                   json_extract(data, '$.roles_revoked')
+            FROM {LINKED_USERS_TABLE}
+            WHERE (json_extract(data, '$.twitch_user_id') IS NOT NULL
+                   OR json_extract(data, '$.twitch_username') IS NOT NULL)
+        """
+        rows: list[tuple] = []
+        if discord_ids is None:
+            rows = conn.execute(select).fetchall()
+        else:
+            ids = [str(did) for did in discord_ids]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start : start + 500]
+                rows.extend(
+                    conn.execute(
+                        f"{select} AND discord_id IN ({','.join('?' for _ in chunk)})",
+                        chunk,
+                    ).fetchall()
+                )
+        return {
+            str(did): {
+                "twitch_user_id": twitch_id,
+                "twitch_username": twitch_name,
+                "is_subscriber": bool(is_sub),
+                "tier": str(tier) if tier is not None else None,
+                "roles_revoked": bool(revoked),
+            }
+            for did, twitch_id, twitch_name, is_sub, tier, revoked in rows
+        }
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def unlinked_notice_targets(
+    *, include_resolved: bool = False, noticed_only: bool = False
+) -> list[Dict[str, Any]]:
+    """再リンク DM の対象（未連携ユーザー）を通知日時つきで返す。
+
+    include_resolved=False なら resolved 済みを除き、noticed_only=True なら
+    last_notice_at があるユーザーだけに絞る。JSON 全体はデコードしない。
+    """
+    where = [_UNLINKED_WHERE]
+    if not include_resolved:
+        where.append(f"{_UNLINKED_RESOLVED_EXPR} = 0")
+    if noticed_only:
+        where.append("json_extract(data, '$.last_notice_at') IS NOT NULL")
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        rows = conn.execute(
+            f"""
+            SELECT discord_id,
+                   json_extract(data, '$.first_notice_at'),
+                   json_extract(data, '$.last_notice_at')
+            FROM {LINKED_USERS_TABLE}
+            WHERE {" AND ".join(where)}
+            """
+        ).fetchall()
+        return [
+            {
+                "discord_id": str(did),
+                "first_notice_at": first_notice,
+                "last_notice_at": last_notice,
+            }
+            for did, first_notice, last_notice in rows
+        ]
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# ---- Outbox helpers ----
+def _outbox_insert(
+    conn: sqlite3.Connection, actions: list[Dict[str, Any]], now: str
 ) -> None:
+    rows = []
+    once_rows = []
+    # EventSub 等から積まれたアクションは、処理するときにも同じ相関 ID でログを出す
+    correlation_id = current_correlation_id()
+    for action in actions or []:
+        payload = action.get("payload")
+        if correlation_id and (payload is None or isinstance(payload, dict)):
+            payload = {**(payload or {}), "correlation_id": correlation_id}
+        row = (
+            str(action["kind"]),
+            str(action["discord_id"]) if action.get("discord_id") is not None else None,
+            json.dumps(payload, ensure_ascii=False, default=str) if payload is not None else None,
+            int(action.get("priority", 100)),
+            action.get("dedupe_key"),
+            now,
+            now,
+            now,
+        )
+        if action.get("once") and action.get("dedupe_key"):
+            once_rows.append(row + (action["dedupe_key"],))
+        else:
+            rows.append(row)
+    upsert = """
+            ON CONFLICT(dedupe_key) WHERE status = 'pending' DO UPDATE SET
+                next_attempt_at=MIN(next_attempt_at, excluded.next_attempt_at),
+                updated_at=excluded.updated_at
+    """
+    if rows:
+        conn.executemany(
+            f"""
+            INSERT INTO {OUTBOX_TABLE}
+                (kind, discord_id, payload, priority, dedupe_key, next_attempt_at, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            {upsert}
+            """,
+            rows,
+        )
+    if once_rows:
+        # 一度きりのアクション（節目 DM・配信開始通知）は、実行中・実行済みの行があれば積まない。
+        # pending の間だけの合流では、処理後に届いた再送で二重に送ってしまう
+        conn.executemany(
+            f"""
+            INSERT INTO {OUTBOX_TABLE}
+                (kind, discord_id, payload, priority, dedupe_key, next_attempt_at, created_at, updated_at)
+            SELECT ?, ?, ?, ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {OUTBOX_TABLE} WHERE dedupe_key = ? AND status IN ('running', 'done')
+            )
+            {upsert}
+            """,
+            once_rows,
+        )
+
+
+def patch_linked_user_with_outbox(
+    discord_id: str,
+    updates: Dict[str, Any],
+    actions: list[Dict[str, Any]],
+    *,
+    include_none: bool = False,
+) -> Dict[str, Any]:
+    """patch_linked_user とアウトボックスへの追加を 1 トランザクションで行う。"""
+    did = str(discord_id)
     conn = _db_connect()
     try:
         _db_init(conn)
         now = _now_iso()
         with conn:
+            row = conn.execute(
+                f"SELECT data FROM {LINKED_USERS_TABLE} WHERE discord_id = ?", (did,)
+            ).fetchone()
+            try:
+                current = json.loads(row[0] or "{}") if row else {}
+            except Exception:
+                current = {}
+            if not isinstance(current, dict):
+                current = {}
+            for k, v in (updates or {}).items():
+                if v is None and not include_none:
+                    continue
+                current[k] = v
             conn.execute(
-                f"UPDATE {INBOX_TABLE} SET status=?, processed_at=?, error=?, retries=(CASE WHEN ? THEN retries+1 ELSE retries END) WHERE source=? AND delivery_id=?",
-                (
-                    "done" if ok else "failed",
-                    now,
-                    None if ok else (error or "unknown error"),
-                    0 if ok else 1,
-                    source,
-                    delivery_id,
-                ),
+                f"""
+                INSERT INTO {LINKED_USERS_TABLE} (discord_id, data, created_at, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(discord_id) DO UPDATE SET
+                    data=excluded.data,
+                    updated_at=excluded.updated_at
+                """,
+                (did, json.dumps(current, ensure_ascii=False, default=str), now, now),
+            )
+            _outbox_insert(conn, actions, now)
+        return current
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def outbox_enqueue(actions: list[Dict[str, Any]]) -> None:
+    if not actions:
+        return
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        with conn:
+            _outbox_insert(conn, actions, _now_iso())
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def outbox_claim(limit: int = 50) -> list[Dict[str, Any]]:
+    """実行期限の来たアクションを優先度順に取り出し、running にする。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        with conn:
+            cur = conn.execute(
+                f"""
+                SELECT id, kind, discord_id, payload, priority, attempts, created_at
+                FROM {OUTBOX_TABLE}
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY priority, id
+                LIMIT ?
+                """,
+                (now, int(limit)),
             )
+            rows = cur.fetchall()
+            if rows:
+                conn.executemany(
+                    f"UPDATE {OUTBOX_TABLE} SET status='running', updated_at=? WHERE id=?",
+                    [(now, r[0]) for r in rows],
+                )
+        result = []
+        for oid, kind, did, payload, priority, attempts, created_at in rows:
+            try:
+                payload_obj = json.loads(payload) if payload else {}
+            except Exception:
+                payload_obj = {}
+            result.append(
+                {
+                    "id": int(oid),
+                    "kind": kind,
+                    "discord_id": did,
+                    "payload": payload_obj,
+                    "priority": int(priority),
+                    "attempts": int(attempts or 0),
+                    "created_at": created_at,
+                }
+            )
+        return result
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def outbox_complete(ids: list[int]) -> None:
+    if not ids:
+        return
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        with conn:
+            conn.executemany(
+                f"UPDATE {OUTBOX_TABLE} SET status='done', last_error=NULL, updated_at=? WHERE id=?",
+                [(now, int(i)) for i in ids],
+            )
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def outbox_retry(
+    failures: Mapping[int, str], *, base_delay_sec: float, max_attempts: int
+) -> None:
+    """失敗したアクションを指数バックオフで再投入する。上限に達したら failed。"""
+    if not failures:
+        return
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = dt.datetime.now(dt.timezone.utc)
+        with conn:
+            for oid, error in failures.items():
+                row = conn.execute(
+                    f"SELECT attempts FROM {OUTBOX_TABLE} WHERE id=?", (int(oid),)
+                ).fetchone()
+                attempts = int(row[0] or 0) + 1 if row else 1
+                status = "failed" if attempts >= max_attempts else "pending"
+                due = now + dt.timedelta(seconds=base_delay_sec * (2 ** (attempts - 1)))
+                # 同じ dedupe_key の pending が既にあれば、そちらに合流して自分は閉じる
+                try:
+                    conn.execute(
+                        f"UPDATE {OUTBOX_TABLE} SET status=?, attempts=?, last_error=?, next_attempt_at=?, updated_at=? WHERE id=?",
+                        (status, attempts, str(error), due.isoformat(), now.isoformat(), int(oid)),
+                    )
+                except sqlite3.IntegrityError:
+                    conn.execute(
+                        f"UPDATE {OUTBOX_TABLE} SET status='done', last_error=?, updated_at=? WHERE id=?",
+                        (f"coalesced: {error}", now.isoformat(), int(oid)),
+                    )
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def outbox_prune(keep_days: int = 7) -> int:
+    """完了済みの古い行を消す（failed は調査用に残す）。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        cutoff = (
+            dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=keep_days)
+        ).isoformat()
+        with conn:
+            cur = conn.execute(
+                f"DELETE FROM {OUTBOX_TABLE} WHERE status='done' AND updated_at < ?",
+                (cutoff,),
+            )
+        return int(cur.rowcount or 0)
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def outbox_requeue_running() -> int:
+    """前回プロセスが実行途中で落ちたアクションを pending に戻す。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        with conn:
+            # 同じ dedupe_key の pending がある行は合流済みとして閉じる
+            conn.execute(
+                f"""
+                UPDATE {OUTBOX_TABLE} SET status='done', last_error='coalesced', updated_at=?
+                WHERE status='running' AND dedupe_key IS NOT NULL AND dedupe_key IN (
+                    SELECT dedupe_key FROM {OUTBOX_TABLE} WHERE status='pending'
+                )
+                """,
+                (now,),
+            )
+            cur = conn.execute(
+                f"UPDATE {OUTBOX_TABLE} SET status='pending', updated_at=? WHERE status='running'",
+                (now,),
+            )
+        return int(cur.rowcount or 0)
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# ---- Inbox helpers ----
+def inbox_enqueue_event(
+    *,
+    source: str,
+    delivery_id: str,
+    event_type: str,
+    twitch_user_id: str | None,
+    payload: dict,
+    headers: dict | None,
+    status: str = "pending",
+) -> bool:
+    """受信を記録する。同じ delivery_id を処理済み（done）なら何もせず False を返す。
+
+    EventSub は少なくとも 1 回の配送なので、再送を二重に反映しないために使う。
+    """
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        p_json = json.dumps(payload, ensure_ascii=False, default=str)
+        h_json = json.dumps(headers or {}, ensure_ascii=False, default=str)
+        with conn:
+            row = conn.execute(
+                f"SELECT status FROM {INBOX_TABLE} WHERE source=? AND delivery_id=?",
+                (source, delivery_id),
+            ).fetchone()
+            if row is not None and row[0] == "done":
+                return False
+            conn.execute(
+                f"""
+                INSERT INTO {INBOX_TABLE}
+                (source, delivery_id, event_type, twitch_user_id, payload, headers, status, received_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source, delivery_id) DO UPDATE SET
+                    event_type=excluded.event_type,
+                    twitch_user_id=excluded.twitch_user_id,
+                    payload=excluded.payload,
+                    headers=excluded.headers,
+                    status=excluded.status
+                """,
+                (
+                    source,
+                    delivery_id,
+                    event_type,
+                    str(twitch_user_id) if twitch_user_id is not None else None,
+                    p_json,
+                    h_json,
+                    status,
+                    now,
+                ),
+            )
+        return True
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def inbox_mark_processed(
+    source: str, delivery_id: str, *, ok: bool, error: str | None = None
+) -> None:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        with conn:
+            conn.execute(
+                f"UPDATE {INBOX_TABLE} SET status=?, processed_at=?, error=?, retries=(CASE WHEN ? THEN retries+1 ELSE retries END) WHERE source=? AND delivery_id=?",
+                (
+                    "done" if ok else "failed",
+                    now,
+                    None if ok else (error or "unknown error"),
+                    0 if ok else 1,
+                    source,
+                    delivery_id,
+                ),
+            )
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def queue_status_counts() -> Dict[Tuple[str, str], int]:
+    """(キュー名, status) → 件数。inbox は処理済み（done）を数えない。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        counts: Dict[Tuple[str, str], int] = {}
+        for queue, table, where in (
+            ("inbox", INBOX_TABLE, "WHERE status != 'done'"),
+            ("outbox", OUTBOX_TABLE, ""),
+        ):
+            for status, count in conn.execute(
+                f"SELECT status, COUNT(1) FROM {table} {where} GROUP BY status"
+            ):
+                counts[(queue, str(status))] = int(count)
+        # 0 件でも系列が消えないようにする
+        for key in (("inbox", "pending"), ("inbox", "failed"), ("outbox", "pending")):
+            counts.setdefault(key, 0)
+        return counts
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# ---- Broadcast job helpers ----
+def _broadcast_job_row_to_dict(row: sqlite3.Row | tuple) -> Dict[str, Any]:
+    (job_id, spec_json, status, total, error, created_at, started_at, finished_at, updated_at) = row
+    try:
+        spec = json.loads(spec_json or "{}")
+    except Exception:
+        spec = {}
+    return {
+        "id": job_id,
+        "spec": spec if isinstance(spec, dict) else {},
+        "status": status,
+        "total": int(total or 0),
+        "error": error,
+        "created_at": created_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "updated_at": updated_at,
+    }
+
+
+def _broadcast_job_counts(conn: sqlite3.Connection, job_id: str) -> Dict[str, int]:
+    cur = conn.execute(
+        f"SELECT status, COUNT(1) FROM {BROADCAST_RECIPIENTS_TABLE} WHERE job_id = ? GROUP BY status",
+        (job_id,),
+    )
+    return {str(status): int(cnt or 0) for status, cnt in cur.fetchall()}
+
+
+def broadcast_job_create(
+    job_id: str, spec: Dict[str, Any], recipients: list[Dict[str, Any]]
+) -> None:
+    """ジョブ仕様と受信者スナップショットを 1 トランザクションで保存する。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        spec_json = json.dumps(spec or {}, ensure_ascii=False, default=str)
+        rows = []
+        seen: set[str] = set()
+        for item in recipients or []:
+            raw_id = item.get("id")
+            did = str(raw_id).strip() if raw_id is not None else ""
+            if not did or did in seen:
+                continue
+            seen.add(did)
+            rows.append((job_id, did, item.get("display_name"), now))
+        with conn:
+            conn.execute(
+                f"""
+                INSERT INTO {BROADCAST_JOBS_TABLE}
+                    (id, spec, status, total, created_at, updated_at)
+                VALUES (?, ?, 'pending', ?, ?, ?)
+                """,
+                (job_id, spec_json, len(rows), now, now),
+            )
+            conn.executemany(
+                f"""
+                INSERT INTO {BROADCAST_RECIPIENTS_TABLE}
+                    (job_id, discord_id, display_name, status, updated_at)
+                VALUES (?, ?, ?, 'pending', ?)
+                """,
+                rows,
+            )
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def broadcast_job_get(job_id: str) -> Optional[Dict[str, Any]]:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        cur = conn.execute(
+            f"SELECT id, spec, status, total, error, created_at, started_at, finished_at, updated_at FROM {BROADCAST_JOBS_TABLE} WHERE id = ?",
+            (str(job_id),),
+        )
+        row = cur.fetchone()
+        if not row:
+            return None
+        job = _broadcast_job_row_to_dict(row)
+        job["counts"] = _broadcast_job_counts(conn, job["id"])
+        return job
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def broadcast_job_list(
+    limit: int = 20, statuses: list[str] | None = None
+) -> list[Dict[str, Any]]:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        sql = f"SELECT id, spec, status, total, error, created_at, started_at, finished_at, updated_at FROM {BROADCAST_JOBS_TABLE}"
+        params: list[Any] = []
+        if statuses:
+            sql += f" WHERE status IN ({','.join('?' for _ in statuses)})"
+            params.extend(statuses)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(int(limit))
+        jobs = [_broadcast_job_row_to_dict(r) for r in conn.execute(sql, params)]
+        for job in jobs:
+            job["counts"] = _broadcast_job_counts(conn, job["id"])
+        return jobs
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def broadcast_job_set_status(
+    job_id: str,
+    status: str,
+    *,
+    error: str | None = None,
+    only_from: list[str] | None = None,
+) -> bool:
+    """ステータスを更新する。only_from 指定時はその状態からの遷移のみ許可。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        sql = f"""
+            UPDATE {BROADCAST_JOBS_TABLE} SET
+                status=?,
+                error=?,
+                updated_at=?,
+                started_at=(CASE WHEN ?='running' AND started_at IS NULL THEN ? ELSE started_at END),
+                finished_at=(CASE WHEN ? IN ('done', 'cancelled', 'failed') THEN ? ELSE NULL END)
+            WHERE id=?
+        """
+        params: list[Any] = [status, error, now, status, now, status, now, str(job_id)]
+        if only_from:
+            sql += f" AND status IN ({','.join('?' for _ in only_from)})"
+            params.extend(only_from)
+        with conn:
+            cur = conn.execute(sql, params)
+        return cur.rowcount > 0
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def broadcast_job_pending_recipients(job_id: str) -> list[Dict[str, Any]]:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        cur = conn.execute(
+            f"SELECT discord_id, display_name FROM {BROADCAST_RECIPIENTS_TABLE} WHERE job_id = ? AND status = 'pending' ORDER BY rowid",
+            (str(job_id),),
+        )
+        return [{"id": did, "display_name": name} for did, name in cur.fetchall()]
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def broadcast_recipients_record(
+    job_id: str, outcomes: Mapping[str, Tuple[str, Optional[str]]]
+) -> None:
+    """受信者ごとの結果 (status, reason) をまとめて保存する。"""
+    if not outcomes:
+        return
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        with conn:
+            conn.executemany(
+                f"UPDATE {BROADCAST_RECIPIENTS_TABLE} SET status=?, reason=?, updated_at=? WHERE job_id=? AND discord_id=?",
+                [
+                    (status, reason, now, str(job_id), str(did))
+                    for did, (status, reason) in outcomes.items()
+                ],
+            )
+            conn.execute(
+                f"UPDATE {BROADCAST_JOBS_TABLE} SET updated_at=? WHERE id=?",
+                (now, str(job_id)),
+            )
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def broadcast_jobs_unfinished() -> list[str]:
+    """再起動時に再開すべきジョブ（pending / running）の ID を古い順に返す。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        cur = conn.execute(
+            f"SELECT id FROM {BROADCAST_JOBS_TABLE} WHERE status IN ('pending', 'running') ORDER BY created_at"
+        )
+        return [str(r[0]) for r in cur.fetchall()]
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# ---- Link job helpers ----
+def link_job_create(job_id: str, discord_id: str, access_token: str) -> None:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        with conn:
+            conn.execute(
+                f"""
+                INSERT INTO {LINK_JOBS_TABLE}
+                    (id, discord_id, status, stage, access_token, created_at, updated_at)
+                VALUES (?, ?, 'pending', 'queued', ?, ?, ?)
+                """,
+                (str(job_id), str(discord_id), access_token, now, now),
+            )
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def link_job_get(job_id: str) -> Optional[Dict[str, Any]]:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        cur = conn.execute(
+            f"SELECT id, discord_id, status, stage, access_token, result, error, attempts, created_at, updated_at, finished_at FROM {LINK_JOBS_TABLE} WHERE id = ?",
+            (str(job_id),),
+        )
+        row = cur.fetchone()
+        if not row:
+            return None
+        (
+            jid,
+            did,
+            status,
+            stage,
+            token,
+            result,
+            error,
+            attempts,
+            created_at,
+            updated_at,
+            finished_at,
+        ) = row
+        try:
+            result_obj = json.loads(result) if result else None
+        except Exception:
+            result_obj = None
+        return {
+            "id": jid,
+            "discord_id": did,
+            "status": status,
+            "stage": stage,
+            "access_token": token,
+            "result": result_obj,
+            "error": error,
+            "attempts": int(attempts or 0),
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "finished_at": finished_at,
+        }
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def link_job_update(
+    job_id: str,
+    *,
+    status: str | None = None,
+    stage: str | None = None,
+    result: Dict[str, Any] | None = None,
+    error: str | None = None,
+    attempt: bool = False,
+) -> None:
+    """リンクジョブの進捗を更新する。done / failed ではアクセストークンを消す。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = _now_iso()
+        sets = ["updated_at=?"]
+        params: list[Any] = [now]
+        if status is not None:
+            sets.append("status=?")
+            params.append(status)
+            if status in ("done", "failed"):
+                sets.extend(["finished_at=?", "access_token=NULL"])
+                params.append(now)
+        if stage is not None:
+            sets.append("stage=?")
+            params.append(stage)
+        if result is not None:
+            sets.append("result=?")
+            params.append(json.dumps(result, ensure_ascii=False, default=str))
+        if error is not None:
+            sets.append("error=?")
+            params.append(error)
+        if attempt:
+            sets.append("attempts=attempts+1")
+        params.append(str(job_id))
+        with conn:
+            conn.execute(
+                f"UPDATE {LINK_JOBS_TABLE} SET {', '.join(sets)} WHERE id=?", params
+            )
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def link_jobs_unfinished() -> list[str]:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        cur = conn.execute(
+            f"SELECT id FROM {LINK_JOBS_TABLE} WHERE status IN ('pending', 'running') ORDER BY created_at"
+        )
+        return [str(r[0]) for r in cur.fetchall()]
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# ---- Scheduler helpers ----
+def scheduler_job_get(job_id: str) -> Optional[bytes]:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        row = conn.execute(
+            f"SELECT job_state FROM {SCHEDULER_JOBS_TABLE} WHERE id = ?", (job_id,)
+        ).fetchone()
+        return bytes(row[0]) if row else None
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def scheduler_jobs_list(due_before: Optional[float] = None) -> list[Tuple[str, bytes]]:
+    """(id, job_state) を next_run_time 順に返す（一時停止中のジョブは最後）。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        if due_before is None:
+            rows = conn.execute(
+                f"""
+                SELECT id, job_state FROM {SCHEDULER_JOBS_TABLE}
+                ORDER BY next_run_time IS NULL, next_run_time
+                """
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f"""
+                SELECT id, job_state FROM {SCHEDULER_JOBS_TABLE}
+                WHERE next_run_time <= ?
+                ORDER BY next_run_time
+                """,
+                (due_before,),
+            ).fetchall()
+        return [(str(job_id), bytes(state)) for job_id, state in rows]
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def scheduler_next_run_time() -> Optional[float]:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        (value,) = conn.execute(
+            f"SELECT MIN(next_run_time) FROM {SCHEDULER_JOBS_TABLE}"
+        ).fetchone()
+        return float(value) if value is not None else None
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def scheduler_job_save(
+    job_id: str, next_run_time: Optional[float], job_state: bytes, *, insert: bool
+) -> bool:
+    """insert=True なら新規追加（既存なら False）、False なら更新（無ければ False）。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        with conn:
+            if insert:
+                try:
+                    conn.execute(
+                        f"INSERT INTO {SCHEDULER_JOBS_TABLE} (id, next_run_time, job_state) VALUES (?, ?, ?)",
+                        (job_id, next_run_time, sqlite3.Binary(job_state)),
+                    )
+                except sqlite3.IntegrityError:
+                    return False
+                return True
+            cur = conn.execute(
+                f"UPDATE {SCHEDULER_JOBS_TABLE} SET next_run_time = ?, job_state = ? WHERE id = ?",
+                (next_run_time, sqlite3.Binary(job_state), job_id),
+            )
+            return bool(cur.rowcount)
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def scheduler_jobs_delete(job_ids: Optional[list[str]] = None) -> int:
+    """指定 ID（None なら全件）のジョブを消す。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        with conn:
+            if job_ids is None:
+                cur = conn.execute(f"DELETE FROM {SCHEDULER_JOBS_TABLE}")
+            else:
+                cur = conn.executemany(
+                    f"DELETE FROM {SCHEDULER_JOBS_TABLE} WHERE id = ?",
+                    [(job_id,) for job_id in job_ids],
+                )
+        return int(cur.rowcount or 0)
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def scheduler_lease_acquire(name: str, owner: str, ttl_sec: float) -> bool:
+    """リースを取得・更新する。他プロセスが有効期限内で保持していれば False。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now_ts = dt.datetime.now(dt.timezone.utc).timestamp()
+        now = _now_iso()
+        with conn:
+            conn.execute(
+                f"""
+                INSERT INTO {SCHEDULER_LEASES_TABLE} (name, owner, expires_at, acquired_at, renewed_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    acquired_at = CASE WHEN owner = excluded.owner
+                                       THEN acquired_at ELSE excluded.acquired_at END,
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at,
+                    renewed_at = excluded.renewed_at
+                WHERE owner = excluded.owner OR expires_at < ?
+                """,
+                (name, owner, now_ts + ttl_sec, now, now, now_ts),
+            )
+            row = conn.execute(
+                f"SELECT owner FROM {SCHEDULER_LEASES_TABLE} WHERE name = ?", (name,)
+            ).fetchone()
+        return bool(row) and row[0] == owner
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def scheduler_lease_release(name: str, owner: str) -> None:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        with conn:
+            conn.execute(
+                f"DELETE FROM {SCHEDULER_LEASES_TABLE} WHERE name = ? AND owner = ?",
+                (name, owner),
+            )
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def scheduler_run_start(job_id: str, owner: str) -> int:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        with conn:
+            cur = conn.execute(
+                f"INSERT INTO {SCHEDULER_RUNS_TABLE} (job_id, owner, status, started_at) VALUES (?, ?, 'running', ?)",
+                (job_id, owner, _now_iso()),
+            )
+        return int(cur.lastrowid)
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def scheduler_run_finish(
+    run_id: int,
+    *,
+    status: str,
+    duration_sec: float,
+    metrics: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+) -> None:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        with conn:
+            conn.execute(
+                f"""
+                UPDATE {SCHEDULER_RUNS_TABLE}
+                SET status = ?, finished_at = ?, duration_sec = ?, metrics = ?, error = ?
+                WHERE id = ?
+                """,
+                (
+                    status,
+                    _now_iso(),
+                    round(float(duration_sec), 3),
+                    json.dumps(metrics, ensure_ascii=False, default=str)
+                    if metrics is not None
+                    else None,
+                    error,
+                    run_id,
+                ),
+            )
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def scheduler_runs_recent(
+    limit: int = 50, job_id: Optional[str] = None
+) -> list[Dict[str, Any]]:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        sql = f"""
+            SELECT id, job_id, owner, status, started_at, finished_at, duration_sec, metrics, error
+            FROM {SCHEDULER_RUNS_TABLE}
+        """
+        params: list[Any] = []
+        if job_id:
+            sql += " WHERE job_id = ?"
+            params.append(job_id)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(int(limit))
+        result = []
+        for row in conn.execute(sql, params).fetchall():
+            try:
+                metrics = json.loads(row[7]) if row[7] else None
+            except Exception:
+                metrics = None
+            result.append(
+                {
+                    "id": row[0],
+                    "job_id": row[1],
+                    "owner": row[2],
+                    "status": row[3],
+                    "started_at": row[4],
+                    "finished_at": row[5],
+                    "duration_sec": row[6],
+                    "metrics": metrics,
+                    "error": row[8],
+                }
+            )
+        return result
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def scheduler_runs_prune(keep_days: int = 90) -> int:
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        cutoff = (
+            dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=keep_days)
+        ).isoformat()
+        with conn:
+            cur = conn.execute(
+                f"DELETE FROM {SCHEDULER_RUNS_TABLE} WHERE started_at < ? AND status != 'running'",
+                (cutoff,),
+            )
+        return int(cur.rowcount or 0)
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# ---- DM suppression helpers ----
+def dm_suppressions_record(
+    failures: Mapping[str, Optional[str]],
+    *,
+    source: str | None = None,
+    base_days: float = 7.0,
+    max_days: float = 90.0,
+) -> None:
+    """DM 拒否を記録する。停止期間は失敗回数ごとに倍（base_days × 2^(n-1), 上限 max_days）。"""
+    if not failures:
+        return
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now = dt.datetime.now(dt.timezone.utc)
+        now_iso = now.isoformat()
+        ids = [str(did) for did in failures]
+        counts: Dict[str, int] = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            cur = conn.execute(
+                f"SELECT discord_id, failure_count FROM {DM_SUPPRESSIONS_TABLE} WHERE discord_id IN ({','.join('?' for _ in chunk)})",
+                chunk,
+            )
+            counts.update({did: int(cnt or 0) for did, cnt in cur.fetchall()})
+        rows = []
+        for did in ids:
+            failure_count = counts.get(did, 0) + 1
+            days = min(float(max_days), float(base_days) * (2 ** (failure_count - 1)))
+            until = (now + dt.timedelta(days=days)).isoformat()
+            rows.append((did, failures[did], source, failure_count, now_iso, now_iso, until))
+        with conn:
+            conn.executemany(
+                f"""
+                INSERT INTO {DM_SUPPRESSIONS_TABLE}
+                    (discord_id, reason, source, failure_count, first_failed_at, last_failed_at, suppressed_until)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(discord_id) DO UPDATE SET
+                    reason=excluded.reason,
+                    source=excluded.source,
+                    failure_count=excluded.failure_count,
+                    last_failed_at=excluded.last_failed_at,
+                    suppressed_until=excluded.suppressed_until
+                """,
+                rows,
+            )
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def dm_suppressions_clear(discord_ids: list[str]) -> int:
+    """DM が届いたユーザーを抑止リストから外す。"""
+    if not discord_ids:
+        return 0
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        with conn:
+            cur = conn.executemany(
+                f"DELETE FROM {DM_SUPPRESSIONS_TABLE} WHERE discord_id = ?",
+                [(str(did),) for did in discord_ids],
+            )
+        return int(cur.rowcount or 0)
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def dm_suppressions_active(
+    discord_ids: list[str] | None = None,
+) -> Dict[str, Dict[str, Any]]:
+    """停止期間中のユーザーを返す（期限切れの行は再送で再判定するため含めない）。"""
+    conn = _db_connect()
+    try:
+        _db_init(conn)
+        now_iso = dt.datetime.now(dt.timezone.utc).isoformat()
+        select = f"SELECT discord_id, reason, failure_count, suppressed_until FROM {DM_SUPPRESSIONS_TABLE} WHERE suppressed_until > ?"
+        rows: list[tuple] = []
+        if discord_ids is None:
+            rows = conn.execute(select, (now_iso,)).fetchall()
+        else:
+            ids = [str(did) for did in discord_ids]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start : start + 500]
+                rows.extend(
+                    conn.execute(
+                        f"{select} AND discord_id IN ({','.join('?' for _ in chunk)})",
+                        [now_iso, *chunk],
+                    ).fetchall()
+                )
+        return {
+            str(did): {
+                "reason": reason,
+                "failure_count": int(cnt or 0),
+                "suppressed_until": until,
+            }
+            for did, reason, cnt, until in rows
+        }
     finally:
         try:
             conn.close()
@@ -0,0 +1,261 @@
+# bot/utils/scheduling.py
+"""
+永続スケジューラ（APScheduler + db.sqlite3）
+- ジョブは scheduler_jobs に保存され、再起動しても次回実行時刻が残る。停止中に
+  過ぎた実行は misfire 猶予内なら起動後に 1 回だけ追いかけて実行する
+- scheduler_leases のリースを持つプロセス（リーダー）だけがジョブを実行する。
+  リーダーが落ちてリースが切れると、残りのプロセスが引き継ぐ
+- 実行ごとに scheduler_runs へ状態・所要時間・ジョブが返したメトリクスを残す
+- ジョブ本体は register() でプロセス内に登録し、保存されるのは ID だけ
+  （run_job への文字列参照）なので Cog のインスタンスを pickle しない
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import pickle
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+from bot.common import debug_print
+from bot.utils.logs import get_logger
+from bot.utils.metrics import SCHEDULER_JOB_SECONDS
+from bot.utils.save_and_load import (
+    scheduler_job_get,
+    scheduler_job_save,
+    scheduler_jobs_delete,
+    scheduler_jobs_list,
+    scheduler_lease_acquire,
+    scheduler_lease_release,
+    scheduler_next_run_time,
+    scheduler_run_finish,
+    scheduler_run_start,
+    scheduler_runs_prune,
+)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+# 停止中に過ぎた実行を起動後に追いかける猶予（0 なら追いかけない）
+MISFIRE_GRACE_SEC = _env_float("SCHEDULER_MISFIRE_GRACE_SEC", 12 * 3600)
+LEASE_TTL_SEC = max(5.0, _env_float("SCHEDULER_LEASE_TTL_SEC", 60))
+RUN_HISTORY_DAYS = 90
+
+log = get_logger("scheduler")
+
+JobTarget = Callable[..., Awaitable[Optional[Dict[str, Any]]]]
+
+
+class SQLiteJobStore(BaseJobStore):
+    """scheduler_jobs テーブルに保存するジョブストア（SQLAlchemy 不要版）。"""
+
+    def __init__(self, pickle_protocol: int = pickle.HIGHEST_PROTOCOL) -> None:
+        super().__init__()
+        self.pickle_protocol = pickle_protocol
+
+    def _restore(self, job_state: bytes) -> Job:
+        state = pickle.loads(job_state)
+        state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _restore_all(self, rows: list[tuple[str, bytes]]) -> list[Job]:
+        jobs: list[Job] = []
+        broken: list[str] = []
+        for job_id, job_state in rows:
+            try:
+                jobs.append(self._restore(job_state))
+            except Exception as e:
+                log.warning("unable to restore job %s: %r; removing", job_id, e)
+                broken.append(job_id)
+        if broken:
+            scheduler_jobs_delete(broken)
+        return jobs
+
+    def _dump(self, job: Job) -> tuple[Optional[float], bytes]:
+        return (
+            datetime_to_utc_timestamp(job.next_run_time),
+            pickle.dumps(job.__getstate__(), self.pickle_protocol),
+        )
+
+    def lookup_job(self, job_id):
+        job_state = scheduler_job_get(job_id)
+        return self._restore(job_state) if job_state is not None else None
+
+    def get_due_jobs(self, now):
+        return self._restore_all(scheduler_jobs_list(datetime_to_utc_timestamp(now)))
+
+    def get_next_run_time(self):
+        return utc_timestamp_to_datetime(scheduler_next_run_time())
+
+    def get_all_jobs(self):
+        return self._restore_all(scheduler_jobs_list())
+
+    def add_job(self, job):
+        next_run_time, job_state = self._dump(job)
+        if not scheduler_job_save(job.id, next_run_time, job_state, insert=True):
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        next_run_time, job_state = self._dump(job)
+        if not scheduler_job_save(job.id, next_run_time, job_state, insert=False):
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        if not scheduler_jobs_delete([job_id]):
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        scheduler_jobs_delete(None)
+
+
+class PersistentScheduler:
+    """プロセスに 1 つだけ作る（同じテーブルを読むスケジューラが 2 つあると二重実行になる）。"""
+
+    LEASE_NAME = "scheduler"
+
+    def __init__(self) -> None:
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.misfire_grace_time = int(MISFIRE_GRACE_SEC) or 1
+        self.scheduler = AsyncIOScheduler(
+            jobstores={"default": SQLiteJobStore()},
+            job_defaults={"coalesce": True, "max_instances": 1},
+            timezone="Asia/Tokyo",
+        )
+        self.targets: Dict[str, JobTarget] = {}
+        self.is_leader = False
+        self._lease_task: Optional[asyncio.Task] = None
+
+    def register(self, job_id: str, target: JobTarget) -> None:
+        """ジョブ本体を登録する。Cog の __init__ など、start より前に呼ぶこと。"""
+        self.targets[job_id] = target
+
+    def start(self) -> None:
+        """一時停止状態で起動し、リースを取れたら実行を再開する。"""
+        if self.scheduler.running:
+            return
+        self.scheduler.start(paused=True)
+        self._lease_task = asyncio.create_task(self._hold_lease(), name="scheduler-lease")
+        try:
+            scheduler_runs_prune(RUN_HISTORY_DAYS)
+        except Exception as e:
+            log.warning("prune failed: %r", e)
+        debug_print(f"[Scheduler] started as {self.owner}")
+
+    def ensure_job(
+        self, job_id: str, trigger: BaseTrigger, kwargs: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """定義が同じジョブは保存済みのまま残す（次回実行時刻＝取りこぼしを保つため）。"""
+        if job_id not in self.targets:
+            raise KeyError(f"job target not registered: {job_id}")
+        kwargs = dict(kwargs or {})
+        existing = self.scheduler.get_job(job_id)
+        if (
+            existing is not None
+            and str(existing.trigger) == str(trigger)
+            and dict(existing.kwargs) == kwargs
+            and existing.misfire_grace_time == self.misfire_grace_time
+        ):
+            return
+        self.scheduler.add_job(
+            f"{__name__}:run_job",
+            trigger,
+            args=[job_id],
+            kwargs=kwargs,
+            id=job_id,
+            name=job_id,
+            misfire_grace_time=self.misfire_grace_time,
+            replace_existing=True,
+        )
+        debug_print(f"[Scheduler] job {job_id} scheduled: {trigger}")
+
+    async def _hold_lease(self) -> None:
+        while True:
+            try:
+                held = await asyncio.to_thread(
+                    scheduler_lease_acquire, self.LEASE_NAME, self.owner, LEASE_TTL_SEC
+                )
+            except Exception as e:
+                log.warning("lease check failed: %r", e)
+                held = False
+            if held and not self.is_leader:
+                self.is_leader = True
+                self.scheduler.resume()
+                log.info("acquired leadership; jobs resumed")
+            elif not held and self.is_leader:
+                self.is_leader = False
+                self.scheduler.pause()
+                log.warning("lost leadership; jobs paused")
+            await asyncio.sleep(LEASE_TTL_SEC / 3)
+
+    def shutdown(self) -> None:
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+            self._lease_task = None
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        if self.is_leader:
+            self.is_leader = False
+            try:
+                scheduler_lease_release(self.LEASE_NAME, self.owner)
+            except Exception:
+                pass
+
+    async def run(self, job_id: str, **kwargs: Any) -> None:
+        target = self.targets.get(job_id)
+        if target is None:
+            log.warning("no target registered for %s; skipped", job_id)
+            return
+        if not self.is_leader:
+            # pause が間に合わずに発火した場合の保険
+            debug_print(f"[Scheduler] not leader; {job_id} skipped")
+            return
+        run_id = await asyncio.to_thread(scheduler_run_start, job_id, self.owner)
+        started = time.monotonic()
+        status, metrics, error = "ok", None, None
+        try:
+            metrics = await target(**kwargs)
+        except asyncio.CancelledError:
+            # シャットダウン等で中断された。履歴だけは閉じておく
+            elapsed = time.monotonic() - started
+            SCHEDULER_JOB_SECONDS.observe(elapsed, job_id, "cancelled")
+            scheduler_run_finish(run_id, status="cancelled", duration_sec=elapsed)
+            raise
+        except Exception as e:
+            status, error = "error", repr(e)
+            log.exception("job %s failed: %r", job_id, e)
+        elapsed = time.monotonic() - started
+        SCHEDULER_JOB_SECONDS.observe(elapsed, job_id, status)
+        await asyncio.to_thread(
+            scheduler_run_finish,
+            run_id,
+            status=status,
+            duration_sec=elapsed,
+            metrics=metrics,
+            error=error,
+        )
+
+
+SCHEDULER = PersistentScheduler()
+
+
+async def run_job(job_id: str, **kwargs: Any) -> None:
+    """保存されたジョブから呼ばれるエントリポイント。"""
+    await SCHEDULER.run(job_id, **kwargs)
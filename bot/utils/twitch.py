@@ -1,5 +1,9 @@
+import hashlib
+import hmac
 import json
+import logging
 import os
+import time
 import urllib.parse
 import httpx
 from typing import Any, Dict, Optional, Tuple
@@ -9,7 +13,10 @@ from bot.utils.save_and_load import (
     get_broadcaster_oauth,
     get_eventsub_config,
 )
-from bot.common import debug_print
+from bot.utils.logs import get_logger, lazy
+from bot.utils.metrics import HELIX_REQUEST_SECONDS, HELIX_REQUESTS, InstrumentedTransport
+
+log = get_logger("twitch")
 
 # ==================== パス設定（絶対パス） ====================
 
@@ -18,6 +25,9 @@ TOKEN_PATH = os.path.join(PROJECT_ROOT, "venv", "token.json")
 
 API_BASE = "https://api.twitch.tv/helix"
 
+# OAuth state の有効期限（秒）。/link の URL はこの時間だけ使える
+LINK_STATE_MAX_AGE = int(os.getenv("LINK_STATE_MAX_AGE", str(30 * 60)))
+
 # Bits取得の一時無効化フラグ（401/403検出後は以後スキップ）
 _BITS_DISABLED = False
 
@@ -28,16 +38,16 @@ BACKOFF_BASE = 0.5  # 秒（指数バックオフの初期値）
 
 
 async def _print_json_response(resp: httpx.Response, label: str = ""):
-    """テスト用: HTTPレスポンスのJSONを整形して表示"""
+    """テスト用: HTTPレスポンスのJSONを整形してデバッグログへ（無効なら解析も整形もしない）"""
+    if not log.isEnabledFor(logging.DEBUG):
+        return
     try:
         data = resp.json()
     except Exception as e:
-        debug_print(f"[{label}] JSON decode error: {e!r}")
-        debug_print(resp.text)
+        log.debug("%s JSON decode error: %r body=%s", label, e, lazy(getattr, resp, "text"))
         return
-    debug_print(f"===== {label} JSON =====")
-    debug_print(json.dumps(data, indent=4, ensure_ascii=False))
-    debug_print("=" * 40)
+    # 整形はログを書き出すスレッドで行う
+    log.debug("%s JSON\n%s", label, lazy(json.dumps, data, indent=4, ensure_ascii=False))
 
 
 # ==================== OAuth URL生成 ====================
@@ -49,11 +59,67 @@ def get_auth_url(discord_user_id: str) -> str:
         "redirect_uri": redirect_uri,
         "response_type": "code",
         "scope": "user:read:subscriptions",  # 視聴者が自分のサブ情報を配信者に対して開示
-        "state": discord_user_id,
+        "state": sign_link_state(discord_user_id),
     }
     return f"{base}?{urllib.parse.urlencode(params)}"
 
 
+def _link_state_signature(payload: str) -> str:
+    _, client_secret, _ = get_twitch_keys()
+    mac = hmac.new(client_secret.encode("utf-8"), payload.encode("utf-8"), hashlib.sha256)
+    return mac.hexdigest()[:32]
+
+
+def sign_link_state(discord_user_id: str, *, now: float | None = None) -> str:
+    """OAuth の state を "<discord_id>.<発行時刻>.<署名>" 形式で作る。"""
+    issued = int(now if now is not None else time.time())
+    payload = f"{discord_user_id}.{issued}"
+    return f"{payload}.{_link_state_signature(payload)}"
+
+
+def verify_link_state(
+    state: str, *, max_age: int = LINK_STATE_MAX_AGE, now: float | None = None
+) -> Optional[str]:
+    """state を検証して Discord ID を返す。改ざん・期限切れ・形式不正なら None。"""
+    parts = str(state or "").split(".")
+    if len(parts) != 3:
+        return None
+    discord_id, issued, signature = parts
+    if not discord_id.isdigit() or not issued.isdigit():
+        return None
+    expected = _link_state_signature(f"{discord_id}.{issued}")
+    if not hmac.compare_digest(expected, signature):
+        return None
+    age = (now if now is not None else time.time()) - int(issued)
+    if age < -60 or age > max_age:
+        return None
+    return discord_id
+
+
+async def exchange_oauth_code(code: str) -> str:
+    """認可コードを視聴者のアクセストークンに交換する。失敗時は例外。"""
+    client_id, client_secret, redirect_uri = get_twitch_keys()
+    payload = {
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "code": code,
+        "grant_type": "authorization_code",
+        "redirect_uri": redirect_uri,
+    }
+    async with _new_client() as client:
+        r = await client.post(
+            "https://id.twitch.tv/oauth2/token",
+            data=payload,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+    if r.status_code != 200:
+        raise RuntimeError(f"Failed to get token: {r.text}")
+    token = r.json().get("access_token")
+    if not token:
+        raise RuntimeError("Access token not found")
+    return token
+
+
 # ==================== 内部ユーティリティ（共通クライアント / リクエスト） ====================
 def _viewer_headers(viewer_access_token: str, client_id: str) -> Dict[str, str]:
     return {
@@ -72,7 +138,11 @@ def _broadcaster_headers() -> Dict[str, str]:
 
 
 def _new_client() -> httpx.AsyncClient:
-    return httpx.AsyncClient(timeout=HTTP_TIMEOUT)
+    # エンドポイントごとの所要時間とステータスを /metrics に出す
+    return httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT,
+        transport=InstrumentedTransport(HELIX_REQUEST_SECONDS, HELIX_REQUESTS),
+    )
 
 
 async def _request_json(
@@ -122,11 +192,7 @@ async def _get_me_and_login(
 ) -> Tuple[str, str]:
     """/users で自分の id と login を取得"""
     r = await _request_json(client, "GET", f"{API_BASE}/users", headers=headers)
-    debug_print("[DEBUG] /users status:", r.status_code)
-    try:
-        debug_print("[DEBUG] /users body:", r.text)
-    except Exception:
-        pass
+    log.debug("/users status=%s body=%s", r.status_code, lazy(getattr, r, "text"))
     r.raise_for_status()
     data = r.json().get("data", [])
     if not data:
@@ -149,8 +215,9 @@ async def _get_user_subscription_to_broadcaster(
     r = await _request_json(
         client, "GET", f"{API_BASE}/subscriptions/user", headers=headers, params=params
     )
-    debug_print("[DEBUG] /subscriptions/user status:", r.status_code)
-    debug_print("[DEBUG] /subscriptions/user body:", r.text)
+    log.debug(
+        "/subscriptions/user status=%s body=%s", r.status_code, lazy(getattr, r, "text")
+    )
     await _print_json_response(r, "/users")
     if r.status_code == 404:
         # 「対象なし」パターン
@@ -175,8 +242,11 @@ async def _get_broadcaster_subscription_by_user(
     r = await _request_json(
         client, "GET", f"{API_BASE}/subscriptions", headers=headers, params=params
     )
-    debug_print("[DEBUG] /subscriptions (broadcaster) status:", r.status_code)
-    debug_print("[DEBUG] /subscriptions (broadcaster) body:", r.text)
+    log.debug(
+        "/subscriptions (broadcaster) status=%s body=%s",
+        r.status_code,
+        lazy(getattr, r, "text"),
+    )
     if r.status_code == 404:
         return None
     # 401/403 はスコープ不足や無効トークンの可能性 → 呼び出し元で握りつぶす
@@ -292,11 +362,12 @@ async def register_eventsub_subscriptions(
                 headers=headers,
                 content=json.dumps(body),
             )
-            debug_print("[EventSub] create", body["type"], "status:", r.status_code)
-            try:
-                debug_print("[EventSub] body:", r.text)
-            except Exception:
-                pass
+            log.info(
+                "EventSub create %s status=%s body=%s",
+                body["type"],
+                r.status_code,
+                lazy(getattr, r, "text"),
+            )
 
     if close_client:
         async with client:
@@ -459,13 +530,12 @@ async def _get_bits_leaderboard_for_user(
     r = await _request_json(
         client, "GET", f"{API_BASE}/bits/leaderboard", headers=headers, params=params
     )
-    debug_print("[DEBUG] /bits/leaderboard status:", r.status_code)
-    debug_print("[DEBUG] /bits/leaderboard body:", r.text)
+    log.debug("/bits/leaderboard status=%s body=%s", r.status_code, lazy(getattr, r, "text"))
 
     # 401/403 はトークン失効やスコープ不足の可能性が高い → 以後スキップ
     if r.status_code in (401, 403):
         _BITS_DISABLED = True
-        debug_print("[INFO] bits leaderboard disabled due to auth error (401/403).")
+        log.info("bits leaderboard disabled due to auth error (%s)", r.status_code)
         return None, 0
     if r.status_code == 404:
         return None, 0
@@ -562,10 +632,12 @@ async def get_user_info_and_subscription(
             result["bits_score"] = int(bits_score or 0)
         except httpx.HTTPStatusError as e:
             # スコープ不足やトークン失効などの場合はログだけ出して0扱いに
-            debug_print(
-                f"[WARN] bits leaderboard fetch failed: {e.response.status_code} {e.response.text}"
+            log.warning(
+                "bits leaderboard fetch failed: %s %s",
+                e.response.status_code,
+                lazy(getattr, e.response, "text"),
             )
         except httpx.HTTPError as e:
-            debug_print(f"[WARN] bits leaderboard fetch http error: {e!r}")
+            log.warning("bits leaderboard fetch http error: %r", e)
 
         return result
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+API_SERVER_MODE の比較ベンチマーク (no Discord required)
+
+管理 API が Bot ループ上のコルーチンを呼ぶ経路のレイテンシを 2 通りで測る。
+  single : uvicorn を Bot と同じループで動かし、そのまま await する
+  thread : uvicorn を別スレッド・別ループで動かし、run_coroutine_threadsafe で渡す
+Bot ループ側ではゲートウェイ処理の代わりに、一定間隔で CPU を使うタスクを回す。
+負荷をかけるクライアントは別スレッドの別ループから叩く。
+
+Usage:
+  python scripts/api_loop_benchmark.py --requests 2000 --concurrency 20 --bot-load-ms 1
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+
+class _QuietServer(uvicorn.Server):
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+def _build_app(mode: str, bot_loop: asyncio.AbstractEventLoop) -> FastAPI:
+    app = FastAPI()
+
+    async def bot_work() -> dict:
+        # Bot 側の状態を読むだけの軽い処理（ランナーの pause/resume 等を想定）
+        await asyncio.sleep(0)
+        return {"ok": True}
+
+    @app.get("/call")
+    async def call():
+        if mode == "single":
+            return await bot_work()
+        fut = asyncio.run_coroutine_threadsafe(bot_work(), bot_loop)
+        return await asyncio.wrap_future(fut)
+
+    return app
+
+
+async def _gateway_load(load_ms: float, interval_ms: float) -> None:
+    """ゲートウェイイベントの処理を模した CPU 負荷。"""
+    while True:
+        end = time.perf_counter() + load_ms / 1000
+        while time.perf_counter() < end:
+            pass
+        await asyncio.sleep(interval_ms / 1000)
+
+
+async def _drive(url: str, requests: int, concurrency: int) -> tuple[list[float], float]:
+    latencies: list[float] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+    async with httpx.AsyncClient(timeout=30) as client:
+        # ウォームアップ
+        for _ in range(20):
+            await client.get(url)
+
+        async def _worker():
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                t0 = time.perf_counter()
+                r = await client.get(url)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                r.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+def _run_client(url: str, args, out: dict) -> None:
+    out["result"] = asyncio.run(_drive(url, args.requests, args.concurrency))
+
+
+async def _bench(mode: str, args) -> dict:
+    bot_loop = asyncio.get_running_loop()
+    app = _build_app(mode, bot_loop)
+    config = uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning")
+    server = _QuietServer(config)
+    load_task = asyncio.create_task(_gateway_load(args.bot_load_ms, args.bot_interval_ms))
+
+    api_thread = None
+    if mode == "single":
+        api_task = asyncio.create_task(server.serve())
+    else:
+        api_task = None
+        api_thread = threading.Thread(target=server.run, daemon=True)
+        api_thread.start()
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    out: dict = {}
+    client = threading.Thread(
+        target=_run_client, args=(f"http://127.0.0.1:{args.port}/call", args, out)
+    )
+    client.start()
+    while client.is_alive():
+        await asyncio.sleep(0.05)
+
+    server.should_exit = True
+    if api_task is not None:
+        await api_task
+    if api_thread is not None:
+        while api_thread.is_alive():
+            await asyncio.sleep(0.05)
+    load_task.cancel()
+
+    latencies, elapsed = out["result"]
+    q = statistics.quantiles(latencies, n=100)
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(q[49], 3),
+        "p95_ms": round(q[94], 3),
+        "p99_ms": round(q[98], 3),
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="single-loop vs threaded API latency")
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--concurrency", type=int, default=20)
+    p.add_argument("--bot-load-ms", type=float, default=1.0)
+    p.add_argument("--bot-interval-ms", type=float, default=10.0)
+    p.add_argument("--port", type=int, default=8799)
+    p.add_argument("--modes", default="single,thread")
+    args = p.parse_args()
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        print(asyncio.run(_bench(mode, args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Local broadcast attachment tester (no Discord required)
+
+1 回のダウンロードで N 人分の DM 添付をまかなえることを確認する。
+ダウンロードは httpx.MockTransport で差し替え、受信者はダミーの send() を持つ。
+
+Usage:
+  python scripts/dm_attachments_local_test.py --recipients 200 --size-kb 512
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+class _FakeRecipient:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+        self.received: list[tuple[str, bytes]] = []
+
+    async def send(self, content=None, file=None, files=None):
+        for f in ([file] if file is not None else []) + list(files or []):
+            self.received.append((f.filename, f.fp.read()))
+            f.close()
+
+
+async def _run(recipients: int, size_kb: int) -> int:
+    from bot.bot_client import _send_dm
+    from bot.utils.dm_attachments import load_attachment_set
+    from bot.utils.dm_broadcast import DM_SENT, broadcast_dm
+
+    payload = os.urandom(size_kb * 1024)
+    downloads = 0
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        nonlocal downloads
+        downloads += 1
+        return httpx.Response(200, content=payload)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(_handler)) as client:
+        attachment_set = await load_attachment_set(
+            [{"url": "https://example.invalid/files/banner.png", "name": "banner.png"}],
+            client=client,
+        )
+
+    targets = [_FakeRecipient(i) for i in range(recipients)]
+
+    async def _send_one(target: _FakeRecipient):
+        return await _send_dm(target, "hello {user}", attachment_set)
+
+    summary = await broadcast_dm(targets, _send_one, record_outcomes=False)
+
+    ok = True
+    if downloads != 1:
+        print(f"NG: expected 1 download, got {downloads}")
+        ok = False
+    if summary.sent != recipients:
+        print(f"NG: expected {recipients} sent, got {summary.as_dict()}")
+        ok = False
+    for target in targets:
+        if target.received != [("banner.png", payload)]:
+            print(f"NG: recipient {target.id} got unexpected attachments")
+            ok = False
+            break
+    print(
+        f"downloads={downloads} recipients={recipients} buffer_bytes={attachment_set.total_bytes} result={summary.as_dict()}"
+    )
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Broadcast attachment reuse tester")
+    p.add_argument("--recipients", type=int, default=100)
+    p.add_argument("--size-kb", type=int, default=256)
+    args = p.parse_args()
+    raise SystemExit(asyncio.run(_run(args.recipients, args.size_kb)))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,21 +8,47 @@ Usage examples:
 
   # start uvicorn automatically (127.0.0.1:8000)
   python scripts/eventsub_local_test.py --start-server
+
+  # load mode against a throwaway server (temp token.json with an empty discord_token + temp DB)
+  python scripts/eventsub_local_test.py --headless --load --events 5000 --rate 200 --concurrency 32
+
+負荷モード (--load):
+  対応している通知（subscribe / subscription.message / subscription.end / cheer / stream.online）を
+  正しい HMAC 署名付きで、指定したレート・同時数で送る（asyncio + httpx のコネクションプール）。
+  同じ Message-Id の再送、過去にずらしたタイムスタンプ、ギフトサブの一斉到着（gift 1 件 + subscribe N 件）を混ぜ、
+  応答レイテンシのパーセンタイル・エラー率と、送信から DB（webhook_events）に反映されるまでの時間を出す。
+  DB は同じマシンのファイルを直接読む（--headless なら一時ディレクトリの DB）。
 """
 from __future__ import annotations
 
 import argparse
+import asyncio
+import datetime as dt
 import json
 import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
 import threading
 import time
 import uuid
 import hmac
 import hashlib
-from typing import Tuple
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
 
 import requests
 
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+HEADLESS_SECRET = "eventsub-load-test-secret"
+# 負荷モードで作る連携ユーザー（実運用の ID と重ならない範囲）
+LOAD_DISCORD_ID_BASE = 990_000_000_000_000_000
+LOAD_TWITCH_ID_BASE = 880_000_000
+
 
 def _now_iso() -> str:
     return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
@@ -81,17 +107,397 @@ def _start_uvicorn_in_thread(host: str, port: int) -> None:
     time.sleep(1.0)
 
 
-def main() -> None:
-    p = argparse.ArgumentParser(description="Local EventSub tester for NeiBot")
-    p.add_argument("--base-url", default="http://127.0.0.1:8000", help="FastAPI base URL")
-    p.add_argument("--discord-id", default="999999999999999999", help="Test Discord ID to link")
-    p.add_argument("--twitch-user-id", default="111111111", help="Test Twitch user_id")
-    p.add_argument("--start-server", action="store_true", help="Start uvicorn for bot.bot_client:app")
-    args = p.parse_args()
+# ---------- 負荷モード ----------
+@dataclass
+class _Shot:
+    """送る 1 リクエスト。再送は元と同じ Message-Id・タイムスタンプ・本文を使う。"""
+
+    kind: str
+    msg_id: str
+    msg_ts: str
+    body: bytes
+    twitch_user_id: Optional[str]
+    replay: bool = False
+    skewed: bool = False
+    # 送信結果
+    sent_at: Optional[float] = None
+    lateness: float = 0.0
+    latency: Optional[float] = None
+    status: Optional[int] = None
+    matched: Optional[int] = None
+    error: Optional[str] = None
+    reflected_at: Optional[float] = None
+
+
+@dataclass
+class _Plan:
+    slots: list[list[_Shot]] = field(default_factory=list)
+    bursts: int = 0
+
+
+def _shot(
+    secret: str,
+    sub_type: str,
+    twitch_user_id: str,
+    when: dt.datetime,
+    rng: random.Random,
+    *,
+    skewed: bool = False,
+    **event_overrides,
+) -> tuple[_Shot, dict]:
+    from benchmarks.datagen import notification
+
+    body, headers = notification(sub_type, twitch_user_id, f"viewer_{twitch_user_id}", when, rng)
+    body["event"].update(event_overrides)
+    raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    msg_id = headers["Twitch-Eventsub-Message-Id"]
+    msg_ts = headers["Twitch-Eventsub-Message-Timestamp"]
+    shot = _Shot(sub_type, msg_id, msg_ts, raw, twitch_user_id, skewed=skewed)
+    return shot, {
+        "Twitch-Eventsub-Message-Id": msg_id,
+        "Twitch-Eventsub-Message-Timestamp": msg_ts,
+        "Twitch-Eventsub-Message-Type": "notification",
+        "Twitch-Eventsub-Message-Signature": _sign(secret, msg_id, msg_ts, raw),
+        "Content-Type": "application/json",
+    }
+
+
+def _build_plan(args, secret: str) -> tuple[_Plan, dict[str, dict]]:
+    """送る順に並べたスロット（同じスロットは同時に送る）と、Message-Id → ヘッダ。"""
+    from benchmarks.datagen import EVENT_TYPES
+
+    rng = random.Random(args.seed)
+    now = dt.datetime.now(dt.timezone.utc)
+    twitch_ids = [str(LOAD_TWITCH_ID_BASE + i) for i in range(args.users)]
+    types, weights = zip(*EVENT_TYPES)
+    headers_by_id: dict[str, dict] = {}
+    plan = _Plan()
+
+    def _slot_time() -> dt.datetime:
+        # 送る予定の時刻（レート無制限なら 1ms ずつ）を通知の時刻にする
+        step = 1 / args.rate if args.rate > 0 else 0.001
+        return now + dt.timedelta(seconds=len(plan.slots) * step)
+
+    def _add(shot_and_headers: tuple[_Shot, dict]) -> _Shot:
+        shot, headers = shot_and_headers
+        headers_by_id[shot.msg_id] = headers
+        return shot
+
+    # 配信開始の通知を先頭に 1 件（outbox に積まれる）
+    plan.slots.append(
+        [_add(_shot(secret, "stream.online", "12345678", now, rng, id=str(uuid.uuid4()), type="live"))]
+    )
+    burst_every = args.events // (args.gift_bursts + 1) if args.gift_bursts else 0
+    originals: list[_Shot] = []
+    for i in range(args.events):
+        if burst_every and i and i % burst_every == 0 and plan.bursts < args.gift_bursts:
+            # ギフトサブ: 贈った人の gift 通知と、受け取った人数分の subscribe がほぼ同時に届く
+            gifter = rng.choice(twitch_ids)
+            when = _slot_time()
+            burst = [
+                _add(
+                    _shot(
+                        secret,
+                        "channel.subscription.gift",
+                        gifter,
+                        when,
+                        rng,
+                        total=args.gift_burst_size,
+                        tier="1000",
+                        is_anonymous=False,
+                        cumulative_total=rng.randint(args.gift_burst_size, 500),
+                    )
+                )
+            ]
+            for recipient in rng.sample(twitch_ids, min(args.gift_burst_size, len(twitch_ids))):
+                burst.append(
+                    _add(_shot(secret, "channel.subscribe", recipient, when, rng, tier="1000", is_gift=True))
+                )
+            plan.slots.append(burst)
+            originals.extend(burst)
+            plan.bursts += 1
+        when = _slot_time()
+        skewed = rng.random() < args.out_of_order
+        if skewed:
+            # 遅れて届いた通知（Twitch の再送や経路の遅延）を模して、タイムスタンプを過去へずらす
+            when -= dt.timedelta(seconds=rng.uniform(1, args.max_skew))
+        shot = _add(
+            _shot(secret, rng.choices(types, weights)[0], rng.choice(twitch_ids), when, rng, skewed=skewed)
+        )
+        plan.slots.append([shot])
+        originals.append(shot)
+
+    # 再送: 既に送った通知を、同じ Message-Id のまま後ろのどこかでもう一度送る
+    for _ in range(int(len(originals) * args.duplicates)):
+        source_index = rng.randrange(len(plan.slots) - 1)
+        source = rng.choice(plan.slots[source_index])
+        replay = _Shot(
+            source.kind, source.msg_id, source.msg_ts, source.body, source.twitch_user_id, replay=True
+        )
+        plan.slots.insert(rng.randint(source_index + 1, len(plan.slots)), [replay])
+    return plan, headers_by_id
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    ms = sorted(v * 1000 for v in values)
+    if len(ms) == 1:
+        q = [ms[0]] * 99
+    else:
+        q = statistics.quantiles(ms, n=100, method="inclusive")
+    return {
+        "n": len(ms),
+        "p50_ms": round(q[49], 2),
+        "p90_ms": round(q[89], 2),
+        "p95_ms": round(q[94], 2),
+        "p99_ms": round(q[98], 2),
+        "max_ms": round(ms[-1], 2),
+        "mean_ms": round(statistics.fmean(ms), 2),
+    }
+
+
+def _inbox_status(db_path: str, msg_ids: list[str]) -> dict[str, str]:
+    result: dict[str, str] = {}
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+    try:
+        for start in range(0, len(msg_ids), 500):
+            chunk = msg_ids[start : start + 500]
+            placeholders = ",".join("?" for _ in chunk)
+            rows = conn.execute(
+                f"SELECT delivery_id, status FROM webhook_events WHERE source='twitch' AND delivery_id IN ({placeholders})",
+                chunk,
+            ).fetchall()
+            result.update(rows)
+    finally:
+        conn.close()
+    return result
 
-    if args.start_server:
-        _start_uvicorn_in_thread("127.0.0.1", 8000)
 
+def _stale_users(db_path: str, shots: list[_Shot]) -> int:
+    """最後に届いた通知で、新しい時刻の反映が古い時刻で上書きされた連携ユーザーの数。"""
+    newest: dict[str, dt.datetime] = {}
+    for shot in shots:
+        if shot.replay or not shot.matched or shot.kind == "stream.online":
+            continue
+        ts = dt.datetime.fromisoformat(shot.msg_ts.replace("Z", "+00:00"))
+        if shot.twitch_user_id and ts > newest.get(shot.twitch_user_id, ts - dt.timedelta(1)):
+            newest[shot.twitch_user_id] = ts
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+    try:
+        rows = conn.execute(
+            "SELECT json_extract(data, '$.twitch_user_id'), json_extract(data, '$.last_eventsub_at') "
+            "FROM linked_users WHERE discord_id >= ? AND discord_id < ?",
+            (str(LOAD_DISCORD_ID_BASE), str(LOAD_DISCORD_ID_BASE + 10**9)),
+        ).fetchall()
+    finally:
+        conn.close()
+    stale = 0
+    for twitch_id, last_at in rows:
+        expected = newest.get(str(twitch_id))
+        if expected is None or not last_at:
+            continue
+        if dt.datetime.fromisoformat(str(last_at)) < expected:
+            stale += 1
+    return stale
+
+
+def _seed_load_users(count: int) -> None:
+    from bot.utils.save_and_load import patch_linked_users
+
+    patch_linked_users(
+        {
+            str(LOAD_DISCORD_ID_BASE + i): {
+                "twitch_user_id": str(LOAD_TWITCH_ID_BASE + i),
+                "twitch_username": f"viewer_{LOAD_TWITCH_ID_BASE + i}",
+                "is_subscriber": False,
+                "resolved": True,
+            }
+            for i in range(count)
+        }
+    )
+
+
+async def _run_load(args, base_url: str, secret: str, db_path: str) -> dict:
+    import httpx
+
+    plan, headers_by_id = _build_plan(args, secret)
+    shots = [shot for slot in plan.slots for shot in slot]
+    tracked = {shot.msg_id: shot for shot in shots if not shot.replay}
+    sem = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    sending_done = asyncio.Event()
+
+    async def _send(client: httpx.AsyncClient, shot: _Shot, due: float) -> None:
+        async with sem:
+            shot.sent_at = time.perf_counter()
+            shot.lateness = max(0.0, shot.sent_at - due)
+            try:
+                r = await client.post(
+                    "/twitch_eventsub", content=shot.body, headers=headers_by_id[shot.msg_id]
+                )
+                shot.latency = time.perf_counter() - shot.sent_at
+                shot.status = r.status_code
+                if r.status_code == 200:
+                    shot.matched = int((r.json() or {}).get("matched") or 0)
+            except httpx.HTTPError as e:
+                shot.latency = time.perf_counter() - shot.sent_at
+                shot.error = type(e).__name__
+
+    async def _watch_db() -> None:
+        """送った通知が webhook_events で done / failed になった時刻を記録する。"""
+        deadline: Optional[float] = None
+        while True:
+            waiting = [m for m, s in tracked.items() if s.sent_at is not None and s.reflected_at is None]
+            if waiting:
+                seen = await asyncio.to_thread(_inbox_status, db_path, waiting)
+                now = time.perf_counter()
+                for msg_id, status in seen.items():
+                    if status in ("done", "failed"):
+                        tracked[msg_id].reflected_at = now
+            if sending_done.is_set():
+                if all(s.reflected_at is not None or s.status != 200 for s in tracked.values()):
+                    return
+                deadline = deadline or time.perf_counter() + args.settle_timeout
+                if time.perf_counter() > deadline:
+                    return
+            await asyncio.sleep(args.poll_ms / 1000)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        watcher = asyncio.create_task(_watch_db())
+        started = time.perf_counter()
+        tasks = []
+        for index, slot in enumerate(plan.slots):
+            due = started + (index / args.rate if args.rate > 0 else 0.0)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.extend(asyncio.create_task(_send(client, shot, due)) for shot in slot)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        sending_done.set()
+        await watcher
+
+    errors: dict[str, int] = {}
+    for shot in shots:
+        if shot.error or shot.status != 200:
+            key = shot.error or f"http_{shot.status}"
+            errors[key] = errors.get(key, 0) + 1
+    by_type: dict[str, dict] = {}
+    for shot in shots:
+        if shot.latency is not None:
+            by_type.setdefault(shot.kind, []).append(shot.latency)
+    replays = [s for s in shots if s.replay]
+    reflected = [s for s in tracked.values() if s.reflected_at is not None]
+    return {
+        "requests": len(shots),
+        "originals": len(tracked),
+        "replays": len(replays),
+        "replays_applied_again": sum(1 for s in replays if s.matched),
+        "out_of_order": sum(1 for s in shots if s.skewed),
+        "gift_bursts": plan.bursts,
+        "elapsed_sec": round(elapsed, 3),
+        "achieved_rps": round(len(shots) / elapsed, 1) if elapsed else None,
+        "target_rps": args.rate or None,
+        "concurrency": args.concurrency,
+        "error_rate": round(sum(errors.values()) / len(shots), 4),
+        "errors": errors,
+        "latency": _percentiles([s.latency for s in shots if s.latency is not None and not s.error]),
+        "latency_by_type": {k: _percentiles(v) for k, v in sorted(by_type.items())},
+        "send_lateness": _percentiles([s.lateness for s in shots if s.sent_at is not None]),
+        "db_reflect": _percentiles([s.reflected_at - s.sent_at for s in reflected]),
+        "db_reflect_poll_ms": args.poll_ms,
+        "not_reflected": sum(1 for s in tracked.values() if s.reflected_at is None and s.status == 200),
+        "stale_users": await asyncio.to_thread(_stale_users, db_path, shots),
+    }
+
+
+def _print_load_report(report: dict) -> None:
+    def _line(label: str, stats: dict) -> None:
+        if not stats:
+            print(f"  {label:<32} -")
+            return
+        print(
+            f"  {label:<32} n={stats['n']:<6} p50={stats['p50_ms']:>8.1f} p90={stats['p90_ms']:>8.1f} "
+            f"p95={stats['p95_ms']:>8.1f} p99={stats['p99_ms']:>8.1f} max={stats['max_ms']:>8.1f} ms"
+        )
+
+    print(
+        f"sent {report['requests']} requests in {report['elapsed_sec']}s "
+        f"({report['achieved_rps']} req/s, target {report['target_rps'] or 'unlimited'}, "
+        f"concurrency {report['concurrency']})"
+    )
+    print(
+        f"  originals={report['originals']} replays={report['replays']} "
+        f"out_of_order={report['out_of_order']} gift_bursts={report['gift_bursts']}"
+    )
+    print(f"  error_rate={report['error_rate']:.2%} {report['errors'] or ''}")
+    _line("response latency", report["latency"])
+    for kind, stats in report["latency_by_type"].items():
+        _line(f"  {kind}", stats)
+    _line("send lateness (vs schedule)", report["send_lateness"])
+    _line(f"db reflect (poll {report['db_reflect_poll_ms']}ms)", report["db_reflect"])
+    print(f"  not reflected in DB: {report['not_reflected']}")
+    print(f"  replays applied again (should be 0 unless sent concurrently with the original): {report['replays_applied_again']}")
+    print(f"  users whose last_eventsub_at went backwards (out-of-order): {report['stale_users']}")
+
+
+# ---------- ヘッドレス（一時ディレクトリのサーバー） ----------
+def _start_headless_server(args) -> tuple[subprocess.Popen, str]:
+    """Discord トークンが空の token.json と空の DB で bot.bot_client:app を別プロセスで起動する。"""
+    tmp = tempfile.mkdtemp(prefix="neibot-eventsub-load-")
+    with open(os.path.join(tmp, "token.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "discord_token": "",
+                "admin_api_token": "eventsub-load-test-admin",
+                "twitch_secret_key": HEADLESS_SECRET,
+                "twitch_redirect_uri": f"http://127.0.0.1:{args.port}/twitch_callback",
+            },
+            f,
+        )
+    env = {
+        "NEIBOT_DATA_DIR": tmp,
+        "NEIBOT_DB_PATH": os.path.join(tmp, "db.sqlite3"),
+        "LOG_FILE": os.path.join(tmp, "{name}.jsonl"),
+    }
+    # このプロセスの save_and_load（シードと DB の読み取り）も同じ場所を使う
+    os.environ.update(env)
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "bot.bot_client:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+        ],
+        env=dict(os.environ, PYTHONPATH=REPO_ROOT),
+        cwd=REPO_ROOT,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"headless server exited with {proc.returncode}")
+        try:
+            if requests.get(f"{base_url}/twitch_eventsub", timeout=1).status_code == 200:
+                break
+        except requests.RequestException:
+            time.sleep(0.2)
+    else:
+        proc.terminate()
+        raise SystemExit("headless server did not start")
+    print(f"headless server: {base_url} (data {tmp})")
+    return proc, base_url
+
+
+def _single_run(args) -> None:
+    """従来の 1 件ずつの確認（subscribe → message → end）。"""
     # secret
     from bot.utils.save_and_load import get_eventsub_config, patch_linked_user, get_linked_user
 
@@ -138,6 +544,67 @@ def main() -> None:
     print("After end:", get_linked_user(str(args.discord_id)))
 
 
+def main() -> None:
+    p = argparse.ArgumentParser(description="Local EventSub tester for NeiBot")
+    p.add_argument("--base-url", default="http://127.0.0.1:8000", help="FastAPI base URL")
+    p.add_argument("--discord-id", default="999999999999999999", help="Test Discord ID to link")
+    p.add_argument("--twitch-user-id", default="111111111", help="Test Twitch user_id")
+    p.add_argument("--start-server", action="store_true", help="Start uvicorn for bot.bot_client:app")
+    p.add_argument(
+        "--headless",
+        action="store_true",
+        help="Start bot.bot_client:app in a subprocess with a temp token.json (empty discord_token) and DB",
+    )
+    p.add_argument("--port", type=int, default=8799, help="Port for --headless")
+    load = p.add_argument_group("load mode")
+    load.add_argument("--load", action="store_true", help="Run the load generator instead of the single run")
+    load.add_argument("--events", type=int, default=2000, help="Notifications to send (excluding replays)")
+    load.add_argument("--rate", type=float, default=100.0, help="Target requests/sec (0 = as fast as possible)")
+    load.add_argument("--concurrency", type=int, default=16, help="In-flight requests / pooled connections")
+    load.add_argument("--users", type=int, default=500, help="Linked test users the events are spread over")
+    load.add_argument("--duplicates", type=float, default=0.05, help="Share of notifications replayed with the same Message-Id")
+    load.add_argument("--out-of-order", type=float, default=0.1, help="Share of notifications with a past timestamp")
+    load.add_argument("--max-skew", type=float, default=600.0, help="Max seconds a timestamp is moved back")
+    load.add_argument("--gift-bursts", type=int, default=3, help="Gift-sub bursts mixed into the run")
+    load.add_argument("--gift-burst-size", type=int, default=50, help="Recipients per gift burst")
+    load.add_argument("--seed", type=int, default=1)
+    load.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout (sec)")
+    load.add_argument("--poll-ms", type=int, default=20, help="DB polling interval for end-to-end timing")
+    load.add_argument("--settle-timeout", type=float, default=30.0, help="Wait for the DB after the last send (sec)")
+    load.add_argument("--json-out", help="Write the load report as JSON")
+    args = p.parse_args()
+
+    server: Optional[subprocess.Popen] = None
+    if args.headless:
+        server, args.base_url = _start_headless_server(args)
+    elif args.start_server:
+        _start_uvicorn_in_thread("127.0.0.1", 8000)
+
+    try:
+        if not args.load:
+            _single_run(args)
+            return
+        from bot.utils.save_and_load import DB_PATH, get_eventsub_config
+
+        _, secret = get_eventsub_config()
+        if not secret:
+            raise SystemExit("EventSub secret missing (token.json twitch_secret_key / TWITCH_EVENTSUB_SECRET)")
+        _seed_load_users(args.users)
+        report = asyncio.run(_run_load(args, args.base_url, secret, DB_PATH))
+        _print_load_report(report)
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        if report["error_rate"] > 0 or report["not_reflected"]:
+            sys.exit(1)
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+DISCORD_MEMBER_CACHE の比較ベンチマーク (no Discord required)
+
+合成した大規模ギルド（既定 100,000 人、うち連携済み 5%）を、py-cord の ConnectionState に
+偽のゲートウェイ（GUILD_MEMBERS_CHUNK を JSON から組み立てて流す）をつないで読み込ませる。
+  all    : 起動時に全員をチャンクしてキャッシュ（READY までにかかる時間 = 全員のチャンク）
+  linked : 起動時はチャンクしない。連携済みメンバーだけを user_ids 指定で取り寄せ、
+           全員が必要な処理（全件のロール照合など）はキャッシュせずにチャンクを取り寄せる
+各シナリオは別プロセスで実行し、tracemalloc で保持メモリとピークを測る。
+
+Usage:
+  python scripts/member_cache_benchmark.py --members 100000 --linked-ratio 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+GUILD_ID = 100
+TIER_ROLE_IDS = [201, 202, 203]
+LINKED_ROLE_ID = 204
+OTHER_ROLE_IDS = [301, 302, 303, 304]
+CHUNK_SIZE = 1000
+
+
+def _member_payload(i: int, roles: list[int]) -> dict:
+    uid = 10_000_000 + i
+    return {
+        "user": {
+            "id": str(uid),
+            "username": f"user{i}",
+            "global_name": f"User {i}",
+            "discriminator": "0",
+            "avatar": None,
+        },
+        "nick": None if i % 4 else f"nick{i}",
+        "roles": [str(r) for r in roles],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+    }
+
+
+def _build_dataset(args) -> tuple[dict[int, bytes], list[int]]:
+    """メンバー ID → JSON（ゲートウェイから届く形）と、連携済みメンバーの ID 一覧。"""
+    rng = random.Random(42)
+    payloads: dict[int, bytes] = {}
+    linked: list[int] = []
+    for i in range(args.members):
+        roles = [r for r in OTHER_ROLE_IDS if rng.random() < 0.1]
+        if rng.random() < args.linked_ratio:
+            linked.append(10_000_000 + i)
+            roles += [LINKED_ROLE_ID, rng.choice(TIER_ROLE_IDS)]
+        elif rng.random() < 0.002:
+            # 連携を外したのにロールが残っている人（リコンサイルで外す対象）
+            roles.append(rng.choice(TIER_ROLE_IDS))
+        payloads[10_000_000 + i] = json.dumps(_member_payload(i, roles)).encode()
+    return payloads, linked
+
+
+def _guild_payload(member_count: int) -> dict:
+    roles = [{"id": str(GUILD_ID), "name": "@everyone"}]
+    roles += [{"id": str(r), "name": f"role-{r}"} for r in TIER_ROLE_IDS + [LINKED_ROLE_ID] + OTHER_ROLE_IDS]
+    for pos, role in enumerate(roles):
+        role.update(
+            permissions="0", position=pos, color=0, hoist=False, managed=False, mentionable=False
+        )
+    return {
+        "id": str(GUILD_ID),
+        "name": "synthetic",
+        "owner_id": "1",
+        "member_count": member_count,
+        "large": True,
+        "roles": roles,
+        "channels": [],
+        "members": [],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+    }
+
+
+class _FakeGateway:
+    """request_chunks に対して GUILD_MEMBERS_CHUNK を 1,000 人ずつ返す。"""
+
+    def __init__(self, state, payloads: dict[int, bytes]) -> None:
+        self.state = state
+        self.payloads = payloads
+
+    async def request_chunks(
+        self, guild_id, query=None, *, limit, user_ids=None, presences=False, nonce=None
+    ):
+        ids = list(user_ids) if user_ids else list(self.payloads)
+        asyncio.get_running_loop().create_task(self._send(guild_id, ids, nonce))
+
+    async def _send(self, guild_id: int, ids: list[int], nonce: str) -> None:
+        # 往復の遅延（要求側が応答を待ち始めてから届く）
+        await asyncio.sleep(0.001)
+        count = max(1, (len(ids) + CHUNK_SIZE - 1) // CHUNK_SIZE)
+        for index in range(count):
+            part = ids[index * CHUNK_SIZE : (index + 1) * CHUNK_SIZE]
+            raw = b'{"guild_id":"%d","nonce":"%s","chunk_index":%d,"chunk_count":%d,"members":[%s]}' % (
+                guild_id,
+                nonce.encode(),
+                index,
+                count,
+                b",".join(self.payloads[i] for i in part if i in self.payloads),
+            )
+            self.state.parse_guild_members_chunk(json.loads(raw))
+            # ゲートウェイからの受信の合間に他の処理が走る
+            await asyncio.sleep(0)
+
+
+def _mb(n: int) -> float:
+    return round(n / 1024 / 1024, 1)
+
+
+async def _scenario(policy: str, args) -> dict:
+    from bot.utils.member_cache import MemberCache, create_bot
+
+    payloads, linked = _build_dataset(args)
+    managed = set(TIER_ROLE_IDS + [LINKED_ROLE_ID])
+    gc.collect()
+    tracemalloc.start()
+
+    bot = create_bot("!", intents_mode=args.intents, member_cache=policy, shard_count="")
+    state = bot._connection
+    state.loop = asyncio.get_running_loop()
+    gateway = _FakeGateway(state, payloads)
+    state._get_websocket = lambda *a, **k: gateway
+    guild = state._add_guild_from_data(_guild_payload(args.members))
+    cache = MemberCache(policy)
+    result: dict = {"policy": policy, "members": args.members, "linked": len(linked)}
+
+    # 起動: all は READY 前に全員をチャンク、linked は連携済みだけを取り寄せる
+    started = time.perf_counter()
+    if policy == "all":
+        await guild.chunk()
+    else:
+        await cache.ensure_cached(guild, linked)
+    result["startup_sec"] = round(time.perf_counter() - started, 3)
+    gc.collect()
+    result["cached_after_startup"] = len(guild.members)
+    result["retained_after_startup_mb"] = _mb(tracemalloc.get_traced_memory()[0])
+
+    # 全件のロール照合の前処理（linked はここで初めて全員を取り寄せる）
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await cache.cache_matching(guild, set(linked), managed)
+    holders = await cache.role_members(guild, managed)
+    result["full_pass_sec"] = round(time.perf_counter() - started, 3)
+    result["role_holders"] = len({m.id for ms in holders.values() for m in ms})
+    result["full_pass_peak_mb"] = _mb(tracemalloc.get_traced_memory()[1])
+    del holders
+    # 使い回し期間の経過を模す
+    for guild_id, stamp in [(gid, entry[0]) for gid, entry in cache._lists.items()]:
+        cache._expire(guild_id, stamp)
+    gc.collect()
+    result["cached_after_full_pass"] = len(guild.members)
+    result["retained_after_full_pass_mb"] = _mb(tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+    return result
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="member cache policy benchmark")
+    p.add_argument("--members", type=int, default=100_000)
+    p.add_argument("--linked-ratio", type=float, default=0.05)
+    p.add_argument("--intents", default="minimal", choices=["minimal", "all"])
+    p.add_argument("--policies", default="all,linked")
+    p.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.scenario:
+        print(json.dumps(asyncio.run(_scenario(args.scenario, args))))
+        return
+    for policy in [x.strip() for x in args.policies.split(",") if x.strip()]:
+        out = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--scenario",
+                policy,
+                "--members",
+                str(args.members),
+                "--linked-ratio",
+                str(args.linked_ratio),
+                "--intents",
+                args.intents,
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        print(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
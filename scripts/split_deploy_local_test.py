@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+"""
+分割構成（受付専用プロセス + Bot プロセス）のローカル結合テスト (no Discord required)
+
+一時ディレクトリに token.json と db.sqlite3 を用意し、次の 2 プロセスを起動する。
+  ingress : python -m bot.ingress_app（uvicorn の複数ワーカー）
+  bot     : このスクリプトの --stub-bot。BOT_IPC_ADDRESS で待ち受け、/internal/wake と
+            /guilds・SSE を返し、本物の OutboxConsumer で outbox を処理する（Discord の代わりに数えるだけ）
+署名付き EventSub を並列に送り、inbox / outbox への記録、wake と outbox の消化、
+Bot 専用 API の中継（認証・SSE を含む）を確認する。
+
+Usage:
+  python scripts/split_deploy_local_test.py --events 300 --workers 2
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+ADMIN_TOKEN = "split-test-admin-token"
+EVENTSUB_SECRET = "split-test-eventsub-secret"
+
+
+# ---------- Bot プロセスの代わり ----------
+def run_stub_bot() -> None:
+    from bot.utils.admin_auth import require_admin_token
+    from bot.utils.bot_ipc import BOT_IPC_ADDRESS, WAKE_PATH, parse_ipc_address
+    from bot.utils.outbox import (
+        KIND_MILESTONE_DM,
+        KIND_ROLES,
+        KIND_STREAM_ONLINE,
+        OutboxConsumer,
+    )
+
+    stats = {"wakes": 0, "link_jobs": [], "consumed": {}}
+
+    def _handler(kind: str):
+        async def _consume(rows: list[dict]) -> dict[int, str]:
+            stats["consumed"][kind] = stats["consumed"].get(kind, 0) + len(rows)
+            return {}
+
+        return _consume
+
+    consumer = OutboxConsumer(
+        {k: _handler(k) for k in (KIND_ROLES, KIND_STREAM_ONLINE, KIND_MILESTONE_DM)}
+    )
+
+    @asynccontextmanager
+    async def _lifespan(_app):
+        await consumer.start()
+        yield
+
+    app = FastAPI(lifespan=_lifespan)
+
+    @app.post(WAKE_PATH)
+    async def wake(request: Request, authorization: str | None = Header(None)):
+        if not require_admin_token(authorization):
+            return PlainTextResponse("forbidden", status_code=403)
+        payload = await request.json()
+        stats["wakes"] += 1
+        if payload.get("link_job_id"):
+            stats["link_jobs"].append(payload["link_job_id"])
+        consumer.notify()
+        return {"status": "ok"}
+
+    @app.get("/guilds")
+    async def guilds(authorization: str | None = Header(None)):
+        if not require_admin_token(authorization):
+            return PlainTextResponse("forbidden", status_code=403)
+        return {"guilds": [{"id": 1, "name": "stub-guild"}], "pid": os.getpid()}
+
+    @app.get("/broadcast/jobs/{job_id}/events")
+    async def events(job_id: str):
+        async def _stream():
+            for i in range(3):
+                yield f"event: progress\ndata: {json.dumps({'job': job_id, 'sent': i})}\n\n"
+                await asyncio.sleep(0.05)
+            yield "event: end\ndata: {}\n\n"
+
+        return StreamingResponse(_stream(), media_type="text/event-stream")
+
+    @app.get("/stub/stats")
+    async def stub_stats():
+        return stats
+
+    address = parse_ipc_address(BOT_IPC_ADDRESS)
+    uvicorn.run(app, log_level="warning", **address.uvicorn_kwargs())
+
+
+# ---------- テスト本体 ----------
+def _sign(msg_id: str, msg_ts: str, body: bytes) -> str:
+    mac = hmac.new(
+        EVENTSUB_SECRET.encode("utf-8"), (msg_id + msg_ts).encode("utf-8") + body, hashlib.sha256
+    )
+    return "sha256=" + mac.hexdigest()
+
+
+def _eventsub_request(sub_type: str, event: dict, *, signature: str | None = None):
+    body = json.dumps({"subscription": {"type": sub_type, "version": "1"}, "event": event}).encode()
+    msg_id = str(uuid.uuid4())
+    msg_ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    headers = {
+        "Twitch-Eventsub-Message-Id": msg_id,
+        "Twitch-Eventsub-Message-Timestamp": msg_ts,
+        "Twitch-Eventsub-Message-Type": "notification",
+        "Twitch-Eventsub-Message-Signature": signature or _sign(msg_id, msg_ts, body),
+        "Content-Type": "application/json",
+    }
+    return body, headers
+
+
+def _check(label: str, ok: bool, detail: object = "") -> bool:
+    print(f"[{'OK' if ok else 'NG'}] {label} {detail}")
+    return ok
+
+
+async def _wait_until(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await predicate():
+            return True
+        await asyncio.sleep(0.2)
+    return False
+
+
+async def _drive(args, base_url: str, ipc_client: httpx.AsyncClient, db_path: str) -> bool:
+    results: list[bool] = []
+    auth = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+
+        async def _ingress_up() -> bool:
+            try:
+                return (await client.get("/twitch_eventsub")).status_code == 200
+            except httpx.HTTPError:
+                return False
+
+        if not await _wait_until(_ingress_up, 30):
+            return _check("ingress started", False)
+
+        r = await client.post(
+            "/twitch_eventsub",
+            json={"challenge": "challenge-ok"},
+            headers={"Twitch-Eventsub-Message-Type": "webhook_callback_verification"},
+        )
+        results.append(_check("verification challenge", r.text == "challenge-ok", r.status_code))
+
+        body, headers = _eventsub_request("channel.subscribe", {"user_id": "1"}, signature="sha256=bad")
+        r = await client.post("/twitch_eventsub", content=body, headers=headers)
+        results.append(_check("bad signature rejected", r.status_code == 403, r.status_code))
+
+        # 並列に EventSub を送る（複数ワーカーが同じ SQLite に書く）
+        latencies: list[float] = []
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def _post(i: int) -> int:
+            tier = ("1000", "2000", "3000")[i % 3]
+            body, headers = _eventsub_request(
+                "channel.subscribe", {"user_id": str(100000 + i % args.users), "tier": tier}
+            )
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/twitch_eventsub", content=body, headers=headers)
+                latencies.append((time.perf_counter() - t0) * 1000)
+            return r.status_code
+
+        started = time.perf_counter()
+        codes = await asyncio.gather(*(_post(i) for i in range(args.events)))
+        elapsed = time.perf_counter() - started
+        q = statistics.quantiles(latencies, n=100)
+        results.append(
+            _check(
+                "eventsub accepted",
+                all(c == 200 for c in codes),
+                f"n={len(codes)} rps={len(codes) / elapsed:.1f} p50={q[49]:.1f}ms p95={q[94]:.1f}ms",
+            )
+        )
+        body, headers = _eventsub_request(
+            "stream.online",
+            {"id": "stream-1", "broadcaster_user_id": "42", "broadcaster_user_login": "nei"},
+        )
+        r = await client.post("/twitch_eventsub", content=body, headers=headers)
+        results.append(_check("stream.online accepted", r.status_code == 200, r.status_code))
+
+        with sqlite3.connect(db_path) as conn:
+            inbox = conn.execute(
+                "SELECT COUNT(*) FROM webhook_events WHERE status='done'"
+            ).fetchone()[0]
+        results.append(_check("inbox rows", inbox == args.events + 1, inbox))
+
+        async def _outbox_drained() -> bool:
+            with sqlite3.connect(db_path) as conn:
+                pending = conn.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE status IN ('pending','running')"
+                ).fetchone()[0]
+            return pending == 0
+
+        results.append(_check("outbox drained by bot", await _wait_until(_outbox_drained, 15)))
+        stats = (await ipc_client.get("/stub/stats")).json()
+        consumed = stats["consumed"]
+        results.append(
+            _check(
+                "bot consumed roles + stream_online",
+                consumed.get("roles", 0) >= 1 and consumed.get("stream_online") == 1,
+                consumed,
+            )
+        )
+        results.append(_check("wake received", stats["wakes"] >= 1, stats["wakes"]))
+
+        # Bot 専用 API の中継
+        r = await client.get("/guilds")
+        results.append(_check("relay without token rejected", r.status_code == 403, r.status_code))
+        r = await client.get("/guilds", headers=auth)
+        results.append(
+            _check(
+                "relay /guilds",
+                r.status_code == 200 and r.json()["guilds"][0]["name"] == "stub-guild",
+                r.status_code,
+            )
+        )
+        r = await client.get("/broadcast/jobs", headers=auth)
+        results.append(
+            _check("/broadcast/jobs served by ingress", r.status_code == 200 and r.json() == {"jobs": []})
+        )
+        events: list[str] = []
+        async with client.stream("GET", "/broadcast/jobs/x/events", headers=auth) as resp:
+            async for line in resp.aiter_lines():
+                if line.startswith("event:"):
+                    events.append(line.split(":", 1)[1].strip())
+        results.append(_check("SSE relay", events == ["progress"] * 3 + ["end"], events))
+        r = await client.get("/not-a-route", headers=auth)
+        results.append(_check("unknown path not relayed", r.status_code == 404, r.status_code))
+    return all(results)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="split deployment integration test")
+    p.add_argument("--events", type=int, default=300)
+    p.add_argument("--users", type=int, default=50)
+    p.add_argument("--concurrency", type=int, default=20)
+    p.add_argument("--workers", type=int, default=2)
+    p.add_argument("--port", type=int, default=8791)
+    p.add_argument("--stub-bot", action="store_true", help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.stub_bot:
+        run_stub_bot()
+        return
+
+    tmp = tempfile.mkdtemp(prefix="neibot-split-")
+    with open(os.path.join(tmp, "token.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "admin_api_token": ADMIN_TOKEN,
+                "twitch_secret_key": EVENTSUB_SECRET,
+                "twitch_redirect_uri": f"http://127.0.0.1:{args.port}/twitch_callback",
+            },
+            f,
+        )
+    db_path = os.path.join(tmp, "db.sqlite3")
+    ipc = (
+        f"unix:{os.path.join(tmp, 'bot.sock')}"
+        if hasattr(os, "fork")
+        else f"http://127.0.0.1:{args.port + 1}"
+    )
+    env = dict(
+        os.environ,
+        NEIBOT_DATA_DIR=tmp,
+        NEIBOT_DB_PATH=db_path,
+        BOT_IPC_ADDRESS=ipc,
+        INGRESS_WORKERS=str(args.workers),
+        FASTAPI_PORT=str(args.port),
+        PYTHONPATH=REPO_ROOT,
+        # 受付ワーカーのログ（logs/ingress-<pid>.jsonl）をリポジトリに残さない
+        LOG_FILE=os.path.join(tmp, "{name}.jsonl"),
+    )
+    os.environ.update(env)
+
+    from bot.utils.bot_ipc import ipc_client, parse_ipc_address
+    from bot.utils.save_and_load import patch_linked_users
+
+    patch_linked_users(
+        {
+            str(900000 + i): {"twitch_user_id": str(100000 + i), "twitch_username": f"user{i}"}
+            for i in range(args.users)
+        }
+    )
+
+    procs = [
+        subprocess.Popen([sys.executable, __file__, "--stub-bot"], env=env, cwd=REPO_ROOT),
+        subprocess.Popen([sys.executable, "-m", "bot.ingress_app"], env=env, cwd=REPO_ROOT),
+    ]
+
+    async def _run() -> bool:
+        async with ipc_client(parse_ipc_address(ipc), httpx.Timeout(10.0)) as bot_client:
+            return await _drive(args, f"http://127.0.0.1:{args.port}", bot_client, db_path)
+
+    try:
+        ok = asyncio.run(_run())
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
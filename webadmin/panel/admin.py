@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils import timezone
-from .models import LinkedUser, WebhookEvent
+from .models import DmSuppression, LinkedUser, WebhookEvent
 from bot.utils.eventsub_apply import apply_event_to_linked_users
 
 
@@ -90,3 +90,24 @@ class WebhookEventAdmin(admin.ModelAdmin):
 
     mark_pending.short_description = "Mark selected as pending"
 
+
+@admin.register(DmSuppression)
+class DmSuppressionAdmin(admin.ModelAdmin):
+    list_display = (
+        "discord_id",
+        "reason",
+        "source",
+        "failure_count",
+        "last_failed_at",
+        "suppressed_until",
+    )
+    list_filter = ("source",)
+    search_fields = ("discord_id",)
+    ordering = ("-last_failed_at",)
+    actions = ("lift_suppression",)
+
+    def lift_suppression(self, request, queryset):
+        deleted, _ = queryset.delete()
+        self.message_user(request, f"Lifted suppression for {deleted} user(s)")
+
+    lift_suppression.short_description = "Lift DM suppression (send again next time)"
@@ -56,6 +56,23 @@ class MultiFileField(forms.FileField):
 class RoleBroadcastForm(forms.Form):
     guild_id = forms.ChoiceField(label="サーバー", choices=())
     role_ids = forms.MultipleChoiceField(label="ロール", choices=(), required=False)
+    role_mode = forms.ChoiceField(
+        label="複数ロールの扱い",
+        choices=(
+            ("union", "いずれかのロールを持つメンバー"),
+            ("intersection", "すべてのロールを持つメンバー"),
+        ),
+        initial="union",
+        widget=forms.RadioSelect,
+        required=False,
+    )
+    exclude_role_ids = forms.MultipleChoiceField(
+        label="除外するロール",
+        choices=(),
+        required=False,
+        widget=forms.CheckboxSelectMultiple,
+        help_text="チェックしたロールを持つメンバーには送信しません。",
+    )
     streak_filters = forms.MultipleChoiceField(
         label="Streak月数フィルタ",
         choices=(),
@@ -67,6 +84,8 @@ class RoleBroadcastForm(forms.Form):
     attachments = MultiFileField(label="添付ファイル", required=False)
     # 8MB は Discord DM の添付制限
     MAX_ATTACHMENT_BYTES = 8 * 1024 * 1024
+    # 1 通あたりの添付数の上限（bot/utils/dm_attachments.py の MAX_FILES_PER_MESSAGE と揃える）
+    MAX_ATTACHMENT_FILES = 10
     ALLOWED_PLACEHOLDERS = {"user"}
     PLACEHOLDER_RE = re.compile(r"(?<!\{)\{([^\{\}]+)\}(?!\})")
 
@@ -109,6 +128,7 @@ class RoleBroadcastForm(forms.Form):
             except Exception:
                 roles = []
         self.fields["role_ids"].choices = roles
+        self.fields["exclude_role_ids"].choices = roles
         if not self.is_bound and roles:
             self.initial.setdefault("role_ids", [roles[0][0]])
         streak_choices = self._build_streak_choices()
@@ -121,7 +141,9 @@ class RoleBroadcastForm(forms.Form):
             streak_field.help_text = "streak情報がまだないため現在は利用できません。"
 
     def clean_attachments(self):
-        files = self.cleaned_data.get("attachments") or []
+        files = [f for f in (self.cleaned_data.get("attachments") or []) if f is not None]
+        if len(files) > self.MAX_ATTACHMENT_FILES:
+            raise forms.ValidationError(f"添付ファイルは{self.MAX_ATTACHMENT_FILES}個までにしてください。")
         cleaned: list[UploadedFile] = []
         for f in files:
             if f is None:
@@ -159,6 +181,9 @@ class RoleBroadcastForm(forms.Form):
                 unique.append(v)
         return unique
 
+    def clean_role_mode(self):
+        return self.cleaned_data.get("role_mode") or "union"
+
     def clean_streak_filters(self):
         values = self.cleaned_data.get("streak_filters") or []
         cleaned: list[int] = []
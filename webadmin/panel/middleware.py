@@ -0,0 +1,78 @@
+"""
+管理パネルのリクエストごとの所要時間と DB 時間（集計は bot.utils.request_timing と共通）。
+ORM の SQL は connection.execute_wrapper で 1 文ずつ測り、遅い文は EXPLAIN QUERY PLAN と一緒に残す。
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, List
+
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+
+from bot.utils.request_timing import (
+    REQUEST_STATS,
+    UNMATCHED_ROUTE,
+    begin_request,
+    end_request,
+    format_plan,
+    is_explainable,
+    record_statement,
+)
+
+# EXPLAIN 自体も execute_wrapper を通るので、その間は測らない
+_explaining: ContextVar[bool] = ContextVar("panel_sql_explaining", default=False)
+
+
+def _explain(conn: Any, sql: str, params: Any) -> List[str]:
+    if conn.vendor != "sqlite" or not is_explainable(sql):
+        return []
+    token = _explaining.set(True)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return format_plan(cursor.fetchall())
+    finally:
+        _explaining.reset(token)
+
+
+def _sql_wrapper(execute: Callable, sql: str, params: Any, many: bool, context: dict) -> Any:
+    if _explaining.get():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        conn = context["connection"]
+        if many:
+            first = params[0] if isinstance(params, (list, tuple)) and params else None
+            explain = (lambda: _explain(conn, sql, first)) if first is not None else None
+        else:
+            explain = lambda: _explain(conn, sql, params)  # noqa: E731
+        record_statement(time.perf_counter() - started, sql, "django", explain)
+
+
+class RequestTimingMiddleware:
+    """
+    ビューの所要時間をルート（urls.py のパターン）ごとに集計する。
+    SSE などのストリーミング応答は、応答オブジェクトを返すまでの時間になる。
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        acc, token = begin_request(request.path)
+        status = 500
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(_sql_wrapper):
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            end_request(token)
+            match = getattr(request, "resolver_match", None)
+            route = f"/{match.route}" if match is not None and match.route is not None else UNMATCHED_ROUTE
+            REQUEST_STATS.record("panel", request.method or "", route, status, elapsed, acc)
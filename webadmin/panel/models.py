@@ -47,4 +47,20 @@ class WebhookEvent(models.Model):
         return f"{self.source}:{self.delivery_id} [{self.status}]"
 
 
+class DmSuppression(models.Model):
+    discord_id = models.CharField(max_length=64, primary_key=True)
+    reason = models.TextField(null=True, blank=True)
+    source = models.CharField(max_length=32, null=True, blank=True)
+    failure_count = models.IntegerField(default=1)
+    first_failed_at = models.CharField(max_length=40)
+    last_failed_at = models.CharField(max_length=40)
+    suppressed_until = models.CharField(max_length=40)
 
+    class Meta:
+        managed = False
+        db_table = "dm_suppressions"
+        verbose_name = "DM Suppression"
+        verbose_name_plural = "DM Suppressions"
+
+    def __str__(self) -> str:
+        return f"{self.discord_id} (x{self.failure_count})"
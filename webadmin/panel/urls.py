@@ -6,7 +6,19 @@ urlpatterns = [
     path("unresolved/", views.unresolved_users, name="unresolved_users"),
     path("status/", views.self_service, name="self_service"),
     path("broadcast/", views.broadcast, name="broadcast"),
+    path("broadcast/jobs/", views.broadcast_jobs, name="broadcast_jobs"),
+    path(
+        "broadcast/jobs/<str:job_id>/",
+        views.broadcast_progress,
+        name="broadcast_progress",
+    ),
+    path(
+        "broadcast/jobs/<str:job_id>/events/",
+        views.broadcast_progress_stream,
+        name="broadcast_progress_stream",
+    ),
     path("eventsub/", views.eventsub_admin, name="eventsub_admin"),
     path("import-subscribers/", views.import_subscribers, name="import_subscribers"),
+    path("performance/", views.performance, name="performance"),
 ]
 
@@ -15,7 +15,12 @@ from django.conf import settings
 from django.contrib import messages
 from django.db import transaction
 from django.contrib.auth.decorators import login_required
-from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    HttpResponseForbidden,
+    StreamingHttpResponse,
+)
 from django.shortcuts import redirect, render
 from django.utils import timezone
 from django.utils.dateparse import parse_date, parse_datetime
@@ -25,7 +30,8 @@ from .forms import (
     SubscriberImportForm,
     EventSubSubscriptionForm,
 )
-from .models import LinkedUser, WebhookEvent
+from .models import DmSuppression, LinkedUser, WebhookEvent
+from bot.utils.request_timing import timing_snapshot
 
 TIER_LABELS: List[Tuple[str, str]] = [
     ("1000", "Tier 1"),
@@ -216,6 +222,8 @@ def _build_dashboard_context() -> Dict[str, Any]:
         "stale_records": 0,
         "pending_relink": 0,
         "dm_failures": 0,
+        "dm_suppressed": 0,
+        "dm_suppression_expired": 0,
         "last_updated": None,
     }
     reminder_stats: Dict[str, Any] = {
@@ -330,6 +338,17 @@ def _build_dashboard_context() -> Dict[str, Any]:
             latest_update = updated_at
 
     user_stats["last_updated"] = _to_local(latest_update)
+    # suppressed_until は UTC の ISO 文字列なので文字列比較で判定できる
+    now_iso = now.astimezone(dt.timezone.utc).isoformat()
+    try:
+        user_stats["dm_suppressed"] = DmSuppression.objects.filter(
+            suppressed_until__gt=now_iso
+        ).count()
+        user_stats["dm_suppression_expired"] = DmSuppression.objects.filter(
+            suppressed_until__lte=now_iso
+        ).count()
+    except Exception:
+        pass
     total_users = user_stats["total"]
     if total_users:
         user_stats["active_ratio"] = round(
@@ -1062,140 +1081,122 @@ def broadcast(request: HttpRequest) -> HttpResponse:
                         }
                     )
 
-            headers = (
-                {"Authorization": f"Bearer {settings.ADMIN_API_TOKEN}"}
-                if settings.ADMIN_API_TOKEN
-                else {}
-            )
             role_labels = {
                 str(value): label for value, label in form.fields["role_ids"].choices
             }
-            success_roles: List[str] = []
-            failed_roles: List[Tuple[str, str]] = []
-            aggregated_recipients: Dict[str, Dict[str, Any]] = {}
-            last_meta: Dict[str, Any] | None = None
-
-            for rid in role_ids:
-                payload: Dict[str, Any] = {"role_id": rid, "message": message}
-                if guild_id:
-                    payload["guild_id"] = guild_id
-                if streak_filters:
-                    payload["streak_filters"] = streak_filters
-                if attachments:
-                    payload["attachments"] = attachments
-                    first = attachments[0]
-                    payload.setdefault("file_url", first.get("url"))
-                    payload.setdefault("file_path", first.get("path"))
-                if preview_requested:
-                    payload["preview_only"] = True
-                try:
-                    resp = requests.post(
-                        f"{settings.BOT_ADMIN_API_BASE}/send_role_dm",
-                        json=payload,
-                        headers=headers,
-                        timeout=10,
-                    )
-                except Exception as exc:
-                    failed_roles.append(
-                        (role_labels.get(str(rid), str(rid)), str(exc))
-                    )
-                    continue
+            role_mode = form.cleaned_data.get("role_mode") or "union"
+            exclude_role_ids = [
+                int(r) for r in form.cleaned_data.get("exclude_role_ids") or []
+            ]
+            # ロールの合成と重複排除は Bot 側で 1 回だけ行う
+            payload: Dict[str, Any] = {
+                "role_ids": role_ids,
+                "role_mode": role_mode,
+                "message": message,
+            }
+            if exclude_role_ids:
+                payload["exclude_role_ids"] = exclude_role_ids
+            if guild_id:
+                payload["guild_id"] = guild_id
+            if streak_filters:
+                payload["streak_filters"] = streak_filters
+            if attachments:
+                payload["attachments"] = attachments
+            if preview_requested:
+                payload["preview_only"] = True
 
+            error_reason: Optional[str] = None
+            data: Dict[str, Any] = {}
+            try:
+                resp = requests.post(
+                    f"{settings.BOT_ADMIN_API_BASE}/send_role_dm",
+                    json=payload,
+                    headers=_admin_api_headers(),
+                    timeout=10,
+                )
+            except requests.RequestException as exc:
+                error_reason = str(exc)
+            else:
                 if resp.status_code == 200:
-                    role_label = role_labels.get(str(rid), str(rid))
                     try:
-                        data: Dict[str, Any] = resp.json()
+                        data = resp.json()
                     except ValueError:
                         data = {}
-                    recipients_payload = data.get("recipients") or []
-
-                    if preview_requested:
-                        normalized_preview = []
-                        for entry in recipients_payload:
-                            normalized_entry = _normalize_recipient_entry(entry)
-                            if normalized_entry:
-                                normalized_preview.append(normalized_entry)
-                        normalized_sorted = sorted(
-                            normalized_preview,
-                            key=lambda item: (item.get("label") or item.get("id") or "").casefold(),
-                        )
-                        preview_results.append(
-                            {
-                                "role": role_label,
-                                "guild_name": data.get("guild_name"),
-                                "count": len(normalized_sorted),
-                                "recipients": normalized_sorted[:preview_limit],
-                                "has_more": len(normalized_sorted) > preview_limit,
-                                "remaining": max(0, len(normalized_sorted) - preview_limit),
-                                "streak_filters": sorted(streak_filters),
-                            }
-                        )
-                        continue
-
-                    success_roles.append(role_label)
-                    for entry in recipients_payload:
-                        normalized = _normalize_recipient_entry(entry)
-                        if not normalized:
-                            continue
-                        aggregated_recipients[normalized["id"]] = normalized
-                    if recipients_payload:
-                        last_meta = {
-                            "guild_name": data.get("guild_name"),
-                            "role_name": data.get("role_name") or role_label,
-                        }
                 else:
-                    reason = f"{resp.status_code} {resp.text}".strip()
-                    failed_roles.append((role_labels.get(str(rid), str(rid)), reason))
+                    error_reason = f"{resp.status_code} {resp.text}".strip()
+
+            role_names = [
+                str(item.get("name"))
+                for item in data.get("roles") or []
+                if item.get("name")
+            ] or [role_labels.get(str(rid), str(rid)) for rid in role_ids]
+            joiner = " ∩ " if role_mode == "intersection" else "、"
+            role_summary = joiner.join(role_names)
+            excluded_names = [
+                str(item.get("name"))
+                for item in data.get("excluded_roles") or []
+                if item.get("name")
+            ]
+            normalized_recipients: List[Dict[str, Any]] = []
+            for entry in data.get("recipients") or []:
+                normalized_entry = _normalize_recipient_entry(entry)
+                if normalized_entry:
+                    normalized_recipients.append(normalized_entry)
+            normalized_recipients.sort(
+                key=lambda item: (item.get("label") or item.get("id") or "").casefold()
+            )
 
-            if preview_requested:
-                total_preview = sum(item["count"] for item in preview_results)
-                if total_preview:
+            if error_reason is not None:
+                messages.error(
+                    request,
+                    f"ロール「{role_summary}」への処理に失敗しました: {error_reason}",
+                )
+            elif preview_requested:
+                preview_results.append(
+                    {
+                        "role": role_summary,
+                        "excluded_roles": excluded_names,
+                        "suppressed_count": int(data.get("suppressed_count") or 0),
+                        "guild_name": data.get("guild_name"),
+                        "count": len(normalized_recipients),
+                        "recipients": normalized_recipients[:preview_limit],
+                        "has_more": len(normalized_recipients) > preview_limit,
+                        "remaining": max(0, len(normalized_recipients) - preview_limit),
+                        "streak_filters": sorted(streak_filters),
+                    }
+                )
+                if normalized_recipients:
                     messages.info(
                         request, "対象メンバーを表示しました。送信前にご確認ください。"
                     )
-                elif not failed_roles:
+                else:
                     messages.warning(
                         request, "該当するメンバーが見つかりませんでした。"
                     )
+            elif not data.get("job_id"):
+                messages.warning(
+                    request, "該当するメンバーが見つからなかったため送信しませんでした。"
+                )
             else:
-                if aggregated_recipients:
-                    sorted_recipients = sorted(
-                        aggregated_recipients.values(),
-                        key=lambda item: (item.get("label") or item.get("id") or "").casefold(),
-                    )
-                    recipient_popup = {
-                        "recipients": sorted_recipients,
-                        "count": len(sorted_recipients),
-                        "roles": success_roles,
-                        "generated_at": timezone.now().isoformat(),
-                    }
-                    if streak_filters:
-                        recipient_popup["streak_filters"] = [
-                            str(value) for value in sorted(streak_filters)
-                        ]
-                    if last_meta and last_meta.get("guild_name"):
-                        recipient_popup["guild_name"] = last_meta["guild_name"]
-                    request.session["last_role_dm_recipients"] = recipient_popup
-                    request.session.modified = True
-
-                if success_roles:
-                    if len(success_roles) == 1:
-                        messages.success(
-                            request, f"「{success_roles[0]}」への送信をキューに投入しました。"
-                        )
-                    else:
-                        joined = "、".join(success_roles)
-                        messages.success(
-                            request,
-                            f"{len(success_roles)}件のロール（{joined}）への送信をキューに投入しました。",
-                        )
-                if not failed_roles:
-                    return redirect("broadcast")
-
-            for label, reason in failed_roles:
-                messages.error(
-                    request, f"ロール「{label}」への処理に失敗しました: {reason}"
+                recipient_popup = {
+                    "recipients": normalized_recipients,
+                    "count": len(normalized_recipients),
+                    "roles": role_names,
+                    "generated_at": timezone.now().isoformat(),
+                }
+                if streak_filters:
+                    recipient_popup["streak_filters"] = [
+                        str(value) for value in sorted(streak_filters)
+                    ]
+                if data.get("guild_name"):
+                    recipient_popup["guild_name"] = data["guild_name"]
+                request.session["last_role_dm_recipients"] = recipient_popup
+                request.session.modified = True
+                messages.success(
+                    request,
+                    f"「{role_summary}」の {len(normalized_recipients)} 人への送信をキューに投入しました。",
                 )
+                return redirect("broadcast_progress", job_id=str(data["job_id"]))
     else:
         form = RoleBroadcastForm()
 
@@ -1353,9 +1354,214 @@ def eventsub_admin(request: HttpRequest) -> HttpResponse:
     return render(request, "panel/eventsub.html", context)
 
 
+BROADCAST_JOB_STATUS_LABELS: Dict[str, Tuple[str, str]] = {
+    "pending": ("待機中", "warning"),
+    "running": ("送信中", "success"),
+    "paused": ("一時停止", "muted"),
+    "cancelled": ("中止", "danger"),
+    "done": ("完了", "success"),
+    "failed": ("エラー", "danger"),
+}
+
+
+def _admin_api_headers() -> Dict[str, str]:
+    return (
+        {"Authorization": f"Bearer {settings.ADMIN_API_TOKEN}"}
+        if settings.ADMIN_API_TOKEN
+        else {}
+    )
+
+
+def _decorate_broadcast_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    counts = job.get("counts") or {}
+    total = int(job.get("total") or 0)
+    done = sum(
+        int(counts.get(key, 0))
+        for key in ("sent", "dm_closed", "failed", "suppressed")
+    )
+    label, tone = BROADCAST_JOB_STATUS_LABELS.get(
+        str(job.get("status")), (str(job.get("status")), "muted")
+    )
+    spec = job.get("spec") or {}
+    return {
+        **job,
+        "status_label": label,
+        "status_tone": tone,
+        "done": done,
+        "remaining": max(0, total - done),
+        "percent": int(done * 100 / total) if total else 0,
+        "role_name": spec.get("role_name")
+        or "、".join(str(rid) for rid in spec.get("role_ids") or [])
+        or spec.get("role_id"),
+        "created_at_local": _to_local(_parse_iso_datetime(job.get("created_at"))),
+    }
+
+
+@login_required
+def broadcast_jobs(request: HttpRequest) -> HttpResponse:
+    if not request.user.is_staff:
+        return HttpResponseForbidden("このページへアクセスする権限がありません。")
+
+    jobs: List[Dict[str, Any]] = []
+    try:
+        resp = requests.get(
+            f"{settings.BOT_ADMIN_API_BASE}/broadcast/jobs",
+            headers=_admin_api_headers(),
+            timeout=10,
+        )
+    except requests.RequestException as exc:
+        messages.error(request, f"送信ジョブの取得に失敗しました: {exc}")
+    else:
+        if resp.status_code == 200:
+            jobs = [_decorate_broadcast_job(job) for job in resp.json().get("jobs", [])]
+        else:
+            messages.error(
+                request,
+                f"送信ジョブの取得に失敗しました (status={resp.status_code}): {resp.text}",
+            )
+    return render(request, "panel/broadcast_jobs.html", {"jobs": jobs})
 
 
+@login_required
+def broadcast_progress(request: HttpRequest, job_id: str) -> HttpResponse:
+    if not request.user.is_staff:
+        return HttpResponseForbidden("このページへアクセスする権限がありません。")
 
+    headers = _admin_api_headers()
+    if request.method == "POST":
+        action = request.POST.get("action") or ""
+        if action in ("pause", "resume", "cancel"):
+            try:
+                resp = requests.post(
+                    f"{settings.BOT_ADMIN_API_BASE}/broadcast/jobs/{job_id}/{action}",
+                    headers=headers,
+                    timeout=10,
+                )
+            except requests.RequestException as exc:
+                messages.error(request, f"操作に失敗しました: {exc}")
+            else:
+                if resp.status_code == 200:
+                    messages.success(request, "ジョブの状態を更新しました。")
+                else:
+                    messages.error(
+                        request,
+                        f"操作に失敗しました (status={resp.status_code}): {resp.text}",
+                    )
+        return redirect("broadcast_progress", job_id=job_id)
 
+    job: Optional[Dict[str, Any]] = None
+    try:
+        resp = requests.get(
+            f"{settings.BOT_ADMIN_API_BASE}/broadcast/jobs/{job_id}",
+            headers=headers,
+            timeout=10,
+        )
+    except requests.RequestException as exc:
+        messages.error(request, f"送信ジョブの取得に失敗しました: {exc}")
+    else:
+        if resp.status_code == 200:
+            job = _decorate_broadcast_job(resp.json())
+        elif resp.status_code == 404:
+            messages.error(request, "指定された送信ジョブが見つかりません。")
+        else:
+            messages.error(
+                request,
+                f"送信ジョブの取得に失敗しました (status={resp.status_code}): {resp.text}",
+            )
+    return render(
+        request,
+        "panel/broadcast_progress.html",
+        {
+            "job_id": job_id,
+            "job": job,
+            "status_labels": {k: v[0] for k, v in BROADCAST_JOB_STATUS_LABELS.items()},
+        },
+    )
+
+
+@login_required
+def broadcast_progress_stream(request: HttpRequest, job_id: str) -> HttpResponse:
+    """FastAPI の SSE をそのまま中継する（EventSource は Authorization を付けられないため）。"""
+    if not request.user.is_staff:
+        return HttpResponseForbidden("このページへアクセスする権限がありません。")
+    try:
+        upstream = requests.get(
+            f"{settings.BOT_ADMIN_API_BASE}/broadcast/jobs/{job_id}/events",
+            headers=_admin_api_headers(),
+            stream=True,
+            timeout=(5, 60),
+        )
+    except requests.RequestException as exc:
+        return HttpResponse(f"upstream error: {exc}", status=502)
+    if upstream.status_code != 200:
+        upstream.close()
+        return HttpResponse(upstream.text, status=upstream.status_code)
+
+    def _relay():
+        try:
+            for chunk in upstream.iter_content(chunk_size=None):
+                if chunk:
+                    yield chunk
+        except requests.RequestException:
+            return
+        finally:
+            upstream.close()
+
+    response = StreamingHttpResponse(_relay(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+def performance(request: HttpRequest) -> HttpResponse:
+    """ルート別の所要時間と遅い SQL（パネルはこのプロセス分、Bot は /debug/requests から取得）。"""
+    if not request.user.is_staff:
+        return HttpResponseForbidden("このページへアクセスする権限がありません。")
 
+    panel = timing_snapshot()
+    bot_stats: Optional[Dict[str, Any]] = None
+    try:
+        resp = requests.get(
+            f"{settings.BOT_ADMIN_API_BASE}/debug/requests",
+            headers=_admin_api_headers(),
+            timeout=10,
+        )
+    except requests.RequestException as exc:
+        messages.error(request, f"Bot の計測値の取得に失敗しました: {exc}")
+    else:
+        if resp.status_code == 200:
+            bot_stats = resp.json()
+        else:
+            messages.error(
+                request,
+                f"Bot の計測値の取得に失敗しました (status={resp.status_code}): {resp.text}",
+            )
 
+    sections = [("管理パネル", panel)]
+    if bot_stats is not None:
+        sections.append(("Bot API", bot_stats))
+    # timing_snapshot() の要素はプロセス共通の記録そのものなので、表示用の値はコピーに足す
+    sections = [
+        (
+            title,
+            {
+                **stats,
+                "slow_queries": [
+                    {
+                        **entry,
+                        "at_local": timezone.localtime(
+                            dt.datetime.fromtimestamp(entry["ts"], dt.timezone.utc)
+                        ),
+                    }
+                    for entry in stats.get("slow_queries", [])
+                ],
+            },
+        )
+        for title, stats in sections
+    ]
+    return render(
+        request,
+        "panel/performance.html",
+        {"sections": sections, "slow_sql_ms": panel["slow_sql_ms"]},
+    )